@@ -0,0 +1,168 @@
+"""
+Process-local read-through LRU cache with TTL, entry and byte caps.
+
+Used in front of the transcription and sentiment lookups: popular videos are served
+from memory instead of a Mongo round trip. Concurrent misses of one key share a single
+load (no stampede). Writers call `set`/`invalidate` after storing, so a process never
+serves its own stale data; other workers converge within the TTL.
+
+Cached values are shared between callers and must be treated as read-only.
+"""
+import asyncio
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from app.core.config import settings
+
+
+def approximate_size(value: Any) -> int:
+    """Rough in-memory size in bytes, dominated by long strings (transcripts)"""
+    if isinstance(value, str):
+        return sys.getsizeof(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(approximate_size(k) + approximate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(approximate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    def __init__(
+        self,
+        name: str,
+        max_entries: int = 1000,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: float = 600,
+        sizeof: Callable[[Any], int] = approximate_size,
+        enabled: bool = True,
+    ):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self.enabled = enabled
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int, float]]" = OrderedDict()
+        self._loading: Dict[Hashable, asyncio.Future] = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key) if self.enabled else None
+        if entry is None:
+            return default
+        value, size, expires = entry
+        if expires <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            return default
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if not self.enabled or value is None:
+            return
+        size = self.sizeof(value)
+        self._remove(key)
+        if size > self.max_bytes:
+            return  # would evict everything else
+        self._entries[key] = (value, size, time.monotonic() + self.ttl)
+        self.bytes += size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        self._remove(key)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.bytes = 0
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Cached value, or the result of `loader()` (cached unless None); one load per key at a time"""
+        _missing = object()
+        value = self.get(key, _missing)
+        if value is not _missing:
+            self.hits += 1
+            return value
+        self.misses += 1
+        if not self.enabled:
+            return await loader()
+
+        while key in self._loading:
+            pending = self._loading[key]
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # The task loading it was cancelled, not this one: load it here
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # retrieved here, there may be no waiters
+            raise
+        finally:
+            self._loading.pop(key, None)
+        self.set(key, value)
+        future.set_result(value)
+        return value
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "coalesced": self.coalesced,
+        }
+
+
+def _cache(name: str) -> LRUCache:
+    return LRUCache(
+        name,
+        max_entries=settings.CACHE_MAX_ENTRIES,
+        max_bytes=settings.CACHE_MAX_BYTES,
+        ttl=settings.CACHE_TTL_SECONDS,
+        enabled=settings.CACHE_ENABLED,
+    )
+
+
+# (link_hash, model) -> transcription document
+transcription_cache = _cache("transcriptions")
+# (transcription_id, model) -> sentiment results
+sentiment_cache = _cache("sentiment_analysis")
+
+
+def cache_stats() -> dict:
+    return {cache.name: cache.stats() for cache in (transcription_cache, sentiment_cache)}
@@ -0,0 +1,74 @@
+"""
+Compressed storage of transcripts.
+
+With `TRANSCRIPT_COMPRESSION` = "zlib" or "zstd" (needs the optional `zstandard` package,
+falls back to zlib without it), transcripts longer than `TRANSCRIPT_COMPRESSION_MIN_BYTES`
+are stored as `transcription_z` (binary) + `transcription_codec` instead of the plain
+`transcription` string. Readers go through `unpack_text`, so plain and compressed
+documents can live side by side.
+"""
+import logging
+import zlib
+from typing import Optional
+
+from bson import Binary
+
+from app.core.config import settings
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Projection of the stored transcript in either form
+TEXT_PROJECTION = {"transcription": 1, "transcription_z": 1, "transcription_codec": 1}
+
+
+def _codec() -> str:
+    codec = settings.TRANSCRIPT_COMPRESSION.lower()
+    if codec == "zstd" and zstandard is None:
+        logger.warning("TRANSCRIPT_COMPRESSION=zstd but `zstandard` is not installed, using zlib")
+        return "zlib"
+    return codec
+
+
+def compress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=settings.TRANSCRIPT_COMPRESSION_LEVEL).compress(data)
+    return zlib.compress(data, settings.TRANSCRIPT_COMPRESSION_LEVEL)
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Transcript is zstd-compressed, install `zstandard` to read it")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "zlib":
+        return zlib.decompress(data)
+    raise ValueError(f"Unknown transcript codec: {codec}")
+
+
+def pack_text(text: Optional[str]) -> dict:
+    """Document fields storing `text`: compressed when enabled and long enough, plain otherwise."""
+    codec = _codec()
+    if text is None or codec not in ("zlib", "zstd"):
+        return {"transcription": text}
+    data = text.encode("utf-8")
+    if len(data) < settings.TRANSCRIPT_COMPRESSION_MIN_BYTES:
+        return {"transcription": text}
+    return {"transcription_z": Binary(compress(data, codec)), "transcription_codec": codec}
+
+
+def has_text(doc: dict) -> bool:
+    return "transcription" in doc or "transcription_z" in doc
+
+
+def unpack_text(doc: Optional[dict]) -> Optional[str]:
+    """Transcript of a document stored by `pack_text` (or by older versions, as a plain string)."""
+    if not doc:
+        return None
+    if "transcription_z" in doc:
+        return decompress(bytes(doc["transcription_z"]), doc.get("transcription_codec", "zlib")).decode("utf-8")
+    return doc.get("transcription")
@@ -0,0 +1,57 @@
+"""
+Per-stage concurrency limits of the analysis pipeline.
+
+Each stage (download, transcription, sentiment) has its own slot count from settings
+(`<STAGE>_CONCURRENCY`, 0 = unlimited); analyses over the limit wait for a free slot,
+so a burst of analyses does not open dozens of downloads or paid API calls at once.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from app.core.config import settings
+
+
+class StageLimiter:
+    def __init__(self, limits: Dict[str, int]):
+        self.limits = limits
+        self._semaphores: Dict[str, Optional[asyncio.Semaphore]] = {}
+        self.running: Dict[str, int] = {stage: 0 for stage in limits}
+        self.waiting: Dict[str, int] = {stage: 0 for stage in limits}
+        # Slots released and seconds spent holding them, per stage
+        self.completed: Dict[str, int] = {stage: 0 for stage in limits}
+        self.busy_seconds: Dict[str, float] = {stage: 0.0 for stage in limits}
+
+    def _semaphore(self, stage: str) -> Optional[asyncio.Semaphore]:
+        if stage not in self._semaphores:
+            limit = self.limits.get(stage, 0)
+            self._semaphores[stage] = asyncio.Semaphore(limit) if limit > 0 else None
+        return self._semaphores[stage]
+
+    @asynccontextmanager
+    async def slot(self, stage: str):
+        semaphore = self._semaphore(stage)
+        self.waiting[stage] = self.waiting.get(stage, 0) + 1
+        try:
+            if semaphore is not None:
+                await semaphore.acquire()
+        finally:
+            self.waiting[stage] -= 1
+        self.running[stage] = self.running.get(stage, 0) + 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.running[stage] -= 1
+            self.completed[stage] = self.completed.get(stage, 0) + 1
+            self.busy_seconds[stage] = self.busy_seconds.get(stage, 0.0) + time.perf_counter() - started
+            if semaphore is not None:
+                semaphore.release()
+
+
+stage_limiter = StageLimiter({
+    "download": settings.DOWNLOAD_CONCURRENCY,
+    "transcription": settings.TRANSCRIPTION_CONCURRENCY,
+    "sentiment": settings.SENTIMENT_CONCURRENCY,
+})
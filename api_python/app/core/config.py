@@ -1,7 +1,202 @@
+import importlib
 import os
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+# Values come from the environment; `ENV_FILE` (default `.env` in the working directory) fills in the rest
+ENV_FILE = os.getenv("ENV_FILE", ".env")
+
+
+def load_env_file(path: Union[str, Path]) -> Dict[str, str]:
+    """KEY=VALUE lines of an env file (comments, blank lines and `export ` prefixes allowed)"""
+    values = {}
+    try:
+        lines = Path(path).read_text(encoding="utf-8").splitlines()
+    except OSError:
+        return values
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#") or "=" not in line:
+            continue
+        key, _, value = line.removeprefix("export ").partition("=")
+        value = value.strip()
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+            value = value[1:-1]
+        values[key.strip()] = value
+    return values
+
 
 class Settings:
-    APP_NAME: str = "Video Sentiment Analyzer"
-    VERSION: str = "0.1.0"
+    """Typed application settings; a malformed value fails at startup with the name of the variable."""
+
+    def __init__(self, env: Optional[Dict[str, str]] = None, env_file: Optional[str] = ENV_FILE):
+        # Real environment variables win over the env file
+        self._env = {**(load_env_file(env_file) if env_file else {}), **(os.environ if env is None else env)}
+
+        self.APP_NAME: str = "Video Sentiment Analyzer"
+        self.VERSION: str = "0.1.0"
+
+        # Secrets: environment / env file first, then the hand-made `app/core/*_secret.py` modules
+        self.SECRET_KEY: str = self._secret("SECRET_KEY", default="your-secret-key-change-this-in-production")
+        self.DEEPGRAM_SECRET: str = self._secret("DEEPGRAM_SECRET", module="deepgram_secret")
+        self.GROQ_SECRET: str = self._secret("GROQ_SECRET", module="groq_secret")
+
+        # MongoDB connection pool, created in the FastAPI lifespan (see `core.database`)
+        self.MONGO_URI: str = self._str("MONGO_URI", "mongodb://localhost:27017")
+        self.MONGO_DB: str = self._str("MONGO_DB", "video_sentiment")
+        self.MONGO_MAX_POOL_SIZE: int = self._int("MONGO_MAX_POOL_SIZE", 100)
+        self.MONGO_MIN_POOL_SIZE: int = self._int("MONGO_MIN_POOL_SIZE", 0)
+        # Connections being opened at once; limits connection storms after a restart
+        self.MONGO_MAX_CONNECTING: int = self._int("MONGO_MAX_CONNECTING", 2)
+        # How long an operation waits for a free pooled connection / for a reachable server
+        self.MONGO_WAIT_QUEUE_TIMEOUT_MS: int = self._int("MONGO_WAIT_QUEUE_TIMEOUT_MS", 10000)
+        self.MONGO_SERVER_SELECTION_TIMEOUT_MS: int = self._int("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)
+        self.MONGO_MAX_IDLE_TIME_MS: int = self._int("MONGO_MAX_IDLE_TIME_MS", 0)
+        # Empty = server defaults; e.g. MONGO_WRITE_CONCERN=majority, MONGO_READ_CONCERN=majority
+        self.MONGO_WRITE_CONCERN: str = self._str("MONGO_WRITE_CONCERN", "")
+        self.MONGO_READ_CONCERN: str = self._str("MONGO_READ_CONCERN", "")
+        self.MONGO_READ_PREFERENCE: str = self._str("MONGO_READ_PREFERENCE", "primary")
+
+        # Analyses running a stage at once in this process (0 = unlimited); others wait for a slot
+        self.DOWNLOAD_CONCURRENCY: int = self._int("DOWNLOAD_CONCURRENCY", 4)
+        self.TRANSCRIPTION_CONCURRENCY: int = self._int("TRANSCRIPTION_CONCURRENCY", 8)
+        self.SENTIMENT_CONCURRENCY: int = self._int("SENTIMENT_CONCURRENCY", 8)
+
+        # Transcription engines (`transcription.backends`): `auto` sends audio up to this many seconds to a
+        # local engine with an idle worker (0 = local engines only as fallback or when named explicitly)
+        self.TRANSCRIPTION_LOCAL_MAX_SECONDS: float = self._float("TRANSCRIPTION_LOCAL_MAX_SECONDS", 0)
+        # Local CPU whisper (`transcription.local_whisper`): model size, worker processes per server process
+        # (0 disables it), torch threads per worker (0 = CPUs / workers) and int8 quantization
+        self.WHISPER_MODEL: str = self._str("WHISPER_MODEL", "base")
+        self.WHISPER_WORKERS: int = self._int("WHISPER_WORKERS", 1)
+        self.WHISPER_THREADS: int = self._int("WHISPER_THREADS", 0)
+        self.WHISPER_INT8: bool = self._bool("WHISPER_INT8", True)
+
+        # Batch submissions (`analysis.batch`): URLs per request, videos after expanding playlists/channels,
+        # and analyses of one batch started at once
+        self.BATCH_MAX_SOURCES: int = self._int("BATCH_MAX_SOURCES", 50)
+        self.BATCH_MAX_ENTRIES: int = self._int("BATCH_MAX_ENTRIES", 200)
+        self.BATCH_CONCURRENCY: int = self._int("BATCH_CONCURRENCY", 4)
+
+        # Transcripts are stored compressed ("zlib", "zstd" or "none") when at least this long
+        self.TRANSCRIPT_COMPRESSION: str = self._str("TRANSCRIPT_COMPRESSION", "zlib")
+        self.TRANSCRIPT_COMPRESSION_LEVEL: int = self._int("TRANSCRIPT_COMPRESSION_LEVEL", 6)
+        self.TRANSCRIPT_COMPRESSION_MIN_BYTES: int = self._int("TRANSCRIPT_COMPRESSION_MIN_BYTES", 1024)
+
+        # Analysis steps/status are written behind: coalesced per analysis and flushed as one bulk
+        # write after this many seconds or once this many analyses are pending (0 s = write at once)
+        self.WRITE_BEHIND_FLUSH_SECONDS: float = self._float("WRITE_BEHIND_FLUSH_SECONDS", 1.0)
+        self.WRITE_BEHIND_MAX_PENDING: int = self._int("WRITE_BEHIND_MAX_PENDING", 100)
+
+        # Retention (see `core.retention`); 0 days = keep forever. Archiving (and deleting) completed
+        # analyses and transcriptions is opt-in; by default only failed analyses and stale audio go
+        self.RETENTION_ENABLED: bool = self._bool("RETENTION_ENABLED", True)
+        self.RETENTION_INTERVAL_SECONDS: float = self._float("RETENTION_INTERVAL_SECONDS", 3600)
+        self.RETENTION_FAILED_ANALYSES_DAYS: int = self._int("RETENTION_FAILED_ANALYSES_DAYS", 30)
+        self.ARCHIVE_ANALYSES_AFTER_DAYS: int = self._int("ARCHIVE_ANALYSES_AFTER_DAYS", 0)
+        self.ARCHIVE_TRANSCRIPTIONS_AFTER_DAYS: int = self._int("ARCHIVE_TRANSCRIPTIONS_AFTER_DAYS", 0)
+        self.RETENTION_AUDIO_HOURS: float = self._float("RETENTION_AUDIO_HOURS", 24)
+        self.ARCHIVE_DIR: str = self._str("ARCHIVE_DIR", "archive")
+        # Throttling: documents per batch and pause between batches
+        self.RETENTION_BATCH_SIZE: int = self._int("RETENTION_BATCH_SIZE", 200)
+        self.RETENTION_BATCH_PAUSE_SECONDS: float = self._float("RETENTION_BATCH_PAUSE_SECONDS", 0.5)
+        # Batches of sentiment rows checked for a missing transcription per run (0 = all)
+        self.RETENTION_ORPHAN_SCAN_BATCHES: int = self._int("RETENTION_ORPHAN_SCAN_BATCHES", 10)
+
+        # Sentiment backfill (`sentiment.backfill`): analyses in flight and the LLM provider's account limits
+        self.BACKFILL_CONCURRENCY: int = self._int("BACKFILL_CONCURRENCY", 4)
+        self.BACKFILL_BATCH_SIZE: int = self._int("BACKFILL_BATCH_SIZE", 50)
+        self.BACKFILL_REQUESTS_PER_MINUTE: float = self._float("BACKFILL_REQUESTS_PER_MINUTE", 30)
+        self.BACKFILL_TOKENS_PER_MINUTE: float = self._float("BACKFILL_TOKENS_PER_MINUTE", 60000)
+
+        # Process-local LRU caches of transcriptions / sentiment results (per cache caps)
+        self.CACHE_ENABLED: bool = self._bool("CACHE_ENABLED", True)
+        self.CACHE_TTL_SECONDS: float = self._float("CACHE_TTL_SECONDS", 600)
+        self.CACHE_MAX_ENTRIES: int = self._int("CACHE_MAX_ENTRIES", 1000)
+        self.CACHE_MAX_BYTES: int = self._int("CACHE_MAX_BYTES", 64 * 1024 * 1024)
+
+        # Cancel analyses whose client went away (socket disconnect / closed HTTP stream)
+        self.CANCEL_ON_DISCONNECT: bool = self._bool("CANCEL_ON_DISCONNECT", False)
+        # Seconds a client has to reconnect before its analyses are cancelled
+        self.CANCEL_GRACE_SECONDS: float = self._float("CANCEL_GRACE_SECONDS", 30)
+
+        # Fan-out of analysis events between worker processes: "local", "unix" or "mongo"
+        self.EVENT_BUS_BACKEND: str = self._str("EVENT_BUS_BACKEND", "local")
+        self.EVENT_BUS_UNIX_DIR: str = self._str("EVENT_BUS_UNIX_DIR", "/tmp/video-sent-bus")
+        self.EVENT_BUS_MONGO_COLLECTION: str = self._str("EVENT_BUS_MONGO_COLLECTION", "event_bus")
+        self.EVENT_BUS_MONGO_SIZE: int = self._int("EVENT_BUS_MONGO_SIZE", 64 * 1024 * 1024)
+
+        # Progress updates are coalesced per analysis to at most this many emits per second
+        self.PROGRESS_MAX_EMITS_PER_SECOND: float = self._float("PROGRESS_MAX_EMITS_PER_SECOND", 4)
+
+        # bcrypt cost factor of new hashes; older hashes are upgraded on the next successful login
+        self.BCRYPT_ROUNDS: int = self._int("BCRYPT_ROUNDS", 12)
+        # Processes hashing/verifying passwords, keeps bcrypt off the event loop
+        self.PASSWORD_HASH_WORKERS: int = self._int("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1))
+
+        # Token-bucket budgets per route class, "<burst>/<seconds>", charged per client IP and per user
+        self.RATE_LIMIT_ENABLED: bool = self._bool("RATE_LIMIT_ENABLED", True)
+        self.RATE_LIMIT_AUTH: str = self._str("RATE_LIMIT_AUTH", "10/60")
+        self.RATE_LIMIT_ANALYSIS: str = self._str("RATE_LIMIT_ANALYSIS", "5/60")
+        self.RATE_LIMIT_CONTROL: str = self._str("RATE_LIMIT_CONTROL", "30/60")
+        self.RATE_LIMIT_READ: str = self._str("RATE_LIMIT_READ", "120/60")
+        # Shed these route classes (503) while event-loop lag is above the threshold (0 disables)
+        self.LOAD_SHED_LAG_MS: float = self._float("LOAD_SHED_LAG_MS", 250)
+        self.LOAD_SHED_CLASSES: str = self._str("LOAD_SHED_CLASSES", "analysis,read")
+
+    def _str(self, name: str, default: str) -> str:
+        return self._env.get(name, default)
+
+    def _int(self, name: str, default: int) -> int:
+        value = self._env.get(name)
+        try:
+            return default if value in (None, "") else int(value)
+        except ValueError:
+            raise ValueError(f"{name} must be an integer, got {value!r}") from None
+
+    def _float(self, name: str, default: float) -> float:
+        value = self._env.get(name)
+        try:
+            return float(default if value in (None, "") else value)
+        except ValueError:
+            raise ValueError(f"{name} must be a number, got {value!r}") from None
+
+    def _bool(self, name: str, default: bool) -> bool:
+        value = self._env.get(name)
+        if value in (None, ""):
+            return default
+        if value.lower() in ("1", "true", "yes", "on"):
+            return True
+        if value.lower() in ("0", "false", "no", "off"):
+            return False
+        raise ValueError(f"{name} must be a boolean, got {value!r}")
+
+    def _secret(self, name: str, module: Optional[str] = None, default: str = "") -> str:
+        if self._env.get(name):
+            return self._env[name]
+        if module:
+            try:
+                return getattr(importlib.import_module(f"app.core.{module}"), name)
+            except (ImportError, AttributeError):
+                pass
+        return default
+
+    def mongo_client_options(self) -> dict:
+        """Keyword arguments of `AsyncIOMotorClient` for the pool / concern settings"""
+        options = {
+            "maxPoolSize": self.MONGO_MAX_POOL_SIZE,
+            "minPoolSize": self.MONGO_MIN_POOL_SIZE,
+            "maxConnecting": self.MONGO_MAX_CONNECTING,
+            "waitQueueTimeoutMS": self.MONGO_WAIT_QUEUE_TIMEOUT_MS or None,
+            "serverSelectionTimeoutMS": self.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            "maxIdleTimeMS": self.MONGO_MAX_IDLE_TIME_MS or None,
+            "readPreference": self.MONGO_READ_PREFERENCE,
+        }
+        if self.MONGO_WRITE_CONCERN:
+            w = self.MONGO_WRITE_CONCERN
+            options["w"] = int(w) if w.isdigit() else w
+        if self.MONGO_READ_CONCERN:
+            options["readConcernLevel"] = self.MONGO_READ_CONCERN
+        return options
 
 settings = Settings()
@@ -1,15 +1,116 @@
-from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo import ASCENDING
-from fastapi import FastAPI
+import logging
+from typing import Optional
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
 
-MONGO_URI = "mongodb://localhost:27017"
-DB_NAME = "video_sentiment"
+from app.core.config import settings
+
+MONGO_URI = settings.MONGO_URI
+DB_NAME = settings.MONGO_DB
+
+_client: Optional[AsyncIOMotorClient] = None
+
+
+def create_client(**overrides) -> AsyncIOMotorClient:
+    """Motor client with the pool settings from `settings`; `overrides` e.g. for benchmarks"""
+    return AsyncIOMotorClient(settings.MONGO_URI, **{**settings.mongo_client_options(), **overrides})
+
+
+async def connect_db(**overrides) -> AsyncIOMotorClient:
+    """Open the client (FastAPI lifespan); a client opened earlier is replaced"""
+    global _client
+    if _client is not None:
+        _client.close()
+    _client = create_client(**overrides)
+    return _client
+
+
+async def close_db() -> None:
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
+
+
+def get_client() -> AsyncIOMotorClient:
+    # Scripts and tests that run without the lifespan get a client on first use
+    global _client
+    if _client is None:
+        _client = create_client()
+    return _client
+
+
+def get_database() -> AsyncIOMotorDatabase:
+    return get_client()[settings.MONGO_DB]
+
+
+class _Database:
+    """`db` of the modules; resolves the database of the current client at use time."""
+
+    def __getattr__(self, name: str):
+        return getattr(get_database(), name)
+
+    def __getitem__(self, name: str):
+        return get_database()[name]
+
+
+db = _Database()
+
+# Indexes follow the query shapes (equality fields first, then the sort); `index_audit` checks them with explain().
+# Default names are kept, so indexes created by earlier versions are recognised instead of conflicting.
+INDEXES = {
+    # Login lookups and duplicate-free registration
+    "users": [
+        ([("email", ASCENDING)], {"unique": True}),
+    ],
+    # Cache lookup and upsert of `transcribe_video`: one transcription per (video, model)
+    "transcriptions": [
+        ([("link_hash", ASCENDING), ("model", ASCENDING)], {"unique": True}),
+        ([("created_at", ASCENDING)], {}),
+    ],
+    # Cache lookup of `analyze`: one result per (transcription, model)
+    "sentiment_analysis": [
+        ([("transcription_id", ASCENDING), ("model", ASCENDING)], {"unique": True}),
+    ],
+    # Keyset pagination of the analysis history; retention: TTL of failed analyses,
+    # archival by age and the "still referenced" check of old transcriptions
+    "analyses": [
+        ([("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], {}),
+        ([("expire_at", ASCENDING)], {"expireAfterSeconds": 0}),
+        ([("created_at", ASCENDING)], {}),
+        ([("transcription_id", ASCENDING)], {}),
+        # Full-text search (`analysis.search`), newest first without an in-memory sort
+        ([("user_id", ASCENDING), ("search_terms", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], {}),
+    ],
+    # Dashboard rollups (`analysis.rollups`); also the `on` key of the rebuild's `$merge`
+    "aspect_rollups": [
+        ([("user_id", ASCENDING), ("period", ASCENDING), ("bucket", ASCENDING), ("aspect", ASCENDING)],
+         {"unique": True}),
+    ],
+}
+
+# Superseded by the compound indexes above (a prefix of them)
+OBSOLETE_INDEXES = {
+    "transcriptions": ["link_hash_1"],
+}
 
-client = AsyncIOMotorClient(MONGO_URI)
-db = client[DB_NAME]
 
 async def init_indexes():
-    await db.transcriptions.create_index("link_hash")
-    await db.transcriptions.create_index("created_at")
+    """Create the indexes from `INDEXES`; idempotent, run at every startup"""
+    for collection_name, indexes in INDEXES.items():
+        collection = getattr(db, collection_name)
+        for keys, options in indexes:
+            try:
+                await collection.create_index(keys, **options)
+            except OperationFailure as e:
+                # e.g. existing duplicates, which must be merged by hand before a unique index can be built
+                logging.error(f"❌    Could not create index {keys} on {collection_name}: {e}")
 
-    # await db.sentiments.create_index("transcription_id")
\ No newline at end of file
+    for collection_name, names in OBSOLETE_INDEXES.items():
+        collection = getattr(db, collection_name)
+        for name in names:
+            try:
+                await collection.drop_index(name)
+            except OperationFailure:
+                pass  # already dropped
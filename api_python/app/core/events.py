@@ -0,0 +1,121 @@
+import asyncio
+import logging
+from collections import OrderedDict, defaultdict, deque
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Events after which no further events are published for an analysis (or a batch of them)
+TERMINAL_EVENTS = frozenset({
+    "analysis_complete", "analysis_error", "analysis_cancelled",
+    "batch_complete", "batch_error", "batch_cancelled",
+})
+
+Event = Tuple[str, Dict[str, Any]]
+
+
+class AnalysisEventBus:
+    """In-process pub/sub for analysis progress events.
+
+    Every publisher (the analysis pipeline) pushes `(event, data)` tuples keyed
+    by analysis_id; every subscriber (an SSE/NDJSON stream, a socket) gets its
+    own bounded queue. Publishing never blocks: when a slow subscriber's queue
+    is full the oldest pending event is dropped to make room.
+    """
+
+    def __init__(self, max_queue_size: int = 256):
+        self.max_queue_size = max_queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+
+    def subscribe(self, analysis_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._subscribers[analysis_id].add(queue)
+        return queue
+
+    def unsubscribe(self, analysis_id: str, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(analysis_id)
+        if not queues:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[analysis_id]
+
+    def subscriber_count(self, analysis_id: Optional[str] = None) -> int:
+        if analysis_id is not None:
+            return len(self._subscribers.get(analysis_id, ()))
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    def publish(self, analysis_id: str, event: str, data: Dict[str, Any]) -> None:
+        for queue in tuple(self._subscribers.get(analysis_id, ())):
+            if queue.full():
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    pass
+                logger.warning(f"Event queue full for analysis {analysis_id}, dropped oldest event")
+            queue.put_nowait((event, data))
+
+
+class ReplayBuffer:
+    """Bounded in-memory history of recent events per analysis.
+
+    Each recorded event gets a per-analysis sequence number, so a client that
+    reconnects can ask for everything after the last `seq` it saw. Both the number
+    of events kept per analysis and the number of analyses kept are capped; the
+    least recently updated analysis is evicted first.
+    """
+
+    def __init__(self, max_analyses: int = 1000, max_events: int = 64):
+        self.max_analyses = max_analyses
+        self.max_events = max_events
+        self._events: "OrderedDict[str, Deque[Tuple[int, str, Dict[str, Any]]]]" = OrderedDict()
+        self._seq: Dict[str, int] = {}
+
+    def record(self, analysis_id: str, event: str, data: Dict[str, Any], seq: Optional[int] = None) -> Dict[str, Any]:
+        """Store an event and return its data with `seq` added.
+
+        `seq` is assigned here unless given (events relayed from another process).
+        """
+        if seq is None:
+            seq = self._seq.get(analysis_id, 0) + 1
+        self._seq[analysis_id] = max(seq, self._seq.get(analysis_id, 0))
+        data = {**data, "seq": seq}
+        events = self._events.get(analysis_id)
+        if events is None:
+            events = self._events[analysis_id] = deque(maxlen=self.max_events)
+            while len(self._events) > self.max_analyses:
+                evicted, _ = self._events.popitem(last=False)
+                self._seq.pop(evicted, None)
+        else:
+            self._events.move_to_end(analysis_id)
+        events.append((seq, event, data))
+        return data
+
+    def since(self, analysis_id: str, last_seq: int = 0) -> Optional[List[Event]]:
+        """Events after `last_seq`, or None when the analysis is not buffered (or history was truncated)."""
+        events = self._events.get(analysis_id)
+        if events is None:
+            return None
+        if last_seq and events[0][0] > last_seq + 1:
+            return None
+        return [(event, data) for seq, event, data in events if seq > last_seq]
+
+    def forget(self, analysis_id: str) -> None:
+        self._events.pop(analysis_id, None)
+        self._seq.pop(analysis_id, None)
+
+
+def compact_events(events: List[Event]) -> List[Event]:
+    """Collapse a replay into the latest state: one entry per step plus other events, in order."""
+    latest_step: Dict[str, int] = {}
+    for index, (event, data) in enumerate(events):
+        if event == "analysis_step":
+            latest_step[data.get("step", {}).get("step")] = index
+    return [
+        (event, data) for index, (event, data) in enumerate(events)
+        if event != "analysis_step" or latest_step.get(data.get("step", {}).get("step")) == index
+    ]
+
+
+event_bus = AnalysisEventBus()
+replay_buffer = ReplayBuffer()
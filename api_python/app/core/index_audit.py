@@ -0,0 +1,128 @@
+"""
+Index audit: runs explain() on every hot query and fails if any of them is a collection scan.
+
+    python -m app.core.index_audit [--mongo-uri URI] [--db NAME] [--create]
+
+`--create` first builds the indexes from `INDEXES` (what `init_indexes` does at startup).
+Exit code 1 if a query plan contains COLLSCAN; a blocking (in-memory) SORT is reported as a warning.
+"""
+import argparse
+import sys
+from datetime import datetime, timezone
+from typing import Iterator, List, Optional
+
+from bson import ObjectId
+from pymongo import MongoClient
+from pymongo.errors import OperationFailure
+
+from app.core.database import DB_NAME, INDEXES, MONGO_URI
+from app.modules.v1.analysis.history import (
+    DEFAULT_PAGE_SIZE, DETAIL_PROJECTION, HISTORY_SORT, SUMMARY_PROJECTION, encode_cursor, decode_cursor,
+)
+from app.modules.v1.analysis.rollups import ROLLUP_PROJECTION
+from app.modules.v1.analysis.search import SEARCH_PROJECTION
+from app.modules.v1.auth.service import USER_PROJECTION
+
+
+def hot_queries() -> List[dict]:
+    """Query shapes of the request paths, with placeholder values (plans do not depend on them)"""
+    user_id = "audit@example.com"
+    cursor = encode_cursor({"_id": ObjectId(), "created_at": datetime.now(tz=timezone.utc)})
+    return [
+        {"name": "login", "collection": "users",
+         "filter": {"email": user_id}, "projection": USER_PROJECTION, "limit": 1},
+        {"name": "transcription cache", "collection": "transcriptions",
+         "filter": {"link_hash": "0" * 64, "model": "deepgram-nova-2"}, "limit": 1},
+        {"name": "sentiment cache", "collection": "sentiment_analysis",
+         "filter": {"transcription_id": str(ObjectId()), "model": "llama-3.3-70b-versatile"}, "limit": 1},
+        {"name": "history first page", "collection": "analyses",
+         "filter": {"user_id": user_id}, "projection": SUMMARY_PROJECTION,
+         "sort": HISTORY_SORT, "limit": DEFAULT_PAGE_SIZE + 1},
+        {"name": "history next page", "collection": "analyses",
+         "filter": {"user_id": user_id, **decode_cursor(cursor)}, "projection": SUMMARY_PROJECTION,
+         "sort": HISTORY_SORT, "limit": DEFAULT_PAGE_SIZE + 1},
+        {"name": "analysis detail", "collection": "analyses",
+         "filter": {"_id": ObjectId(), "user_id": user_id}, "projection": DETAIL_PROJECTION, "limit": 1},
+        {"name": "search", "collection": "analyses",
+         "filter": {"user_id": user_id, "search_terms": {"$all": ["bater", "iphon"]}}, "projection": SEARCH_PROJECTION,
+         "sort": HISTORY_SORT, "limit": DEFAULT_PAGE_SIZE + 1},
+        {"name": "aspect rollups", "collection": "aspect_rollups",
+         "filter": {"user_id": user_id, "period": "month", "bucket": {"$gte": "2024-01", "$lte": "2024-12"},
+                    "aspect": "bateria"},
+         "projection": ROLLUP_PROJECTION, "sort": [("bucket", 1), ("aspect", 1)]},
+    ]
+
+
+def plan_stages(plan) -> Iterator[dict]:
+    """All stages of an explain() winning plan (classic and slot-based engine output)"""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan
+        for key, value in plan.items():
+            if key != "slotBasedPlan":
+                yield from plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from plan_stages(item)
+
+
+def check_plan(explain: dict) -> dict:
+    """Summary of an explain() result: stage names, used indexes, collection scan / blocking sort flags"""
+    stages = list(plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {})))
+    names = [stage["stage"] for stage in stages]
+    return {
+        "stages": names,
+        "indexes": sorted({stage["indexName"] for stage in stages if stage.get("indexName")}),
+        "collscan": "COLLSCAN" in names,
+        "blocking_sort": "SORT" in names,
+    }
+
+
+def explain_query(database, query: dict) -> dict:
+    cursor = database[query["collection"]].find(query["filter"], query.get("projection"))
+    if query.get("sort"):
+        cursor = cursor.sort(query["sort"])
+    if query.get("limit"):
+        cursor = cursor.limit(query["limit"])
+    return cursor.explain()
+
+
+def create_indexes(database) -> None:
+    for collection_name, indexes in INDEXES.items():
+        for keys, options in indexes:
+            try:
+                database[collection_name].create_index(keys, **options)
+            except OperationFailure as e:
+                print(f"could not create index {keys} on {collection_name}: {e}", file=sys.stderr)
+
+
+def audit(database, queries: Optional[List[dict]] = None) -> bool:
+    """Print the plan of every hot query; returns False if any of them scans a whole collection"""
+    ok = True
+    for query in queries or hot_queries():
+        result = check_plan(explain_query(database, query))
+        status = "FAIL" if result["collscan"] else "ok"
+        ok = ok and not result["collscan"]
+        indexes = ", ".join(result["indexes"]) or "-"
+        print(f"{status:<5} {query['collection'] + ': ' + query['name']:<40} {' > '.join(result['stages']):<40} index: {indexes}")
+        if result["blocking_sort"]:
+            print(f"      warning: in-memory SORT, no index provides the sort order of {query['name']}")
+    return ok
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-uri", default=MONGO_URI)
+    parser.add_argument("--db", default=DB_NAME)
+    parser.add_argument("--create", action="store_true", help="create the indexes from INDEXES first")
+    args = parser.parse_args(argv)
+
+    with MongoClient(args.mongo_uri) as client:
+        database = client[args.db]
+        if args.create:
+            create_indexes(database)
+        return 0 if audit(database) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,254 @@
+"""
+Message bus used to fan analysis events out across server processes.
+
+Socket.IO rooms and the in-process `event_bus` only reach clients connected to the
+current process. When the API runs with several uvicorn workers (or pods), every
+analysis event is published on this bus and each process delivers it to its own
+clients. Backends:
+
+- `local`: single process, messages are delivered in-process only (default)
+- `unix`: workers on one host, datagrams over Unix sockets in a shared directory
+- `mongo`: workers on any host, tailing a capped collection in MongoDB
+"""
+import asyncio
+import datetime
+import glob
+import json
+import logging
+import os
+import socket
+import uuid
+import zlib
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[Dict[str, Any], bool], Awaitable[None]]
+
+
+class MessageBus:
+    """In-process backend; base class of the distributed ones."""
+
+    distributed = False
+
+    def __init__(self):
+        self.node_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._handlers: Dict[str, Handler] = {}
+
+    def on(self, message_type: str, handler: Handler) -> None:
+        """Register the handler of a message type, called as `handler(payload, remote)`."""
+        self._handlers[message_type] = handler
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def publish(self, message_type: str, payload: Dict[str, Any]) -> None:
+        """Deliver locally and (for distributed backends) to every other process."""
+        await self._deliver(message_type, payload, remote=False)
+        if self.distributed:
+            await self._send({"type": message_type, "origin": self.node_id, "payload": payload})
+
+    async def _send(self, message: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    async def _deliver(self, message_type: str, payload: Dict[str, Any], remote: bool) -> None:
+        handler = self._handlers.get(message_type)
+        if handler is None:
+            return
+        try:
+            await handler(payload, remote)
+        except Exception as e:
+            logger.error(f"Message bus handler for '{message_type}' failed: {e}")
+
+    async def _receive(self, message: Dict[str, Any]) -> None:
+        if message.get("origin") == self.node_id:
+            return
+        await self._deliver(message.get("type"), message.get("payload") or {}, remote=True)
+
+
+def _encode(message: Dict[str, Any]) -> bytes:
+    return zlib.compress(json.dumps(message, default=str).encode("utf-8"))
+
+
+def _decode(data: bytes) -> Dict[str, Any]:
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+
+class UnixSocketMessageBus(MessageBus):
+    """Peer-to-peer datagrams between processes on one host.
+
+    Every process binds `<dir>/<pid>-<id>.sock`; publishing sends one datagram to every
+    other socket in the directory. Sockets of dead processes are removed on first
+    failed send. Messages are zlib-compressed JSON.
+    """
+
+    distributed = True
+    BUFFER_SIZE = 4 * 1024 * 1024
+
+    def __init__(self, directory: str):
+        super().__init__()
+        self.directory = directory
+        self.path = os.path.join(directory, f"{os.getpid()}-{self.node_id.rsplit(':', 1)[1]}.sock")
+        self._sock: Optional[socket.socket] = None
+
+    async def start(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        for option in (socket.SO_SNDBUF, socket.SO_RCVBUF):
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, option, self.BUFFER_SIZE)
+            except OSError:
+                pass
+        sock.bind(self.path)
+        sock.setblocking(False)
+        self._sock = sock
+        asyncio.get_running_loop().add_reader(sock.fileno(), self._on_readable)
+        logger.info(f"Unix socket message bus listening on {self.path}")
+
+    async def stop(self) -> None:
+        if self._sock is None:
+            return
+        asyncio.get_running_loop().remove_reader(self._sock.fileno())
+        self._sock.close()
+        self._sock = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _on_readable(self) -> None:
+        while self._sock is not None:
+            try:
+                data = self._sock.recv(self.BUFFER_SIZE)
+            except (BlockingIOError, InterruptedError):
+                return
+            try:
+                message = _decode(data)
+            except Exception as e:
+                logger.warning(f"Dropping malformed bus message: {e}")
+                continue
+            asyncio.ensure_future(self._receive(message))
+
+    async def _send(self, message: Dict[str, Any]) -> None:
+        if self._sock is None:
+            return
+        data = _encode(message)
+        for peer in glob.glob(os.path.join(self.directory, "*.sock")):
+            if peer == self.path:
+                continue
+            try:
+                self._sock.sendto(data, peer)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Process is gone, its socket file is stale
+                try:
+                    os.unlink(peer)
+                except OSError:
+                    pass
+            except BlockingIOError:
+                logger.warning(f"Bus peer {peer} is not keeping up, message dropped")
+            except OSError as e:
+                logger.error(f"Failed to send bus message ({len(data)} bytes) to {peer}: {e}")
+
+
+class MongoMessageBus(MessageBus):
+    """Fan-out through a capped MongoDB collection read with a tailable cursor.
+
+    Works against a standalone mongod (change streams would need a replica set).
+    The capped collection keeps only the most recent messages.
+    """
+
+    distributed = True
+    RETRY_DELAY = 1.0
+    SEEN_WINDOW = 10000
+
+    def __init__(self, collection_name: str, size_bytes: int):
+        super().__init__()
+        self.collection_name = collection_name
+        self.size_bytes = size_bytes
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def collection(self):
+        # Imported lazily so the bus can be configured before the database client exists
+        from app.core.database import db
+        return db[self.collection_name]
+
+    async def _ensure_collection(self) -> None:
+        from app.core.database import db
+        from pymongo.errors import CollectionInvalid
+        try:
+            await db.create_collection(self.collection_name, capped=True, size=self.size_bytes)
+        except CollectionInvalid:
+            pass
+
+    async def start(self) -> None:
+        await self._ensure_collection()
+        # Tail from a fresh marker so old messages are not replayed and the cursor never starts empty
+        marker = await self.collection.insert_one({"type": "_marker", "origin": self.node_id})
+        self._task = asyncio.create_task(self._tail(marker.inserted_id))
+        logger.info(f"Mongo message bus tailing '{self.collection_name}'")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _tail(self, last_id) -> None:
+        from bson import ObjectId
+        from pymongo import CursorType
+        # ObjectIds from different processes are only ordered by their timestamp (seconds),
+        # so (re)start one second back and skip what was already seen
+        seen: Deque = deque(maxlen=self.SEEN_WINDOW)
+        seen_ids = set()
+        while True:
+            try:
+                since = ObjectId.from_datetime(last_id.generation_time - datetime.timedelta(seconds=1))
+                cursor = self.collection.find(
+                    {"_id": {"$gte": since}},
+                    cursor_type=CursorType.TAILABLE_AWAIT,
+                )
+                # Each `async for` ends on an empty (awaited) batch; keep polling while the cursor lives
+                while cursor.alive:
+                    async for doc in cursor:
+                        if doc["_id"] in seen_ids:
+                            continue
+                        if len(seen) == seen.maxlen:
+                            seen_ids.discard(seen[0])
+                        seen.append(doc["_id"])
+                        seen_ids.add(doc["_id"])
+                        last_id = doc["_id"]
+                        if doc.get("type") != "_marker":
+                            await self._receive(doc)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Mongo message bus cursor failed: {e}")
+            await asyncio.sleep(self.RETRY_DELAY)
+
+    async def _send(self, message: Dict[str, Any]) -> None:
+        await self.collection.insert_one(message)
+
+
+def create_message_bus(backend: str) -> MessageBus:
+    if backend == "unix":
+        return UnixSocketMessageBus(settings.EVENT_BUS_UNIX_DIR)
+    if backend == "mongo":
+        return MongoMessageBus(settings.EVENT_BUS_MONGO_COLLECTION, settings.EVENT_BUS_MONGO_SIZE)
+    if backend != "local":
+        raise ValueError(f"Unknown EVENT_BUS_BACKEND: {backend}")
+    return MessageBus()
+
+
+message_bus = create_message_bus(settings.EVENT_BUS_BACKEND)
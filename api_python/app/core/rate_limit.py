@@ -0,0 +1,230 @@
+"""
+Per-client rate limiting (token buckets) and load shedding.
+
+Every request/event belongs to a route class with its own budget
+(`RATE_LIMIT_<CLASS>` = "<burst>/<seconds>") and is charged to the bucket of the
+client IP and, when authenticated, of the user id. When event-loop lag crosses
+`LOAD_SHED_LAG_MS`, classes in `LOAD_SHED_CLASSES` are refused with 503 until it recovers.
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Route classes: auth (bcrypt), analysis (downloads + paid APIs), control (cancel, health), read (default)
+ROUTE_CLASSES: Tuple[Tuple[str, str, str], ...] = (
+    # (method, path prefix, class) - first match wins
+    ("POST", "/api/v1/auth/login", "auth"),
+    ("POST", "/api/v1/auth/register", "auth"),
+    ("POST", "/api/v1/process", "analysis"),
+    ("POST", "/api/v1/transcribe/", "analysis"),
+    ("POST", "/api/v1/sentiment/", "analysis"),
+    ("POST", "/api/v1/analysis/stream", "analysis"),
+    ("POST", "/api/v1/analysis/batch", "analysis"),
+    ("POST", "/api/v1/analysis/", "control"),  # /{id}/cancel
+)
+
+# Not limited here: Socket.IO events are guarded per event in the socket handlers
+EXEMPT_PREFIXES = ("/socket.io",)
+EXEMPT_PATHS = ("/",)
+
+
+def route_class(method: str, path: str) -> str:
+    for route_method, prefix, name in ROUTE_CLASSES:
+        if method == route_method and path.startswith(prefix):
+            return name
+    return "read"
+
+
+def parse_budget(spec: str) -> Tuple[float, float]:
+    """'10/60' -> (capacity 10, refill 10/60 tokens per second)"""
+    count, _, seconds = spec.partition("/")
+    capacity = float(count)
+    return capacity, capacity / float(seconds or 1)
+
+
+class TokenBucket:
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity: float, rate: float, now: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, now: float, cost: float = 1.0) -> float:
+        """Take `cost` tokens; returns 0 if allowed, otherwise seconds until they are available."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate if self.rate else math.inf
+
+
+class RateLimiter:
+    """In-memory token buckets keyed by (route class, client key); least recently used keys are evicted."""
+
+    def __init__(self, budgets: Dict[str, Tuple[float, float]], max_keys: int = 100_000):
+        self.budgets = budgets
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[Tuple[str, str], TokenBucket]" = OrderedDict()
+        self.rejected = 0
+
+    def check(self, route: str, keys: Iterable[Optional[str]], now: Optional[float] = None) -> float:
+        """Charge every key; returns 0 if allowed, else the Retry-After in seconds."""
+        budget = self.budgets.get(route)
+        if budget is None:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        retry_after = 0.0
+        for key in keys:
+            if not key:
+                continue
+            bucket = self._buckets.get((route, key))
+            if bucket is None:
+                bucket = self._buckets[(route, key)] = TokenBucket(*budget, now)
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end((route, key))
+            retry_after = max(retry_after, bucket.take(now))
+        if retry_after:
+            self.rejected += 1
+        return retry_after
+
+    def reset(self) -> None:
+        self._buckets.clear()
+        self.rejected = 0
+
+
+class LoadShedder:
+    """Measures event-loop lag; `overloaded` while it is above the threshold."""
+
+    def __init__(self, threshold: float, interval: float = 0.1, shed_classes: Iterable[str] = ()):
+        self.threshold = threshold
+        self.interval = interval
+        self.shed_classes = set(shed_classes)
+        self.lag = 0.0
+        self.shed = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def overloaded(self) -> bool:
+        return self.threshold > 0 and self.lag > self.threshold
+
+    def should_shed(self, route: str) -> bool:
+        if route in self.shed_classes and self.overloaded:
+            self.shed += 1
+            return True
+        return False
+
+    async def start(self) -> None:
+        if self._task is None and self.threshold > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            was_overloaded = self.overloaded
+            # Rise immediately, decay smoothly so a single quiet tick does not end overload mode
+            self.lag = lag if lag > self.lag else self.lag * 0.7 + lag * 0.3
+            if self.overloaded != was_overloaded:
+                logger.warning(
+                    f"Event loop lag {self.lag * 1000:.0f} ms: load shedding {'ON' if self.overloaded else 'OFF'}"
+                )
+
+
+def _too_many_requests(retry_after: float) -> JSONResponse:
+    seconds = max(1, math.ceil(retry_after))
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Too many requests", "meta": {"retry_after": seconds}},
+        headers={"Retry-After": str(seconds)},
+    )
+
+
+def _overloaded() -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server overloaded, try again later"},
+        headers={"Retry-After": "5"},
+    )
+
+
+def _client_ip(request: Request) -> Optional[str]:
+    return request.client.host if request.client else None
+
+
+def _user_id(request: Request) -> Optional[str]:
+    authorization = request.headers.get("authorization", "")
+    if not authorization.lower().startswith("bearer "):
+        return None
+    # Imported lazily: auth.service imports the database module
+    from app.modules.v1.auth.service import decode_token
+    try:
+        payload = decode_token(authorization[len("bearer "):].strip())
+    except Exception:
+        # Limited by IP like an anonymous client; rejecting the token is up to the endpoint
+        return None
+    return f"user:{payload['sub']}" if isinstance(payload, dict) and payload.get("sub") else None
+
+
+class RateLimitMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        path = request.url.path
+        # CORS preflights are not counted (the actual request is)
+        if not settings.RATE_LIMIT_ENABLED or request.method == "OPTIONS" or path in EXEMPT_PATHS \
+                or path.startswith(EXEMPT_PREFIXES):
+            return await call_next(request)
+
+        route = route_class(request.method, path)
+        if load_shedder.should_shed(route):
+            return _overloaded()
+        retry_after = rate_limiter.check(route, (_client_ip(request), _user_id(request)))
+        if retry_after:
+            return _too_many_requests(retry_after)
+        return await call_next(request)
+
+
+def check_socket_event(route: str, user_id: Optional[str], ip: Optional[str] = None) -> Optional[dict]:
+    """Guard of a Socket.IO event: None if allowed, else the error payload to emit."""
+    if not settings.RATE_LIMIT_ENABLED:
+        return None
+    if load_shedder.should_shed(route):
+        return {"error": "Server overloaded, try again later", "retry_after": 5}
+    retry_after = rate_limiter.check(route, (ip, f"user:{user_id}" if user_id else None))
+    if retry_after:
+        return {"error": "Too many requests", "retry_after": max(1, math.ceil(retry_after))}
+    return None
+
+
+rate_limiter = RateLimiter({
+    "auth": parse_budget(settings.RATE_LIMIT_AUTH),
+    "analysis": parse_budget(settings.RATE_LIMIT_ANALYSIS),
+    "control": parse_budget(settings.RATE_LIMIT_CONTROL),
+    "read": parse_budget(settings.RATE_LIMIT_READ),
+})
+load_shedder = LoadShedder(settings.LOAD_SHED_LAG_MS / 1000, shed_classes=settings.LOAD_SHED_CLASSES.split(","))
@@ -0,0 +1,264 @@
+"""
+Retention of analyses, transcriptions, sentiment results and downloaded audio.
+
+- Failed/cancelled analyses get `expire_at` and are removed by a TTL index
+  (`RETENTION_FAILED_ANALYSES_DAYS`).
+- A background job (`RETENTION_INTERVAL_SECONDS`, one worker at a time via a lease in
+  `maintenance`) removes leftover audio files older than `RETENTION_AUDIO_HOURS`.
+- Opt-in (both 0 = off by default, the archives are not restorable from the app): the job
+  archives completed analyses older than `ARCHIVE_ANALYSES_AFTER_DAYS` and transcriptions
+  older than `ARCHIVE_TRANSCRIPTIONS_AFTER_DAYS` that no analysis references any more to
+  gzipped JSONL files under `ARCHIVE_DIR`, then deletes them; with transcription archiving on,
+  sentiment rows of missing transcriptions are archived and pruned the same way.
+- Sentiment rows have no age to select by, so the orphan check is incremental: every run goes
+  on after the last `_id` checked (checkpoint in `maintenance`) for at most
+  `RETENTION_ORPHAN_SCAN_BATCHES` batches and starts over after the end of the collection.
+- The job works in small batches with a pause between them and waits while the server is
+  overloaded (see `rate_limit.load_shedder`), so it does not compete with live traffic.
+
+Archives are MongoDB Extended JSON (canonical), one document per line, restorable with
+`mongoimport --file <file>` after gunzip.
+"""
+import asyncio
+import gzip
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId, json_util
+from bson.errors import InvalidId
+from fastapi.concurrency import run_in_threadpool
+from pymongo.errors import DuplicateKeyError
+
+from app.core.cache import sentiment_cache, transcription_cache
+from app.core.config import settings
+from app.core.database import db
+from app.core.rate_limit import load_shedder
+from app.modules.v1.transcription.backends import AUTO
+
+logger = logging.getLogger(__name__)
+
+FAILED_STATUSES = ("error", "cancelled")
+LEASE_ID = "retention"
+ORPHAN_CHECKPOINT_ID = "retention:orphaned_sentiment"
+
+
+def failed_expiry(now: Optional[datetime] = None) -> Dict[str, datetime]:
+    """`$set` fields that let the TTL index remove a failed/cancelled analysis (empty if kept forever)"""
+    days = settings.RETENTION_FAILED_ANALYSES_DAYS
+    if days <= 0:
+        return {}
+    return {"expire_at": (now or datetime.utcnow()) + timedelta(days=days)}
+
+
+def write_archive(path: Path, docs: List[dict]) -> None:
+    """Append documents to a gzipped JSONL archive (each append is a complete gzip member)"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    lines = "".join(json_util.dumps(doc, json_options=json_util.CANONICAL_JSON_OPTIONS) + "\n" for doc in docs)
+    with gzip.open(path, "at", encoding="utf-8") as archive:
+        archive.write(lines)
+
+
+def read_archive(path: Path) -> List[dict]:
+    with gzip.open(path, "rt", encoding="utf-8") as archive:
+        return [json_util.loads(line) for line in archive if line.strip()]
+
+
+def _object_ids(values) -> List[ObjectId]:
+    ids = []
+    for value in values:
+        try:
+            ids.append(ObjectId(value))
+        except (InvalidId, TypeError):
+            pass
+    return ids
+
+
+class RetentionJob:
+    def __init__(self):
+        self.node_id = uuid.uuid4().hex
+        self._task: Optional[asyncio.Task] = None
+        self.last_run: Optional[dict] = None
+
+    # --- scheduling -------------------------------------------------------------------
+
+    async def start(self) -> None:
+        if self._task is None and settings.RETENTION_ENABLED and settings.RETENTION_INTERVAL_SECONDS > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        # First pass after startup has settled, then every interval
+        await asyncio.sleep(min(60, settings.RETENTION_INTERVAL_SECONDS))
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌    Retention job failed: {e}")
+            await asyncio.sleep(settings.RETENTION_INTERVAL_SECONDS)
+
+    async def _acquire_lease(self, now: datetime) -> bool:
+        """Only one worker (of any process/host) runs the job per interval"""
+        try:
+            await db.maintenance.find_one_and_update(
+                {"_id": LEASE_ID, "locked_until": {"$lt": now}},
+                {"$set": {
+                    "locked_until": now + timedelta(seconds=settings.RETENTION_INTERVAL_SECONDS),
+                    "owner": self.node_id,
+                }},
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def _throttle(self) -> None:
+        await asyncio.sleep(settings.RETENTION_BATCH_PAUSE_SECONDS)
+        while load_shedder.overloaded:
+            await asyncio.sleep(max(1.0, settings.RETENTION_BATCH_PAUSE_SECONDS))
+
+    # --- passes -----------------------------------------------------------------------
+
+    async def run_once(self, now: Optional[datetime] = None) -> dict:
+        now = now or datetime.utcnow()
+        if not await self._acquire_lease(now):
+            return {"skipped": True}
+        started = time.perf_counter()
+        run_id = f"{now:%Y%m%dT%H%M%S}-{self.node_id[:8]}"
+        stats: Dict[str, Any] = {"run_id": run_id}
+
+        stats["failed_expiry_backfilled"] = await self.backfill_failed_expiry()
+        if settings.ARCHIVE_ANALYSES_AFTER_DAYS > 0:
+            cutoff = now - timedelta(days=settings.ARCHIVE_ANALYSES_AFTER_DAYS)
+            stats["analyses"], _ = await self._archive(
+                "analyses", {"status": "completed", "created_at": {"$lt": cutoff}}, run_id
+            )
+        if settings.ARCHIVE_TRANSCRIPTIONS_AFTER_DAYS > 0:
+            cutoff = now - timedelta(days=settings.ARCHIVE_TRANSCRIPTIONS_AFTER_DAYS)
+            stats["transcriptions"], _ = await self._archive(
+                "transcriptions", {"created_at": {"$lt": cutoff}}, run_id, keep=self._referenced_transcriptions
+            )
+            stats["orphaned_sentiment"] = await self.prune_orphaned_sentiment(run_id, now)
+        stats["audio_files"] = await run_in_threadpool(self.prune_audio)
+
+        stats["seconds"] = round(time.perf_counter() - started, 2)
+        self.last_run = stats
+        logger.info(f"Retention run {run_id}: {stats}")
+        return stats
+
+    async def backfill_failed_expiry(self) -> int:
+        """`expire_at` for failed analyses written before retention existed"""
+        days = settings.RETENTION_FAILED_ANALYSES_DAYS
+        if days <= 0:
+            return 0
+        result = await db.analyses.update_many(
+            {"status": {"$in": list(FAILED_STATUSES)}, "expire_at": {"$exists": False}},
+            [{"$set": {"expire_at": {"$add": [{"$ifNull": ["$created_at", "$$NOW"]}, days * 86400 * 1000]}}}],
+        )
+        return result.modified_count
+
+    async def prune_orphaned_sentiment(self, run_id: str, now: datetime) -> int:
+        """Archive sentiment rows of missing transcriptions among the next batches after the checkpoint"""
+        checkpoint = await db.maintenance.find_one({"_id": ORPHAN_CHECKPOINT_ID}) or {}
+        archived, last_id = await self._archive(
+            "sentiment_analysis", {}, run_id, keep=self._sentiment_with_transcription,
+            after=checkpoint.get("last_id"), max_batches=settings.RETENTION_ORPHAN_SCAN_BATCHES,
+        )
+        await db.maintenance.update_one(
+            {"_id": ORPHAN_CHECKPOINT_ID}, {"$set": {"last_id": last_id, "updated_at": now}}, upsert=True
+        )
+        return archived
+
+    async def _archive(
+        self, collection_name: str, query: dict, run_id: str, keep=None, after=None, max_batches: int = 0
+    ) -> Tuple[int, Any]:
+        """
+        Archive and delete matching documents in `_id` order, batch by batch, starting after `after`.
+        `keep(docs)` returns the ids among a batch that must stay (e.g. still referenced).
+        Stops after `max_batches` batches (0 = all); returns the number archived and the last `_id`
+        checked, None when the end was reached.
+        """
+        collection = getattr(db, collection_name)
+        path = Path(settings.ARCHIVE_DIR) / collection_name / f"{run_id}.jsonl.gz"
+        archived = 0
+        last_id = after
+        batches = 0
+        while True:
+            batch_query = {**query, "_id": {"$gt": last_id}} if last_id is not None else query
+            docs = await collection.find(batch_query).sort("_id", 1).limit(settings.RETENTION_BATCH_SIZE) \
+                .to_list(settings.RETENTION_BATCH_SIZE)
+            if not docs:
+                return archived, None
+            last_id = docs[-1]["_id"]
+            batches += 1
+            kept = await keep(docs) if keep else set()
+            expired = [doc for doc in docs if doc["_id"] not in kept]
+            if expired:
+                # Written (and closed) before anything is deleted
+                await run_in_threadpool(write_archive, path, expired)
+                await collection.delete_many({"_id": {"$in": [doc["_id"] for doc in expired]}})
+                self._invalidate(collection_name, expired)
+                archived += len(expired)
+            if len(docs) < settings.RETENTION_BATCH_SIZE:
+                return archived, None
+            if max_batches and batches >= max_batches:
+                return archived, last_id
+            await self._throttle()
+
+    async def _referenced_transcriptions(self, docs: List[dict]) -> set:
+        ids = [str(doc["_id"]) for doc in docs]
+        referenced = set(await db.analyses.distinct("transcription_id", {"transcription_id": {"$in": ids}}))
+        return {doc["_id"] for doc in docs if str(doc["_id"]) in referenced}
+
+    async def _sentiment_with_transcription(self, docs: List[dict]) -> set:
+        ids = _object_ids(doc.get("transcription_id") for doc in docs)
+        existing = await db.transcriptions.find({"_id": {"$in": ids}}, {"_id": 1}).to_list(None)
+        existing = {str(doc["_id"]) for doc in existing}
+        return {doc["_id"] for doc in docs if doc.get("transcription_id") in existing}
+
+    @staticmethod
+    def _invalidate(collection_name: str, docs: List[dict]) -> None:
+        # This process only; other workers drop the entries within the cache TTL
+        for doc in docs:
+            if collection_name == "transcriptions":
+                transcription_cache.invalidate((doc.get("link_hash"), doc.get("model")))
+                # `auto` requests cache whichever engine's transcription they found
+                transcription_cache.invalidate((doc.get("link_hash"), AUTO))
+            elif collection_name == "sentiment_analysis":
+                sentiment_cache.invalidate((doc.get("transcription_id"), doc.get("model")))
+
+    @staticmethod
+    def prune_audio(audio_dir: Optional[Path] = None) -> int:
+        """Remove downloaded audio left behind (e.g. by failed analyses)"""
+        hours = settings.RETENTION_AUDIO_HOURS
+        if hours <= 0:
+            return 0
+        if audio_dir is None:
+            from app.modules.v1.downloader.downloader import RESOURCES_DIR
+            audio_dir = RESOURCES_DIR
+        cutoff = time.time() - hours * 3600
+        removed = 0
+        for path in Path(audio_dir).glob("*"):
+            try:
+                if path.is_file() and path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+
+retention_job = RetentionJob()
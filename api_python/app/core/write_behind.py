@@ -0,0 +1,159 @@
+"""
+Write-behind buffer of per-document updates (analysis steps and status).
+
+Pipeline steps are appended to `steps` of the analysis document, but not one write per
+step: updates are coalesced per document (`$set` fields merged, steps appended, repeated
+updates of the same step/status replaced) and flushed as one unordered `bulk_write` when
+`WRITE_BEHIND_FLUSH_SECONDS` passed since the first pending update or
+`WRITE_BEHIND_MAX_PENDING` documents are waiting. Terminal states go through `finish`,
+which writes the pending updates together with the final fields and waits for it.
+"""
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from app.core.config import settings
+from app.core.database import db
+
+logger = logging.getLogger(__name__)
+
+
+class _Pending:
+    __slots__ = ("set", "steps")
+
+    def __init__(self):
+        self.set: Dict[str, Any] = {}
+        self.steps: List[dict] = []
+
+    def merge(self, newer: "_Pending") -> None:
+        self.set.update(newer.set)
+        self.steps.extend(newer.steps)
+
+    def update(self) -> dict:
+        update: Dict[str, Any] = {}
+        if self.set:
+            update["$set"] = self.set
+        if self.steps:
+            update["$push"] = {"steps": {"$each": self.steps}}
+        return update
+
+
+class WriteBehindBuffer:
+    def __init__(self, collection_name: str, flush_interval: float, max_pending: int):
+        self.collection_name = collection_name
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: Dict[Any, _Pending] = {}
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._flushing: Optional[asyncio.Task] = None
+        self.updates = 0
+        self.writes = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.flush_interval > 0
+
+    def _entry(self, doc_id) -> _Pending:
+        if doc_id not in self._pending:
+            self._pending[doc_id] = _Pending()
+        return self._pending[doc_id]
+
+    @staticmethod
+    def _add(entry: _Pending, fields: Optional[dict], step: Optional[dict]) -> None:
+        if fields:
+            entry.set.update(fields)
+        if step:
+            last = entry.steps[-1] if entry.steps else None
+            if last and (last["step"], last["status"]) == (step["step"], step["status"]):
+                entry.steps[-1] = step
+            else:
+                entry.steps.append(step)
+
+    async def update(self, doc_id, fields: Optional[dict] = None, step: Optional[dict] = None) -> None:
+        """Queue `$set` of `fields` and/or appending `step` to the document's `steps`."""
+        self.updates += 1
+        self._add(self._entry(doc_id), fields, step)
+        if not self.enabled:
+            await self.flush()
+        elif len(self._pending) >= self.max_pending:
+            self._start_flush()
+        elif self._handle is None:
+            self._handle = asyncio.get_running_loop().call_later(self.flush_interval, self._start_flush)
+
+    def _start_flush(self) -> None:
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        loop = asyncio.get_running_loop()
+        if self._flushing is not None and not self._flushing.done():
+            # One bulk write at a time, the rest goes with the next one
+            self._handle = loop.call_later(self.flush_interval, self._start_flush)
+            return
+        self._flushing = loop.create_task(self.flush())
+
+    async def flush(self) -> None:
+        """Write every pending update as one unordered bulk write."""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        ids = list(pending)
+        requests = [UpdateOne({"_id": doc_id}, pending[doc_id].update()) for doc_id in ids]
+        collection = getattr(db, self.collection_name)
+        try:
+            await collection.bulk_write(requests, ordered=False)
+            self.writes += 1
+        except BulkWriteError as e:
+            # Per-document errors (e.g. validation) would fail again, they are dropped
+            failed = {error["index"] for error in e.details.get("writeErrors", [])}
+            logger.error(f"❌    Write-behind to {self.collection_name}: {len(failed)} of {len(ids)} updates failed")
+        except PyMongoError as e:
+            # Connection problems: keep the updates (before newer ones) for the next flush
+            logger.error(f"❌    Write-behind to {self.collection_name} failed, retrying later: {e}")
+            self._requeue(pending)
+
+    def _requeue(self, pending: Dict[Any, _Pending]) -> None:
+        for doc_id, entry in pending.items():
+            newer = self._pending.get(doc_id)
+            if newer:
+                entry.merge(newer)
+            self._pending[doc_id] = entry
+        if self._handle is None and self.enabled:
+            self._handle = asyncio.get_running_loop().call_later(self.flush_interval, self._start_flush)
+
+    async def finish(self, doc_id, fields: dict, step: Optional[dict] = None) -> None:
+        """Write the terminal `fields` (and `step`) together with the document's pending updates, now."""
+        if self._flushing is not None and not self._flushing.done():
+            # Earlier steps of the document may be in the bulk write being sent
+            await asyncio.shield(self._flushing)
+        entry = self._pending.pop(doc_id, None) or _Pending()
+        self._add(entry, fields, step)
+        self.updates += 1
+        await getattr(db, self.collection_name).update_one({"_id": doc_id}, entry.update())
+        self.writes += 1
+
+    async def stop(self) -> None:
+        """Flush what is left (server shutdown)."""
+        if self._flushing is not None and not self._flushing.done():
+            await self._flushing
+        await self.flush()
+
+    def clear(self) -> None:
+        """Drop pending updates without writing them."""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self._pending.clear()
+
+    def stats(self) -> dict:
+        return {"pending": len(self._pending), "updates": self.updates, "writes": self.writes}
+
+
+analysis_writer = WriteBehindBuffer(
+    "analyses", settings.WRITE_BEHIND_FLUSH_SECONDS, settings.WRITE_BEHIND_MAX_PENDING
+)
@@ -9,9 +9,17 @@ import logging
 from app.modules.v1.transcription.router import router as transcribe_router
 from app.modules.v1.sentiment.router import router as sentiment_router
 from app.modules.v1.auth.router import router as auth_router
+from app.modules.v1.analysis.router import router as analysis_router
 
 # Importy Core
-from app.core.database import init_indexes
+from app.core.database import connect_db, close_db, init_indexes
+from app.core.message_bus import message_bus
+from app.core.rate_limit import RateLimitMiddleware, load_shedder
+from app.core.cache import cache_stats
+from app.core.retention import retention_job
+from app.core.write_behind import analysis_writer
+from app.modules.v1.auth.service import shutdown_password_pool
+from app.modules.v1.transcription.service import transcription_backends
 from app.core.exceptions import AppException
 from app.socketio_handler import mount_socketio
 
@@ -27,12 +35,25 @@ logger = logging.getLogger(__name__)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    await connect_db()
     await init_indexes()
     logger.info("✅ MongoDB connected and indexes initialized!")
+    await message_bus.start()
+    await load_shedder.start()
+    await retention_job.start()
     yield
+    await retention_job.stop()
+    await analysis_writer.stop()
+    await load_shedder.stop()
+    await message_bus.stop()
+    shutdown_password_pool()
+    transcription_backends.close()
+    await close_db()
 
 app = FastAPI(title="Video Sentiment Analyzer", lifespan=lifespan)
 
+# Added first = inner: CORS wraps the limiter, so its 429/503 responses carry the CORS headers
+app.add_middleware(RateLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000"],
@@ -46,6 +67,7 @@ mount_socketio(app)
 app.include_router(auth_router, prefix="/api/v1/auth", tags=["Authentication v1"])
 app.include_router(transcribe_router, prefix="/api/v1/transcribe", tags=["Transcription v1"])
 app.include_router(sentiment_router, prefix="/api/v1/sentiment", tags=["Sentiment Analysis v1"])
+app.include_router(analysis_router, prefix="/api/v1/analysis", tags=["Analysis Stream v1"])
 
 app.add_exception_handler(AppException, app_exception_handler)
 app.add_exception_handler(RequestValidationError, validation_exception_handler)
@@ -56,12 +78,17 @@ app.add_exception_handler(Exception, global_exception_handler)
 def root():
     return {"message": "Welcome to Video Sentiment Analyzer API 🚀"}
 
+@app.get("/api/v1/cache/stats")
+def cache_statistics():
+    """Hit/miss/eviction counters of this worker's transcription and sentiment caches"""
+    return cache_stats()
+
 from app.modules.v1.transcription.schemas import TranscriptionRequest
-from app.modules.v1.transcription.service import transcribe_video
+from app.modules.v1.transcription.service import transcribe_video, word_timings_of
 from app.modules.v1.sentiment.service import analyze
 @app.post("/api/v1/process")
 async def process(request: TranscriptionRequest):
     result = await transcribe_video(request.url, model_name=request.model)
     string_id = str(result.id)
-    analysis = await analyze(string_id)
+    analysis = await analyze(string_id, transcription_text=result.transcription, word_timings=word_timings_of(result))
     return {"transcription": result, "sentiment_analysis": analysis}
\ No newline at end of file
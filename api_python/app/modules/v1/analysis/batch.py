@@ -0,0 +1,150 @@
+"""
+Batch submissions: a list of video, playlist and channel URLs analyzed as one job.
+
+1. Every source URL is expanded with yt-dlp flat extraction (`downloader.expand_url`), up to
+   `BATCH_MAX_ENTRIES` videos in total.
+2. Videos are deduplicated by their canonical key (YouTube video id, otherwise the URL), so a
+   video listed in two playlists or submitted as `youtu.be/...` and `watch?v=...` runs once.
+3. Videos whose transcription is already stored (by the canonical URL or the submitted one)
+   are marked `cached` and analyzed with that URL, so they skip download and transcription.
+4. The pipeline runs each video as a regular analysis (`batch_id` set), `BATCH_CONCURRENCY`
+   at a time; their events are folded into one stream of the batch (see
+   `pipeline.process_batch`) ending with `batch_complete`: every entry with its
+   analysis id and status, plus the per-aspect sentiment of all of them combined.
+
+The batch itself is stored in `batches`.
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.database import db
+from app.core.exceptions import DownloadError
+from app.modules.v1.downloader.downloader import expand_url
+from app.modules.v1.transcription.service import transcription_backends
+from app.utils.helpers import hash_url
+
+BATCH_PROJECTION = {"user_id": 0}
+# Fields needed to rebuild the final event of a finished batch
+BATCH_FINAL_PROJECTION = {"status": 1, "entries": 1, "errors": 1, "summary": 1, "error": 1}
+RUNNING_STATUSES = ("expanding", "processing")
+
+
+def entry_key(entry: dict) -> str:
+    return entry.get("video_id") or hash_url(entry["url"])
+
+
+async def expand_sources(sources: Iterable[str], max_entries: int) -> Tuple[List[dict], List[dict]]:
+    """Unique videos of the source URLs in submission order, and `{"source", "error"}` of unlistable ones"""
+    entries: List[dict] = []
+    errors: List[dict] = []
+    seen = set()
+    for source in sources:
+        if len(entries) >= max_entries:
+            break
+        try:
+            videos = await run_in_threadpool(expand_url, source, max_entries - len(entries))
+        except DownloadError as e:
+            errors.append({"source": source, "error": str(e)})
+            continue
+        for video in videos:
+            key = entry_key(video)
+            if key in seen:
+                continue
+            seen.add(key)
+            # The submitted URL of a single video is kept: earlier analyses may have cached it under that form
+            submitted = source if len(videos) == 1 else None
+            entries.append({**video, "source": source, "submitted_url": submitted})
+    return entries[:max_entries], errors
+
+
+async def mark_cached(entries: List[dict], model: str) -> None:
+    """Set `cached` on entries with a stored transcription and switch their `url` to the cached form"""
+    candidates: Dict[str, Tuple[int, str]] = {}
+    for index, entry in enumerate(entries):
+        for url in filter(None, (entry["url"], entry.pop("submitted_url", None))):
+            candidates.setdefault(hash_url(url), (index, url))
+    found = await db.transcriptions.find(
+        {"link_hash": {"$in": list(candidates)}, "model": transcription_backends.model_filter(model)}, {"link_hash": 1}
+    ).to_list(None) if candidates else []
+    for entry in entries:
+        entry["cached"] = False
+    for doc in found:
+        index, url = candidates[doc["link_hash"]]
+        entries[index].update(cached=True, url=url)
+
+
+def combine_digests(digests: Iterable[Optional[dict]]) -> dict:
+    """Per-aspect sentiment of several analyses: summed counts, score (-1..1) over all of them"""
+    aspects: Dict[str, dict] = {}
+    for digest in digests:
+        for aspect, counts in ((digest or {}).get("aspects") or {}).items():
+            total = aspects.setdefault(aspect, {"analyses": 0, "positive": 0, "negative": 0, "neutral": 0})
+            total["analyses"] += 1
+            for label in ("positive", "negative", "neutral"):
+                total[label] += counts.get(label, 0)
+    for total in aspects.values():
+        mentions = total["positive"] + total["negative"] + total["neutral"]
+        total["score"] = round((total["positive"] - total["negative"]) / mentions, 3) if mentions else 0.0
+    return {"aspects": aspects}
+
+
+def summarize(entries: List[dict], digests: Iterable[Optional[dict]]) -> dict:
+    statuses = [entry.get("status") for entry in entries]
+    return {
+        "total": len(entries),
+        "completed": statuses.count("completed"),
+        "failed": statuses.count("error"),
+        "cancelled": statuses.count("cancelled"),
+        "cached": sum(1 for entry in entries if entry.get("cached")),
+        "sentiment_digest": combine_digests(digests),
+    }
+
+
+async def create_batch(batch_oid: ObjectId, user_id: str, sources: List[str], model: str) -> None:
+    await db.batches.insert_one({
+        "_id": batch_oid,
+        "user_id": user_id,
+        "sources": sources,
+        "model": model,
+        "status": "expanding",
+        "entries": [],
+        "created_at": datetime.utcnow(),
+    })
+
+
+async def update_batch(batch_oid: ObjectId, fields: dict) -> None:
+    await db.batches.update_one({"_id": batch_oid}, {"$set": fields})
+
+
+def final_batch_event(doc: dict) -> Optional[Tuple[str, dict]]:
+    """Rebuild the terminal event of a finished batch document, as `process_batch` emitted it"""
+    batch_id = str(doc["_id"])
+    if doc.get("status") == "completed":
+        return "batch_complete", {
+            "batch_id": batch_id,
+            "entries": doc.get("entries") or [],
+            "errors": doc.get("errors") or [],
+            "summary": doc.get("summary"),
+        }
+    if doc.get("status") == "cancelled":
+        return "batch_cancelled", {"batch_id": batch_id, "entries": doc.get("entries") or []}
+    if doc.get("status") == "error":
+        return "batch_error", {"batch_id": batch_id, "error": doc.get("error") or "Batch failed"}
+    return None
+
+
+async def get_batch(user_id: str, batch_id: str) -> Optional[dict]:
+    """Stored batch of the user (entries, status and, once finished, `summary`)"""
+    try:
+        oid = ObjectId(batch_id)
+    except (InvalidId, TypeError):
+        return None
+    doc = await db.batches.find_one({"_id": oid, "user_id": user_id}, BATCH_PROJECTION)
+    if doc is None:
+        return None
+    doc["batch_id"] = str(doc.pop("_id"))
+    return doc
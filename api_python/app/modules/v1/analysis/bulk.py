@@ -0,0 +1,299 @@
+"""
+Offline bulk processing of video URLs (nightly backfills), without the web server:
+
+    python -m app.modules.v1.analysis.bulk urls.txt -o results.jsonl -w 4
+
+Every URL of the input file (one per line, `#` comments) goes through the same services as
+an analysis - `transcribe_video` (download with `download_audio`, Deepgram) and `analyze` -
+in `--workers` processes, each with its own event loop and MongoDB client. Transcriptions and
+sentiment results are stored in MongoDB as usual (and reused: stored ones are cache hits);
+one JSON record per URL is appended to the output.
+
+Without `--user` the runs only fill the shared transcription and sentiment stores: nobody's
+history, /search or /rollups show them. `--user <user id>` also saves every completed URL as a
+completed analysis of that user, with its `sentiment_digest`, `search_terms` and rollup counts
+like an analysis made in the app.
+
+Completed URLs are appended to the checkpoint file (`<output>.done` by default) after their
+record is written, so a rerun skips them and retries only failed or unfinished ones. A video
+is identified by its YouTube id, so other URL forms of it are skipped too.
+
+Provider limits: the sentiment calls of all workers share `--sentiment-rpm` / `--sentiment-tpm`
+(defaults `BACKFILL_REQUESTS_PER_MINUTE` / `BACKFILL_TOKENS_PER_MINUTE`, split evenly between
+the workers); each worker transcribes one file at a time, so Deepgram sees at most `--workers`
+concurrent requests. The summary reports throughput, cache hits and time per stage.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+from app.core.concurrency import stage_limiter
+from app.core.config import settings
+from app.core.database import close_db, connect_db, db
+from app.modules.v1.sentiment.backfill import ProviderLimiter, estimate_tokens
+from app.modules.v1.sentiment.service import DEFAULT_MODEL as SENTIMENT_MODEL, analyze, get_saved_results
+from app.modules.v1.transcription.service import transcribe_video, word_timings_of
+from app.utils.helpers import youtube_video_id
+from . import history, rollups, search
+from .schemas import VideoAnalysis
+
+STAGES = ("download", "transcription", "sentiment")
+
+# State of a worker process: event loop (with its MongoDB client) and its share of the provider limits
+_worker: Dict[str, object] = {}
+
+
+def url_key(url: str) -> str:
+    return youtube_video_id(url) or url
+
+
+def read_urls(path: Path) -> List[str]:
+    """URLs of the input file in order, without blank lines, comments and repeated videos"""
+    urls, seen = [], set()
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        url = line.strip()
+        if not url or url.startswith("#") or url_key(url) in seen:
+            continue
+        seen.add(url_key(url))
+        urls.append(url)
+    return urls
+
+
+def read_checkpoint(path: Path) -> Set[str]:
+    if not Path(path).exists():
+        return set()
+    return {line.strip() for line in Path(path).read_text(encoding="utf-8").splitlines() if line.strip()}
+
+
+def _stage_counters() -> Dict[str, tuple]:
+    return {stage: (stage_limiter.completed.get(stage, 0), stage_limiter.busy_seconds.get(stage, 0.0))
+            for stage in STAGES}
+
+
+async def save_analysis(user_id: str, url: str, transcription, sentiment_model: str, sentiment: dict) -> str:
+    """Completed analysis of the user for a processed URL, stored as the app stores one; returns its id"""
+    now = datetime.utcnow()
+    analysis = VideoAnalysis(
+        url=url,
+        title=transcription.title,
+        status="completed",
+        transcription_id=str(transcription.id),
+        sentiment_model=sentiment_model,
+        created_at=now,
+        completed_at=now,
+        user_id=user_id,
+    )
+    sentiment_payload = {"message": sentiment}
+    digest = history.sentiment_digest(sentiment_payload)
+    result = await db.analyses.insert_one({
+        **analysis.model_dump(exclude={"id"}),
+        "sentiment_digest": digest,
+        "search_terms": search.document_terms(transcription.title, transcription.transcription, sentiment_payload),
+    })
+    try:
+        await rollups.record_analysis(user_id, now, digest)
+    except Exception as e:
+        # Not retried with the URL (that would save the analysis twice); `rollups --rebuild` catches up
+        logging.error(f"Rollup update of analysis {result.inserted_id} failed: {e}")
+    return str(result.inserted_id)
+
+
+async def process_url(
+    url: str,
+    model: str = "deepgram-nova-2",
+    sentiment_model: str = SENTIMENT_MODEL,
+    limiter: Optional[ProviderLimiter] = None,
+    user_id: Optional[str] = None,
+) -> dict:
+    """
+    Transcribe and analyze one URL; returns its output record.\n
+    With `user_id` the result is also saved as an analysis of that user (`save_analysis`).\n
+    Per-stage seconds and cache hits come from the stage slots it used (one URL at a time per process).
+    """
+    record: dict = {"url": url, "key": url_key(url)}
+    before, started = _stage_counters(), time.perf_counter()
+    try:
+        transcription = await transcribe_video(url, model_name=model)
+        transcription_id = str(transcription.id)
+        stored = await get_saved_results(transcription_id, sentiment_model)
+        if stored is None and limiter is not None:
+            await limiter.acquire(sum(estimate_tokens(transcription.transcription or "")))
+        sentiment = await analyze(transcription_id, sentiment_model, transcription_text=transcription.transcription,
+                                  word_timings=word_timings_of(transcription))
+        if sentiment is None:
+            raise RuntimeError("Sentiment analysis failed")
+        record.update(
+            status="completed",
+            title=transcription.title,
+            transcription_id=transcription_id,
+            sentiment_model=sentiment_model,
+            sentiment_digest=history.sentiment_digest(sentiment),
+            sentiment=sentiment,
+        )
+        if user_id:
+            record["analysis_id"] = await save_analysis(user_id, url, transcription, sentiment_model, sentiment)
+    except Exception as e:
+        record.update(status="error", error=str(e))
+        stored = None
+    after = _stage_counters()
+    used = {stage: after[stage][0] - before[stage][0] for stage in STAGES}
+    record["seconds"] = {stage: round(after[stage][1] - before[stage][1], 3) for stage in STAGES}
+    record["seconds"]["total"] = round(time.perf_counter() - started, 3)
+    if record["status"] == "completed":
+        record["cache"] = {"transcription": used["download"] == 0, "sentiment": stored is not None}
+    return record
+
+
+def _init_worker(sentiment_rpm: float, sentiment_tpm: float) -> None:
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(connect_db())
+    _worker.update(loop=loop, limiter=ProviderLimiter(sentiment_rpm, sentiment_tpm))
+
+
+def _run_in_worker(url: str, model: str, sentiment_model: str, user_id: Optional[str] = None) -> dict:
+    return _worker["loop"].run_until_complete(
+        process_url(url, model, sentiment_model, _worker["limiter"], user_id=user_id)
+    )
+
+
+class BulkSummary:
+    def __init__(self, total: int, skipped: int):
+        self.total = total
+        self.skipped = skipped
+        self.completed = 0
+        self.failed = 0
+        self.cache_hits = {"transcription": 0, "sentiment": 0}
+        self.stage_seconds = {stage: 0.0 for stage in STAGES}
+        self.started = time.perf_counter()
+
+    def add(self, record: dict) -> None:
+        if record.get("status") != "completed":
+            self.failed += 1
+            return
+        self.completed += 1
+        for name, hit in record.get("cache", {}).items():
+            self.cache_hits[name] += bool(hit)
+        for stage in STAGES:
+            self.stage_seconds[stage] += record.get("seconds", {}).get(stage, 0.0)
+
+    def report(self) -> dict:
+        elapsed = time.perf_counter() - self.started
+        processed = self.completed + self.failed
+        return {
+            "urls": self.total,
+            "skipped": self.skipped,
+            "completed": self.completed,
+            "failed": self.failed,
+            "seconds": round(elapsed, 1),
+            "per_minute": round(processed / elapsed * 60, 2) if elapsed else 0.0,
+            "cache_hits": self.cache_hits,
+            # Time spent in each stage (summed over workers) and per completed URL
+            "stages": {
+                stage: {"total": round(seconds, 1),
+                        "mean": round(seconds / self.completed, 2) if self.completed else 0.0}
+                for stage, seconds in self.stage_seconds.items()
+            },
+        }
+
+
+def run(
+    input_path: Path,
+    output_path: Path,
+    checkpoint_path: Optional[Path] = None,
+    workers: int = 4,
+    model: str = "deepgram-nova-2",
+    sentiment_model: str = SENTIMENT_MODEL,
+    sentiment_rpm: Optional[float] = None,
+    sentiment_tpm: Optional[float] = None,
+    report=print,
+    user_id: Optional[str] = None,
+) -> dict:
+    """
+    Process the URLs of `input_path` not in the checkpoint; `workers=0` runs them in this process.\n
+    `user_id` saves the completed ones as analyses of that user.
+    """
+    checkpoint_path = Path(checkpoint_path or f"{output_path}.done")
+    urls = read_urls(input_path)
+    done = read_checkpoint(checkpoint_path)
+    todo = [url for url in urls if url_key(url) not in done]
+    summary = BulkSummary(len(urls), len(urls) - len(todo))
+    shares = max(1, workers)
+    rpm = (settings.BACKFILL_REQUESTS_PER_MINUTE if sentiment_rpm is None else sentiment_rpm) / shares
+    tpm = (settings.BACKFILL_TOKENS_PER_MINUTE if sentiment_tpm is None else sentiment_tpm) / shares
+    report(f"{len(todo)} URLs to process ({summary.skipped} done earlier) with {workers or 'no'} worker processes")
+
+    with open(output_path, "a", encoding="utf-8") as output, open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+        def save(record: dict) -> None:
+            # Record first: a crash in between repeats the URL on the next run instead of losing it
+            output.write(json.dumps(record, default=str, ensure_ascii=False) + "\n")
+            output.flush()
+            if record["status"] == "completed":
+                checkpoint.write(record["key"] + "\n")
+                checkpoint.flush()
+            summary.add(record)
+            processed = summary.completed + summary.failed
+            report(f"[{processed}/{len(todo)}] {record['status']:9} {record['url']} "
+                   f"({record['seconds']['total']:.1f} s){' - ' + record['error'] if 'error' in record else ''}")
+
+        if workers <= 0:
+            _init_worker(rpm, tpm)
+            try:
+                for url in todo:
+                    save(_run_in_worker(url, model, sentiment_model, user_id))
+            finally:
+                _worker["loop"].run_until_complete(close_db())
+                _worker["loop"].close()
+                _worker.clear()
+                asyncio.set_event_loop(None)
+        else:
+            # spawn: workers must not inherit the parent's threads or client state
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                                     initargs=(rpm, tpm)) as pool:
+                futures = {pool.submit(_run_in_worker, url, model, sentiment_model, user_id): url for url in todo}
+                for future in as_completed(futures):
+                    try:
+                        record = future.result()
+                    except Exception as e:
+                        # The worker process died (e.g. out of memory); the URL is retried next run
+                        url = futures[future]
+                        record = {"url": url, "key": url_key(url), "status": "error", "error": str(e),
+                                  "seconds": {"total": 0.0}}
+                    save(record)
+
+    result = summary.report()
+    report(f"Done at {datetime.now():%H:%M:%S}: {json.dumps(result)}")
+    return result
+
+
+def main(argv: Optional[Iterable[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Transcribe and analyze a list of video URLs without the server. Results are stored as "
+                    "transcriptions and sentiment results only; pass --user to also save them as that user's "
+                    "analyses (history, search, rollups)."
+    )
+    parser.add_argument("input", type=Path, help="file with one URL per line")
+    parser.add_argument("-o", "--output", type=Path, default=Path("results.jsonl"), help="JSONL records (appended)")
+    parser.add_argument("--checkpoint", type=Path, default=None, help="completed URLs (default: <output>.done)")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="worker processes (0: run in this process)")
+    parser.add_argument("--model", default="deepgram-nova-2", help="transcription model")
+    parser.add_argument("--sentiment-model", default=SENTIMENT_MODEL)
+    parser.add_argument("--sentiment-rpm", type=float, default=None, help="default: BACKFILL_REQUESTS_PER_MINUTE")
+    parser.add_argument("--sentiment-tpm", type=float, default=None, help="default: BACKFILL_TOKENS_PER_MINUTE")
+    parser.add_argument("--user", default=None, help="user id to save the completed URLs as analyses of")
+    args = parser.parse_args(argv)
+    result = run(args.input, args.output, args.checkpoint, args.workers, args.model, args.sentiment_model,
+                 args.sentiment_rpm, args.sentiment_tpm, user_id=args.user)
+    return 0 if not result["failed"] else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,132 @@
+import base64
+from datetime import datetime
+from typing import Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from app.core.compression import TEXT_PROJECTION, unpack_text
+from app.core.database import db
+from app.modules.v1.sentiment.service import get_saved_results
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# History list: no transcription/sentiment payloads, those are fetched by `get_analysis_detail`
+SUMMARY_PROJECTION = {
+    "url": 1,
+    "title": 1,
+    "status": 1,
+    "created_at": 1,
+    "completed_at": 1,
+    "sentiment_digest": 1,
+}
+
+# Detail view: everything but the step history and the search terms
+DETAIL_PROJECTION = {"steps": 0, "search_terms": 0}
+
+# Newest first; (user_id, created_at, _id) is covered by the compound index from `init_indexes`
+HISTORY_SORT = [("created_at", -1), ("_id", -1)]
+
+SENTIMENT_LABELS = {"pozytywny": "positive", "negatywny": "negative", "neutralny": "neutral"}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def sentiment_digest(sentiment: Optional[dict]) -> dict:
+    """
+    Per-aspect counts and score (-1..1) of a sentiment payload, stored with the analysis
+    so the history list can show it without loading the payload itself.
+    """
+    message = sentiment.get("message", sentiment) if isinstance(sentiment, dict) else None
+    results = message.get("results", message) if isinstance(message, dict) else None
+    aspects = {}
+    for aspect, data in (results if isinstance(results, dict) else {}).items():
+        if not isinstance(data, dict) or not data.get("sentiments"):
+            continue
+        counts = {"positive": 0, "negative": 0, "neutral": 0}
+        for item in data["sentiments"]:
+            label = SENTIMENT_LABELS.get(item.get("sentiment"))
+            if label:
+                counts[label] += 1
+        total = sum(counts.values())
+        if total:
+            aspects[aspect] = {**counts, "score": round((counts["positive"] - counts["negative"]) / total, 3)}
+    return {"aspects": aspects}
+
+
+def encode_cursor(doc: dict) -> str:
+    raw = f"{doc['created_at'].isoformat()}|{doc['_id']}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> dict:
+    """Keyset filter for the page after `cursor` (older than the last returned analysis)."""
+    try:
+        created_at, oid = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        created_at, oid = datetime.fromisoformat(created_at), ObjectId(oid)
+    except Exception:
+        raise InvalidCursor("Invalid cursor")
+    return {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "_id": {"$lt": oid}},
+    ]}
+
+
+def _serialize(doc: dict) -> dict:
+    out = {"id": str(doc["_id"]), **{k: v for k, v in doc.items() if k != "_id"}}
+    for key in ("created_at", "completed_at"):
+        if isinstance(out.get(key), datetime):
+            out[key] = out[key].isoformat()
+    return out
+
+
+async def list_analyses(user_id: str, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None) -> dict:
+    """
+    One page of the user's analysis history (summary fields only).\n
+    Returns `{"analyses": [...], "next_cursor": str | None}`; pass `next_cursor` back for the next page.
+    """
+    limit = max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+    query = {"user_id": user_id}
+    if cursor:
+        query.update(decode_cursor(cursor))
+
+    docs = await db.analyses.find(query, SUMMARY_PROJECTION).sort(HISTORY_SORT).limit(limit + 1).to_list(limit + 1)
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    next_cursor = encode_cursor(docs[-1]) if has_more else None
+    return {"analyses": [_serialize(doc) for doc in docs], "next_cursor": next_cursor}
+
+
+async def resolve_results(doc: dict) -> dict:
+    """
+    `transcription` and `sentiment` of an analysis document. Analyses keep only references
+    (`transcription_id`, `sentiment_model`); the payloads are loaded - and the transcript
+    decompressed - here, when a view needs them. Older documents still carry them inline.
+    """
+    transcription, sentiment = doc.get("transcription"), doc.get("sentiment")
+    transcription_id = doc.get("transcription_id")
+    if transcription_id and transcription is None:
+        try:
+            text_doc = await db.transcriptions.find_one({"_id": ObjectId(transcription_id)}, TEXT_PROJECTION)
+        except InvalidId:
+            text_doc = None
+        transcription = unpack_text(text_doc)
+    if transcription_id and sentiment is None and doc.get("sentiment_model"):
+        sentiment = {"message": await get_saved_results(transcription_id, doc["sentiment_model"], current_only=False)}
+    return {"transcription": transcription, "sentiment": sentiment}
+
+
+async def get_analysis_detail(user_id: str, analysis_id: str) -> Optional[dict]:
+    """Full analysis (transcription, sentiment) of the user, None if not found."""
+    try:
+        oid = ObjectId(analysis_id)
+    except Exception:
+        return None
+    doc = await db.analyses.find_one({"_id": oid, "user_id": user_id}, DETAIL_PROJECTION)
+    if not doc:
+        return None
+    results = {key: value for key, value in (await resolve_results(doc)).items() if value is not None}
+    return _serialize({**doc, **results})
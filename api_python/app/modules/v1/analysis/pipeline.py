@@ -0,0 +1,357 @@
+"""
+Analysis pipeline: one video (`process_video_analysis`) or a batch of them (`process_batch`),
+run as background tasks registered for cancellation (`start_analysis_task`, `start_batch_task`).
+
+Progress goes out as events: recorded for replay and published on the message bus, from where
+every server process delivers them to its HTTP streams and Socket.IO rooms. `sid` is the socket
+that started the work, if any; the socket layer plugs in through `use_clients` (joining the
+analysis room, events without an analysis), so the pipeline serves both transports without
+depending on either.
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+
+from app.core.config import settings
+from app.core.database import db
+from app.core.events import event_bus, replay_buffer
+from app.core.message_bus import message_bus
+from app.core.retention import failed_expiry
+from app.core.write_behind import analysis_writer
+from app.modules.v1.sentiment.service import analyze, DEFAULT_MODEL as SENTIMENT_MODEL
+from app.modules.v1.transcription.backends import normalize_model
+from app.modules.v1.transcription.service import transcribe_video, word_timings_of
+from . import batch, history, rollups, search
+from .progress import ProgressReporter
+from .registry import analysis_registry, current_analysis
+from .schemas import VideoAnalysis
+
+logger = logging.getLogger(__name__)
+
+
+class ClientChannel:
+    """Directly connected clients (Socket.IO sids); without a socket layer there are none"""
+
+    async def emit(self, sid: str, event: str, payload: dict) -> None:
+        pass
+
+    async def join(self, sid: str, analysis_id: str) -> None:
+        pass
+
+    def has_listeners(self, analysis_id: str, exclude_sid: Optional[str] = None) -> bool:
+        return False
+
+
+clients = ClientChannel()
+
+
+def use_clients(channel: ClientChannel) -> None:
+    global clients
+    clients = channel
+
+
+def analysis_has_listeners(analysis_id: str, exclude_sid: Optional[str] = None) -> bool:
+    """True if any socket (other than `exclude_sid`) or HTTP stream still follows the analysis"""
+    if event_bus.subscriber_count(analysis_id):
+        return True
+    return clients.has_listeners(analysis_id, exclude_sid)
+
+
+async def emit_event(sid: Optional[str], analysis_id: Optional[str], event: str, payload: dict):
+    """Record event for replay and publish it to every server process (see `socketio_handler.deliver_event`).
+
+    Events without an analysis (e.g. validation errors) go straight to `sid`.
+    """
+    if not analysis_id:
+        if sid:
+            await clients.emit(sid, event, payload)
+        return
+    payload = replay_buffer.record(analysis_id, event, payload)
+    await message_bus.publish('analysis_event', {'analysis_id': analysis_id, 'event': event, 'data': payload})
+
+
+async def emit_step(sid: Optional[str], analysis_id: str, step: str, status: str, message: str, **progress):
+    """Emit progress step of an analysis; extra `progress` fields (percent, eta, ...) go into the step"""
+    await emit_event(sid, analysis_id, 'analysis_step', {
+        'analysis_id': analysis_id,
+        'step': {
+            'step': step,
+            'status': status,
+            'message': message,
+            'timestamp': datetime.utcnow().isoformat(),
+            **progress,
+        },
+    })
+
+
+def step_record(step: str, status: str, message: str) -> dict:
+    """Entry of the persisted `steps` history of an analysis (see `AnalysisStep`)"""
+    return {'step': step, 'status': status, 'message': message, 'timestamp': datetime.utcnow()}
+
+
+async def process_video_analysis(
+    sid: Optional[str],
+    url: str,
+    user_id: str,
+    model: str = "deepgram-nova-2",
+    analysis_oid: Optional[ObjectId] = None,
+    batch_id: Optional[str] = None,
+):
+    """Process video analysis with real-time updates via Socket.IO and the event bus.
+
+    `sid` may be None for HTTP streaming clients, which subscribe to the event bus
+    under a pre-allocated `analysis_oid` before the analysis starts (and for the
+    videos of a batch, followed by `process_batch`).
+    """
+    analysis_id = str(analysis_oid) if analysis_oid else None
+    result = None
+    entry = analysis_registry.get(analysis_id) if analysis_id else None
+    context_token = current_analysis.set(entry)
+
+    async def emit_progress(update: dict):
+        fields = {k: v for k, v in update.items() if k not in ('step', 'status', 'message')}
+        await emit_step(sid, analysis_id, update['step'], update.get('status', 'in_progress'), update.get('message', ''), **fields)
+
+    async def record_step(step: str, status: str, message: str):
+        # Persisted through the write-behind buffer; progress ticks (`emit_progress`) are not
+        await analysis_writer.update(result.inserted_id, step=step_record(step, status, message))
+        await emit_step(sid, analysis_id, step, status, message)
+
+    progress = ProgressReporter(emit_progress, 1 / settings.PROGRESS_MAX_EMITS_PER_SECOND)
+    if entry:
+        entry.progress = progress
+    
+    try:
+        # Create analysis record with user_id
+        analysis = VideoAnalysis(
+            url=url,
+            status="processing",
+            steps=[],
+            user_id=user_id,
+            batch_id=batch_id
+        )
+        
+        analysis_doc = (
+            analysis.model_dump(exclude={'id'}) if hasattr(analysis, 'model_dump')
+            else analysis.dict(exclude={'id'})
+        )
+        if analysis_oid:
+            analysis_doc["_id"] = analysis_oid
+        result = await db.analyses.insert_one(analysis_doc)
+        analysis_id = str(result.inserted_id)
+        
+        if sid:
+            await clients.join(sid, analysis_id)
+        logger.info(f"Starting analysis {analysis_id} for {url}")
+        await emit_event(sid, analysis_id, 'analysis_started', {'analysis_id': analysis_id})
+        
+        # Step 1: Download and transcribe; real progress (download, convert, upload) comes from `progress`
+        await record_step("download", "in_progress", "Pobieranie wideo z YouTube...")
+        logger.info("Starting transcription - this may take a while")
+        
+        # Engine by name, or picked by `transcription_backends` for "auto" (and the GUI's legacy names)
+        transcription_result = await transcribe_video(url, model_name=normalize_model(model))
+        logger.info("Transcription completed")
+        await progress.flush()
+        
+        transcription_id = str(transcription_result.id)
+        transcription_text = transcription_result.transcription
+        
+        await record_step("transcription", "completed", "Transkrypcja zakończona")
+        
+        # Step 2: Sentiment analysis
+        await record_step("sentiment", "in_progress", "Analiza sentymentu...")
+        
+        # v2 sentiment service exposes `analyze(transcript_id)`; the text and word timings are passed along instead of re-read
+        sentiment_result = await analyze(transcription_id, SENTIMENT_MODEL, transcription_text=transcription_text,
+                                         word_timings=word_timings_of(transcription_result))
+
+        # GUI expects sentiment to be wrapped under a `message` key
+        if isinstance(sentiment_result, dict) and 'message' in sentiment_result:
+            sentiment_payload = sentiment_result
+        else:
+            sentiment_payload = {'message': sentiment_result}
+
+        await record_step("sentiment", "completed", "Analiza sentymentu zakończona")
+        
+        # Update analysis with results (terminal state: written now, with the buffered steps)
+        digest = history.sentiment_digest(sentiment_payload)
+        await analysis_writer.finish(
+            result.inserted_id,
+            {
+                "status": "completed",
+                "title": transcription_result.title,
+                "transcription_id": transcription_id,
+                "sentiment_model": SENTIMENT_MODEL,
+                "sentiment_digest": digest,
+                "search_terms": search.document_terms(transcription_result.title, transcription_text, sentiment_payload),
+                "completed_at": datetime.utcnow()
+            }
+        )
+        
+        try:
+            await rollups.record_analysis(user_id, analysis.created_at, digest)
+        except Exception as e:
+            # Dashboards catch up with `rollups --rebuild`; the analysis itself is saved
+            logger.error(f"Rollup update of analysis {analysis_id} failed: {str(e)}")
+
+        # Emit completion
+        await emit_event(sid, analysis_id, 'analysis_complete', {
+            'analysis_id': analysis_id,
+            'title': transcription_result.title,
+            'transcription': transcription_text,
+            'sentiment': sentiment_payload
+        })
+        
+        logger.info(f"Analysis {analysis_id} completed successfully")
+        
+    except asyncio.CancelledError:
+        progress.close()
+        cancellation = analysis_registry.record_cancelled(entry) if entry else {"reason": "cancelled"}
+        if analysis_id and result:
+            await analysis_writer.finish(
+                result.inserted_id,
+                {"status": "cancelled", "cancellation": cancellation, "completed_at": datetime.utcnow(),
+                 **failed_expiry()}
+            )
+        await emit_event(sid, analysis_id, 'analysis_cancelled', {
+            'analysis_id': analysis_id,
+            **cancellation
+        })
+        raise
+    except Exception as e:
+        progress.close()
+        logger.error(f"Error in analysis {analysis_id}: {str(e)}")
+        if analysis_id and result:
+            await analysis_writer.finish(
+                result.inserted_id,
+                {"status": "error", **failed_expiry()},
+                step=step_record("error", "error", f"Błąd: {str(e)}")
+            )
+            await emit_step(sid, analysis_id, "error", "error", f"Błąd: {str(e)}")
+        await emit_event(sid, analysis_id, 'analysis_error', {
+            'analysis_id': analysis_id,
+            'error': str(e)
+        })
+    finally:
+        progress.close()
+        current_analysis.reset(context_token)
+        if analysis_id:
+            analysis_registry.unregister(analysis_id)
+
+
+def start_analysis_task(
+    sid: Optional[str], url: str, user_id: str, model: str = "deepgram-nova-2", batch_id: Optional[str] = None
+) -> str:
+    """Start `process_video_analysis` in background and register it for cancellation"""
+    analysis_oid = ObjectId()
+    analysis_id = str(analysis_oid)
+    task = asyncio.create_task(
+        process_video_analysis(sid, url, user_id, model, analysis_oid=analysis_oid, batch_id=batch_id)
+    )
+    analysis_registry.register(analysis_id, user_id, task)
+    return analysis_id
+
+
+# Terminal events of the analyses of a batch -> entry status
+BATCH_ENTRY_STATUS = {"analysis_complete": "completed", "analysis_error": "error", "analysis_cancelled": "cancelled"}
+
+
+async def process_batch(sid: Optional[str], batch_oid: ObjectId, sources: List[str], user_id: str, model: str):
+    """Expand, deduplicate and analyze the videos of a batch (see `analysis.batch`) as one event stream.
+
+    Every video is a regular analysis started without a socket; this task follows its events on
+    the event bus and re-emits them under the batch id: `batch_started`, `batch_expanded`
+    (entries), `batch_progress` (steps and status changes of the videos, with running counts)
+    and `batch_complete` with the combined result. Cancelling the batch cancels its analyses.
+    """
+    batch_id = str(batch_oid)
+    entries: List[dict] = []
+    digests: List[Optional[dict]] = []
+    counts: Dict[str, int] = {"completed": 0, "error": 0, "cancelled": 0}
+    semaphore = asyncio.Semaphore(max(1, settings.BATCH_CONCURRENCY))
+
+    async def emit_entry(index: int, **fields):
+        await emit_event(sid, batch_id, 'batch_progress', {
+            'batch_id': batch_id, 'index': index, 'analysis_id': entries[index].get('analysis_id'),
+            'total': len(entries), 'done': sum(counts.values()), **counts, **fields,
+        })
+
+    async def run_entry(index: int, entry: dict):
+        async with semaphore:
+            analysis_id = start_analysis_task(None, entry['url'], user_id, model, batch_id=batch_id)
+            # Subscribed before the analysis task runs, so none of its events is missed
+            queue = event_bus.subscribe(analysis_id)
+            entry.update(analysis_id=analysis_id, status='processing')
+            try:
+                while True:
+                    event, data = await queue.get()
+                    if event == 'analysis_step':
+                        await emit_entry(index, step=data.get('step'))
+                    elif event in BATCH_ENTRY_STATUS:
+                        entry['status'] = BATCH_ENTRY_STATUS[event]
+                        counts[entry['status']] += 1
+                        if event == 'analysis_complete':
+                            entry['title'] = data.get('title') or entry.get('title')
+                            digests.append(history.sentiment_digest(data.get('sentiment')))
+                        elif event == 'analysis_error':
+                            entry['error'] = data.get('error')
+                        await emit_entry(index, status=entry['status'])
+                        return
+            except asyncio.CancelledError:
+                analysis_registry.cancel(analysis_id, "batch_cancelled")
+                raise
+            finally:
+                event_bus.unsubscribe(analysis_id, queue)
+
+    try:
+        if sid:
+            await clients.join(sid, batch_id)
+        await batch.create_batch(batch_oid, user_id, sources, model)
+        await emit_event(sid, batch_id, 'batch_started', {'batch_id': batch_id, 'sources': sources})
+
+        entries, errors = await batch.expand_sources(sources, settings.BATCH_MAX_ENTRIES)
+        await batch.mark_cached(entries, model)
+        await batch.update_batch(batch_oid, {"status": "processing", "entries": entries, "errors": errors})
+        await emit_event(sid, batch_id, 'batch_expanded', {'batch_id': batch_id, 'entries': entries, 'errors': errors})
+        logger.info(f"Batch {batch_id}: {len(entries)} videos ({sum(e['cached'] for e in entries)} cached) "
+                    f"from {len(sources)} sources")
+
+        await asyncio.gather(*(run_entry(index, entry) for index, entry in enumerate(entries)))
+
+        summary = batch.summarize(entries, digests)
+        await batch.update_batch(batch_oid, {
+            "status": "completed", "entries": entries, "summary": summary, "completed_at": datetime.utcnow(),
+        })
+        await emit_event(sid, batch_id, 'batch_complete', {
+            'batch_id': batch_id, 'entries': entries, 'errors': errors, 'summary': summary,
+        })
+    except asyncio.CancelledError:
+        try:
+            await batch.update_batch(batch_oid, {
+                "status": "cancelled", "entries": entries, "completed_at": datetime.utcnow(),
+            })
+        finally:
+            await emit_event(sid, batch_id, 'batch_cancelled', {'batch_id': batch_id, 'entries': entries})
+        raise
+    except Exception as e:
+        logger.error(f"Error in batch {batch_id}: {str(e)}")
+        try:
+            await batch.update_batch(batch_oid, {"status": "error", "error": str(e), "completed_at": datetime.utcnow()})
+        except Exception:
+            pass
+        await emit_event(sid, batch_id, 'batch_error', {'batch_id': batch_id, 'error': str(e)})
+    finally:
+        analysis_registry.unregister(batch_id)
+
+
+def start_batch_task(sid: Optional[str], sources: List[str], user_id: str, model: str = "deepgram-nova-2") -> str:
+    """Start `process_batch` in background; the batch id is cancellable like an analysis id"""
+    batch_oid = ObjectId()
+    batch_id = str(batch_oid)
+    task = asyncio.create_task(process_batch(sid, batch_oid, sources, user_id, model))
+    analysis_registry.register(batch_id, user_id, task)
+    return batch_id
@@ -0,0 +1,87 @@
+import asyncio
+import threading
+from typing import Awaitable, Callable, Dict, Optional
+
+# Progress update produced by the pipeline services, e.g.
+# {"step": "download", "message": "Pobieranie audio... 42%", "percent": 42.0, "eta": 12}
+Progress = Dict[str, object]
+
+
+class ProgressReporter:
+    """Throttled, coalescing sink of progress updates of one analysis.
+
+    `update` may be called at any rate and from any thread (download worker reader,
+    threadpool uploads); at most one emit per `min_interval` is sent per analysis and
+    only the latest update of every step survives until then.
+    """
+
+    def __init__(
+        self,
+        emit: Callable[[Progress], Awaitable[None]],
+        min_interval: float = 0.25,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+    ):
+        self._emit = emit
+        self.min_interval = min_interval
+        self._loop = loop or asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._pending: Dict[str, Progress] = {}
+        self._last_emit = 0.0
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._flushing: Optional[asyncio.Task] = None
+        self._closed = False
+        self.received = 0
+        self.emitted = 0
+
+    def update(self, progress: Progress) -> None:
+        if threading.get_ident() != self._loop_thread:
+            self._loop.call_soon_threadsafe(self._update, progress)
+        else:
+            self._update(progress)
+
+    __call__ = update
+
+    def _update(self, progress: Progress) -> None:
+        if self._closed:
+            return
+        self.received += 1
+        step = progress["step"]
+        # Re-insert so pending steps flush in the order they were last updated
+        self._pending.pop(step, None)
+        self._pending[step] = progress
+        if self._handle is None and self._flushing is None:
+            delay = max(0.0, self._last_emit + self.min_interval - self._loop.time())
+            self._handle = self._loop.call_later(delay, self._start_flush)
+
+    def _start_flush(self) -> None:
+        self._handle = None
+        self._flushing = self._loop.create_task(self.flush())
+
+    async def flush(self) -> None:
+        """Emit pending updates now (called before a step changes state, so order is kept)."""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        pending, self._pending = self._pending, {}
+        try:
+            for progress in pending.values():
+                await self._emit(progress)
+                self.emitted += 1
+        finally:
+            self._last_emit = self._loop.time()
+            if self._flushing is asyncio.current_task():
+                self._flushing = None
+            # Updates that arrived while emitting wait for the next slot
+            if self._pending and not self._closed and self._handle is None:
+                self._handle = self._loop.call_later(self.min_interval, self._start_flush)
+
+    def close(self) -> None:
+        """Drop pending updates; later updates are ignored."""
+        self._closed = True
+        self._pending.clear()
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self._flushing is not None and self._flushing is not asyncio.current_task():
+            self._flushing.cancel()
+            self._flushing = None
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ActiveAnalysis:
+    """Bookkeeping for a single running analysis task."""
+
+    def __init__(self, analysis_id: str, user_id: str, task: asyncio.Task):
+        self.analysis_id = analysis_id
+        self.user_id = user_id
+        self.task = task
+        self.cancel_reason: Optional[str] = None
+        # CPU time burnt locally (download worker: yt-dlp + ffmpeg)
+        self.cpu_seconds = 0.0
+        self.download_finished = False
+        # Progress sink (`ProgressReporter`), callable from any thread
+        self.progress: Optional[Callable[[dict], None]] = None
+        self._grace_handle: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def stage(self) -> str:
+        return "providers" if self.download_finished else "download"
+
+    @property
+    def grace_pending(self) -> bool:
+        return self._grace_handle is not None
+
+
+# Set by the analysis pipeline so nested services (download worker) can report into it
+current_analysis: ContextVar[Optional[ActiveAnalysis]] = ContextVar("current_analysis", default=None)
+
+
+class AnalysisRegistry:
+    """Registry of in-flight analyses used for cancellation.
+
+    Also keeps CPU accounting of download workers, used to estimate how much
+    CPU time a cancellation saved (average CPU of a finished download minus what
+    the cancelled one had already used).
+    """
+
+    def __init__(self):
+        self._active: Dict[str, ActiveAnalysis] = {}
+        self.downloads_finished = 0
+        self.download_cpu_seconds = 0.0
+        self.cancelled = 0
+        self.cpu_seconds_spent_on_cancelled = 0.0
+        self.cpu_seconds_reclaimed = 0.0
+
+    def register(self, analysis_id: str, user_id: str, task: asyncio.Task) -> ActiveAnalysis:
+        entry = ActiveAnalysis(analysis_id, user_id, task)
+        self._active[analysis_id] = entry
+        return entry
+
+    def get(self, analysis_id: str) -> Optional[ActiveAnalysis]:
+        return self._active.get(analysis_id)
+
+    def unregister(self, analysis_id: str) -> None:
+        entry = self._active.pop(analysis_id, None)
+        if entry and entry._grace_handle:
+            entry._grace_handle.cancel()
+
+    def for_user(self, user_id: str) -> List[ActiveAnalysis]:
+        return [entry for entry in self._active.values() if entry.user_id == user_id]
+
+    def cancel(self, analysis_id: str, reason: str = "cancelled") -> bool:
+        entry = self._active.get(analysis_id)
+        if not entry or entry.task.done():
+            return False
+        if entry._grace_handle:
+            entry._grace_handle.cancel()
+            entry._grace_handle = None
+        entry.cancel_reason = reason
+        logger.info(f"Cancelling analysis {analysis_id}: {reason}")
+        entry.task.cancel(reason)
+        return True
+
+    def cancel_after_grace(self, analysis_id: str, reason: str, delay: Optional[float] = None) -> None:
+        """Cancel unless the client comes back (see `keep_alive`) within the grace period."""
+        entry = self._active.get(analysis_id)
+        if not entry or entry._grace_handle:
+            return
+        delay = settings.CANCEL_GRACE_SECONDS if delay is None else delay
+        entry._grace_handle = asyncio.get_running_loop().call_later(delay, self.cancel, analysis_id, reason)
+
+    def keep_alive(self, analysis_id: str) -> None:
+        """Client re-attached: drop the pending grace cancellation."""
+        entry = self._active.get(analysis_id)
+        if entry and entry._grace_handle:
+            entry._grace_handle.cancel()
+            entry._grace_handle = None
+
+    def record_download(self, cpu_seconds: float) -> None:
+        self.downloads_finished += 1
+        self.download_cpu_seconds += cpu_seconds
+
+    def record_cancelled(self, entry: ActiveAnalysis) -> dict:
+        """Account a cancelled analysis and return a summary for the analysis document."""
+        reclaimed = 0.0
+        if not entry.download_finished and self.downloads_finished:
+            average = self.download_cpu_seconds / self.downloads_finished
+            reclaimed = max(0.0, average - entry.cpu_seconds)
+
+        self.cancelled += 1
+        self.cpu_seconds_spent_on_cancelled += entry.cpu_seconds
+        self.cpu_seconds_reclaimed += reclaimed
+        logger.info(
+            f"Analysis {entry.analysis_id} cancelled at stage '{entry.stage}': "
+            f"{entry.cpu_seconds:.2f} CPU s spent, ~{reclaimed:.2f} CPU s reclaimed "
+            f"(total reclaimed: {self.cpu_seconds_reclaimed:.2f} s)"
+        )
+        return {
+            "reason": entry.cancel_reason or "cancelled",
+            "stage": entry.stage,
+            "cpu_seconds_spent": round(entry.cpu_seconds, 3),
+            "cpu_seconds_reclaimed": round(reclaimed, 3),
+        }
+
+    def stats(self) -> dict:
+        return {
+            "active": len(self._active),
+            "cancelled": self.cancelled,
+            "cpu_seconds_spent_on_cancelled": round(self.cpu_seconds_spent_on_cancelled, 3),
+            "cpu_seconds_reclaimed": round(self.cpu_seconds_reclaimed, 3),
+        }
+
+
+analysis_registry = AnalysisRegistry()
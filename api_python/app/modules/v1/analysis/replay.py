@@ -0,0 +1,89 @@
+from typing import Optional
+
+from bson import ObjectId
+
+from app.core.database import db
+from app.core.events import Event, TERMINAL_EVENTS, compact_events, replay_buffer
+from .batch import BATCH_FINAL_PROJECTION, RUNNING_STATUSES, final_batch_event
+from .history import resolve_results
+from .registry import analysis_registry
+
+# Fields needed to rebuild the final event of a finished analysis
+FINAL_STATE_PROJECTION = {
+    "status": 1, "title": 1, "transcription": 1, "sentiment": 1, "transcription_id": 1, "sentiment_model": 1,
+    "cancellation": 1,
+}
+
+
+def final_event_from_doc(doc: dict) -> Optional[Event]:
+    """Rebuild the terminal event of an already finished analysis document."""
+    analysis_id = str(doc["_id"])
+    if doc.get("status") == "completed":
+        return "analysis_complete", {
+            "analysis_id": analysis_id,
+            "title": doc.get("title"),
+            "transcription": doc.get("transcription"),
+            "sentiment": doc.get("sentiment"),
+        }
+    if doc.get("status") == "error":
+        return "analysis_error", {"analysis_id": analysis_id, "error": "Analysis failed"}
+    if doc.get("status") == "cancelled":
+        return "analysis_cancelled", {"analysis_id": analysis_id, **(doc.get("cancellation") or {})}
+    return None
+
+
+def is_finished(events: list) -> bool:
+    return any(event in TERMINAL_EVENTS for event, _ in events)
+
+
+async def _find_stored(oid: ObjectId, user_id: str) -> Optional[dict]:
+    """The user's analysis document, otherwise their batch document (marked `batch`)"""
+    doc = await db.analyses.find_one({"_id": oid, "user_id": user_id}, FINAL_STATE_PROJECTION)
+    if doc is None:
+        doc = await db.batches.find_one({"_id": oid, "user_id": user_id}, BATCH_FINAL_PROJECTION)
+        if doc is not None:
+            doc["batch"] = True
+    return doc
+
+
+async def catch_up(analysis_id: str, user_id: str, last_seq: int = 0) -> Optional[dict]:
+    """
+    Compact catch-up for a (re)joining client.\n
+    Served from the in-memory replay buffer; falls back to the `analyses` document, or the
+    `batches` document of a batch id (final state only) when the history is not buffered any more.
+    Returns None if the analysis does not exist or belongs to another user.
+    """
+    entry = analysis_registry.get(analysis_id)
+    doc = None
+    if entry is not None:
+        if entry.user_id != user_id:
+            return None
+    else:
+        try:
+            oid = ObjectId(analysis_id)
+        except Exception:
+            return None
+        doc = await _find_stored(oid, user_id)
+        if not doc:
+            return None
+
+    # Without a local entry the analysis may still run in another worker process
+    running = entry is not None or doc.get("status") in (RUNNING_STATUSES if doc.get("batch") else ("processing",))
+    buffered = replay_buffer.since(analysis_id, last_seq)
+    if buffered is not None:
+        return {"events": compact_events(buffered), "running": running, "source": "memory"}
+
+    if doc is None:
+        doc = await _find_stored(ObjectId(analysis_id), user_id) or {"_id": analysis_id}
+    if doc.get("batch"):
+        final = final_batch_event(doc)
+    else:
+        if doc.get("status") == "completed":
+            doc = {**doc, **await resolve_results(doc)}
+        final = final_event_from_doc(doc)
+    return {
+        "events": [final] if final else [],
+        "running": running,
+        "status": doc.get("status"),
+        "source": "database",
+    }
@@ -0,0 +1,175 @@
+"""
+Aspect sentiment rollups for dashboards ("battery sentiment of my reviews this month").
+
+Every completed analysis adds its `sentiment_digest` (per-aspect counts and score, see
+`history.sentiment_digest`) to one `aspect_rollups` document per aspect and time bucket
+(`day` = "2024-05-17", `month` = "2024-05") of its user, with `$inc` upserts. Reading a
+dashboard is then one indexed range query over a handful of buckets, independent of how
+many analyses there are.
+
+Rollups are rebuilt from the analyses (backfill, or after changing the digest) with:
+
+    python -m app.modules.v1.analysis.rollups --rebuild
+
+Analyses completing during a rebuild may be missed; run it when traffic is low.
+"""
+import argparse
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from pymongo import UpdateOne
+
+from app.core.database import db
+
+PERIODS = {"day": "%Y-%m-%d", "month": "%Y-%m"}
+MAX_BUCKETS = 1000
+
+ROLLUP_PROJECTION = {"_id": 0, "bucket": 1, "aspect": 1, "analyses": 1, "positive": 1, "negative": 1,
+                     "neutral": 1, "score_sum": 1}
+
+
+class InvalidRollupQuery(ValueError):
+    pass
+
+
+def bucket(created_at: datetime, period: str) -> str:
+    return created_at.strftime(PERIODS[period])
+
+
+def rollup_updates(user_id: str, created_at: datetime, digest: Optional[dict]) -> List[UpdateOne]:
+    """`$inc` upserts adding one analysis' digest to its day and month buckets"""
+    aspects: Dict[str, dict] = (digest or {}).get("aspects") or {}
+    updates = []
+    for aspect, counts in aspects.items():
+        inc = {
+            "analyses": 1,
+            "positive": counts.get("positive", 0),
+            "negative": counts.get("negative", 0),
+            "neutral": counts.get("neutral", 0),
+            "score_sum": counts.get("score", 0.0),
+        }
+        for period in PERIODS:
+            updates.append(UpdateOne(
+                {"user_id": user_id, "period": period, "bucket": bucket(created_at, period), "aspect": aspect},
+                {"$inc": inc, "$set": {"updated_at": datetime.utcnow()}},
+                upsert=True,
+            ))
+    return updates
+
+
+async def record_analysis(user_id: Optional[str], created_at: datetime, digest: Optional[dict]) -> None:
+    updates = rollup_updates(user_id, created_at, digest) if user_id else []
+    if updates:
+        await db.aspect_rollups.bulk_write(updates, ordered=False)
+
+
+def _summary(doc: dict) -> dict:
+    analyses = doc.get("analyses", 0)
+    return {
+        "bucket": doc["bucket"],
+        "aspect": doc["aspect"],
+        "analyses": analyses,
+        "positive": doc.get("positive", 0),
+        "negative": doc.get("negative", 0),
+        "neutral": doc.get("neutral", 0),
+        # Mean of the per-analysis aspect scores (-1..1)
+        "score": round(doc.get("score_sum", 0.0) / analyses, 3) if analyses else None,
+    }
+
+
+async def get_rollups(
+    user_id: str,
+    period: str = "month",
+    aspect: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+) -> dict:
+    """
+    Rollups of the user's analyses per bucket (and aspect), oldest bucket first.\n
+    `start` / `end` are inclusive bucket keys in the period's format ("2024-05" or "2024-05-17").
+    """
+    if period not in PERIODS:
+        raise InvalidRollupQuery(f"period must be one of: {', '.join(PERIODS)}")
+    for value in (start, end):
+        if value is not None:
+            try:
+                datetime.strptime(value, PERIODS[period])
+            except ValueError:
+                raise InvalidRollupQuery(f"Invalid {period} bucket: {value}")
+    query: dict = {"user_id": user_id, "period": period}
+    if start or end:
+        query["bucket"] = {**({"$gte": start} if start else {}), **({"$lte": end} if end else {})}
+    if aspect:
+        query["aspect"] = aspect
+    docs = await db.aspect_rollups.find(query, ROLLUP_PROJECTION) \
+        .sort([("bucket", 1), ("aspect", 1)]).limit(MAX_BUCKETS).to_list(MAX_BUCKETS)
+    return {"period": period, "rollups": [_summary(doc) for doc in docs]}
+
+
+def rebuild_pipeline(period: str) -> List[dict]:
+    """Aggregation recomputing the `period` rollups of all analyses, merged into `aspect_rollups`"""
+    return [
+        {"$match": {"status": "completed", "user_id": {"$ne": None}, "sentiment_digest.aspects": {"$exists": True}}},
+        {"$project": {
+            "user_id": 1,
+            "bucket": {"$dateToString": {"format": PERIODS[period], "date": "$created_at"}},
+            "aspects": {"$objectToArray": "$sentiment_digest.aspects"},
+        }},
+        {"$unwind": "$aspects"},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "bucket": "$bucket", "aspect": "$aspects.k"},
+            "analyses": {"$sum": 1},
+            "positive": {"$sum": "$aspects.v.positive"},
+            "negative": {"$sum": "$aspects.v.negative"},
+            "neutral": {"$sum": "$aspects.v.neutral"},
+            "score_sum": {"$sum": "$aspects.v.score"},
+        }},
+        {"$project": {
+            "_id": 0,
+            "user_id": "$_id.user_id",
+            "period": {"$literal": period},
+            "bucket": "$_id.bucket",
+            "aspect": "$_id.aspect",
+            "analyses": 1, "positive": 1, "negative": 1, "neutral": 1, "score_sum": 1,
+            "updated_at": "$$NOW",
+        }},
+        {"$merge": {
+            "into": "aspect_rollups",
+            "on": ["user_id", "period", "bucket", "aspect"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert",
+        }},
+    ]
+
+
+async def rebuild() -> int:
+    """Recompute every rollup from the analyses; returns the number of rollup documents"""
+    await db.aspect_rollups.delete_many({})
+    for period in PERIODS:
+        await db.analyses.aggregate(rebuild_pipeline(period), allowDiskUse=True).to_list(None)
+    return await db.aspect_rollups.count_documents({})
+
+
+async def _rebuild_main() -> None:
+    from app.core.database import close_db, connect_db, init_indexes
+    await connect_db()
+    try:
+        # `$merge ... on` needs the unique index
+        await init_indexes()
+        print(f"Rebuilt {await rebuild()} rollups")
+    finally:
+        await close_db()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Aspect sentiment rollups")
+    parser.add_argument("--rebuild", action="store_true", help="recompute all rollups from the analyses")
+    args = parser.parse_args(argv)
+    if args.rebuild:
+        asyncio.run(_rebuild_main())
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,290 @@
+import asyncio
+import json
+from typing import AsyncIterator, Literal, Optional
+
+from fastapi import APIRouter, Header, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+
+from app.core.config import settings
+from app.core.events import TERMINAL_EVENTS, event_bus
+from app.core.message_bus import message_bus
+from app.modules.v1.auth.service import decode_token
+from . import batch, history, rollups, search
+from .pipeline import analysis_has_listeners, start_analysis_task, start_batch_task
+from .registry import analysis_registry
+from .replay import catch_up, is_finished
+from .schemas import AnalysisStreamRequest, BatchRequest
+
+router = APIRouter()
+
+# Seconds of silence after which a keep-alive line is sent (keeps proxies from closing the stream)
+HEARTBEAT_INTERVAL = 15.0
+
+StreamFormat = Literal["sse", "ndjson"]
+
+MEDIA_TYPES = {
+    "sse": "text/event-stream",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def _user_id_from_header(authorization: Optional[str]) -> str:
+    """Resolve user id from `Authorization: Bearer <token>` header."""
+    if not authorization or not authorization.lower().startswith("bearer "):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Authentication token is required",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    try:
+        payload = decode_token(authorization[len("bearer "):].strip())
+    except Exception:
+        # A token the JWT library cannot even parse is just an invalid token
+        payload = None
+    if not isinstance(payload, dict) or not payload.get("sub"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return payload["sub"]
+
+
+def format_event(fmt: StreamFormat, event: str, data: dict) -> str:
+    """Serialize a single event as an SSE frame or an NDJSON line."""
+    body = json.dumps(data, default=str, ensure_ascii=False)
+    if fmt == "sse":
+        # `id:` lets EventSource resume with a Last-Event-ID header after reconnect
+        event_id = f"id: {data['seq']}\n" if "seq" in data else ""
+        return f"{event_id}event: {event}\ndata: {body}\n\n"
+    return f'{{"event": {json.dumps(event)}, "data": {body}}}\n'
+
+
+def _heartbeat(fmt: StreamFormat) -> str:
+    return ": ping\n\n" if fmt == "sse" else '{"event": "ping", "data": {}}\n'
+
+
+async def stream_events(
+    analysis_id: str,
+    queue: asyncio.Queue,
+    fmt: StreamFormat,
+    request: Request,
+    replay: Optional[list] = None,
+) -> AsyncIterator[str]:
+    """Send the catch-up `replay`, then drain the subscriber queue until a terminal event or client disconnect."""
+    finished = False
+    last_seq = 0
+    try:
+        for event, data in replay or ():
+            last_seq = max(last_seq, data.get("seq", 0))
+            yield format_event(fmt, event, data)
+        while True:
+            try:
+                event, data = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield _heartbeat(fmt)
+                continue
+            if data.get("seq", last_seq + 1) <= last_seq:
+                continue  # already sent in the replay
+            yield format_event(fmt, event, data)
+            if event in TERMINAL_EVENTS:
+                finished = True
+                break
+    finally:
+        event_bus.unsubscribe(analysis_id, queue)
+        entry = analysis_registry.get(analysis_id)
+        # Last HTTP listener gone and no socket attached: nobody will read the result
+        if not finished and settings.CANCEL_ON_DISCONNECT and entry and not analysis_has_listeners(analysis_id):
+            analysis_registry.cancel_after_grace(analysis_id, "client_disconnected")
+
+
+@router.get("")
+async def list_analyses(
+    limit: int = history.DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    authorization: Optional[str] = Header(None),
+):
+    """
+    Page of the user's analysis history, newest first.\n
+    Summary fields only (no transcription/sentiment); pass `next_cursor` as `cursor` for the next page.
+    """
+    user_id = _user_id_from_header(authorization)
+    try:
+        return await history.list_analyses(user_id, limit, cursor)
+    except history.InvalidCursor as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@router.get("/search")
+async def search_analyses(
+    q: str,
+    limit: int = history.DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    authorization: Optional[str] = Header(None),
+):
+    """
+    The user's analyses whose title, transcript or sentiment quotes contain every word of `q`
+    (case, Polish diacritics and inflection are ignored), newest first, with highlighted snippets.\n
+    Pass `next_cursor` as `cursor` for the next page.
+    """
+    user_id = _user_id_from_header(authorization)
+    try:
+        return await search.search_analyses(user_id, q, limit, cursor)
+    except history.InvalidCursor as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@router.get("/rollups")
+async def get_rollups(
+    period: str = "month",
+    aspect: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    authorization: Optional[str] = Header(None),
+):
+    """
+    Sentiment of the user's analyses per aspect and `period` ("day" or "month") bucket,
+    optionally limited to one `aspect` and to buckets `start`..`end` (e.g. "2024-01".."2024-06").
+    """
+    user_id = _user_id_from_header(authorization)
+    try:
+        return await rollups.get_rollups(user_id, period, aspect, start, end)
+    except rollups.InvalidRollupQuery as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@router.post("/batch")
+async def start_batch_stream(
+    body: BatchRequest,
+    request: Request,
+    format: StreamFormat = "sse",
+    authorization: Optional[str] = Header(None),
+):
+    """
+    Analyze a list of video, playlist and channel URLs as one batch and stream its progress.\n
+    Playlists and channels are expanded (up to `BATCH_MAX_ENTRIES` videos), duplicates removed and
+    already transcribed videos served from the cache. Events: batch_started, batch_expanded,
+    batch_progress, then batch_complete with every entry and the combined sentiment
+    (or batch_error / batch_cancelled). The batch id cancels like an analysis id.
+    """
+    user_id = _user_id_from_header(authorization)
+    sources = list(dict.fromkeys(str(url) for url in body.urls))
+    if len(sources) > settings.BATCH_MAX_SOURCES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=f"At most {settings.BATCH_MAX_SOURCES} URLs per batch"
+        )
+
+    batch_id = start_batch_task(None, sources, user_id, body.model)
+    queue = event_bus.subscribe(batch_id)
+
+    return StreamingResponse(
+        stream_events(batch_id, queue, format, request),
+        media_type=MEDIA_TYPES[format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/batch/{batch_id}")
+async def get_batch(batch_id: str, authorization: Optional[str] = Header(None)):
+    """Stored batch: sources, entries with their analysis ids and status, and `summary` once finished."""
+    user_id = _user_id_from_header(authorization)
+    found = await batch.get_batch(user_id, batch_id)
+    if found is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Batch not found")
+    return found
+
+
+@router.get("/{analysis_id}")
+async def get_analysis_detail(analysis_id: str, authorization: Optional[str] = Header(None)):
+    """Full analysis with transcription and sentiment."""
+    user_id = _user_id_from_header(authorization)
+    analysis = await history.get_analysis_detail(user_id, analysis_id)
+    if analysis is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Analysis not found")
+    return analysis
+
+
+@router.post("/stream")
+async def start_analysis_stream(
+    body: AnalysisStreamRequest,
+    request: Request,
+    format: StreamFormat = "sse",
+    authorization: Optional[str] = Header(None),
+):
+    """
+    Start video analysis and stream its progress over plain HTTP.\n
+    `format=sse` returns Server-Sent Events, `format=ndjson` one JSON object per line.
+    Events are the same as on Socket.IO: analysis_started, analysis_step,
+    analysis_complete, analysis_error, analysis_cancelled.
+    """
+    user_id = _user_id_from_header(authorization)
+
+    analysis_id = start_analysis_task(None, str(body.url), user_id, body.model)
+    # The task has not run yet, so subscribing now misses no event
+    queue = event_bus.subscribe(analysis_id)
+
+    return StreamingResponse(
+        stream_events(analysis_id, queue, format, request),
+        media_type=MEDIA_TYPES[format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/{analysis_id}/stream")
+async def attach_analysis_stream(
+    analysis_id: str,
+    request: Request,
+    format: StreamFormat = "sse",
+    authorization: Optional[str] = Header(None),
+    last_event_id: Optional[str] = Header(None),
+):
+    """
+    Attach to the progress stream of an existing analysis (or batch).\n
+    Starts with a compact catch-up of the events after `Last-Event-ID` (all events
+    when absent); finished analyses and batches return their final event and close.
+    """
+    user_id = _user_id_from_header(authorization)
+    last_seq = int(last_event_id) if last_event_id and last_event_id.isdigit() else 0
+
+    # Subscribe before loading the catch-up so no live event falls in between
+    queue = event_bus.subscribe(analysis_id)
+    state = await catch_up(analysis_id, user_id, last_seq)
+    if state is None:
+        event_bus.unsubscribe(analysis_id, queue)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Analysis not found")
+
+    if not state["running"] or is_finished(state["events"]):
+        event_bus.unsubscribe(analysis_id, queue)
+        return StreamingResponse(
+            iter([format_event(format, *event) for event in state["events"]]),
+            media_type=MEDIA_TYPES[format],
+        )
+
+    analysis_registry.keep_alive(analysis_id)
+    return StreamingResponse(
+        stream_events(analysis_id, queue, format, request, replay=state["events"]),
+        media_type=MEDIA_TYPES[format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/{analysis_id}/cancel")
+async def cancel_analysis(analysis_id: str, authorization: Optional[str] = Header(None)):
+    """
+    Cancel a running analysis: kills the download worker, aborts provider calls
+    and marks the analysis as `cancelled`.
+    """
+    user_id = _user_id_from_header(authorization)
+    entry = analysis_registry.get(analysis_id)
+    if not entry and message_bus.distributed:
+        # May be running in another worker process
+        await message_bus.publish("cancel_analysis", {
+            "analysis_id": analysis_id, "user_id": user_id, "reason": "cancelled_by_user"
+        })
+        return {"analysis_id": analysis_id, "status": "cancelling"}
+    if not entry or entry.user_id != user_id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Analysis not found or already finished")
+    analysis_registry.cancel(analysis_id, "cancelled_by_user")
+    return {"analysis_id": analysis_id, "status": "cancelling"}
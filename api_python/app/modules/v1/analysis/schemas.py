@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, HttpUrl
 from typing import Optional, List
 from datetime import datetime
 
@@ -14,8 +14,20 @@ class VideoAnalysis(BaseModel):
     title: Optional[str] = None
     status: str = "pending"  # "pending", "processing", "completed", "error"
     steps: List[AnalysisStep] = []
-    transcription: Optional[str] = None
-    sentiment: Optional[dict] = None
+    # References to `transcriptions` / `sentiment_analysis`; payloads are not copied into the analysis
+    transcription_id: Optional[str] = None
+    sentiment_model: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     completed_at: Optional[datetime] = None
     user_id: Optional[str] = None
+    # Set when the analysis is one video of a batch submission (`analysis.batch`)
+    batch_id: Optional[str] = None
+
+class AnalysisStreamRequest(BaseModel):
+    url: HttpUrl
+    model: Optional[str] = "deepgram-nova-2"
+
+class BatchRequest(BaseModel):
+    # Videos, playlists and channels
+    urls: List[HttpUrl] = Field(..., min_length=1)
+    model: Optional[str] = "deepgram-nova-2"
@@ -0,0 +1,219 @@
+"""
+Full-text search over the user's analyses: title, transcript and sentiment quotes.
+
+MongoDB text indexes have no Polish analyzer and cannot index compressed transcripts, so
+analyses carry their own `search_terms`: unique stems of the searchable text, lowercased,
+with Polish diacritics folded (`ł` -> `l`, `ą` -> `a`) and common inflection suffixes
+stripped (`bateria`, `baterii`, `baterią` -> `bater`). A query matches analyses containing
+all of its stems; `(user_id, search_terms, created_at, _id)` serves it newest first without
+an in-memory sort, with the same keyset cursor as the history list. Highlights are computed
+for the returned page only.
+
+Analyses completed before search existed are indexed with:
+
+    python -m app.modules.v1.analysis.search --reindex
+"""
+import argparse
+import asyncio
+from functools import lru_cache
+from typing import Iterable, List, Optional, Set
+
+from app.core.database import db
+from app.utils.text import WORD_RE, fold
+from .history import (
+    DEFAULT_PAGE_SIZE, HISTORY_SORT, MAX_PAGE_SIZE, SUMMARY_PROJECTION,
+    _serialize, decode_cursor, encode_cursor, resolve_results,
+)
+
+SEARCH_PROJECTION = {**SUMMARY_PROJECTION, "transcription_id": 1, "sentiment_model": 1}
+
+# Characters around a match in a highlight snippet; snippets per field
+SNIPPET_CONTEXT = 60
+MAX_SNIPPETS = 3
+MAX_QUERY_TERMS = 8
+
+STOPWORDS = frozenset("""
+    a aby ale bo by byc byl byla bylo co czy dla do go i ich im jak jako jest jej juz ma mi na nad nie
+    no o od oraz po pod przez przy sa sie ta tak te tego ten to tu tez w we wiec z za ze
+""".split())
+
+# Longest first; stripped only when at least MIN_STEM letters stay
+SUFFIXES = sorted("""
+    owania owanie owego owej owym owych owymi ami ach ego emu ych ymi imi iej owi ow om em ie ia ii y a e i o u
+""".split(), key=len, reverse=True)
+MIN_STEM = 3
+
+
+def stem(word: str) -> str:
+    """Light Polish stemmer of a folded word; words with digits (model names) are kept as they are"""
+    if not word.isalpha():
+        return word
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM:
+            return word[:-len(suffix)]
+    return word
+
+
+@lru_cache(maxsize=100_000)
+def term(word: str) -> Optional[str]:
+    """Index term of a word of the original text, None for stopwords and single letters"""
+    folded = fold(word)
+    if folded in STOPWORDS or (len(folded) < 2 and not folded.isdigit()):
+        return None
+    return stem(folded)
+
+
+def terms(text: Optional[str]) -> List[str]:
+    return [t for t in (term(word) for word in WORD_RE.findall(text or "")) if t]
+
+
+def quotes(sentiment: Optional[dict]) -> List[str]:
+    """Quoted sentences (`sentence`, older results: `quote`) of a sentiment payload"""
+    message = sentiment.get("message", sentiment) if isinstance(sentiment, dict) else None
+    results = message.get("results", message) if isinstance(message, dict) else None
+    found = []
+    for data in (results if isinstance(results, dict) else {}).values():
+        for item in (data.get("sentiments") or []) if isinstance(data, dict) else []:
+            if isinstance(item, dict):
+                text = item.get("sentence") or item.get("quote")
+                if isinstance(text, str):
+                    found.append(text)
+    return found
+
+
+def document_terms(title: Optional[str], transcription: Optional[str], sentiment: Optional[dict]) -> List[str]:
+    """`search_terms` of an analysis, stored with its final state"""
+    found: Set[str] = set(terms(title)) | set(terms(transcription))
+    for quote in quotes(sentiment):
+        found.update(terms(quote))
+    return sorted(found)
+
+
+def query_terms(q: str) -> List[str]:
+    # Unique, in query order
+    return list(dict.fromkeys(terms(q)))[:MAX_QUERY_TERMS]
+
+
+def _snippet_bounds(text: str, start: int, end: int) -> tuple:
+    """`SNIPPET_CONTEXT` characters around [start, end), widened or narrowed to whole words"""
+    lo, hi = max(0, start - SNIPPET_CONTEXT), min(len(text), end + SNIPPET_CONTEXT)
+    if lo > 0:
+        space = text.find(" ", lo, start)
+        lo = space + 1 if space != -1 else lo
+    if hi < len(text):
+        space = text.rfind(" ", end, hi)
+        hi = space if space != -1 else hi
+    return lo, hi
+
+
+def highlight(text: Optional[str], wanted: Iterable[str], max_snippets: int = MAX_SNIPPETS) -> List[dict]:
+    """
+    Snippets of `text` around words whose term is in `wanted`:
+    `[{"text": "...", "matches": [[start, end], ...]}]`, offsets relative to the snippet text.
+    """
+    wanted = set(wanted)
+    if not text or not wanted:
+        return []
+    windows: List[list] = []  # [lo, hi, spans]
+    for match in WORD_RE.finditer(text):
+        if term(match.group()) not in wanted:
+            continue
+        start, end = match.span()
+        if windows and end <= windows[-1][1]:
+            # Inside the previous snippet
+            windows[-1][2].append((start, end))
+            continue
+        if len(windows) == max_snippets:
+            break
+        lo, hi = _snippet_bounds(text, start, end)
+        if windows and lo < windows[-1][1]:
+            lo = windows[-1][1]
+            while lo < start and text[lo].isspace():
+                lo += 1
+        windows.append([lo, hi, [(start, end)]])
+    return [
+        {"text": text[lo:hi], "matches": [[start - lo, end - lo] for start, end in spans]}
+        for lo, hi, spans in windows
+    ]
+
+
+async def _highlights(doc: dict, wanted: List[str]) -> dict:
+    results = await resolve_results(doc)
+    found = {}
+    title = highlight(doc.get("title"), wanted, 1)
+    if title:
+        found["title"] = title
+    quote_snippets = [s for quote in quotes(results["sentiment"]) for s in highlight(quote, wanted, 1)]
+    if quote_snippets:
+        found["quotes"] = quote_snippets[:MAX_SNIPPETS]
+    transcript = highlight(results["transcription"], wanted)
+    if transcript:
+        found["transcription"] = transcript
+    return found
+
+
+async def search_analyses(
+    user_id: str, q: str, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None
+) -> dict:
+    """
+    One page of the user's analyses matching every word of `q`, newest first.\n
+    Returns `{"analyses": [... + "highlights"], "next_cursor": str | None, "terms": [...]}`.
+    """
+    limit = max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+    wanted = query_terms(q or "")
+    if not wanted:
+        return {"analyses": [], "next_cursor": None, "terms": []}
+    query = {"user_id": user_id, "search_terms": {"$all": wanted}}
+    if cursor:
+        query.update(decode_cursor(cursor))
+
+    docs = await db.analyses.find(query, SEARCH_PROJECTION).sort(HISTORY_SORT).limit(limit + 1).to_list(limit + 1)
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    highlights = await asyncio.gather(*(_highlights(doc, wanted) for doc in docs))
+    analyses = []
+    for doc, found in zip(docs, highlights):
+        summary = {key: value for key, value in doc.items() if key in SUMMARY_PROJECTION or key == "_id"}
+        analyses.append({**_serialize(summary), "highlights": found})
+    return {
+        "analyses": analyses,
+        "next_cursor": encode_cursor(docs[-1]) if has_more else None,
+        "terms": wanted,
+    }
+
+
+async def reindex(batch_size: int = 100) -> int:
+    """Set `search_terms` of completed analyses that do not have them yet"""
+    indexed = 0
+    query = {"status": "completed", "search_terms": {"$exists": False}}
+    while True:
+        docs = await db.analyses.find(query).limit(batch_size).to_list(batch_size)
+        if not docs:
+            return indexed
+        for doc in docs:
+            results = await resolve_results(doc)
+            search_terms = document_terms(doc.get("title"), results["transcription"], results["sentiment"])
+            await db.analyses.update_one({"_id": doc["_id"]}, {"$set": {"search_terms": search_terms}})
+            indexed += 1
+
+
+async def _reindex_main() -> None:
+    from app.core.database import close_db, connect_db
+    await connect_db()
+    try:
+        print(f"Indexed {await reindex()} analyses")
+    finally:
+        await close_db()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Search index of analyses")
+    parser.add_argument("--reindex", action="store_true", help="index completed analyses without search_terms")
+    args = parser.parse_args(argv)
+    if args.reindex:
+        asyncio.run(_reindex_main())
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,12 +1,16 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 import jwt
 import bcrypt
+from app.core.config import settings
 from app.core.database import db
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 
 # JWT settings
-SECRET_KEY = "your-secret-key-change-this-in-production"  # TODO: Move to config
+SECRET_KEY = settings.SECRET_KEY
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_DAYS = 7
 
@@ -19,16 +23,58 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(password_bytes, hash_bytes)
 
 
-def get_password_hash(password: str) -> str:
+def get_password_hash(password: str, rounds: Optional[int] = None) -> str:
     """Hash a password"""
     # Convert password to bytes and hash it
     password_bytes = password.encode('utf-8')
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=rounds or settings.BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password_bytes, salt)
     # Return as string for storage
     return hashed.decode('utf-8')
 
 
+def hash_rounds(hashed_password: str) -> int:
+    """Cost factor of a bcrypt hash (`$2b$<rounds>$...`)"""
+    try:
+        return int(hashed_password.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return 0
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    return hash_rounds(hashed_password) != settings.BCRYPT_ROUNDS
+
+
+# bcrypt holds the CPU for ~200 ms per call, so it runs in a bounded process pool
+_password_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_password_pool() -> ProcessPoolExecutor:
+    global _password_pool
+    if _password_pool is None:
+        _password_pool = ProcessPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS)
+    return _password_pool
+
+
+def shutdown_password_pool() -> None:
+    global _password_pool
+    if _password_pool is not None:
+        _password_pool.shutdown(wait=False, cancel_futures=True)
+        _password_pool = None
+
+
+async def hash_password_async(password: str) -> str:
+    """`get_password_hash` in the password process pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_password_pool(), get_password_hash, password, settings.BCRYPT_ROUNDS)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """`verify_password` in the password process pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_password_pool(), verify_password, plain_password, hashed_password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create a JWT token"""
     to_encode = data.copy()
@@ -53,21 +99,20 @@ def decode_token(token: str) -> Optional[dict]:
         return None
 
 
+# Fields needed for login/registration responses (skips any future profile data)
+USER_PROJECTION = {"email": 1, "password": 1, "created_at": 1}
+
+
 async def get_user_by_email(email: str):
-    """Get user by email"""
-    user = await db.users.find_one({"email": email})
+    """Get user by email (served by the unique `email` index)"""
+    user = await db.users.find_one({"email": email}, USER_PROJECTION)
     return user
 
 
 async def create_user(email: str, password: str):
-    """Create a new user"""
-    # Check if user already exists
-    existing_user = await get_user_by_email(email)
-    if existing_user:
-        return None
-    
+    """Create a new user, None if the email is taken"""
     # Hash password
-    hashed_password = get_password_hash(password)
+    hashed_password = await hash_password_async(password)
     
     # Create user document
     user_doc = {
@@ -76,12 +121,13 @@ async def create_user(email: str, password: str):
         "created_at": datetime.utcnow()
     }
     
-    # Insert into database
-    result = await db.users.insert_one(user_doc)
-    
-    # Get the created user
-    user = await db.users.find_one({"_id": result.inserted_id})
-    return user
+    # Single insert; the unique index rejects duplicates (also concurrent registrations)
+    try:
+        result = await db.users.insert_one(user_doc)
+    except DuplicateKeyError:
+        return None
+    user_doc["_id"] = result.inserted_id
+    return user_doc
 
 
 async def authenticate_user(email: str, password: str):
@@ -89,17 +135,10 @@ async def authenticate_user(email: str, password: str):
     user = await get_user_by_email(email)
     if not user:
         return False
-    if not verify_password(password, user["password"]):
+    if not await verify_password_async(password, user["password"]):
         return False
+    # Cost factor changed since the hash was made: upgrade it while we know the password
+    if needs_rehash(user["password"]):
+        user["password"] = await hash_password_async(password)
+        await db.users.update_one({"_id": user["_id"]}, {"$set": {"password": user["password"]}})
     return user
-
-
-def decode_token(token: str):
-    """Decode and verify JWT token"""
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
-    except jwt.ExpiredSignatureError:
-        return None
-    except jwt.JWTError:
-        return None
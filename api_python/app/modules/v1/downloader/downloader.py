@@ -1,11 +1,84 @@
+import subprocess
 from pathlib import Path
-from typing import Dict, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 
 from pydantic import HttpUrl
 import yt_dlp
 from app.core.exceptions import DownloadError
+from app.utils.helpers import canonical_video_url, format_eta, youtube_video_id
 
 
+# app/modules/v1/downloader -> app/resources
+RESOURCES_DIR = Path(__file__).resolve().parents[3] / "resources"
+
+# Receives progress updates: {"step", "message", "percent", "eta", ...}; "status" defaults to in_progress
+ProgressCallback = Callable[[Dict], None]
+
+
+def _download_progress_hook(progress: ProgressCallback) -> Callable[[Dict], None]:
+	"""yt-dlp `progress_hooks` entry translating its status dicts into progress updates."""
+	def hook(d: Dict) -> None:
+		if d.get("status") == "downloading":
+			total = d.get("total_bytes") or d.get("total_bytes_estimate")
+			done = d.get("downloaded_bytes") or 0
+			percent = round(done * 100 / total, 1) if total else None
+			eta = d.get("eta")
+			label = f" {percent:.0f}%" if percent is not None else ""
+			progress({
+				"step": "download",
+				"message": f"Pobieranie audio z YouTube...{label}{format_eta(eta)}",
+				"percent": percent,
+				"eta": eta,
+				"downloaded_bytes": done,
+				"total_bytes": total,
+			})
+		elif d.get("status") == "finished":
+			progress({"step": "download", "status": "completed", "message": "Audio pobrane", "percent": 100.0, "eta": 0})
+	return hook
+
+
+def _convert_audio(
+	src: Path,
+	dst: Path,
+	duration: Optional[float],
+	ffmpeg_args: List[str],
+	progress: ProgressCallback,
+) -> None:
+	"""Convert `src` with ffmpeg, reporting its `-progress` output time against `duration`."""
+	cmd = [
+		"ffmpeg", "-y", "-hide_banner", "-nostats", "-loglevel", "error",
+		"-i", str(src), "-vn", *ffmpeg_args,
+		"-progress", "pipe:1", str(dst),
+	]
+	proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+	speed = None
+	for line in proc.stdout:
+		key, _, value = line.strip().partition("=")
+		if key == "speed" and value.endswith("x"):
+			try:
+				speed = float(value[:-1])
+			except ValueError:
+				speed = None
+		elif key in ("out_time_us", "out_time_ms") and duration:
+			# Both keys are in microseconds (out_time_ms is misnamed by ffmpeg)
+			try:
+				done = int(value) / 1_000_000
+			except ValueError:
+				continue
+			percent = round(min(100.0, done * 100 / duration), 1)
+			eta = round((duration - done) / speed) if speed else None
+			progress({
+				"step": "convert",
+				"message": f"Konwersja audio... {percent:.0f}%{format_eta(eta)}",
+				"percent": percent,
+				"eta": eta,
+			})
+	stderr = proc.stderr.read()
+	if proc.wait() != 0:
+		raise DownloadError(f"ffmpeg conversion failed: {stderr.strip()[-500:]}")
+	progress({
+		"step": "convert", "status": "completed", "message": "Konwersja audio zakończona", "percent": 100.0, "eta": 0,
+	})
 
 
 def download_audio(
@@ -20,6 +93,7 @@ def download_audio(
 	bitrate: Optional[str] = None,
 	force: bool = False,
 	ytdlp_opts: Optional[Dict] = None,
+	progress: Optional[ProgressCallback] = None,
 ) -> Tuple[str, Path, Optional[str]]:
 	"""
 	Download audio from a YouTube URL and save it into `app/resources`.
@@ -35,6 +109,9 @@ def download_audio(
 	- bitrate: audio bitrate string like '192k' (None to use defaults)
 	- force: overwrite existing file if True
 	- ytdlp_opts: extra options passed to yt_dlp
+	- progress: optional callback receiving download (yt-dlp hooks) and conversion
+	  (ffmpeg time) progress; conversion is then run by ffmpeg directly instead of
+	  the yt-dlp postprocessor
 
 	Returns (filename_hash, path_to_file, title)
 
@@ -47,9 +124,7 @@ def download_audio(
 
 	url = str(url) 
 	# compute out_dir
-	project_root = Path(__file__).resolve().parents[3]  # app/modules/v1/downloader -> app
-	default_out = project_root / "resources"
-	out_dir = Path(out_dir) if out_dir else default_out
+	out_dir = Path(out_dir) if out_dir else RESOURCES_DIR
 	out_dir.mkdir(parents=True, exist_ok=True)
 
 	# build filename
@@ -99,6 +174,28 @@ def download_audio(
 		ytdlp_opts.setdefault("postprocessor_args", [])
 		ytdlp_opts["postprocessor_args"] += pp_args
 
+	if progress:
+		ytdlp_opts["progress_hooks"] = [_download_progress_hook(progress)]
+		ytdlp_opts.pop("postprocessors", None)
+		ytdlp_opts.pop("postprocessor_args", None)
+		ffmpeg_args = list(pp_args)
+		if bitrate:
+			ffmpeg_args += ["-b:a", bitrate]
+		try:
+			with yt_dlp.YoutubeDL(ytdlp_opts) as ydl:
+				info = ydl.extract_info(url, download=True)
+			downloads = info.get("requested_downloads") if isinstance(info, dict) else None
+			src = Path(downloads[0]["filepath"]) if downloads else next(out_dir.glob(f"{filename_hash}.*"))
+			if src == out_path:
+				src = src.rename(src.with_suffix(f".src{src.suffix}"))
+			_convert_audio(src, out_path, info.get("duration"), ffmpeg_args, progress)
+			src.unlink(missing_ok=True)
+			return str(filename_hash), out_path, info.get("title")
+		except DownloadError:
+			raise
+		except Exception as exc:
+			raise DownloadError(f"Failed to download audio for {url}: {exc}") from exc
+
 	try:
 		with yt_dlp.YoutubeDL(ytdlp_opts) as ydl:
 			info = ydl.extract_info(url, download=True)
@@ -114,6 +211,71 @@ def download_audio(
 		raise DownloadError(f"Failed to download audio for {url}: {exc}") from exc
 
 
+def _flat_videos(ydl, info: Dict, max_entries: int, depth: int = 0) -> List[Dict]:
+	"""Video entries of a flat-extracted playlist; channel tabs (Videos, Shorts...) are expanded one level deep."""
+	videos: List[Dict] = []
+	for entry in info.get("entries") or []:
+		if len(videos) >= max_entries:
+			break
+		if not isinstance(entry, dict):
+			continue
+		url = entry.get("url") or entry.get("webpage_url")
+		if entry.get("_type") == "playlist" or (entry.get("ie_key") == "YoutubeTab" and url):
+			if depth == 0:
+				nested = entry if entry.get("entries") is not None else ydl.extract_info(url, download=False)
+				videos += _flat_videos(ydl, nested, max_entries - len(videos), depth + 1)
+			continue
+		video_id = youtube_video_id(url) if url else None
+		if video_id is None and entry.get("ie_key") == "Youtube":
+			video_id = entry.get("id")
+		if video_id:
+			url = canonical_video_url(video_id)
+		if url:
+			videos.append({"video_id": video_id, "url": url, "title": entry.get("title")})
+	return videos
+
+
+def expand_url(url: str, max_entries: int) -> List[Dict]:
+	"""
+	Videos behind a URL: a playlist or channel is listed with yt-dlp flat extraction (one
+	listing request, no per-video extraction), a video URL is returned as is.
+
+	Returns `[{"video_id", "url", "title"}]`, YouTube videos with their canonical watch URL.
+	Raises DownloadError when the URL cannot be listed.
+	"""
+	url = str(url)
+	video_id = youtube_video_id(url)
+	if video_id:
+		return [{"video_id": video_id, "url": canonical_video_url(video_id), "title": None}]
+	opts = {"quiet": True, "skip_download": True, "extract_flat": "in_playlist", "playlistend": max_entries}
+	try:
+		with yt_dlp.YoutubeDL(opts) as ydl:
+			info = ydl.extract_info(url, download=False)
+			if not isinstance(info, dict):
+				raise DownloadError(f"Nothing to analyze at {url}")
+			if info.get("_type") not in ("playlist", "multi_video"):
+				# A single (non-YouTube) video
+				return [{"video_id": None, "url": info.get("webpage_url") or url, "title": info.get("title")}]
+			return _flat_videos(ydl, info, max_entries)
+	except DownloadError:
+		raise
+	except Exception as exc:
+		raise DownloadError(f"Failed to list videos of {url}: {exc}") from exc
+
+
+def audio_duration(path: Path) -> Optional[float]:
+	"""Duration of an audio file in seconds (ffprobe), None when it cannot be read."""
+	cmd = [
+		"ffprobe", "-v", "error", "-show_entries", "format=duration",
+		"-of", "default=noprint_wrappers=1:nokey=1", str(path),
+	]
+	try:
+		result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+		return float(result.stdout.strip())
+	except (OSError, ValueError, subprocess.SubprocessError):
+		return None
+
+
 if __name__ == "__main__":
     test_url = "https://www.youtube.com/shorts/c7SRzIUjVYw"
     filename_hash, path, info = download_audio(
@@ -0,0 +1,165 @@
+"""
+Run `download_audio` in a separate process so it can be killed on cancellation.
+
+The worker is started in its own session (process group), so killing the group
+also stops the ffmpeg processes spawned by yt-dlp for postprocessing.
+Protocol: JSON arguments on stdin; on stdout `{"progress": {...}}` lines while
+working, then one JSON result object as the last line.
+"""
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+from pathlib import Path
+from typing import Optional, Tuple
+
+from app.core.exceptions import DownloadError
+from app.modules.v1.analysis.registry import analysis_registry, current_analysis
+from .downloader import RESOURCES_DIR, download_audio
+
+logger = logging.getLogger(__name__)
+
+# app/modules/v1/downloader -> api_python (so `-m app...` resolves in the child)
+PROJECT_ROOT = Path(__file__).resolve().parents[4]
+
+
+def _cpu_seconds_of(pid: int) -> float:
+    """CPU time (user + system) of a live process, 0.0 where /proc is unavailable."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        # utime, stime, cutime, cstime (fields 14-17 of proc(5))
+        ticks = sum(int(x) for x in fields[11:15])
+        return ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+def _kill_group(proc: asyncio.subprocess.Process) -> None:
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError, AttributeError):
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass
+
+
+def _remove_scratch_files(out_dir: Path, filename_hash: str) -> None:
+    for leftover in out_dir.glob(f"{filename_hash}.*"):
+        try:
+            leftover.unlink(missing_ok=True)
+        except OSError:
+            pass
+
+
+async def download_audio_in_worker(
+    url: str,
+    filename_hash: str,
+    *,
+    out_dir: Optional[Path] = None,
+) -> Tuple[str, Path, Optional[str]]:
+    """
+    Same contract as `download_audio`, but runs in a killable child process.\n
+    On task cancellation the worker (yt-dlp + ffmpeg) is killed and scratch audio removed.
+    """
+    out_dir = Path(out_dir) if out_dir else RESOURCES_DIR
+    args = json.dumps({"url": str(url), "filename_hash": filename_hash, "out_dir": str(out_dir)})
+    env = dict(os.environ, PYTHONPATH=str(PROJECT_ROOT))
+
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "app.modules.v1.downloader.worker",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=str(PROJECT_ROOT),
+        env=env,
+        start_new_session=True,
+    )
+    entry = current_analysis.get()
+    on_progress = entry.progress if entry else None
+    stderr_task = None
+    try:
+        proc.stdin.write(args.encode("utf-8"))
+        await proc.stdin.drain()
+        proc.stdin.close()
+        stderr_task = asyncio.ensure_future(proc.stderr.read())
+        last_line = b""
+        async for line in proc.stdout:
+            if line.startswith(b'{"progress"'):
+                if on_progress:
+                    try:
+                        on_progress(json.loads(line)["progress"])
+                    except (ValueError, KeyError):
+                        pass
+                continue
+            if line.strip():
+                last_line = line
+        stderr = await stderr_task
+        await proc.wait()
+    except asyncio.CancelledError:
+        spent = _cpu_seconds_of(proc.pid)
+        _kill_group(proc)
+        if stderr_task:
+            stderr_task.cancel()
+        await proc.wait()
+        _remove_scratch_files(out_dir, filename_hash)
+        if entry:
+            entry.cpu_seconds += spent
+        logger.info(f"Download worker {proc.pid} killed after {spent:.2f} CPU s")
+        raise
+
+    try:
+        result = json.loads(last_line.decode("utf-8"))
+    except ValueError:
+        raise DownloadError(
+            f"Download worker failed for {url}",
+            detail={"returncode": proc.returncode, "stderr": stderr.decode("utf-8", "replace")[-2000:]},
+        )
+
+    if not result.get("ok"):
+        raise DownloadError(result.get("error") or f"Failed to download audio for {url}")
+
+    cpu = float(result.get("cpu_seconds", 0.0))
+    analysis_registry.record_download(cpu)
+    if entry:
+        entry.cpu_seconds += cpu
+        entry.download_finished = True
+    return result["filename_hash"], Path(result["path"]), result.get("title")
+
+
+def _own_cpu_seconds() -> float:
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    usage = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+    return sum(u.ru_utime + u.ru_stime for u in usage)
+
+
+def main() -> None:
+    args = json.loads(sys.stdin.read())
+    # yt-dlp prints progress on stdout; keep it for the result line only
+    real_stdout = sys.stdout
+    sys.stdout = sys.stderr
+
+    def report(progress: dict) -> None:
+        real_stdout.write(json.dumps({"progress": progress}) + "\n")
+        real_stdout.flush()
+
+    try:
+        base, path, title = download_audio(
+            args["url"], args["filename_hash"], out_dir=args.get("out_dir"), progress=report
+        )
+        result = {"ok": True, "filename_hash": base, "path": str(path), "title": title}
+    except Exception as exc:
+        result = {"ok": False, "error": str(exc)}
+    result["cpu_seconds"] = _own_cpu_seconds()
+    real_stdout.write(json.dumps(result) + "\n")
+    real_stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Alignment of the LLM's quoted sentences (`sentence`) with the transcript.
+
+The prompt asks for exact quotes, but models trim, re-punctuate or paraphrase them, and
+sometimes invent them. `QuoteAligner` indexes the transcript once - folded words
+(lowercase, no diacritics) and an n-gram -> positions map - and resolves each quote:
+
+1. the quote's n-grams vote for candidate start positions in the transcript,
+2. the best few candidates are compared word by word (`difflib.SequenceMatcher`),
+3. the best one with a similarity of at least `MIN_SCORE` gives the character span of the
+   quote in the transcript (and its time span when word timings are known, see
+   `transcription.word_timings`).
+
+Quotes with no such candidate are flagged `matched: False`.
+"""
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.modules.v1.transcription.word_timings import WordTimings
+from app.utils.text import WORD_RE, fold
+
+NGRAM = 3
+MIN_SCORE = 0.8
+CANDIDATES = 3
+# Transcript words compared beyond the quote length (insertions in the transcript)
+SLACK = 0.25
+
+
+class QuoteAligner:
+    def __init__(self, transcript: str, timings: Optional[WordTimings] = None):
+        self.transcript = transcript or ""
+        matches = list(WORD_RE.finditer(self.transcript))
+        self.words = [fold(m.group()) for m in matches]
+        self.spans = [m.span() for m in matches]
+        self.index: Dict[Tuple[str, ...], List[int]] = defaultdict(list)
+        for i in range(len(self.words) - NGRAM + 1):
+            self.index[tuple(self.words[i:i + NGRAM])].append(i)
+        self.timings = timings if timings is not None and len(timings) else None
+
+    def _candidates(self, quote: List[str]) -> List[int]:
+        if len(quote) < NGRAM:
+            first = quote[0]
+            return [i for i, word in enumerate(self.words) if word == first][:CANDIDATES * 10]
+        votes: Counter = Counter()
+        for offset in range(len(quote) - NGRAM + 1):
+            for position in self.index.get(tuple(quote[offset:offset + NGRAM]), ()):
+                votes[max(0, position - offset)] += 1
+        # Nearby starts are the same occurrence shifted by an insertion/deletion
+        chosen: List[int] = []
+        for start, _ in votes.most_common():
+            if all(abs(start - other) > 2 for other in chosen):
+                chosen.append(start)
+                if len(chosen) == CANDIDATES:
+                    break
+        return chosen
+
+    def align(self, quote: str) -> dict:
+        """`{"matched", "score", "start", "end"[, "start_time", "end_time"]}` of a quote"""
+        words = [fold(m.group()) for m in WORD_RE.finditer(quote or "")]
+        if not words or not self.words:
+            return {"matched": False, "score": 0.0}
+        best: Optional[Tuple[float, int, int]] = None
+        window = len(words) + max(2, int(len(words) * SLACK))
+        for candidate in self._candidates(words):
+            lo = max(0, candidate - window + len(words))
+            segment = self.words[lo:candidate + window]
+            matcher = SequenceMatcher(None, words, segment, autojunk=False)
+            blocks = [block for block in matcher.get_matching_blocks() if block.size]
+            if not blocks:
+                continue
+            first, last = lo + blocks[0].b, lo + blocks[-1].b + blocks[-1].size - 1
+            # Matched words over the quote and the transcript stretch it covers
+            matched = sum(block.size for block in blocks)
+            score = 2 * matched / (len(words) + last - first + 1)
+            if best is None or score > best[0]:
+                best = (score, first, last)
+        if best is None or best[0] < MIN_SCORE:
+            return {"matched": False, "score": round(best[0], 3) if best else 0.0}
+        score, first, last = best
+        result = {"matched": True, "score": round(score, 3), "start": self.spans[first][0], "end": self.spans[last][1]}
+        if self.timings:
+            result["start_time"], result["end_time"] = self.timings.span_times(result["start"], result["end"])
+        return result
+
+
+def quoted_items(results: Optional[dict]) -> Iterator[dict]:
+    """Sentiment items of a `results` dict that carry a quoted `sentence`"""
+    for data in (results if isinstance(results, dict) else {}).values():
+        for item in (data.get("sentiments") or []) if isinstance(data, dict) else []:
+            if isinstance(item, dict) and isinstance(item.get("sentence"), str):
+                yield item
+
+
+def align_results(results: Optional[dict], transcript: str, timings: Optional[WordTimings] = None) -> dict:
+    """
+    Add `alignment` to every quoted sentiment of `results` (the `results` dict of the sentiment
+    payload, modified in place). Returns `{"quotes": n, "matched": n, "unmatched": [quotes]}`.
+    """
+    aligner = None
+    summary = {"quotes": 0, "matched": 0, "unmatched": []}
+    for item in quoted_items(results):
+        aligner = aligner or QuoteAligner(transcript, timings)
+        item["alignment"] = aligner.align(item["sentence"])
+        summary["quotes"] += 1
+        if item["alignment"]["matched"]:
+            summary["matched"] += 1
+        else:
+            summary["unmatched"].append(item["sentence"])
+    return summary
@@ -0,0 +1,310 @@
+"""
+Re-run sentiment analysis over the stored transcriptions, after switching the model or changing
+`SYSTEM_PROMPT` (and bumping `PROMPT_VERSION`):
+
+    python -m app.modules.v1.sentiment.backfill --model llama-3.3-70b-versatile --dry-run
+    python -m app.modules.v1.sentiment.backfill --model llama-3.3-70b-versatile
+
+Transcriptions are read in `_id` order, `BACKFILL_BATCH_SIZE` at a time. Those that already have
+results of the model and the current prompt version are skipped; the rest are analyzed with
+`analyze(..., refresh=True)`, at most `BACKFILL_CONCURRENCY` at a time and within the provider's
+limits (`BACKFILL_REQUESTS_PER_MINUTE`, `BACKFILL_TOKENS_PER_MINUTE`, with estimated tokens).
+
+After every batch the last `_id` and the counters are stored in `maintenance`
+(`backfill:<model>:v<version>`), so an interrupted run continues where it stopped (`--restart`
+starts over). Transcriptions still failing after `--retries` are listed in the checkpoint's
+`failed_ids`. Servers only serve results of the current prompt version (`get_saved_results`).
+
+The analyses showing a re-analyzed transcription get their `sentiment_digest` and `search_terms`
+recomputed after every batch; the `aspect_rollups` built from the digests are rebuilt
+(`rollups.rebuild`) once at the end of a run that changed any.
+
+`--dry-run` only counts the pending transcriptions and estimates tokens, cost and duration.
+"""
+import argparse
+import asyncio
+import logging
+import math
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from app.core.cache import sentiment_cache
+from app.core.compression import TEXT_PROJECTION, unpack_text
+from app.core.config import settings
+from app.core.database import db
+from app.core.rate_limit import TokenBucket
+from app.modules.v1.analysis import history, rollups, search
+from app.modules.v1.transcription.word_timings import WORDS_PROJECTION, WordTimings
+from .service import DEFAULT_MODEL, PROMPT_VERSION, SYSTEM_PROMPT, analyze, current_prompt_query, get_saved_results
+
+logger = logging.getLogger(__name__)
+
+# Polish text with the Llama 3 tokenizer; the JSON answer grows with the number of opinions
+CHARS_PER_TOKEN = 3.0
+OUTPUT_TOKENS_BASE = 200
+OUTPUT_TOKENS_RATIO = 0.15
+
+# USD per 1M input / output tokens (Groq list prices); other models need --price-in / --price-out
+PRICES: Dict[str, Tuple[float, float]] = {
+    "llama-3.3-70b-versatile": (0.59, 0.79),
+    "llama-3.1-8b-instant": (0.05, 0.08),
+}
+
+RETRY_BACKOFF_SECONDS = 5.0
+MAX_FAILED_IDS = 1000
+
+
+def checkpoint_id(model: str) -> str:
+    return f"backfill:{model}:v{PROMPT_VERSION}"
+
+
+def estimate_tokens(text: str) -> Tuple[int, int]:
+    """(input, output) tokens of analyzing a transcription"""
+    prompt = math.ceil((len(SYSTEM_PROMPT) + len(text)) / CHARS_PER_TOKEN)
+    return prompt, OUTPUT_TOKENS_BASE + math.ceil(len(text) / CHARS_PER_TOKEN * OUTPUT_TOKENS_RATIO)
+
+
+def cost(model: str, input_tokens: int, output_tokens: int, prices: Optional[Tuple[float, float]] = None) -> Optional[float]:
+    prices = prices or PRICES.get(model)
+    if prices is None:
+        return None
+    return round((input_tokens * prices[0] + output_tokens * prices[1]) / 1_000_000, 2)
+
+
+class ProviderLimiter:
+    """Requests and tokens per minute of the LLM account; callers wait in arrival order"""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        now = time.monotonic()
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60, now) \
+            if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60, now) if tokens_per_minute > 0 else None
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    async def _take(bucket: Optional[TokenBucket], amount: float) -> None:
+        if bucket is None:
+            return
+        # A transcription larger than the whole budget waits for a full bucket
+        amount = min(amount, bucket.capacity)
+        while True:
+            wait = bucket.take(time.monotonic(), amount)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    async def acquire(self, tokens: int) -> None:
+        async with self._lock:
+            await self._take(self.requests, 1)
+            await self._take(self.tokens, tokens)
+
+
+def _after(last_id) -> dict:
+    return {"_id": {"$gt": last_id}} if last_id is not None else {}
+
+
+async def _pending(docs: List[dict], model: str) -> List[dict]:
+    """Transcriptions of a batch without results of `model` and the current prompt"""
+    ids = [str(doc["_id"]) for doc in docs]
+    current = await db.sentiment_analysis.find(
+        {"transcription_id": {"$in": ids}, "model": model, **current_prompt_query()}, {"transcription_id": 1}
+    ).to_list(None)
+    done = {doc["transcription_id"] for doc in current}
+    return [doc for doc in docs if str(doc["_id"]) not in done]
+
+
+async def _batches(batch_size: int, last_id=None, projection: Optional[dict] = None):
+    while True:
+        docs = await db.transcriptions.find(_after(last_id), projection or TEXT_PROJECTION) \
+            .sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not docs:
+            return
+        yield docs
+        last_id = docs[-1]["_id"]
+
+
+async def refresh_analyses(texts: Dict[str, str], model: str) -> int:
+    """
+    Recompute `sentiment_digest` and `search_terms` of the completed analyses referencing the
+    re-analyzed transcriptions (`texts`: transcription id -> text); returns how many were updated.
+    Older analyses carrying their sentiment inline keep showing it and are left alone.
+    """
+    if not texts:
+        return 0
+    for transcription_id in texts:
+        sentiment_cache.invalidate((transcription_id, model))
+    docs = await db.analyses.find(
+        {"transcription_id": {"$in": list(texts)}, "sentiment_model": model, "status": "completed", "sentiment": None},
+        {"title": 1, "transcription_id": 1},
+    ).to_list(None)
+    updates = []
+    for doc in docs:
+        sentiment = {"message": await get_saved_results(doc["transcription_id"], model)}
+        updates.append(UpdateOne({"_id": doc["_id"]}, {"$set": {
+            "sentiment_digest": history.sentiment_digest(sentiment),
+            "search_terms": search.document_terms(doc.get("title"), texts[doc["transcription_id"]], sentiment),
+        }}))
+    if updates:
+        await db.analyses.bulk_write(updates, ordered=False)
+    return len(updates)
+
+
+def _duration(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+async def estimate(model: str = DEFAULT_MODEL, prices: Optional[Tuple[float, float]] = None,
+                   batch_size: Optional[int] = None) -> dict:
+    """Pending transcriptions of `model` with their estimated tokens, cost (USD) and duration (minutes)"""
+    batch_size = batch_size or settings.BACKFILL_BATCH_SIZE
+    found = {"transcriptions": 0, "pending": 0, "input_tokens": 0, "output_tokens": 0}
+    async for docs in _batches(batch_size):
+        found["transcriptions"] += len(docs)
+        for doc in await _pending(docs, model):
+            text = unpack_text(doc) or ""
+            if not text:
+                continue
+            input_tokens, output_tokens = estimate_tokens(text)
+            found["pending"] += 1
+            found["input_tokens"] += input_tokens
+            found["output_tokens"] += output_tokens
+    found["cost_usd"] = cost(model, found["input_tokens"], found["output_tokens"], prices)
+    rpm, tpm = settings.BACKFILL_REQUESTS_PER_MINUTE, settings.BACKFILL_TOKENS_PER_MINUTE
+    found["minutes"] = round(max(
+        found["pending"] / rpm if rpm > 0 else 0.0,
+        (found["input_tokens"] + found["output_tokens"]) / tpm if tpm > 0 else 0.0,
+    ), 1)
+    return found
+
+
+async def run_backfill(
+    model: str = DEFAULT_MODEL,
+    concurrency: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    limit: Optional[int] = None,
+    retries: int = 2,
+    restart: bool = False,
+    report: Callable[[str], None] = logger.info,
+) -> dict:
+    """
+    Re-analyze the transcriptions without current results of `model`, resuming from the checkpoint.\n
+    `limit` stops after that many analyses (at the end of a batch). Returns the checkpoint counters.
+    """
+    concurrency = concurrency or settings.BACKFILL_CONCURRENCY
+    batch_size = batch_size or settings.BACKFILL_BATCH_SIZE
+    job_id = checkpoint_id(model)
+    if restart:
+        await db.maintenance.delete_one({"_id": job_id})
+    checkpoint = await db.maintenance.find_one({"_id": job_id}) or {}
+    last_id = checkpoint.get("last_id")
+    stats = {key: checkpoint.get(key, 0) for key in ("scanned", "analyzed", "skipped", "failed", "tokens",
+                                                     "analyses_updated")}
+
+    remaining = await db.transcriptions.count_documents(_after(last_id))
+    limiter = ProviderLimiter(settings.BACKFILL_REQUESTS_PER_MINUTE, settings.BACKFILL_TOKENS_PER_MINUTE)
+    semaphore = asyncio.Semaphore(concurrency)
+    started, scanned, analyzed, analyses_updated = time.perf_counter(), 0, 0, 0
+
+    async def reanalyze(doc: dict) -> Optional[int]:
+        """Tokens used, None if the analysis kept failing"""
+        text = unpack_text(doc) or ""
+        tokens = sum(estimate_tokens(text))
+        async with semaphore:
+            for attempt in range(retries + 1):
+                await limiter.acquire(tokens)
+                # None: provider/API error (rate limit, invalid JSON), logged by `analyze`
+                if await analyze(str(doc["_id"]), model, transcription_text=text, refresh=True,
+                                 word_timings=WordTimings.unpack(doc, text)) is not None:
+                    return tokens
+                if attempt < retries:
+                    await asyncio.sleep(RETRY_BACKOFF_SECONDS * 2 ** attempt)
+        return None
+
+    report(f"Backfill {job_id}: {remaining} transcriptions to check"
+           + (f", resuming after {last_id}" if last_id is not None else ""))
+    # Word timings come with the text: quote alignment needs no read per transcription
+    async for docs in _batches(batch_size, last_id, {**TEXT_PROJECTION, **WORDS_PROJECTION}):
+        pending = [doc for doc in await _pending(docs, model) if unpack_text(doc)]
+        outcomes = await asyncio.gather(*(reanalyze(doc) for doc in pending))
+        failed_ids = [str(doc["_id"]) for doc, tokens in zip(pending, outcomes) if tokens is None]
+        updated = await refresh_analyses(
+            {str(doc["_id"]): unpack_text(doc) for doc, tokens in zip(pending, outcomes) if tokens is not None}, model
+        )
+        analyses_updated += updated
+
+        last_id = docs[-1]["_id"]
+        scanned += len(docs)
+        analyzed += len(pending) - len(failed_ids)
+        stats["scanned"] += len(docs)
+        stats["analyzed"] += len(pending) - len(failed_ids)
+        stats["skipped"] += len(docs) - len(pending)
+        stats["failed"] += len(failed_ids)
+        stats["tokens"] += sum(tokens for tokens in outcomes if tokens)
+        stats["analyses_updated"] += updated
+        update = {
+            "$set": {**stats, "last_id": last_id, "model": model, "prompt_version": PROMPT_VERSION,
+                     "updated_at": datetime.utcnow()},
+            "$setOnInsert": {"started_at": datetime.utcnow()},
+        }
+        if failed_ids:
+            update["$push"] = {"failed_ids": {"$each": failed_ids, "$slice": -MAX_FAILED_IDS}}
+        await db.maintenance.update_one({"_id": job_id}, update, upsert=True)
+
+        elapsed = time.perf_counter() - started
+        rate = scanned / elapsed if elapsed else 0.0
+        eta = _duration((remaining - scanned) / rate) if rate else "?"
+        report(f"{scanned}/{remaining} checked, {analyzed} analyzed, {stats['failed']} failed - "
+               f"{rate:.2f} transcriptions/s, {analyzed / elapsed * 60 if elapsed else 0:.1f} analyses/min, ETA {eta}")
+        if limit and analyzed >= limit:
+            break
+    else:
+        await db.maintenance.update_one({"_id": job_id}, {"$set": {"finished_at": datetime.utcnow()}}, upsert=True)
+    if analyses_updated:
+        report(f"{analyses_updated} analyses updated, rebuilding rollups")
+        await rollups.rebuild()
+    return stats
+
+
+async def _main(args) -> None:
+    from app.core.database import close_db, connect_db, init_indexes
+    await connect_db()
+    try:
+        if args.dry_run:
+            prices = (args.price_in, args.price_out) if args.price_in is not None and args.price_out is not None else None
+            found = await estimate(args.model, prices, args.batch_size)
+            price = f"${found['cost_usd']:.2f}" if found["cost_usd"] is not None else "unknown (pass --price-in/--price-out)"
+            print(f"{found['pending']} of {found['transcriptions']} transcriptions to analyze with {args.model} "
+                  f"(prompt v{PROMPT_VERSION}): ~{found['input_tokens']} input + ~{found['output_tokens']} output tokens, "
+                  f"cost {price}, ~{found['minutes']} min at the configured limits")
+        else:
+            # The rollup rebuild's `$merge ... on` needs the unique index
+            await init_indexes()
+            stats = await run_backfill(args.model, args.concurrency, args.batch_size, args.limit, args.retries,
+                                       args.restart, report=print)
+            print(f"Done: {stats}")
+    finally:
+        await close_db()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Re-run sentiment analysis over stored transcriptions")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--dry-run", action="store_true", help="only estimate tokens, cost and duration")
+    parser.add_argument("--concurrency", type=int, default=None, help="default: BACKFILL_CONCURRENCY")
+    parser.add_argument("--batch-size", type=int, default=None, help="default: BACKFILL_BATCH_SIZE")
+    parser.add_argument("--limit", type=int, default=None, help="stop after this many analyses")
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint of an earlier run")
+    parser.add_argument("--price-in", type=float, default=None, help="USD per 1M input tokens")
+    parser.add_argument("--price-out", type=float, default=None, help="USD per 1M output tokens")
+    args = parser.parse_args(argv)
+    asyncio.run(_main(args))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
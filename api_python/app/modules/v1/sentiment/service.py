@@ -1,68 +1,32 @@
+import asyncio
 import datetime
 from bson import ObjectId
+from fastapi.concurrency import run_in_threadpool
 from app.core.sentiment_keywords import ASPECT_KEYWORDS
-from app.core.groq_secret import GROQ_SECRET
+from app.core.config import settings
+from app.core.concurrency import stage_limiter
+from app.core.cache import sentiment_cache
+from app.core.compression import TEXT_PROJECTION, unpack_text
+from app.modules.v1.sentiment.alignment import align_results
+from app.modules.v1.transcription.word_timings import WORDS_PROJECTION, WordTimings
 import logging
+from typing import Optional
 from app.core.database import db
 from groq import Groq, APIError
+from pymongo.errors import DuplicateKeyError
 import json
 
-async def save_results_to_db(transcription_id: str, analysis_model: str, analysis_results: dict) -> None:
-    """Save sentiment analysis results to the database."""
-    try:
-        await db.sentiment_analysis.insert_one({
-            "transcription_id": transcription_id,
-            "model": analysis_model,
-            "results": analysis_results,
-            "created_at": datetime.datetime.now(tz=datetime.timezone.utc)
-        })
-        logging.info(f"✅    Saved sentiment analysis results to DB for transcription_id: {transcription_id}")
-    except Exception as e:
-        logging.error(f"❌    Error saving sentiment analysis results to DB: {e}")
-
-
-async def analyze(transcript_id: str, analysis_model: str = "llama-3.3-70b-versatile") -> list[dict]:
-    """
-    Analyze sentiment for a given transcription ID.\n
-    Uses Groq API with llama-3.3-70b-versatile model.
-    """
+DEFAULT_MODEL = "llama-3.3-70b-versatile"
+# Bump when SYSTEM_PROMPT changes in a way that should re-run stored results (see `sentiment.backfill`);
+# results saved before versioning have no `prompt_version` and count as version 1
+PROMPT_VERSION = 1
 
-    try: 
-        oid = ObjectId(transcript_id)
-    except Exception:
-        logging.error(f"Invalid transcription_id (not an ObjectId): {transcript_id}")
-        return []
-    
-    try:
-        doc = await db.transcriptions.find_one({"_id": oid})
-    except Exception as e:
-        logging.error(f"❌    Error fetching transcription from DB: {e}")
-        return []
-    
-    try:
-        transcription_text = doc["transcription"] if doc else ""
-    except Exception as e:
-        logging.error(f"❌    Error accessing transcription text: {e}")
-        return []
-    
-    existing = await db.sentiment_analysis.find_one({"transcription_id": transcript_id, "model": analysis_model})
-    if existing:
-        logging.info(f"✅    Found existing sentiment analysis results for transcription_id: {transcript_id}")
-        return existing["results"]
-    
-    if not transcription_text:
-        return []
-
-    ASPECT_LIST = ASPECT_KEYWORDS.keys()
-
-    client = Groq(api_key=GROQ_SECRET)
-
-    system_prompt = f"""
+SYSTEM_PROMPT = f"""
     Jesteś ekspertem od analizy sentymentu polskich recenzji telefonów. 
     Twoim zadaniem jest przeanalizować tekst dostarczony przez użytkownika.
     
     Skup się WYŁĄCZNIE na znalezieniu opinii dotyczących następujących aspektów:
-    {', '.join(ASPECT_LIST)}
+    {', '.join(ASPECT_KEYWORDS.keys())}
 
     Zasady odpowiedzi:
     1.  Musisz odpowiedzieć WYŁĄCZNIE w formacie JSON.
@@ -96,18 +60,141 @@ async def analyze(transcript_id: str, analysis_model: str = "llama-3.3-70b-versa
     Jeśli nie znajdziesz żadnych aspektów, zwróć: {{"overall_summary": "Brak szczegółowej analizy aspektów.", "results": {{}} }}
     """
 
-    logging.info(f"Analyzing sentiment for transcription_id: {transcript_id} using model: {analysis_model}")
 
+def current_prompt_query() -> dict:
+    """Filter of stored results produced with the current `PROMPT_VERSION`"""
+    if PROMPT_VERSION == 1:
+        return {"prompt_version": {"$in": [1, None]}}
+    return {"prompt_version": PROMPT_VERSION}
+
+
+async def save_results_to_db(
+    transcription_id: str, analysis_model: str, analysis_results: dict, replace: bool = False
+) -> None:
+    """Save sentiment analysis results to the database; `replace` overwrites stored results of the same model."""
+    doc = {
+        "transcription_id": transcription_id,
+        "model": analysis_model,
+        "prompt_version": PROMPT_VERSION,
+        "results": analysis_results,
+        "created_at": datetime.datetime.now(tz=datetime.timezone.utc)
+    }
+    try:
+        if replace:
+            await db.sentiment_analysis.replace_one(
+                {"transcription_id": transcription_id, "model": analysis_model}, doc, upsert=True
+            )
+        else:
+            await db.sentiment_analysis.insert_one(doc)
+        sentiment_cache.set((transcription_id, analysis_model), analysis_results)
+        logging.info(f"✅    Saved sentiment analysis results to DB for transcription_id: {transcription_id}")
+    except DuplicateKeyError:
+        await _replace_outdated(transcription_id, analysis_model, doc)
+    except Exception as e:
+        logging.error(f"❌    Error saving sentiment analysis results to DB: {e}")
+
+
+async def _replace_outdated(transcription_id: str, analysis_model: str, doc: dict) -> None:
+    """Save over stored results of an older prompt version, which the unique index keeps `insert_one` from adding to"""
     try:
-        chat_completion = client.chat.completions.create(
-            model=analysis_model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": transcription_text}
-            ],
-            response_format={"type": "json_object"},
-            temperature=0.1 
+        replaced = await db.sentiment_analysis.replace_one(
+            {"transcription_id": transcription_id, "model": analysis_model, "$nor": [current_prompt_query()]}, doc
+        )
+    except Exception as e:
+        logging.error(f"❌    Error saving sentiment analysis results to DB: {e}")
+        return
+    if replaced.modified_count:
+        sentiment_cache.set((transcription_id, analysis_model), doc["results"])
+        logging.info(f"✅    Replaced outdated sentiment analysis results for transcription_id: {transcription_id}")
+    else:
+        # A concurrent analysis of the same transcription saved its results first; read those next time
+        sentiment_cache.invalidate((transcription_id, analysis_model))
+        logging.info(f"Sentiment analysis results already saved for transcription_id: {transcription_id}")
+
+
+async def get_saved_results(
+    transcript_id: str, analysis_model: str = DEFAULT_MODEL, current_only: bool = True
+) -> Optional[dict]:
+    """
+    Stored results of a transcription for a model (read through the cache), None if not analyzed yet
+    or only with an older prompt version (`analyze` then runs it again and replaces them).\n
+    `current_only=False` falls back to the older results (views of past analyses, until the backfill).
+    """
+    async def _find_results():
+        found = await db.sentiment_analysis.find_one(
+            {"transcription_id": transcript_id, "model": analysis_model, **current_prompt_query()}, {"results": 1}
         )
+        return found["results"] if found else None
+
+    results = await sentiment_cache.get_or_load((transcript_id, analysis_model), _find_results)
+    if results is None and not current_only:
+        # Not cached: only read until the backfill replaces them
+        found = await db.sentiment_analysis.find_one(
+            {"transcription_id": transcript_id, "model": analysis_model}, {"results": 1}
+        )
+        results = found["results"] if found else None
+    return results
+
+
+async def analyze(
+    transcript_id: str,
+    analysis_model: str = DEFAULT_MODEL,
+    transcription_text: Optional[str] = None,
+    refresh: bool = False,
+    word_timings: Optional[WordTimings] = None,
+) -> list[dict]:
+    """
+    Analyze sentiment for a given transcription ID.\n
+    Uses Groq API with llama-3.3-70b-versatile model.\n
+    Pass `transcription_text` (and its `word_timings`, see `transcription.service.word_timings_of`)
+    when the caller already has the transcription, to skip reading it back.\n
+    `refresh` ignores stored results of the model and replaces them with a new analysis (backfills).
+    """
+
+    try: 
+        oid = ObjectId(transcript_id)
+    except Exception:
+        logging.error(f"Invalid transcription_id (not an ObjectId): {transcript_id}")
+        return []
+    
+    if transcription_text is None:
+        try:
+            doc = await db.transcriptions.find_one({"_id": oid}, {**TEXT_PROJECTION, **WORDS_PROJECTION})
+        except Exception as e:
+            logging.error(f"❌    Error fetching transcription from DB: {e}")
+            return []
+        
+        try:
+            transcription_text = unpack_text(doc) or ""
+            word_timings = WordTimings.unpack(doc, transcription_text)
+        except Exception as e:
+            logging.error(f"❌    Error accessing transcription text: {e}")
+            return []
+    
+    existing = None if refresh else await get_saved_results(transcript_id, analysis_model)
+    if existing is not None:
+        logging.info(f"✅    Found existing sentiment analysis results for transcription_id: {transcript_id}")
+        return existing
+    
+    if not transcription_text:
+        return []
+
+    client = Groq(api_key=settings.GROQ_SECRET)
+
+    logging.info(f"Analyzing sentiment for transcription_id: {transcript_id} using model: {analysis_model}")
+
+    try:
+        async with stage_limiter.slot("sentiment"):
+            chat_completion = await run_in_threadpool(
+                client.chat.completions.create,
+                model=analysis_model,
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": transcription_text}
+                ],
+                response_format={"type": "json_object"},
+                temperature=0.1 
+            )
 
         response_content = chat_completion.choices[0].message.content
         analysis_data = json.loads(response_content)
@@ -116,14 +203,27 @@ async def analyze(transcript_id: str, analysis_model: str = "llama-3.3-70b-versa
         overall_summary = analysis_data.get("overall_summary", "")
         analysis_results = analysis_data.get("results", {})
         
+        # Każdy cytat dostaje pozycję w transkrypcji (`alignment`), z czasem gdy znane są czasy słów;
+        # niedopasowane są oznaczane
+        alignment = await run_in_threadpool(align_results, analysis_results, transcription_text, word_timings)
+        if alignment["unmatched"]:
+            logging.warning(
+                f"{len(alignment['unmatched'])} of {alignment['quotes']} quotes not found in transcription {transcript_id}"
+            )
+
         # Zapisz pełną strukturę do bazy
         full_analysis = {
             "overall_summary": overall_summary,
-            "results": analysis_results
+            "results": analysis_results,
+            "alignment": {"quotes": alignment["quotes"], "matched": alignment["matched"]}
         }
-        await save_results_to_db(transcript_id, analysis_model, full_analysis)
+        await save_results_to_db(transcript_id, analysis_model, full_analysis, replace=refresh)
         return full_analysis
 
+    except asyncio.CancelledError:
+        # Abort the request in flight, nobody is waiting for the result
+        client.close()
+        raise
     except APIError as e:
         print(f"API Groq Error: {e}")
         return None
@@ -0,0 +1,251 @@
+"""
+Transcription engines and the routing between them.
+
+Every engine is a `TranscriptionBackend` registered under the model name stored with its
+transcriptions (`deepgram-nova-2`, `whisper-base`, ...) and declares its `Capabilities`.
+`transcribe_video` downloads the audio once and asks `BackendRegistry.choose` for an engine:
+
+- an explicit model uses that engine (503 when it is unavailable on this server, e.g. its
+  package is not installed or it has no API key),
+- `auto` picks among the available engines accepting the audio's duration: a local engine with
+  an idle worker for audio up to `TRANSCRIPTION_LOCAL_MAX_SECONDS` (no API cost), otherwise the
+  one expected to finish first - duration x real-time factor, times the rounds it waits for a
+  free slot. Real-time factors start from the declared estimate and follow measured runs.
+
+Load (`running`) and measured real-time factors are per server process.
+"""
+import logging
+import math
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+import httpx
+from deepgram import DeepgramClient
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.exceptions import TranscriptionError
+
+AUTO = "auto"
+DEFAULT_MODEL = "deepgram-nova-2"
+# Weight of the latest run in the measured real-time factor
+RTF_WEIGHT = 0.2
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+ProgressCallback = Callable[[dict], None]
+
+
+def normalize_model(model: Optional[str]) -> str:
+    """Model name of a request; the GUI's `whisperpy-*` names never selected an engine and mean `auto`"""
+    if not isinstance(model, str) or not model:
+        return DEFAULT_MODEL
+    if model.startswith("whisperpy"):
+        return AUTO
+    return model
+
+
+@dataclass(frozen=True)
+class Capabilities:
+    languages: Tuple[str, ...] = ("pl",)
+    word_timings: bool = True
+    # Reports progress while transcribing / aborts the request when the analysis is cancelled
+    progress: bool = False
+    cancellable: bool = False
+    # Runs on this machine's CPU (no API cost)
+    local: bool = False
+    # Transcriptions at once (0 = unlimited) and longest accepted audio in seconds (None = any)
+    max_concurrency: int = 0
+    max_duration: Optional[float] = None
+    # Processing seconds per audio second, until runs are measured
+    realtime_factor: float = 0.1
+
+
+@dataclass
+class TranscriptResult:
+    text: str
+    # Deepgram-style words (`word`, `punctuated_word`, `start`, `end`, `confidence`), see `WordTimings.from_words`
+    words: list = field(default_factory=list)
+    # Audio seconds, when the engine reports them
+    duration: Optional[float] = None
+
+
+class TranscriptionBackend:
+    name: str
+    capabilities: Capabilities
+
+    def available(self) -> bool:
+        return True
+
+    async def transcribe(self, path: Path, language: str = "pl",
+                         progress: Optional[ProgressCallback] = None) -> TranscriptResult:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Release workers and clients (application shutdown)"""
+
+
+class ChunkedUpload:
+    """
+    Request body read from `path` in chunks, reporting each completed chunk.\n
+    Re-iterable (every iteration reopens the file), so client retries resend the whole file.
+    """
+
+    def __init__(self, path: Path, progress: ProgressCallback, chunk_size: int = UPLOAD_CHUNK_SIZE):
+        self.path = Path(path)
+        self.progress = progress
+        self.chunk_size = chunk_size
+        self.total_chunks = max(1, math.ceil(self.path.stat().st_size / chunk_size))
+
+    def __iter__(self):
+        with open(self.path, "rb") as audio_file:
+            for index, chunk in enumerate(iter(lambda: audio_file.read(self.chunk_size), b""), 1):
+                yield chunk
+                # Resumed by the HTTP client once the chunk is written
+                done = index == self.total_chunks
+                self.progress({
+                    "step": "transcription",
+                    "message": (
+                        "Transkrypcja audio w toku... To może potrwać kilka minut." if done
+                        else f"Wysyłanie audio do transkrypcji... {index}/{self.total_chunks}"
+                    ),
+                    "percent": round(index * 100 / self.total_chunks, 1),
+                    "chunks_done": index,
+                    "chunks_total": self.total_chunks,
+                })
+
+
+class DeepgramBackend(TranscriptionBackend):
+    capabilities = Capabilities(progress=True, cancellable=True, realtime_factor=0.05)
+
+    def __init__(self, model: str = "nova-2"):
+        self.model = model
+        self.name = f"deepgram-{model}"
+
+    def available(self) -> bool:
+        return bool(settings.DEEPGRAM_SECRET)
+
+    async def transcribe(self, path: Path, language: str = "pl",
+                         progress: Optional[ProgressCallback] = None) -> TranscriptResult:
+        # Own HTTP client so a cancelled analysis can abort the upload in flight
+        http_client = httpx.Client(timeout=60, follow_redirects=True)
+        try:
+            deepgram = DeepgramClient(api_key=settings.DEEPGRAM_SECRET, httpx_client=http_client)
+
+            def _transcribe():
+                if progress:
+                    return deepgram.listen.v1.media.transcribe_file(
+                        request=ChunkedUpload(path, progress),
+                        model=self.model,
+                        smart_format=True,
+                        language=language,
+                    )
+                with open(path, 'rb') as audio_file:
+                    return deepgram.listen.v1.media.transcribe_file(
+                        request=audio_file.read(),
+                        model=self.model,
+                        smart_format=True,
+                        language=language,
+                    )
+
+            response = await run_in_threadpool(_transcribe)
+            logging.info(f"Deepgram response: {response}")
+        finally:
+            http_client.close()
+
+        alternative = response.results.channels[0].alternatives[0]
+        duration = getattr(getattr(response, "metadata", None), "duration", None)
+        return TranscriptResult(
+            text=alternative.transcript.strip(),
+            words=getattr(alternative, "words", None) or [],
+            duration=float(duration) if isinstance(duration, (int, float)) else None,
+        )
+
+
+class BackendRegistry:
+    def __init__(self, backends: Iterable[TranscriptionBackend] = ()):
+        self._backends: Dict[str, TranscriptionBackend] = {}
+        self.running: Dict[str, int] = {}
+        self.realtime_factor: Dict[str, float] = {}
+        for backend in backends:
+            self.register(backend)
+
+    def register(self, backend: TranscriptionBackend) -> None:
+        self._backends[backend.name] = backend
+        self.running.setdefault(backend.name, 0)
+        self.realtime_factor.setdefault(backend.name, backend.capabilities.realtime_factor)
+
+    def get(self, name: str) -> Optional[TranscriptionBackend]:
+        return self._backends.get(name)
+
+    def names(self) -> List[str]:
+        return list(self._backends)
+
+    def model_filter(self, model: str) -> Union[str, dict]:
+        """`model` condition of stored transcriptions usable for a request of `model`"""
+        return {"$in": self.names()} if model == AUTO else model
+
+    def describe(self) -> List[dict]:
+        return [
+            {
+                "name": name,
+                "available": backend.available(),
+                "capabilities": asdict(backend.capabilities),
+                "running": self.running[name],
+                "realtime_factor": round(self.realtime_factor[name], 4),
+            }
+            for name, backend in self._backends.items()
+        ]
+
+    def _idle(self, backend: TranscriptionBackend) -> bool:
+        slots = backend.capabilities.max_concurrency
+        return not slots or self.running[backend.name] < slots
+
+    def expected_seconds(self, backend: TranscriptionBackend, duration: Optional[float]) -> float:
+        """Seconds until a transcription of `duration` audio would finish, waiting rounds included"""
+        slots = backend.capabilities.max_concurrency
+        rounds = 1 + (self.running[backend.name] // slots if slots else 0)
+        return (duration or 1.0) * self.realtime_factor[backend.name] * rounds
+
+    def choose(self, model: str, duration: Optional[float] = None) -> TranscriptionBackend:
+        if model != AUTO:
+            backend = self._backends.get(model)
+            if backend is None:
+                raise TranscriptionError(f"Unknown transcription model: {model}", status_code=400)
+            if not backend.available():
+                raise TranscriptionError(f"Transcription model {model} is not available on this server", status_code=503)
+            return backend
+        candidates = [
+            backend for backend in self._backends.values()
+            if backend.available() and (duration is None or backend.capabilities.max_duration is None
+                                        or duration <= backend.capabilities.max_duration)
+        ]
+        if not candidates:
+            raise TranscriptionError("No transcription engine available for this audio", status_code=503)
+        if duration is not None and duration <= settings.TRANSCRIPTION_LOCAL_MAX_SECONDS:
+            for backend in candidates:
+                if backend.capabilities.local and self._idle(backend):
+                    return backend
+        # min keeps registration order among equal estimates
+        return min(candidates, key=lambda backend: self.expected_seconds(backend, duration))
+
+    @contextmanager
+    def track(self, backend: TranscriptionBackend):
+        """Count a transcription as running on `backend` (its load for `choose`)"""
+        self.running[backend.name] += 1
+        try:
+            yield
+        finally:
+            self.running[backend.name] -= 1
+
+    def record(self, backend: TranscriptionBackend, audio_seconds: Optional[float], seconds: float) -> None:
+        if not audio_seconds:
+            return
+        measured = seconds / audio_seconds
+        self.realtime_factor[backend.name] += RTF_WEIGHT * (measured - self.realtime_factor[backend.name])
+
+    def close(self) -> None:
+        for backend in self._backends.values():
+            backend.close()
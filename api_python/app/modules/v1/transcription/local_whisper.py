@@ -0,0 +1,106 @@
+"""
+Local CPU transcription with openai-whisper (`whisper-<WHISPER_MODEL>`).
+
+Decoding runs in a pool of `WHISPER_WORKERS` processes. Each worker loads the model once (pool
+initializer) with `WHISPER_THREADS` torch threads and, with `WHISPER_INT8`, int8 dynamic
+quantization of its linear layers - openai-whisper has no int8 compute type, `quantize_dynamic`
+gives most of that speed-up on CPU. The pool starts with the first transcription and is shut
+down with the application.
+
+whisper and torch are only imported in the workers: without them the server still starts and
+the engine reports itself unavailable.
+"""
+import asyncio
+import importlib.util
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+from .backends import Capabilities, ProgressCallback, TranscriptionBackend, TranscriptResult
+
+# Rough CPU real-time factors (int8, 4 threads) until runs are measured
+REALTIME_FACTORS = {"tiny": 0.05, "base": 0.1, "small": 0.3, "medium": 0.8, "large": 1.5, "turbo": 0.6}
+
+# Model of this worker process, loaded by the pool initializer
+_model = None
+
+
+@lru_cache(maxsize=None)
+def _installed() -> bool:
+    return all(importlib.util.find_spec(name) is not None for name in ("whisper", "torch"))
+
+
+def _load_model(size: str, threads: int, int8: bool) -> None:
+    global _model
+    import torch
+    import whisper
+
+    torch.set_num_threads(threads)
+    model = whisper.load_model(size, device="cpu")
+    if int8:
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    _model = model
+
+
+def _transcribe_file(path: str, language: str) -> dict:
+    import whisper
+
+    audio = whisper.load_audio(path)
+    result = _model.transcribe(audio, language=language, fp16=False, word_timestamps=True, verbose=None)
+    words = [
+        {
+            "word": word["word"].strip(),
+            "punctuated_word": word["word"].strip(),
+            "start": word["start"],
+            "end": word["end"],
+            "confidence": word.get("probability", 0.0),
+        }
+        for segment in result.get("segments") or []
+        for word in segment.get("words") or []
+    ]
+    return {"text": result.get("text", "").strip(), "words": words, "duration": len(audio) / whisper.audio.SAMPLE_RATE}
+
+
+class LocalWhisperBackend(TranscriptionBackend):
+    def __init__(self, size: str = "base", workers: int = 1, threads: int = 0, int8: bool = True):
+        self.size = size
+        self.name = f"whisper-{size}"
+        self.workers = workers
+        self.threads = threads or max(1, (os.cpu_count() or 1) // max(1, workers))
+        self.int8 = int8
+        self.capabilities = Capabilities(local=True, max_concurrency=workers,
+                                         realtime_factor=REALTIME_FACTORS.get(size, 1.0))
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def available(self) -> bool:
+        return self.workers > 0 and _installed()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: torch threads do not survive a fork of the (threaded) server process
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_load_model,
+                initargs=(self.size, self.threads, self.int8),
+            )
+        return self._pool
+
+    async def transcribe(self, path: Path, language: str = "pl",
+                         progress: Optional[ProgressCallback] = None) -> TranscriptResult:
+        if progress:
+            progress({
+                "step": "transcription",
+                "message": f"Transkrypcja lokalna ({self.name}) w toku... To może potrwać kilka minut.",
+            })
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(self._get_pool(), _transcribe_file, str(path), language)
+        return TranscriptResult(text=result["text"], words=result["words"], duration=result["duration"])
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
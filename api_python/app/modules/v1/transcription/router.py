@@ -1,6 +1,8 @@
-from fastapi import APIRouter
+from typing import Optional
+from fastapi import APIRouter, HTTPException, status
 from .schemas import TranscriptionRequest, Transcription
-from .service import transcribe_video
+from .service import transcribe_video, transcription_backends
+from .word_timings import load_word_timings
 
 router = APIRouter()
 
@@ -8,7 +10,29 @@ router = APIRouter()
 async def process_video(request: TranscriptionRequest):
     '''
     Download and transcribe video from URL provided in request.\n
-    Uses Deepgram's API for transcription with nova-2 model.
+    Uses Deepgram's API with the nova-2 model unless `model` names another engine (or "auto").
     '''
     result = await transcribe_video(request.url, model_name=request.model)
-    return result
\ No newline at end of file
+    return result
+
+
+@router.get("/{transcription_id}/words")
+async def get_words(transcription_id: str, start: float = 0.0, end: Optional[float] = None):
+    '''
+    Words of a transcription with their timings (seconds) and confidence, limited to
+    the time range [`start`, `end`); only this slice is expanded from the stored columns.
+    '''
+    timings = await load_word_timings(transcription_id)
+    if timings is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No word timings for this transcription")
+    words = timings.slice(start, end)
+    return {"transcription_id": transcription_id, "total_words": len(timings), "words": words}
+
+
+@router.get("/backends")
+async def list_backends():
+    '''
+    Transcription engines of this server: capabilities, availability, running
+    transcriptions and measured real-time factor (what "auto" routes by).
+    '''
+    return transcription_backends.describe()
@@ -1,20 +1,23 @@
-from pydantic import BaseModel, HttpUrl, Field
+from pydantic import BaseModel, HttpUrl, Field, PrivateAttr
 from datetime import datetime
-from typing import Optional, Literal
+from typing import Optional
 
 
 class TranscriptionRequest(BaseModel):
     url: HttpUrl
-    model: Optional[Literal["deepgram-nova-2"]] = "deepgram-nova-2"
+    # Engine of `transcription_backends` (GET /api/v1/transcribe/backends) or "auto"
+    model: Optional[str] = "deepgram-nova-2"
 
 class Transcription(BaseModel):
     link_hash: str
     url: HttpUrl
     title: Optional[str]
     transcription: Optional[str]
-    model: Optional[Literal["deepgram-nova-2"]]
+    model: Optional[str]
     created_at: datetime
     id: Optional[str] = Field(None, alias="_id")
+    # Packed word timings (`words_z`, `words_codec`) of the stored document; not part of responses
+    _words: Optional[dict] = PrivateAttr(default=None)
     # Maybe add video services, duration, transcription provider etc. later
     class Config:
         orm_mode = True
@@ -1,56 +1,120 @@
+import asyncio
 import datetime
-from typing import Any
+import time
+from typing import Any, Callable, Optional
 from fastapi.concurrency import run_in_threadpool
+from pymongo import ReturnDocument
 from app.utils.helpers import hash_url
 from app.core.database import db
 from .schemas import Transcription
-from app.modules.v1.downloader.downloader import download_audio
-from deepgram import (
-    DeepgramClient,
-)
-from app.core.deepgram_secret import DEEPGRAM_SECRET
+from .word_timings import WORDS_PROJECTION, WordTimings
+from .backends import AUTO, BackendRegistry, DeepgramBackend, normalize_model
+from .local_whisper import LocalWhisperBackend
+from app.modules.v1.downloader.downloader import audio_duration, download_audio
+from app.modules.v1.downloader.worker import download_audio_in_worker
+from app.modules.v1.analysis.registry import current_analysis
+from app.core.config import settings
+from app.core.concurrency import stage_limiter
+from app.core.cache import transcription_cache
+from app.core.compression import TEXT_PROJECTION, has_text, pack_text, unpack_text
 from app.core.exceptions import TranscriptionError
 import logging
 from pathlib import Path
 import json
 
+# Engines transcriptions can be made with; see `backends` for the routing of `auto`
+transcription_backends = BackendRegistry([
+    DeepgramBackend("nova-2"),
+    LocalWhisperBackend(settings.WHISPER_MODEL, settings.WHISPER_WORKERS, settings.WHISPER_THREADS, settings.WHISPER_INT8),
+])
+
+
+# Fields of `Transcription` (text plain or compressed); everything else stays in the database
+TRANSCRIPTION_PROJECTION = {
+    "link_hash": 1,
+    "url": 1,
+    "title": 1,
+    **TEXT_PROJECTION,
+    # Packed word timings stay with the transcription, so sentiment alignment needs no second read
+    **WORDS_PROJECTION,
+    "model": 1,
+    "created_at": 1,
+}
+
+
+def to_transcription(doc: dict) -> Transcription:
+    # Cached documents keep the compressed text; it is only expanded for the response
+    transcription = Transcription(**{**doc, "transcription": unpack_text(doc)})
+    transcription._words = {key: doc[key] for key in WORDS_PROJECTION if key in doc} or None
+    return transcription
+
+
+def word_timings_of(transcription: Transcription) -> Optional[WordTimings]:
+    """Word timings carried by a `transcribe_video` result, None if transcribed without them"""
+    return WordTimings.unpack(transcription._words, transcription.transcription or "")
+
+
 async def transcribe_video(url: str, model_name: str = "deepgram-nova-2") -> Any:
     '''
     Download and transcribe video from URL provided.\n
-    Uses Deepgram's API for transcription.
+    `model_name` is an engine of `transcription_backends` (Deepgram's API by default) or `auto`,
+    which picks one by the audio's duration, load and availability.
     '''
 
+    model_name = normalize_model(model_name)
     filename_hash = hash_url(str(url))
-    doc = await db.transcriptions.find_one(
-        {
-            "link_hash": filename_hash,
-            "model": model_name
-        })
+    cache_key = (filename_hash, model_name)
+
+    async def _find_transcription():
+        found = await db.transcriptions.find_one(
+            {
+                "link_hash": filename_hash,
+                "model": transcription_backends.model_filter(model_name)
+            },
+            TRANSCRIPTION_PROJECTION,
+        )
+        if found:
+            found["_id"] = str(found["_id"])
+        return found
+
+    doc = await transcription_cache.get_or_load(cache_key, _find_transcription)
     
     if doc:
-        if "transcription" in doc:
-            doc["_id"] = str(doc["_id"])
-            return Transcription(**doc)
+        if has_text(doc):
+            return to_transcription(doc)
     
-    base, path, title = download_audio(url, filename_hash)
-    deepgram_model_name = model_name[len("deepgram-"):] if model_name.startswith("deepgram-") else model_name
+    # An explicit model is checked before downloading; `auto` needs the audio's duration
+    backend = transcription_backends.choose(model_name) if model_name != AUTO else None
+    entry = current_analysis.get()
+    progress: Optional[Callable[[dict], None]] = entry.progress if entry else None
+    async with stage_limiter.slot("download"):
+        if entry is not None:
+            # Cancellable analysis: download in a worker process that can be killed
+            base, path, title = await download_audio_in_worker(url, filename_hash)
+        else:
+            base, path, title = await run_in_threadpool(download_audio, url, filename_hash)
 
+    duration = None
     try:
-        deepgram = DeepgramClient(api_key=DEEPGRAM_SECRET)
-        
-        with open(path, 'rb') as audio_file:
-            response = deepgram.listen.v1.media.transcribe_file(
-                request=audio_file.read(),
-                model=deepgram_model_name,
-                smart_format=True,
-                language="pl",
-            )
-            logging.info(f"Deepgram response: {response}")
+        if backend is None:
+            duration = await run_in_threadpool(audio_duration, path)
+            backend = transcription_backends.choose(AUTO, duration)
+        with transcription_backends.track(backend):
+            async with stage_limiter.slot("transcription"):
+                started = time.perf_counter()
+                result = await backend.transcribe(path, "pl", progress)
+        transcription_backends.record(backend, result.duration or duration, time.perf_counter() - started)
+    except asyncio.CancelledError:
+        try:
+            await run_in_threadpool(lambda: Path(path).unlink(missing_ok=True))
+        except Exception:
+            pass
+        raise
     except Exception as e:
-        logging.error(f"Deepgram transcription error: {e}")
+        logging.error(f"Transcription error ({model_name}): {e}")
         raise e
-    
-    transcription_text = response.results.channels[0].alternatives[0].transcript.strip()
+
+    transcription_text = result.text
 
     # If transcription is empty, remove downloaded file and raise a TranscriptionError
     if not transcription_text:
@@ -69,25 +133,25 @@ async def transcribe_video(url: str, model_name: str = "deepgram-nova-2") -> Any
         "link_hash": filename_hash,
         "url": str(url),
         "title": title,
-        "transcription": transcription_text,
-        "model": model_name,
+        **pack_text(transcription_text),
+        # Word timings as packed columns (`word_timings`), expanded only for quote alignment / the words endpoint
+        **WordTimings.from_words(result.words, transcription_text).pack(),
+        "model": backend.name,
         "created_at": now,
     }
-    await db.transcriptions.update_one(
-        {"link_hash": filename_hash, "model": model_name},       # filtr
+    # One round trip: insert unless a concurrent analysis stored it first, and read back whichever is stored
+    inserted_doc = await db.transcriptions.find_one_and_update(
+        {"link_hash": filename_hash, "model": backend.name},       # filtr
         {"$setOnInsert": new_doc},      # if not found, insert this
-        upsert=True                 # perform upsert if not found
+        projection=TRANSCRIPTION_PROJECTION,
+        upsert=True,                # perform upsert if not found
+        return_document=ReturnDocument.AFTER,
     )
     try:
         await run_in_threadpool(lambda: Path(path).unlink(missing_ok=True))
     except Exception:
         pass
 
-    inserted_doc = await db.transcriptions.find_one(
-        {
-            "link_hash": filename_hash,
-            "model": model_name
-        }
-    )
     inserted_doc["_id"] = str(inserted_doc["_id"])
-    return Transcription(**inserted_doc)
+    transcription_cache.set(cache_key, inserted_doc)
+    return to_transcription(inserted_doc)
@@ -0,0 +1,163 @@
+"""
+Word-level timestamps of a transcription in a compact columnar form.
+
+Deepgram returns every word as an object (`word`, `punctuated_word`, `start`, `end`,
+`confidence`); an hour of speech is ~10k of them. They are kept as parallel arrays instead:
+
+    start_ms, end_ms  uint32   milliseconds from the start of the audio
+    confidence        uint8    0..100
+    offset            uint32   character offset of the word in the transcript text
+
+serialized little-endian one column after another and zlib-compressed into the
+`words_z` field of the transcription (`words_codec` names the codec). The word text is
+not stored again, it is read from the transcript at `offset`. Lookups (`slice`,
+`time_at`) bisect the arrays without expanding them into per-word objects.
+"""
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Any, Iterable, List, Optional, Tuple
+
+from bson import Binary, ObjectId
+from bson.errors import InvalidId
+
+from app.core.compression import TEXT_PROJECTION, compress, decompress, unpack_text
+from app.core.database import db
+
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<BI")  # version, word count
+CODEC = "zlib"
+
+# Fields of a transcription document holding the word timings
+WORDS_PROJECTION = {"words_z": 1, "words_codec": 1}
+
+
+def _field(word: Any, name: str, default=None):
+    if isinstance(word, dict):
+        return word.get(name, default)
+    return getattr(word, name, default)
+
+
+def _little_endian(column: array) -> bytes:
+    if sys.byteorder == "big":
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+class WordTimings:
+    def __init__(self, text: str, start_ms: array, end_ms: array, confidence: array, offset: array):
+        self.text = text or ""
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.confidence = confidence
+        self.offset = offset
+
+    @classmethod
+    def from_words(cls, words: Iterable[Any], text: str) -> "WordTimings":
+        """Columns of Deepgram words (objects or dicts); offsets are found by scanning `text` in order."""
+        start_ms, end_ms = array("I"), array("I")
+        confidence, offset = array("B"), array("I")
+        position = 0
+        for word in words:
+            spelled = _field(word, "punctuated_word") or _field(word, "word") or ""
+            found = text.find(spelled, position) if spelled else -1
+            if found == -1 and spelled:
+                # smart_format may spell the word differently in the transcript; try the raw word
+                found = text.find(_field(word, "word") or spelled, position)
+            if found != -1:
+                position = found + len(spelled)
+            start_ms.append(max(0, round(float(_field(word, "start", 0.0)) * 1000)))
+            end_ms.append(max(0, round(float(_field(word, "end", 0.0)) * 1000)))
+            confidence.append(min(100, max(0, round(float(_field(word, "confidence", 0.0) or 0.0) * 100))))
+            offset.append(found if found != -1 else position)
+        return cls(text, start_ms, end_ms, confidence, offset)
+
+    def __len__(self) -> int:
+        return len(self.start_ms)
+
+    # --- serialization ------------------------------------------------------------------
+
+    def to_bytes(self) -> bytes:
+        columns = b"".join(_little_endian(column) for column in (self.start_ms, self.end_ms, self.offset, self.confidence))
+        return HEADER.pack(FORMAT_VERSION, len(self)) + columns
+
+    @classmethod
+    def from_bytes(cls, data: bytes, text: str) -> "WordTimings":
+        version, count = HEADER.unpack_from(data)
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported word timings format: {version}")
+        columns, position = [], HEADER.size
+        for typecode in ("I", "I", "I", "B"):
+            column = array(typecode)
+            size = column.itemsize * count
+            column.frombytes(data[position:position + size])
+            if sys.byteorder == "big":
+                column.byteswap()
+            columns.append(column)
+            position += size
+        start_ms, end_ms, offset, confidence = columns
+        return cls(text, start_ms, end_ms, confidence, offset)
+
+    def pack(self) -> dict:
+        """Document fields of the timings (empty when there are no words)"""
+        if not len(self):
+            return {}
+        return {"words_z": Binary(compress(self.to_bytes(), CODEC)), "words_codec": CODEC}
+
+    @classmethod
+    def unpack(cls, doc: Optional[dict], text: str) -> Optional["WordTimings"]:
+        if not doc or "words_z" not in doc:
+            return None
+        return cls.from_bytes(decompress(bytes(doc["words_z"]), doc.get("words_codec", CODEC)), text)
+
+    # --- lookups ------------------------------------------------------------------------
+
+    def word(self, index: int) -> dict:
+        start = self.offset[index]
+        end = self.offset[index + 1] if index + 1 < len(self) else len(self.text)
+        return {
+            "word": self.text[start:end].strip(),
+            "start": self.start_ms[index] / 1000,
+            "end": self.end_ms[index] / 1000,
+            "confidence": self.confidence[index] / 100,
+            "offset": start,
+        }
+
+    def slice(self, start: float = 0.0, end: Optional[float] = None) -> List[dict]:
+        """Words overlapping the time range [start, end) seconds, to the last word when `end` is None"""
+        # Words are in time order; the first candidate may have started before `start`
+        first = bisect_right(self.end_ms, max(0, round(start * 1000)))
+        last = len(self) if end is None else bisect_left(self.start_ms, max(0, round(end * 1000)))
+        return [self.word(i) for i in range(first, last)]
+
+    def index_at(self, char_offset: int) -> Optional[int]:
+        """Index of the word containing (or preceding) character `char_offset` of the transcript"""
+        if not len(self):
+            return None
+        return max(0, bisect_right(self.offset, char_offset) - 1)
+
+    def time_at(self, char_offset: int) -> Optional[Tuple[float, float]]:
+        """(start, end) seconds of the word at character `char_offset` of the transcript"""
+        index = self.index_at(char_offset)
+        if index is None:
+            return None
+        return self.start_ms[index] / 1000, self.end_ms[index] / 1000
+
+    def span_times(self, start: int, end: int) -> Optional[Tuple[float, float]]:
+        """(start, end) seconds of the transcript characters [start, end)"""
+        first, last = self.index_at(start), self.index_at(max(start, end - 1))
+        if first is None:
+            return None
+        return self.start_ms[first] / 1000, self.end_ms[last] / 1000
+
+
+async def load_word_timings(transcription_id: str) -> Optional[WordTimings]:
+    """Word timings of a stored transcription, None if unknown or transcribed without them"""
+    try:
+        oid = ObjectId(transcription_id)
+    except (InvalidId, TypeError):
+        return None
+    doc = await db.transcriptions.find_one({"_id": oid}, {**TEXT_PROJECTION, **WORDS_PROJECTION})
+    return WordTimings.unpack(doc, unpack_text(doc)) if doc else None
@@ -1,13 +1,19 @@
 import socketio
 from fastapi import FastAPI
-from app.modules.v1.transcription.service import transcribe_video
-from app.modules.v1.sentiment.service import analyze
-from app.modules.v1.analysis.schemas import VideoAnalysis, AnalysisStep
+from app.modules.v1.transcription.backends import normalize_model
+from app.modules.v1.analysis import history, pipeline
+from app.modules.v1.analysis.pipeline import analysis_has_listeners, start_analysis_task, start_batch_task
 from app.modules.v1.auth.service import decode_token
-from app.core.database import db
-from datetime import datetime
+from app.modules.v1.analysis.registry import analysis_registry
+from app.modules.v1.analysis.replay import catch_up
+from app.core.config import settings
+from app.core.events import event_bus, replay_buffer
+from app.core.message_bus import message_bus
+from app.core.rate_limit import check_socket_event
+from typing import Dict, Optional
 import asyncio
 import logging
+import time
 
 # Create Socket.IO server with ASGI support
 sio = socketio.AsyncServer(
@@ -24,138 +30,142 @@ socket_app = socketio.ASGIApp(sio)
 
 logger = logging.getLogger(__name__)
 
+ANALYSIS_ROOM_PREFIX = "analysis:"
 
-async def emit_step(sid: str, analysis_id: str, step: str, status: str, message: str):
-    """Emit progress step to specific client"""
-    logger.info(f"📤 Emitting step to {sid}: {step} - {status} - {message}")
-    
-    step_data = AnalysisStep(
-        step=step,
-        status=status,
-        message=message,
-        timestamp=datetime.utcnow()
-    )
-    # Convert to dict and handle datetime serialization
-    step_dict = step_data.model_dump() if hasattr(step_data, 'model_dump') else step_data.dict()
-    if 'timestamp' in step_dict and isinstance(step_dict['timestamp'], datetime):
-        step_dict['timestamp'] = step_dict['timestamp'].isoformat()
-    
-    await sio.emit('analysis_step', {
-        'analysis_id': analysis_id,
-        'step': step_dict
-    }, room=sid)
-    logger.info(f"✅ Step emitted successfully")
 
+def analysis_room(analysis_id: str) -> str:
+    """Socket.IO room of a single analysis; survives reconnects (new sid) of its clients"""
+    return f"{ANALYSIS_ROOM_PREFIX}{analysis_id}"
 
-async def process_video_analysis(sid: str, url: str, user_id: str, model: str = "deepgram-nova-2"):
-    """Process video analysis with real-time updates via Socket.IO"""
-    analysis_id = None
-    result = None
-    
-    try:
-        # Create analysis record with user_id
-        analysis = VideoAnalysis(
-            url=url,
-            status="processing",
-            steps=[],
-            user_id=user_id
-        )
-        
-        result = await db.analyses.insert_one(
-            analysis.model_dump(exclude={'id'}) if hasattr(analysis, 'model_dump') 
-            else analysis.dict(exclude={'id'})
-        )
-        analysis_id = str(result.inserted_id)
-        
-        logger.info(f"Starting analysis {analysis_id} for {url}")
-        
-        # Step 1: Download and transcribe (combined step with progress)
-        await emit_step(sid, analysis_id, "download", "in_progress", "Pobieranie wideo z YouTube...")
-        
-        # Długa operacja - transkrypcja
-        logger.info("Starting transcription - this may take a while")
-        await emit_step(sid, analysis_id, "transcription", "in_progress", "Transkrypcja audio w toku... To może potrwać kilka minut.")
-        
-        # Ensure the model is Deepgram-compatible. Map known GUI aliases to Deepgram model names.
-        mapped_model = model
-        if not isinstance(mapped_model, str) or not mapped_model:
-            mapped_model = "deepgram-nova-2"
-        # Map some legacy/gui model names to Deepgram model
-        if mapped_model.startswith("whisper") or mapped_model.startswith("whisperpy"):
-            mapped_model = "deepgram-nova-2"
-
-        transcription_result = await transcribe_video(url, model_name=mapped_model)
-        logger.info("Transcription completed")
-        
-        transcription_id = str(transcription_result.id)
-        transcription_text = transcription_result.transcription
-        
-        await emit_step(sid, analysis_id, "transcription", "completed", "Transkrypcja zakończona")
-        
-        # Step 2: Sentiment analysis
-        await emit_step(sid, analysis_id, "sentiment", "in_progress", "Analiza sentymentu...")
-        
-        # v2 sentiment service exposes `analyze(transcript_id)`
-        sentiment_result = await analyze(transcription_id)
 
-        # GUI expects sentiment to be wrapped under a `message` key
-        if isinstance(sentiment_result, dict) and 'message' in sentiment_result:
-            sentiment_payload = sentiment_result
-        else:
-            sentiment_payload = {'message': sentiment_result}
+async def deliver_event(message: dict, remote: bool):
+    """Deliver an analysis event to the HTTP streams and socket room of this process"""
+    analysis_id, event, payload = message['analysis_id'], message['event'], message['data']
+    if remote:
+        replay_buffer.record(analysis_id, event, payload, seq=payload.get('seq'))
+    event_bus.publish(analysis_id, event, payload)
+    await sio.emit(event, payload, room=analysis_room(analysis_id))
 
-        await emit_step(sid, analysis_id, "sentiment", "completed", "Analiza sentymentu zakończona")
-        
-        # Update analysis with results
-        await db.analyses.update_one(
-            {"_id": result.inserted_id},
-            {
-                "$set": {
-                    "status": "completed",
-                    "title": transcription_result.title,
-                    "transcription": transcription_text,
-                    "sentiment": sentiment_payload,
-                    "completed_at": datetime.utcnow()
-                }
-            }
+
+async def deliver_cancel(message: dict, remote: bool):
+    """Cancel request relayed from the process the client is connected to"""
+    entry = analysis_registry.get(message['analysis_id'])
+    if entry and entry.user_id == message['user_id']:
+        analysis_registry.cancel(entry.analysis_id, message.get('reason', 'cancelled_by_user'))
+
+
+message_bus.on('analysis_event', deliver_event)
+message_bus.on('cancel_analysis', deliver_cancel)
+
+
+class SocketClients(pipeline.ClientChannel):
+    """Sockets of this process for the pipeline: rooms per analysis, direct emits to a sid"""
+
+    async def emit(self, sid: str, event: str, payload: dict) -> None:
+        await sio.emit(event, payload, room=sid)
+
+    async def join(self, sid: str, analysis_id: str) -> None:
+        await sio.enter_room(sid, analysis_room(analysis_id))
+
+    def has_listeners(self, analysis_id: str, exclude_sid: Optional[str] = None) -> bool:
+        return any(
+            participant != exclude_sid
+            for participant, _ in sio.manager.get_participants('/', analysis_room(analysis_id))
         )
-        
-        # Emit completion
-        await sio.emit('analysis_complete', {
-            'analysis_id': analysis_id,
-            'title': transcription_result.title,
-            'transcription': transcription_text,
-            'sentiment': sentiment_payload
-        }, room=sid)
-        
-        logger.info(f"Analysis {analysis_id} completed successfully")
-        
-    except Exception as e:
-        logger.error(f"Error in analysis {analysis_id}: {str(e)}")
-        if analysis_id and result:
-            await db.analyses.update_one(
-                {"_id": result.inserted_id},
-                {"$set": {"status": "error"}}
-            )
-            await emit_step(sid, analysis_id, "error", "error", f"Błąd: {str(e)}")
-        await sio.emit('analysis_error', {
-            'analysis_id': analysis_id,
-            'error': str(e)
-        }, room=sid)
+
+
+pipeline.use_clients(SocketClients())
+
+
+# Expiry timers of authenticated sessions, by sid
+_session_expiry: Dict[str, asyncio.TimerHandle] = {}
+
+
+async def session_user(sid: str) -> Optional[str]:
+    """User id authenticated at connect time (kept in the Socket.IO session)"""
+    try:
+        session = await sio.get_session(sid)
+    except KeyError:
+        return None
+    return session.get('user_id')
+
+
+async def rate_limited(sid: str, route: str, user_id: str, error_event: str = 'analysis_error') -> bool:
+    """Apply the rate limit / load shedding of `route`; emits the rejection and returns True when refused"""
+    try:
+        ip = (await sio.get_session(sid)).get('ip')
+    except KeyError:
+        ip = None
+    rejection = check_socket_event(route, user_id, ip)
+    if rejection is None:
+        return False
+    if error_event == 'error':
+        rejection = {'message': rejection['error'], 'retry_after': rejection['retry_after']}
+    await sio.emit(error_event, rejection, room=sid)
+    return True
+
+
+def _client_ip(environ: dict) -> Optional[str]:
+    client = (environ.get('asgi.scope') or {}).get('client')
+    return client[0] if client else environ.get('REMOTE_ADDR')
+
+
+async def _expire_session(sid: str):
+    _session_expiry.pop(sid, None)
+    await sio.emit('auth_expired', {'message': 'Session expired, please log in again'}, room=sid)
+    await sio.disconnect(sid)
+
+
+def _schedule_expiry(sid: str, exp: Optional[float]):
+    if not exp:
+        return
+    delay = max(0.0, exp - time.time())
+    _session_expiry[sid] = asyncio.get_running_loop().call_later(
+        delay, lambda: asyncio.ensure_future(_expire_session(sid))
+    )
 
 
 @sio.event
 async def connect(sid, environ, auth=None):
-    """Handle client connection with optional authentication"""
-    logger.info(f"Client connected: {sid}")
-    if auth:
-        logger.info(f"Auth data received: {auth}")
+    """Authenticate the socket once (JWT in `auth.token`); the user id is kept in its session"""
+    token = auth.get('token') if isinstance(auth, dict) else None
+    try:
+        payload = decode_token(token) if token else None
+    except Exception as e:
+        # Only ConnectionRefusedError reaches the client as CONNECT_ERROR (the GUI logs out on it)
+        logger.info(f"Rejected socket {sid} with an undecodable token: {e}")
+        payload = None
+    if not isinstance(payload, dict) or not payload.get('sub'):
+        logger.info(f"Rejected unauthenticated socket {sid}")
+        raise socketio.exceptions.ConnectionRefusedError('Authentication failed')
+
+    user_id = payload['sub']
+    await sio.save_session(sid, {'user_id': user_id, 'ip': _client_ip(environ)})
+    # Disconnect when the token expires, handlers trust the session until then
+    _schedule_expiry(sid, payload.get('exp'))
+    logger.info(f"Client connected: {sid} (user {user_id})")
+
+    # Reconnect within the grace period: rejoin the rooms of orphaned analyses
+    for entry in analysis_registry.for_user(user_id):
+        if entry.grace_pending:
+            analysis_registry.keep_alive(entry.analysis_id)
+            await sio.enter_room(sid, analysis_room(entry.analysis_id))
     await sio.emit('connected', {'message': 'Connected to analysis server'}, room=sid)
 
 
 @sio.event
 async def disconnect(sid):
     logger.info(f"Client disconnected: {sid}")
+    expiry = _session_expiry.pop(sid, None)
+    if expiry:
+        expiry.cancel()
+    if settings.CANCEL_ON_DISCONNECT:
+        for room in sio.rooms(sid):
+            if not room.startswith(ANALYSIS_ROOM_PREFIX):
+                continue
+            analysis_id = room[len(ANALYSIS_ROOM_PREFIX):]
+            if not analysis_has_listeners(analysis_id, exclude_sid=sid):
+                analysis_registry.cancel_after_grace(analysis_id, "client_disconnected")
 
 
 @sio.event
@@ -164,76 +174,158 @@ async def start_analysis(sid, data):
     logger.info(f"Analysis request from {sid}: {data}")
     url = data.get('url')
     model = data.get('model', 'deepgram-nova-2')
-    # Normalize model names from the GUI (map whisper aliases to Deepgram)
-    if model and (model.startswith('whisper') or model.startswith('whisperpy')):
-        model = 'deepgram-nova-2'
-    token = data.get('token')
+    # GUI's legacy model names (`whisperpy-*`) mean "auto"
+    model = normalize_model(model)
     
     if not url:
         await sio.emit('analysis_error', {'error': 'URL is required'}, room=sid)
         return
     
-    if not token:
-        await sio.emit('analysis_error', {'error': 'Authentication token is required'}, room=sid)
+    user_id = await session_user(sid)
+    if not user_id:
+        await sio.emit('analysis_error', {'error': 'Not authenticated'}, room=sid)
         return
-    
-    # Decode token to get user_id
-    payload = decode_token(token)
-    if not payload:
-        await sio.emit('analysis_error', {'error': 'Invalid or expired token'}, room=sid)
+    if await rate_limited(sid, 'analysis', user_id):
         return
     
-    user_id = payload.get('sub')
+    # Start processing in background with user_id
+    start_analysis_task(sid, url, user_id, model)
+
+
+@sio.event
+async def start_batch(sid, data):
+    """Analyze a list of video / playlist / channel URLs (`urls`) as one batch, see `process_batch`"""
+    urls = data.get('urls')
+    model = data.get('model', 'deepgram-nova-2')
+    model = normalize_model(model)
+    if not isinstance(urls, list) or not urls or not all(isinstance(url, str) and url for url in urls):
+        await sio.emit('batch_error', {'error': 'urls must be a non-empty list of URLs'}, room=sid)
+        return
+    if len(urls) > settings.BATCH_MAX_SOURCES:
+        await sio.emit('batch_error', {'error': f'At most {settings.BATCH_MAX_SOURCES} URLs per batch'}, room=sid)
+        return
+
+    user_id = await session_user(sid)
     if not user_id:
-        await sio.emit('analysis_error', {'error': 'Invalid token payload'}, room=sid)
+        await sio.emit('batch_error', {'error': 'Not authenticated'}, room=sid)
         return
-    
-    # Start processing in background with user_id
-    asyncio.create_task(process_video_analysis(sid, url, user_id, model))
+    if await rate_limited(sid, 'analysis', user_id, 'batch_error'):
+        return
+
+    start_batch_task(sid, list(dict.fromkeys(urls)), user_id, model)
+
+
+@sio.event
+async def cancel_analysis(sid, data):
+    """Cancel a running analysis owned by the user"""
+    analysis_id = data.get('analysis_id')
+    user_id = await session_user(sid)
+    if not user_id:
+        await sio.emit('analysis_error', {'analysis_id': analysis_id, 'error': 'Not authenticated'}, room=sid)
+        return
+    if await rate_limited(sid, 'control', user_id):
+        return
+
+    entry = analysis_registry.get(analysis_id) if analysis_id else None
+    if analysis_id and not entry and message_bus.distributed:
+        # May be running in another worker; the owner process emits `analysis_cancelled`
+        await message_bus.publish('cancel_analysis', {
+            'analysis_id': analysis_id, 'user_id': user_id, 'reason': 'cancelled_by_user'
+        })
+        return
+    if not entry or entry.user_id != user_id:
+        await sio.emit('analysis_error', {'analysis_id': analysis_id, 'error': 'Analysis not found or already finished'}, room=sid)
+        return
+
+    # The pipeline itself emits `analysis_cancelled` once it has cleaned up
+    analysis_registry.cancel(analysis_id, "cancelled_by_user")
+
+
+@sio.event
+async def subscribe_analysis(sid, data):
+    """Join the room of an analysis (e.g. after reconnect) and get a compact catch-up.
+
+    `last_seq` is the `seq` of the last event the client has seen; only later events are replayed.
+    """
+    analysis_id = data.get('analysis_id')
+    user_id = await session_user(sid)
+    if not user_id:
+        await sio.emit('analysis_error', {'analysis_id': analysis_id, 'error': 'Not authenticated'}, room=sid)
+        return
+    if not analysis_id:
+        await sio.emit('analysis_error', {'error': 'analysis_id is required'}, room=sid)
+        return
+
+    # Join first, so nothing emitted while loading the catch-up is lost (clients dedupe by `seq`)
+    room = analysis_room(analysis_id)
+    await sio.enter_room(sid, room)
+    try:
+        last_seq = int(data.get('last_seq') or 0)
+    except (TypeError, ValueError):
+        last_seq = 0
+    state = await catch_up(analysis_id, user_id, last_seq)
+    if state is None:
+        await sio.leave_room(sid, room)
+        await sio.emit('analysis_error', {'analysis_id': analysis_id, 'error': 'Analysis not found'}, room=sid)
+        return
+    if state['running']:
+        analysis_registry.keep_alive(analysis_id)
+    else:
+        await sio.leave_room(sid, room)
+
+    await sio.emit('analysis_replay', {
+        'analysis_id': analysis_id,
+        'running': state['running'],
+        'events': [{'event': event, 'data': event_data} for event, event_data in state['events']],
+    }, room=sid)
 
 
 @sio.event
 async def get_analyses(sid, data):
-    """Get list of user's analyses"""
+    """Get a page of user's analyses (`limit`, `cursor` = `next_cursor` of the previous page)"""
     logger.info(f"Get analyses request from {sid}")
     
     try:
-        token = data.get('token')
-        
-        if not token:
-            await sio.emit('error', {'message': 'Authentication token is required'}, room=sid)
-            return
-        
-        # Decode token to get user_id
-        payload = decode_token(token)
-        if not payload:
-            await sio.emit('error', {'message': 'Invalid or expired token'}, room=sid)
-            return
-        
-        user_id = payload.get('sub')
+        user_id = await session_user(sid)
         if not user_id:
-            await sio.emit('error', {'message': 'Invalid token payload'}, room=sid)
+            await sio.emit('error', {'message': 'Not authenticated'}, room=sid)
+            return
+        if await rate_limited(sid, 'read', user_id, 'error'):
             return
         
-        # Filter analyses by user_id
-        analyses = await db.analyses.find({"user_id": user_id}).sort("created_at", -1).to_list(100)
-        
-        # Convert ObjectId and datetime to string
-        for analysis in analyses:
-            analysis['id'] = str(analysis['_id'])
-            del analysis['_id']
-            
-            # Convert all datetime fields to ISO format strings
-            for key, value in analysis.items():
-                if isinstance(value, datetime):
-                    analysis[key] = value.isoformat()
-        
-        await sio.emit('analyses_list', {'analyses': analyses}, room=sid)
+        # One page of summaries; heavy fields come from `get_analysis_detail`
+        page = await history.list_analyses(user_id, data.get('limit'), data.get('cursor'))
+        await sio.emit('analyses_list', {**page, 'cursor': data.get('cursor')}, room=sid)
+    except history.InvalidCursor as e:
+        await sio.emit('error', {'message': str(e)}, room=sid)
     except Exception as e:
         logger.error(f"Error fetching analyses: {str(e)}")
         await sio.emit('error', {'message': str(e)}, room=sid)
 
 
+@sio.event
+async def get_analysis_detail(sid, data):
+    """Get a single analysis with its transcription and sentiment"""
+    analysis_id = data.get('analysis_id')
+    user_id = await session_user(sid)
+    if not user_id:
+        await sio.emit('error', {'message': 'Not authenticated'}, room=sid)
+        return
+    if await rate_limited(sid, 'read', user_id, 'error'):
+        return
+
+    try:
+        analysis = await history.get_analysis_detail(user_id, analysis_id) if analysis_id else None
+    except Exception as e:
+        logger.error(f"Error fetching analysis {analysis_id}: {str(e)}")
+        await sio.emit('error', {'message': str(e)}, room=sid)
+        return
+    if analysis is None:
+        await sio.emit('error', {'message': 'Analysis not found'}, room=sid)
+        return
+    await sio.emit('analysis_detail', {'analysis': analysis}, room=sid)
+
+
 def mount_socketio(app: FastAPI):
     """Mount Socket.IO to FastAPI app"""
     app.mount('/socket.io', socket_app)
@@ -1,6 +1,41 @@
 import hashlib
+import re
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+YOUTUBE_ID_RE = re.compile(r"^[A-Za-z0-9_-]{11}$")
+YOUTUBE_HOSTS = ("youtube.com", "www.youtube.com", "m.youtube.com", "music.youtube.com")
+
+
+def youtube_video_id(url: str) -> Optional[str]:
+	"""Video id of a YouTube video URL (watch, youtu.be, shorts, live, embed), None for anything else."""
+	parsed = urlparse(str(url))
+	host = (parsed.hostname or "").lower()
+	candidate = None
+	if host == "youtu.be":
+		candidate = parsed.path.strip("/").split("/")[0]
+	elif host in YOUTUBE_HOSTS:
+		parts = parsed.path.strip("/").split("/")
+		if parts[0] == "watch":
+			candidate = (parse_qs(parsed.query).get("v") or [None])[0]
+		elif parts[0] in ("shorts", "live", "embed") and len(parts) > 1:
+			candidate = parts[1]
+	return candidate if candidate and YOUTUBE_ID_RE.match(candidate) else None
+
+
+def canonical_video_url(video_id: str) -> str:
+	return f"https://www.youtube.com/watch?v={video_id}"
+
 
 def hash_url(url: str) -> str:
 	"""Return a hex hash for a URL to use as filename base."""
 	h = hashlib.sha256(url.encode("utf-8")).hexdigest()
-	return h
\ No newline at end of file
+	return h
+
+
+def format_eta(seconds) -> str:
+	"""Human readable ETA suffix for progress messages ('' when unknown)."""
+	if seconds is None:
+		return ""
+	seconds = int(seconds)
+	return f" (pozostało ~{seconds // 60}:{seconds % 60:02d})"
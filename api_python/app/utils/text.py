@@ -0,0 +1,15 @@
+import re
+import unicodedata
+from functools import lru_cache
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# `ł` has no decomposition, the other Polish letters lose their diacritics in NFKD
+FOLD_TABLE = str.maketrans({"ł": "l", "Ł": "l"})
+
+
+@lru_cache(maxsize=100_000)
+def fold(text: str) -> str:
+	"""Lowercase without diacritics: 'Bateria Łódź' -> 'bateria lodz'"""
+	decomposed = unicodedata.normalize("NFKD", text.translate(FOLD_TABLE).lower())
+	return "".join(char for char in decomposed if not unicodedata.combining(char))
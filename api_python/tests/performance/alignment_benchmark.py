@@ -0,0 +1,71 @@
+"""
+Dopasowanie cytatów z analizy sentymentu do transkrypcji (`QuoteAligner`).
+
+Godzinna transkrypcja (domyślnie 10k słów) z czasami słów (`WordTimings`), Q cytatów (domyślnie 300)
+wyciętych z tekstu - część z pominiętymi słowami i bez polskich znaków, jak je zwraca
+model - oraz 10% cytatów wymyślonych. Raportuje czas budowy indeksu, czas dopasowania
+wszystkich cytatów i skuteczność (trafienia / fałszywe dopasowania).
+
+Uruchomienie:
+    python tests/performance/alignment_benchmark.py -w 10000 -q 300
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from app.modules.v1.sentiment.alignment import QuoteAligner  # noqa: E402
+from app.modules.v1.transcription.word_timings import WordTimings  # noqa: E402
+from app.utils.text import fold  # noqa: E402
+from storage_benchmark import transcript  # noqa: E402
+
+
+def quotes(rng: random.Random, words, count: int):
+    found = []
+    for _ in range(count):
+        i, n = rng.randrange(len(words) - 25), rng.randint(5, 25)
+        quote = words[i:i + n]
+        if rng.random() < 0.3:
+            quote = [word for word in quote if rng.random() > 0.1]
+        if rng.random() < 0.3:
+            quote = [fold(word) for word in quote]
+        found.append((" ".join(quote), i))
+    invented = [(transcript(rng, rng.randint(8, 20)), None) for _ in range(max(1, count // 10))]
+    return found + invented
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-w", "--words", type=int, default=10000)
+    parser.add_argument("-q", "--quotes", type=int, default=300)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    text = transcript(rng, args.words)
+    words = text.split()
+    timings = WordTimings.from_words(
+        [{"punctuated_word": word, "start": i * 0.36, "end": i * 0.36 + 0.3, "confidence": 0.9}
+         for i, word in enumerate(words)],
+        text,
+    )
+    cases = quotes(rng, words, args.quotes)
+
+    start = time.perf_counter()
+    aligner = QuoteAligner(text, timings)
+    built = time.perf_counter()
+    results = [aligner.align(quote) for quote, _ in cases]
+    done = time.perf_counter()
+
+    real = [r for (_, i), r in zip(cases, results) if i is not None]
+    invented = [r for (_, i), r in zip(cases, results) if i is None]
+    print(f"transcript: {len(words)} words, {len(cases)} quotes")
+    print(f"index build: {(built - start) * 1000:7.1f} ms")
+    print(f"alignment:   {(done - built) * 1000:7.1f} ms ({(done - built) * 1e6 / len(cases):.0f} us / quote)")
+    print(f"matched {sum(r['matched'] for r in real)}/{len(real)} real quotes, "
+          f"{sum(r['matched'] for r in invented)}/{len(invented)} invented")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Opóźnienie `/api/v1/process` dla powtarzanego URL-a: bez cache i z rozgrzanym cache.
+
+Aplikacja działa w procesie (httpx + ASGI, bez sieci) na osobnej bazie (domyślnie
+`video_sentiment_bench`), z podmienionym pobieraniem, Deepgramem i Groq. Pierwsze
+żądanie zapisuje transkrypcję i sentyment w bazie, potem N powtórzeń tego samego URL-a
+jest mierzonych z wyłączonym cache (każde czyta z Mongo) i z włączonym.
+
+Uruchomienie (lokalny mongod):
+    python tests/performance/cache_benchmark.py -n 500
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from app.core import database  # noqa: E402
+from app.core.cache import sentiment_cache, transcription_cache, cache_stats  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.main import app  # noqa: E402
+from app.modules.v1.sentiment import service as sentiment_service  # noqa: E402
+from app.modules.v1.transcription import service as transcription_service  # noqa: E402
+
+URL = "https://www.youtube.com/watch?v=cachebench01"
+
+
+def fake_externals():
+    deepgram = MagicMock()
+    response = deepgram.return_value.listen.v1.media.transcribe_file.return_value
+    response.results.channels[0].alternatives[0].transcript = "Bateria trzyma dwa dni. " * 400
+    groq = MagicMock()
+    groq.return_value.chat.completions.create.return_value.choices[0].message.content = json.dumps(
+        {"overall_summary": "S", "results": {"bateria": {"pozytywny": ["trzyma dwa dni"]}}}
+    )
+    return [
+        patch.object(transcription_service, "download_audio", return_value=("hash", __file__, "Title")),
+        patch.object(transcription_service, "DeepgramClient", deepgram),
+        patch.object(transcription_service, "Path"),
+        patch.object(sentiment_service, "Groq", groq),
+        patch.object(settings, "RATE_LIMIT_ENABLED", False),
+    ]
+
+
+async def measure(client: httpx.AsyncClient, n: int, label: str) -> None:
+    latencies = []
+    for _ in range(n):
+        start = time.perf_counter()
+        response = await client.post("/api/v1/process", json={"url": URL})
+        latencies.append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+    latencies.sort()
+    p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+    print(f"{label:<12} p50 {statistics.median(latencies):7.2f} ms   p95 {p95:7.2f} ms")
+
+
+async def run(n: int, mongo_uri: str, db_name: str) -> None:
+    patches = [patch.object(settings, "MONGO_URI", mongo_uri), patch.object(settings, "MONGO_DB", db_name)]
+    patches += fake_externals()
+    for p in patches:
+        p.start()
+    try:
+        client = await database.connect_db()
+        await client.drop_database(db_name)
+        await database.init_indexes()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+            await http.post("/api/v1/process", json={"url": URL})  # stores transcription + sentiment
+
+            for cache in (transcription_cache, sentiment_cache):
+                cache.enabled = False
+            await measure(http, n, "no cache")
+
+            for cache in (transcription_cache, sentiment_cache):
+                cache.enabled = True
+            await http.post("/api/v1/process", json={"url": URL})  # warm up
+            await measure(http, n, "warm cache")
+        print(json.dumps(cache_stats(), indent=2))
+        await client.drop_database(db_name)
+    finally:
+        await database.close_db()
+        for p in reversed(patches):
+            p.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--requests", type=int, default=500)
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="video_sentiment_bench")
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.mongo_uri, args.db))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from locust import HttpUser, task, between
+from locust import HttpUser, task, between, constant
 import random
 
 class VideoSentimentUser(HttpUser):
@@ -34,6 +34,16 @@ class VideoSentimentUser(HttpUser):
         """Sprawdzenie jak serwer radzi sobie z błędami autoryzacji"""
         self.client.get("/api/v1/auth/test") 
 
+    @task(2)
+    def analysis_history(self):
+        """Pierwsza strona historii analiz (lekka projekcja)"""
+        if self.token:
+            self.client.get(
+                "/api/v1/analysis?limit=20",
+                headers={"Authorization": f"Bearer {self.token}"},
+                name="/api/v1/analysis",
+            )
+
     # @task(1) 
     # def process_video(self):
     #     if self.token:
@@ -41,4 +51,33 @@ class VideoSentimentUser(HttpUser):
     #         self.client.post("/api/v1/transcribe/process", json={
     #             "url": "https://www.youtube.com/shorts/c7SRzIUjVYw",
     #             "model": "deepgram-nova-2"
-    #         }, headers=headers)
\ No newline at end of file
+    #         }, headers=headers)
+
+
+class LoginStormUser(HttpUser):
+    """
+    Burza logowań (bcrypt) - mierzy RPS logowania oraz to, jak bardzo rosną opóźnienia
+    pozostałych endpointów (VideoSentimentUser) w tym samym czasie.\n
+    Tylko burza:   locust -f tests/performance/locustfile.py LoginStormUser
+    Mieszany ruch: locust -f tests/performance/locustfile.py (proporcje wg `weight`)
+    """
+    wait_time = constant(0)
+    weight = 1
+    email = "loadtest_login_storm@test.com"
+    password = "password123"
+
+    def on_start(self):
+        # 400 gdy konto już istnieje - to nie błąd
+        with self.client.post("/api/v1/auth/register", json={
+            "email": self.email,
+            "password": self.password
+        }, catch_response=True) as response:
+            if response.status_code in (200, 400):
+                response.success()
+
+    @task
+    def login(self):
+        self.client.post("/api/v1/auth/login", json={
+            "email": self.email,
+            "password": self.password
+        })
@@ -0,0 +1,129 @@
+"""
+Liczba operacji MongoDB na jedną analizę (transkrypcja + sentyment).
+
+Uruchamia w procesie prawdziwe `transcribe_video` i `analyze` tak, jak robi to potok
+Socket.IO, na osobnej bazie (domyślnie `video_sentiment_bench`), z podmienionym
+pobieraniem, Deepgramem i Groq. Każde polecenie wysłane do serwera jest liczone przez
+`CommandListener` pymongo - osobno dla nowego filmu (brak w cache) i dla powtórnej
+analizy tego samego filmu (trafienie w cache).
+
+Porównanie przed/po: uruchomić na obu wersjach kodu (git checkout).
+
+Uruchomienie (lokalny mongod):
+    python tests/performance/mongo_ops_benchmark.py -n 50
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import sys
+import uuid
+from collections import Counter
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from app.core import database  # noqa: E402
+from app.modules.v1.sentiment import service as sentiment_service  # noqa: E402
+from app.modules.v1.transcription import backends as transcription_backends  # noqa: E402
+from app.modules.v1.transcription import service as transcription_service  # noqa: E402
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.commands = Counter()
+
+    def started(self, event):
+        if event.command_name not in ("endSessions", "hello", "isMaster", "ping", "createIndexes", "drop"):
+            self.commands[event.command_name] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def fake_externals():
+    deepgram = MagicMock()
+    response = deepgram.return_value.listen.v1.media.transcribe_file.return_value
+    text = "Bateria trzyma dwa dni, aparat robi dobre zdjęcia."
+    alternative = response.results.channels[0].alternatives[0]
+    alternative.transcript = text
+    alternative.words = [{"word": w, "punctuated_word": w, "start": i * 0.4, "end": i * 0.4 + 0.3, "confidence": 0.9}
+                         for i, w in enumerate(text.split())]
+    groq = MagicMock()
+    groq.return_value.chat.completions.create.return_value.choices[0].message.content = json.dumps(
+        # Z cytatem: wyrównanie cytatów (i czasy słów) jest częścią każdej analizy
+        {"overall_summary": "S", "results": {"bateria": {"sentiments": [
+            {"sentiment": "pozytywny", "sentence": "Bateria trzyma dwa dni"}]}}}
+    )
+    return [
+        patch.object(transcription_service, "download_audio", return_value=("hash", __file__, "Title")),
+        patch.object(transcription_backends, "DeepgramClient", deepgram),
+        patch.object(transcription_service, "Path"),
+        patch.object(sentiment_service, "Groq", groq),
+    ]
+
+
+async def analysis(url: str) -> None:
+    transcription = await transcription_service.transcribe_video(url)
+    parameters = inspect.signature(sentiment_service.analyze).parameters
+    if "word_timings" in parameters:
+        await sentiment_service.analyze(str(transcription.id), transcription_text=transcription.transcription,
+                                        word_timings=transcription_service.word_timings_of(transcription))
+    elif "transcription_text" in parameters:
+        await sentiment_service.analyze(str(transcription.id), transcription_text=transcription.transcription)
+    else:
+        # Before the pipeline carried the transcription: `analyze` read it back by id
+        await sentiment_service.analyze(str(transcription.id))
+
+
+async def measure(counter: CommandCounter, urls, label: str) -> None:
+    counter.commands.clear()
+    for url in urls:
+        await analysis(url)
+    total = sum(counter.commands.values())
+    detail = ", ".join(f"{name} {count / len(urls):.1f}" for name, count in sorted(counter.commands.items()))
+    print(f"{label:<12} {total / len(urls):4.1f} ops/analysis   ({detail})")
+
+
+async def run(n: int, mongo_uri: str, db_name: str) -> None:
+    counter = CommandCounter()
+    client = AsyncIOMotorClient(mongo_uri, event_listeners=[counter])
+    bench_db = client[db_name]
+    await client.drop_database(db_name)
+
+    patches = [
+        patch.object(transcription_service, "db", bench_db),
+        patch.object(sentiment_service, "db", bench_db),
+        patch.object(database, "db", bench_db),
+    ] + fake_externals()
+    for p in patches:
+        p.start()
+    try:
+        await database.init_indexes()
+        urls = [f"https://www.youtube.com/watch?v={uuid.uuid4().hex[:11]}" for _ in range(n)]
+        await measure(counter, urls, "cache miss")
+        await measure(counter, urls, "cache hit")
+    finally:
+        for p in reversed(patches):
+            p.stop()
+        await client.drop_database(db_name)
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--analyses", type=int, default=50)
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="video_sentiment_bench")
+    args = parser.parse_args()
+    asyncio.run(run(args.analyses, args.mongo_uri, args.db))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Test obciążeniowy fan-outu zdarzeń między workerami uvicorna.
+
+Łączy N klientów Socket.IO (websocket) z serwerem uruchomionym z kilkoma workerami,
+każdy klient subskrybuje tę samą analizę (`subscribe_analysis`), a następnie ten
+skrypt publikuje zdarzenia bezpośrednio na szynie (EVENT_BUS_BACKEND=unix|mongo),
+tak jakby wysłał je worker wykonujący analizę. Raportuje liczbę połączonych
+klientów, dostarczone zdarzenia oraz opóźnienie (p50/p95/max).
+
+Uruchomienie:
+    EVENT_BUS_BACKEND=unix uvicorn app.main:app --port 8000 --workers 4
+    EVENT_BUS_BACKEND=unix TEST_TOKEN=<jwt> python tests/performance/multiworker_benchmark.py -n 400 -e 50
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import socketio
+
+# Szyna z aplikacji (ta sama konfiguracja co workery) + helpery z benchmarku strumieni
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from app.core.config import settings  # noqa: E402
+from app.core.message_bus import create_message_bus  # noqa: E402
+from stream_benchmark import BASE_URL, TEST_TOKEN, create_idle_analysis, delete_analysis  # noqa: E402
+
+
+async def connect_clients(n: int, analysis_id: str, latencies: list, subscribed: list):
+    clients = []
+
+    async def start(client: socketio.AsyncClient):
+        @client.on("analysis_replay")
+        async def on_replay(data):
+            subscribed.append(1)
+
+        @client.on("analysis_step")
+        async def on_step(data):
+            sent_at = data.get("sent_at")
+            if sent_at:
+                latencies.append(time.time() - sent_at)
+
+        try:
+            await client.connect(BASE_URL, auth={"token": TEST_TOKEN}, transports=["websocket"])
+            await client.emit("subscribe_analysis", {"analysis_id": analysis_id, "token": TEST_TOKEN})
+        except Exception:
+            pass
+
+    for _ in range(n):
+        clients.append(socketio.AsyncClient(reconnection=False))
+    await asyncio.gather(*(start(c) for c in clients))
+    return clients
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--clients", type=int, default=200)
+    parser.add_argument("-e", "--events", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.1, help="seconds between published events")
+    args = parser.parse_args()
+
+    if not TEST_TOKEN:
+        raise SystemExit("TEST_TOKEN is required")
+    if settings.EVENT_BUS_BACKEND == "local":
+        raise SystemExit("Set EVENT_BUS_BACKEND=unix or mongo (same as the workers)")
+
+    bus = create_message_bus(settings.EVENT_BUS_BACKEND)
+    await bus.start()
+    analysis_id = create_idle_analysis()
+    latencies, subscribed = [], []
+    try:
+        start = time.perf_counter()
+        clients = await connect_clients(args.clients, analysis_id, latencies, subscribed)
+        connect_seconds = time.perf_counter() - start
+        await asyncio.sleep(1)
+
+        for seq in range(1, args.events + 1):
+            await bus.publish("analysis_event", {
+                "analysis_id": analysis_id,
+                "event": "analysis_step",
+                "data": {
+                    "analysis_id": analysis_id,
+                    "step": {"step": "benchmark", "status": "in_progress", "message": str(seq)},
+                    "seq": seq,
+                    "sent_at": time.time(),
+                },
+            })
+            await asyncio.sleep(args.interval)
+        await asyncio.sleep(2)
+
+        connected = sum(1 for c in clients if c.connected)
+        expected = len(subscribed) * args.events
+        print(f"backend         {settings.EVENT_BUS_BACKEND}")
+        print(f"connected       {connected}/{args.clients} in {connect_seconds:.2f}s")
+        print(f"subscribed      {len(subscribed)}")
+        print(f"delivered       {len(latencies)}/{expected}")
+        if latencies:
+            ordered = sorted(latencies)
+            p95 = ordered[int(len(ordered) * 0.95) - 1] if len(ordered) > 1 else ordered[0]
+            print(f"latency p50     {statistics.median(ordered) * 1000:.1f} ms")
+            print(f"latency p95     {p95 * 1000:.1f} ms")
+            print(f"latency max     {ordered[-1] * 1000:.1f} ms")
+
+        await asyncio.gather(*(c.disconnect() for c in clients if c.connected), return_exceptions=True)
+    finally:
+        delete_analysis(analysis_id)
+        await bus.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,118 @@
+"""
+Wyszukiwanie pełnotekstowe analiz (`/api/v1/analysis/search`).
+
+Bez bazy: koszt indeksowania (`document_terms`) jednej transkrypcji, rozmiar `search_terms`
+w dokumencie analizy i czas podświetleń dla strony wyników.
+
+Z `--mongo-uri`: wstawia N analiz (domyślnie 100k, każda z własną transkrypcją) dla U
+użytkowników do bazy `video_sentiment_bench`, tworzy indeksy z `INDEXES` i mierzy
+p50/p95 `search_analyses` (zapytanie + podświetlenia pierwszej strony) dla losowych zapytań.
+
+Uruchomienie:
+    python tests/performance/search_benchmark.py
+    python tests/performance/search_benchmark.py -n 100000 -u 100 --mongo-uri mongodb://localhost:27017
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import bson
+from bson import ObjectId
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from app.core.compression import pack_text  # noqa: E402
+from app.modules.v1.analysis import search  # noqa: E402
+from storage_benchmark import sentiment, transcript  # noqa: E402
+
+QUERIES = ["bateria", "ekran", "aparat zdjęcia", "ładowanie", "procesor wydajność", "noc", "zoom stabilizacja",
+           "iPhone 15", "Galaxy S23", "cena jakość"]
+MODELS = ["iPhone 15", "Galaxy S23", "Pixel 8", "Xiaomi 14"]
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    return statistics.median(latencies), latencies[max(0, int(len(latencies) * 0.95) - 1)]
+
+
+def offline(samples: int) -> None:
+    rng = random.Random(1)
+    texts = [transcript(rng, rng.randint(800, 2500)) for _ in range(samples)]
+    start = time.perf_counter()
+    all_terms = [search.document_terms(f"Recenzja {rng.choice(MODELS)}", text, sentiment(rng)) for text in texts]
+    per_doc = (time.perf_counter() - start) / samples * 1000
+    size = statistics.mean(len(bson.encode({"search_terms": terms})) for terms in all_terms)
+    print(f"document_terms: {per_doc:.2f} ms / transcript, {statistics.mean(map(len, all_terms)):.0f} terms, "
+          f"{size / 1024:.1f} KB BSON")
+
+    wanted = search.query_terms("bateria ekran")
+    start = time.perf_counter()
+    for text in texts[:20]:
+        search.highlight(text, wanted)
+    print(f"highlight: {(time.perf_counter() - start) * 1000:.2f} ms / page of 20")
+
+
+async def online(n: int, users: int, queries: int, mongo_uri: str, db_name: str) -> None:
+    from unittest.mock import patch
+    from app.core import database
+    from app.core.config import settings
+
+    with patch.object(settings, "MONGO_URI", mongo_uri), patch.object(settings, "MONGO_DB", db_name):
+        client = await database.connect_db()
+        try:
+            await client.drop_database(db_name)
+            await database.init_indexes()
+            rng = random.Random(2)
+            now = datetime.utcnow()
+            texts = [transcript(rng, rng.randint(800, 2500)) for _ in range(500)]
+            for offset in range(0, n, 1000):
+                transcriptions, analyses = [], []
+                for i in range(offset, min(n, offset + 1000)):
+                    tid, text = ObjectId(), rng.choice(texts)
+                    title = f"Recenzja {rng.choice(MODELS)} #{i}"
+                    result = sentiment(rng)
+                    transcriptions.append({"_id": tid, "link_hash": f"{i:064x}", "model": "deepgram-nova-2",
+                                           "title": title, "created_at": now, **pack_text(text)})
+                    analyses.append({"url": f"https://youtu.be/{i:011d}", "title": title, "status": "completed",
+                                     "user_id": f"user{i % users}@test.com", "created_at": now - timedelta(minutes=i),
+                                     "transcription_id": str(tid), "sentiment_model": None,
+                                     "search_terms": search.document_terms(title, text, result)})
+                await database.db.transcriptions.insert_many(transcriptions, ordered=False)
+                await database.db.analyses.insert_many(analyses, ordered=False)
+            print(f"inserted {n} analyses for {users} users")
+
+            latencies, hits = [], 0
+            for _ in range(queries):
+                user_id = f"user{rng.randrange(users)}@test.com"
+                start = time.perf_counter()
+                page = await search.search_analyses(user_id, rng.choice(QUERIES))
+                latencies.append((time.perf_counter() - start) * 1000)
+                hits += len(page["analyses"])
+            p50, p95 = percentiles(latencies)
+            print(f"search_analyses: p50 {p50:.1f} ms   p95 {p95:.1f} ms   ({hits / queries:.1f} results / page)")
+            await client.drop_database(db_name)
+        finally:
+            await database.close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--analyses", type=int, default=100000)
+    parser.add_argument("-u", "--users", type=int, default=100)
+    parser.add_argument("-q", "--queries", type=int, default=500)
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--mongo-uri", default=None)
+    parser.add_argument("--db", default="video_sentiment_bench")
+    args = parser.parse_args()
+
+    offline(args.samples)
+    if args.mongo_uri:
+        asyncio.run(online(args.analyses, args.users, args.queries, args.mongo_uri, args.db))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Przepustowość obsługi zdarzeń Socket.IO: JWT w każdym zdarzeniu vs sesja z connect.
+
+Wywołuje w procesie prawdziwy handler `get_analysis_detail` (z nieprawidłowym id,
+więc bez zapytań do bazy) N razy:
+- "before": tożsamość z tokenu w payloadzie, `decode_token` przy każdym zdarzeniu
+  (tak działały handlery przed uwierzytelnianiem przy connect)
+- "after": tożsamość z sesji zapisanej raz w `connect`
+
+Uruchomienie:
+    python tests/performance/socket_auth_benchmark.py -n 20000
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from app import socketio_handler  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.modules.v1.auth.service import create_access_token, decode_token  # noqa: E402
+
+
+class FakeServer:
+    """Socket.IO server stand-in: in-memory sessions, emits are dropped."""
+
+    def __init__(self):
+        self.sessions = {}
+
+    async def save_session(self, sid, session):
+        self.sessions[sid] = session
+
+    async def get_session(self, sid):
+        return self.sessions[sid]
+
+    async def emit(self, *args, **kwargs):
+        pass
+
+    async def enter_room(self, *args, **kwargs):
+        pass
+
+
+async def run(n: int) -> None:
+    token = create_access_token({"sub": "benchmark-user"})
+    server = FakeServer()
+    data = {"analysis_id": "not-an-object-id", "token": token}
+
+    async def session_from_token(sid):
+        # Pre-change behaviour: every event decodes and verifies the JWT from its payload
+        payload = decode_token(data["token"])
+        return payload.get("sub") if payload else None
+
+    # Measures the handler itself, not the per-user event budget
+    with patch.object(socketio_handler, "sio", server), patch.object(settings, "RATE_LIMIT_ENABLED", False):
+        await socketio_handler.connect("sid1", {}, auth={"token": token})
+
+        with patch.object(socketio_handler, "session_user", session_from_token):
+            start = time.perf_counter()
+            for _ in range(n):
+                await socketio_handler.get_analysis_detail("sid1", data)
+            before = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(n):
+            await socketio_handler.get_analysis_detail("sid1", data)
+        after = time.perf_counter() - start
+
+        await socketio_handler.disconnect("sid1")
+
+    print(f"events          {n}")
+    print(f"before (JWT)    {n / before:,.0f} events/s  ({before / n * 1e6:.1f} us/event)")
+    print(f"after (session) {n / after:,.0f} events/s  ({after / n * 1e6:.1f} us/event)")
+    print(f"speedup         {before / after:.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--events", type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(run(args.events))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Rozmiar danych analiz: stary układ (transkrypcja i sentyment kopiowane do `analyses`,
+transkrypcje jako zwykły tekst) vs nowy (`analyses` trzyma referencje, transkrypcje
+skompresowane przez `pack_text`).
+
+Generuje N analiz (domyślnie 10k) dla V różnych filmów (domyślnie 2k - popularne filmy
+są analizowane wielokrotnie) z syntetycznymi polskimi transkrypcjami i liczy rozmiar BSON
+dokumentów każdej kolekcji - tyle danych MongoDB trzyma w cache WiredTiger (working set) -
+oraz pamięć wpisów cache transkrypcji w procesie. Z `--mongo-uri` dodatkowo wstawia oba
+układy do bazy `video_sentiment_bench` i raportuje `storageSize` z collStats (na dysku).
+
+Uruchomienie:
+    python tests/performance/storage_benchmark.py -n 10000 -v 2000
+    python tests/performance/storage_benchmark.py -n 10000 --mongo-uri mongodb://localhost:27017
+"""
+import argparse
+import random
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import bson
+from bson import ObjectId
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from app.core.cache import approximate_size  # noqa: E402
+from app.core.compression import pack_text  # noqa: E402
+
+WORDS = (
+    "telefon bateria ekran aparat zdjęcia procesor wydajność cena jakość obudowa głośnik ładowanie "
+    "szybko wolno bardzo dobrze słabo świetny przeciętny jasny ciemny noc dzień tryb gry aplikacje "
+    "system aktualizacja producent model poprzednik konkurencja wyświetlacz odświeżanie milimetrów "
+    "gramów godzin procent jednak natomiast ale oraz który która które jest był będzie mamy macie "
+    "nagrywanie wideo stabilizacja zoom szeroki kąt portret selfie czytnik linii papilarnych"
+).split()
+ASPECTS = ["bateria", "ekran", "aparat", "wydajność", "cena", "jakość wykonania"]
+
+
+def transcript(rng: random.Random, words: int) -> str:
+    sentences = []
+    while words > 0:
+        n = rng.randint(6, 18)
+        sentences.append(" ".join(rng.choice(WORDS) for _ in range(n)).capitalize() + ".")
+        words -= n
+    return " ".join(sentences)
+
+
+def sentiment(rng: random.Random) -> dict:
+    return {
+        "overall_summary": transcript(rng, 40),
+        "results": {
+            aspect: {"sentiments": [
+                {"sentiment": rng.choice(["pozytywny", "negatywny", "neutralny"]), "quote": transcript(rng, 12)}
+                for _ in range(rng.randint(1, 4))
+            ]}
+            for aspect in rng.sample(ASPECTS, rng.randint(2, len(ASPECTS)))
+        },
+    }
+
+
+def generate(n: int, videos: int, seed: int = 1):
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    texts = [transcript(rng, rng.randint(800, 2500)) for _ in range(videos)]
+    results = [sentiment(rng) for _ in range(videos)]
+    ids = [ObjectId() for _ in range(videos)]
+    old = {"transcriptions": [], "sentiment_analysis": [], "analyses": []}
+    new = {"transcriptions": [], "sentiment_analysis": [], "analyses": []}
+    for i in range(videos):
+        base = {"_id": ids[i], "link_hash": f"{i:064x}", "url": f"https://youtu.be/{i:011d}",
+                "title": f"Recenzja {i}", "model": "deepgram-nova-2", "created_at": now}
+        old["transcriptions"].append({**base, "transcription": texts[i]})
+        new["transcriptions"].append({**base, **pack_text(texts[i])})
+        doc = {"transcription_id": str(ids[i]), "model": "llama-3.3-70b-versatile",
+               "results": results[i], "created_at": now}
+        old["sentiment_analysis"].append(dict(doc))
+        new["sentiment_analysis"].append(dict(doc))
+    for _ in range(n):
+        i = rng.randrange(videos)
+        base = {"url": f"https://youtu.be/{i:011d}", "title": f"Recenzja {i}", "status": "completed",
+                "steps": [], "created_at": now, "completed_at": now, "user_id": f"user{rng.randrange(1000)}@test.com",
+                "sentiment_digest": {"aspects": {}}}
+        old["analyses"].append({**base, "transcription": texts[i], "sentiment": {"message": results[i]}})
+        new["analyses"].append({**base, "transcription_id": str(ids[i]), "sentiment_model": "llama-3.3-70b-versatile"})
+    return old, new
+
+
+def bson_size(docs) -> int:
+    return sum(len(bson.encode(doc)) for doc in docs)
+
+
+def mb(size: float) -> str:
+    return f"{size / 1024 / 1024:9.1f} MB"
+
+
+def report(old, new) -> None:
+    print(f"{'collection':<20} {'old (BSON)':>12} {'new (BSON)':>12}")
+    total_old = total_new = 0
+    for name in old:
+        size_old, size_new = bson_size(old[name]), bson_size(new[name])
+        total_old += size_old
+        total_new += size_new
+        print(f"{name:<20} {mb(size_old)} {mb(size_new)}")
+    print(f"{'total':<20} {mb(total_old)} {mb(total_new)}   ({total_old / total_new:.1f}x smaller)")
+
+    cache_old = sum(approximate_size(doc) for doc in old["transcriptions"]) / len(old["transcriptions"])
+    cache_new = sum(approximate_size(doc) for doc in new["transcriptions"]) / len(new["transcriptions"])
+    print(f"transcription cache entry: {cache_old / 1024:.1f} KB -> {cache_new / 1024:.1f} KB")
+
+
+def report_storage(old, new, mongo_uri: str, db_name: str) -> None:
+    from pymongo import MongoClient
+    with MongoClient(mongo_uri) as client:
+        client.drop_database(db_name)
+        database = client[db_name]
+        print(f"{'collection':<20} {'old (disk)':>12} {'new (disk)':>12}")
+        for name in old:
+            sizes = []
+            for layout, docs in (("old", old[name]), ("new", new[name])):
+                collection = database[f"{layout}_{name}"]
+                collection.insert_many([dict(doc) for doc in docs], ordered=False)
+                sizes.append(database.command("collStats", collection.name)["storageSize"])
+            print(f"{name:<20} {mb(sizes[0])} {mb(sizes[1])}")
+        client.drop_database(db_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--analyses", type=int, default=10000)
+    parser.add_argument("-v", "--videos", type=int, default=2000)
+    parser.add_argument("--mongo-uri", default=None)
+    parser.add_argument("--db", default="video_sentiment_bench")
+    args = parser.parse_args()
+
+    old, new = generate(args.analyses, args.videos)
+    report(old, new)
+    if args.mongo_uri:
+        report_storage(old, new, args.mongo_uri, args.db)
+
+
+if __name__ == "__main__":
+    main()
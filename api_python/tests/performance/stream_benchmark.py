@@ -0,0 +1,127 @@
+"""
+Porównanie kosztu połączeń: strumień SSE/NDJSON vs Socket.IO.
+
+Otwiera N równoległych, bezczynnych połączeń każdego typu do działającego serwera
+i mierzy ile z nich się udało oraz przyrost pamięci (RSS) procesu serwera na połączenie.
+
+Uruchomienie (serwer musi działać lokalnie):
+    uvicorn app.main:app --port 8000
+    TEST_TOKEN=<jwt> python tests/performance/stream_benchmark.py --pid <uvicorn_pid> -n 500
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import time
+
+import httpx
+import jwt
+import socketio
+from pymongo import MongoClient
+
+BASE_URL = os.environ.get("BASE_URL", "http://localhost:8000")
+TEST_TOKEN = os.environ.get("TEST_TOKEN", "")
+MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017")
+MONGO_DB = os.environ.get("MONGO_DB", "video_sentiment")
+
+
+def rss_kb(pid: int) -> int:
+    """Resident memory of the server process in kB (Linux /proc)."""
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def create_idle_analysis() -> str:
+    """Insert a never-finishing analysis so SSE streams stay open."""
+    user_id = jwt.decode(TEST_TOKEN, options={"verify_signature": False})["sub"]
+    with MongoClient(MONGO_URI) as client:
+        result = client[MONGO_DB].analyses.insert_one({
+            "url": "benchmark://idle",
+            "status": "processing",
+            "user_id": user_id,
+            "created_at": datetime.datetime.utcnow(),
+        })
+    return str(result.inserted_id)
+
+
+def delete_analysis(analysis_id: str) -> None:
+    from bson import ObjectId
+    with MongoClient(MONGO_URI) as client:
+        client[MONGO_DB].analyses.delete_one({"_id": ObjectId(analysis_id)})
+
+
+async def open_sse(http: httpx.AsyncClient, analysis_id: str, opened: list, stop: asyncio.Event):
+    url = f"{BASE_URL}/api/v1/analysis/{analysis_id}/stream"
+    try:
+        async with http.stream("GET", url, headers={"Authorization": f"Bearer {TEST_TOKEN}"}) as response:
+            if response.status_code == 200:
+                opened.append(1)
+                await stop.wait()
+    except Exception:
+        pass
+
+
+async def bench_sse(n: int, pid: int, analysis_id: str) -> dict:
+    limits = httpx.Limits(max_connections=n + 10, max_keepalive_connections=0)
+    async with httpx.AsyncClient(timeout=None, limits=limits) as http:
+        before = rss_kb(pid)
+        opened, stop = [], asyncio.Event()
+        start = time.perf_counter()
+        tasks = [asyncio.create_task(open_sse(http, analysis_id, opened, stop)) for _ in range(n)]
+        await asyncio.sleep(max(2.0, n / 200))
+        elapsed = time.perf_counter() - start
+        after = rss_kb(pid)
+        stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return {"connected": len(opened), "seconds": elapsed, "rss_delta_kb": after - before}
+
+
+async def bench_socketio(n: int, pid: int) -> dict:
+    before = rss_kb(pid)
+    clients = [socketio.AsyncClient(reconnection=False) for _ in range(n)]
+    start = time.perf_counter()
+
+    async def connect(c):
+        try:
+            await c.connect(BASE_URL, socketio_path="/socket.io", auth={"token": TEST_TOKEN}, transports=["websocket"])
+        except Exception:
+            pass
+
+    await asyncio.gather(*(connect(c) for c in clients))
+    await asyncio.sleep(max(2.0, n / 200))
+    elapsed = time.perf_counter() - start
+    after = rss_kb(pid)
+    connected = sum(1 for c in clients if c.connected)
+    await asyncio.gather(*(c.disconnect() for c in clients if c.connected), return_exceptions=True)
+    return {"connected": connected, "seconds": elapsed, "rss_delta_kb": after - before}
+
+
+def report(name: str, n: int, res: dict) -> None:
+    per_conn = res["rss_delta_kb"] / res["connected"] if res["connected"] else float("nan")
+    print(f"{name:10s} connected {res['connected']:5d}/{n:<5d} "
+          f"in {res['seconds']:6.2f}s  RSS +{res['rss_delta_kb']:8d} kB  ({per_conn:6.1f} kB/conn)")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pid", type=int, required=True, help="PID of the uvicorn server process")
+    parser.add_argument("-n", "--connections", type=int, default=200)
+    args = parser.parse_args()
+
+    if not TEST_TOKEN:
+        raise SystemExit("TEST_TOKEN is required")
+
+    analysis_id = create_idle_analysis()
+    try:
+        report("sse", args.connections, await bench_sse(args.connections, args.pid, analysis_id))
+        await asyncio.sleep(2)
+        report("socket.io", args.connections, await bench_socketio(args.connections, args.pid))
+    finally:
+        delete_analysis(analysis_id)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
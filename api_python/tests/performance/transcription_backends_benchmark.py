@@ -0,0 +1,89 @@
+"""
+Silniki transkrypcji: współczynnik czasu rzeczywistego (RTF = czas przetwarzania / długość audio).
+
+Dla każdego dostępnego silnika (Deepgram z kluczem API, lokalny whisper z zainstalowanym
+openai-whisper/torch) transkrybuje podane pliki audio, `-c` naraz, i raportuje:
+- RTF każdego pliku oraz łączny (suma czasów / suma długości),
+- przepustowość (sekundy audio na sekundę zegara) przy danej współbieżności,
+- dla whispera osobno czas startu workerów (ładowanie modelu, poza RTF).
+
+Porównanie ustawień lokalnego silnika: `--whisper-model`, `--workers`, `--threads`, `--no-int8`.
+Wyniki służą do ustawienia `realtime_factor` w `Capabilities` i `TRANSCRIPTION_LOCAL_MAX_SECONDS`.
+
+Uruchomienie:
+    python tests/performance/transcription_backends_benchmark.py nagranie1.mp3 nagranie2.mp3 -c 2
+    python tests/performance/transcription_backends_benchmark.py nagranie.mp3 -b whisper-base --no-int8
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from app.modules.v1.downloader.downloader import audio_duration  # noqa: E402
+from app.modules.v1.transcription.backends import BackendRegistry, DeepgramBackend  # noqa: E402
+from app.modules.v1.transcription.local_whisper import LocalWhisperBackend  # noqa: E402
+
+
+async def run_backend(backend, files, durations, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(path):
+        async with semaphore:
+            started = time.perf_counter()
+            result = await backend.transcribe(path, "pl")
+            return time.perf_counter() - started, len(result.text.split())
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one(path) for path in files))
+    wall = time.perf_counter() - started
+    for path, duration, (seconds, words) in zip(files, durations, results):
+        print(f"  {path.name:30} {duration:7.1f} s audio  {seconds:7.2f} s  RTF {seconds / duration:6.3f}  {words} słów")
+    total_audio = sum(durations)
+    busy = sum(seconds for seconds, _ in results)
+    print(f"  razem: RTF {busy / total_audio:.3f}, przepustowość {total_audio / wall:.1f} s audio / s "
+          f"(współbieżność {concurrency})")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="+", type=Path, help="pliki audio (mp3, wav, ...)")
+    parser.add_argument("-b", "--backend", action="append", help="tylko te silniki (domyślnie wszystkie dostępne)")
+    parser.add_argument("-c", "--concurrency", type=int, default=1)
+    parser.add_argument("--whisper-model", default="base")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--no-int8", action="store_true")
+    args = parser.parse_args()
+
+    durations = [audio_duration(path) for path in args.files]
+    if None in durations:
+        parser.error("nie można odczytać długości audio (ffprobe)")
+    whisper = LocalWhisperBackend(args.whisper_model, args.workers, args.threads, not args.no_int8)
+    registry = BackendRegistry([DeepgramBackend("nova-2"), whisper])
+    try:
+        for info in registry.describe():
+            name = info["name"]
+            if args.backend and name not in args.backend:
+                continue
+            if not info["available"]:
+                print(f"{name}: niedostępny, pominięty")
+                continue
+            backend = registry.get(name)
+            print(f"{name} ({sum(durations):.0f} s audio w {len(args.files)} plikach)")
+            if backend is whisper:
+                # Start workerów i załadowanie modelu nie wliczają się do RTF
+                started = time.perf_counter()
+                pool = whisper._get_pool()
+                await asyncio.gather(*(asyncio.get_running_loop().run_in_executor(pool, time.sleep, 0.1)
+                                       for _ in range(args.workers)))
+                print(f"  start {args.workers} workerów: {time.perf_counter() - started:.1f} s "
+                      f"(int8: {whisper.int8}, wątki: {whisper.threads})")
+            await run_backend(backend, args.files, durations, args.concurrency)
+    finally:
+        registry.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,82 @@
+"""
+Opóźnienie wyszukania użytkownika przy logowaniu przy dużej kolekcji `users`.
+
+Wypełnia osobną bazę (domyślnie `video_sentiment_bench`) N użytkownikami (domyślnie 1M,
+jeden wspólny hash bcrypt, żeby nie liczyć bcrypt przy ładowaniu), a potem mierzy
+`find_one({"email": ...}, USER_PROJECTION)` - tak jak `get_user_by_email` - bez indeksu
+(skan kolekcji) i z unikalnym indeksem na `email`. Raportuje p50/p95 oraz liczbę
+przejrzanych dokumentów z explain().
+
+Uruchomienie (lokalny mongod):
+    python tests/performance/user_lookup_benchmark.py -n 1000000 -q 200
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import bcrypt
+from pymongo import MongoClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from app.modules.v1.auth.service import USER_PROJECTION  # noqa: E402
+
+BATCH = 10000
+
+
+def fill(users, n: int) -> None:
+    existing = users.estimated_document_count()
+    if existing >= n:
+        print(f"users           {existing} (reused)")
+        return
+    password = bcrypt.hashpw(b"password123", bcrypt.gensalt(rounds=4)).decode("utf-8")
+    now = datetime.utcnow()
+    start = time.perf_counter()
+    for offset in range(existing, n, BATCH):
+        users.insert_many(
+            [{"email": f"bench_{i}@test.com", "password": password, "created_at": now}
+             for i in range(offset, min(offset + BATCH, n))],
+            ordered=False,
+        )
+    print(f"users           {n} (inserted in {time.perf_counter() - start:.1f}s)")
+
+
+def measure(users, n: int, queries: int, label: str) -> None:
+    emails = [f"bench_{random.randrange(n)}@test.com" for _ in range(queries)]
+    latencies = []
+    for email in emails:
+        start = time.perf_counter()
+        users.find_one({"email": email}, USER_PROJECTION)
+        latencies.append((time.perf_counter() - start) * 1000)
+    plan = users.find({"email": emails[0]}, USER_PROJECTION).explain()
+    examined = plan.get("executionStats", {}).get("totalDocsExamined", "?")
+    latencies.sort()
+    p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+    print(f"{label:<15} p50 {statistics.median(latencies):8.2f} ms   p95 {p95:8.2f} ms   docs examined {examined}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--users", type=int, default=1_000_000)
+    parser.add_argument("-q", "--queries", type=int, default=200)
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="video_sentiment_bench")
+    args = parser.parse_args()
+
+    with MongoClient(args.mongo_uri) as client:
+        users = client[args.db].users
+        fill(users, args.users)
+
+        users.drop_indexes()
+        # Scans are slow at 1M documents; a few queries are enough
+        measure(users, args.users, max(5, args.queries // 20), "no index")
+
+        users.create_index("email", unique=True)
+        measure(users, args.users, args.queries, "unique index")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Czasy słów transkrypcji: lista obiektów (jak z Deepgram) kontra kolumny `WordTimings`.
+
+Godzinna transkrypcja (domyślnie 10k słów). Porównuje:
+- rozmiar w dokumencie: lista słów jako BSON / JSON kontra `words_z` (kolumny + zlib),
+- pamięć w procesie: lista słowników kontra tablice `WordTimings`,
+- czas odczytu: `json.loads` / `bson.decode` listy kontra `WordTimings.unpack`,
+- wycięcie 30 s fragmentu i mapowanie pozycji znaku na czas (skan listy kontra bisekcja).
+
+Uruchomienie:
+    python tests/performance/word_timings_benchmark.py -w 10000
+"""
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import bson
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from app.modules.v1.transcription.word_timings import WordTimings  # noqa: E402
+from storage_benchmark import transcript  # noqa: E402
+
+
+def deepgram_words(rng: random.Random, text: str):
+    words, at = [], 0.0
+    for word in text.split():
+        length = 0.12 + 0.05 * len(word) * rng.random()
+        words.append({"word": word.strip(",.").lower(), "start": round(at, 3), "end": round(at + length, 3),
+                      "confidence": round(rng.uniform(0.6, 1.0), 6), "punctuated_word": word})
+        at += length + rng.uniform(0.02, 0.2)
+    return words
+
+
+def timed(fn, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def allocated(build):
+    tracemalloc.start()
+    value = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size
+
+
+def naive_slice(words, start: float, end: float):
+    return [word for word in words if word["end"] > start and word["start"] < end]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-w", "--words", type=int, default=10000)
+    parser.add_argument("-r", "--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    text = transcript(rng, args.words)
+    words = deepgram_words(rng, text)
+    as_json, as_bson = json.dumps(words).encode(), bson.encode({"words": words})
+    timings = WordTimings.from_words(words, text)
+    packed = timings.pack()
+    print(f"{len(words)} words, {words[-1]['end'] / 60:.1f} min of audio")
+    print(f"size      JSON {len(as_json) / 1024:7.1f} KB   BSON {len(as_bson) / 1024:7.1f} KB   "
+          f"columns {len(timings.to_bytes()) / 1024:6.1f} KB   words_z {len(packed['words_z']) / 1024:6.1f} KB")
+
+    list_memory = allocated(lambda: json.loads(as_json))[1]
+    columns_memory = allocated(lambda: WordTimings.unpack(packed, text))[1]
+    print(f"memory    list of dicts {list_memory / 1024:7.1f} KB   WordTimings {columns_memory / 1024:6.1f} KB")
+
+    json_ms, _ = timed(lambda: json.loads(as_json), args.repeat)
+    bson_ms, _ = timed(lambda: bson.decode(as_bson), args.repeat)
+    unpack_ms, _ = timed(lambda: WordTimings.unpack(packed, text), args.repeat)
+    print(f"decode    JSON {json_ms:6.2f} ms   BSON {bson_ms:6.2f} ms   WordTimings.unpack {unpack_ms:6.3f} ms")
+
+    duration = words[-1]["end"]
+    ranges = [(at, at + 30) for at in (rng.uniform(0, duration - 30) for _ in range(100))]
+    naive_ms, _ = timed(lambda: [naive_slice(words, *r) for r in ranges], 1)
+    columns_ms, _ = timed(lambda: [timings.slice(*r) for r in ranges], 1)
+    print(f"30 s slice  list scan {naive_ms * 10:7.1f} us   WordTimings.slice {columns_ms * 10:6.1f} us")
+
+    offsets = [rng.randrange(len(text)) for _ in range(1000)]
+    columns_ms, _ = timed(lambda: [timings.time_at(offset) for offset in offsets], 1)
+    print(f"time_at   {columns_ms:.3f} us / offset")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,7 @@ from datetime import datetime
 
 # Mock environment variables before importing app modules
 import os
-os.environ["SECRET_KEY"] = "test-secret"
+os.environ["SECRET_KEY"] = "test-secret-key-of-at-least-32-bytes"
 os.environ["GROQ_SECRET"] = "test-groq"
 os.environ["DEEPGRAM_SECRET"] = "test-deepgram"
 
@@ -15,6 +15,30 @@ def event_loop():
     yield loop
     loop.close()
 
+@pytest.fixture(autouse=True)
+def reset_rate_limits():
+    """Każdy test zaczyna z pełnymi limitami zapytań."""
+    from app.core.rate_limit import rate_limiter, load_shedder
+    rate_limiter.reset()
+    load_shedder.lag = 0.0
+    yield
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Cache transkrypcji/sentymentu nie przenosi wyników między testami."""
+    from app.core.cache import transcription_cache, sentiment_cache
+    transcription_cache.clear()
+    sentiment_cache.clear()
+    yield
+
+@pytest.fixture(autouse=True)
+def reset_write_behind():
+    """Niezapisane kroki analiz nie przechodzą do kolejnych testów."""
+    from app.core.write_behind import analysis_writer
+    analysis_writer.clear()
+    yield
+    analysis_writer.clear()
+
 @pytest.fixture
 def mock_db():
     """Mockuje całą bazę danych MongoDB."""
@@ -24,6 +48,9 @@ def mock_db():
     db.transcriptions = AsyncMock()
     db.sentiment_analysis = AsyncMock()
     db.analyses = AsyncMock()
+    db.aspect_rollups = AsyncMock()
+    db.batches = AsyncMock()
+    db.batches.find_one.return_value = None
     return db
 
 @pytest.fixture
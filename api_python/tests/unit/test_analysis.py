@@ -0,0 +1,636 @@
+import pytest
+import asyncio
+import json
+from unittest.mock import patch, AsyncMock, MagicMock
+from fastapi.testclient import TestClient
+from bson import ObjectId
+from app.main import app
+from app.core.events import event_bus
+from app.modules.v1.analysis.router import format_event
+
+client = TestClient(app)
+
+
+async def fake_pipeline(sid, url, user_id, model="deepgram-nova-2", analysis_oid=None, batch_id=None):
+    analysis_id = str(analysis_oid)
+    event_bus.publish(analysis_id, "analysis_started", {"analysis_id": analysis_id})
+    event_bus.publish(analysis_id, "analysis_step", {"analysis_id": analysis_id, "step": {"step": "download"}})
+    event_bus.publish(analysis_id, "analysis_complete", {"analysis_id": analysis_id, "title": "T"})
+
+
+def test_format_event():
+    assert format_event("sse", "analysis_step", {"a": 1}) == 'event: analysis_step\ndata: {"a": 1}\n\n'
+    line = format_event("ndjson", "analysis_step", {"a": 1})
+    assert json.loads(line) == {"event": "analysis_step", "data": {"a": 1}}
+
+
+def test_stream_requires_token():
+    response = client.post("/api/v1/analysis/stream", json={"url": "http://yt.com"})
+    assert response.status_code == 401
+
+    with patch("app.modules.v1.analysis.router.decode_token", return_value=None):
+        response = client.post(
+            "/api/v1/analysis/stream",
+            json={"url": "http://yt.com"},
+            headers={"Authorization": "Bearer bad"},
+        )
+        assert response.status_code == 401
+
+
+def test_malformed_token_returns_401():
+    """Prawdziwe decode_token: śmieciowy token to 401, nie 500"""
+    headers = {"Authorization": "Bearer garbage"}
+    assert client.get("/api/v1/analysis", headers=headers).status_code == 401
+    assert client.get("/api/v1/analysis/search?q=bateria", headers=headers).status_code == 401
+    assert client.post("/api/v1/analysis/stream", json={"url": "http://yt.com"}, headers=headers).status_code == 401
+    with patch("app.modules.v1.auth.service.jwt.decode", side_effect=AttributeError("jwt")):
+        assert client.post("/api/v1/analysis/some-id/cancel", headers=headers).status_code == 401
+
+
+def test_stream_ndjson():
+    with patch("app.modules.v1.analysis.router.decode_token", return_value={"sub": "uid1"}), \
+         patch("app.modules.v1.analysis.pipeline.process_video_analysis", side_effect=fake_pipeline):
+        response = client.post(
+            "/api/v1/analysis/stream?format=ndjson",
+            json={"url": "http://yt.com"},
+            headers={"Authorization": "Bearer good"},
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        events = [json.loads(line)["event"] for line in response.text.splitlines()]
+        assert events == ["analysis_started", "analysis_step", "analysis_complete"]
+    assert event_bus.subscriber_count() == 0
+
+
+def test_stream_sse():
+    with patch("app.modules.v1.analysis.router.decode_token", return_value={"sub": "uid1"}), \
+         patch("app.modules.v1.analysis.pipeline.process_video_analysis", side_effect=fake_pipeline):
+        response = client.post(
+            "/api/v1/analysis/stream",
+            json={"url": "http://yt.com"},
+            headers={"Authorization": "Bearer good"},
+        )
+        assert response.headers["content-type"].startswith("text/event-stream")
+        assert "event: analysis_complete" in response.text
+
+
+def test_attach_stream_completed(mock_db):
+    oid = ObjectId()
+    with patch("app.modules.v1.analysis.router.decode_token", return_value={"sub": "uid1"}), \
+         patch("app.modules.v1.analysis.replay.db", mock_db):
+        mock_db.analyses.find_one.return_value = {"_id": oid, "status": "completed", "title": "T"}
+        response = client.get(
+            f"/api/v1/analysis/{oid}/stream?format=ndjson",
+            headers={"Authorization": "Bearer good"},
+        )
+        assert json.loads(response.text)["event"] == "analysis_complete"
+
+        mock_db.analyses.find_one.return_value = None
+        response = client.get(f"/api/v1/analysis/{oid}/stream", headers={"Authorization": "Bearer good"})
+        assert response.status_code == 404
+    assert event_bus.subscriber_count() == 0
+
+
+def test_attach_stream_finished_batch(mock_db):
+    """Po wygaśnięciu bufora powtórek strumień batcha odtwarzany jest z dokumentu `batches`"""
+    oid = ObjectId()
+    entries = [{"url": "https://youtu.be/aaaaaaaaaaa", "analysis_id": "a1", "status": "completed"}]
+    with patch("app.modules.v1.analysis.router.decode_token", return_value={"sub": "uid1"}), \
+         patch("app.modules.v1.analysis.replay.db", mock_db):
+        mock_db.analyses.find_one.return_value = None
+        mock_db.batches.find_one.return_value = {"_id": oid, "status": "completed", "entries": entries,
+                                                 "summary": {"total": 1}}
+        response = client.get(f"/api/v1/analysis/{oid}/stream?format=ndjson",
+                              headers={"Authorization": "Bearer good"})
+    assert response.status_code == 200
+    line = json.loads(response.text)
+    assert line["event"] == "batch_complete"
+    assert line["data"] == {"batch_id": str(oid), "entries": entries, "errors": [], "summary": {"total": 1}}
+    assert mock_db.batches.find_one.call_args[0][0] == {"_id": oid, "user_id": "uid1"}
+    assert event_bus.subscriber_count() == 0
+
+
+def test_cancel_endpoint():
+    with patch("app.modules.v1.analysis.router.decode_token", return_value={"sub": "uid1"}), \
+         patch("app.modules.v1.analysis.router.analysis_registry") as mock_registry:
+        mock_registry.get.return_value = None
+        response = client.post("/api/v1/analysis/aid1/cancel", headers={"Authorization": "Bearer good"})
+        assert response.status_code == 404
+
+        mock_registry.get.return_value = MagicMock(user_id="uid1")
+        response = client.post("/api/v1/analysis/aid1/cancel", headers={"Authorization": "Bearer good"})
+        assert response.status_code == 200
+        mock_registry.cancel.assert_called_with("aid1", "cancelled_by_user")
+
+
+@pytest.mark.asyncio
+async def test_registry_cancel_after_grace_and_keep_alive():
+    from app.modules.v1.analysis.registry import AnalysisRegistry
+    registry = AnalysisRegistry()
+
+    task = asyncio.create_task(asyncio.sleep(10))
+    registry.register("aid1", "uid1", task)
+    registry.cancel_after_grace("aid1", "client_disconnected", delay=0.01)
+    assert registry.get("aid1").grace_pending
+    registry.keep_alive("aid1")
+    await asyncio.sleep(0.05)
+    assert not task.cancelled()
+
+    registry.cancel_after_grace("aid1", "client_disconnected", delay=0.01)
+    await asyncio.sleep(0.05)
+    assert task.cancelled()
+    assert registry.get("aid1").cancel_reason == "client_disconnected"
+
+
+@pytest.mark.asyncio
+async def test_registry_cpu_accounting():
+    from app.modules.v1.analysis.registry import AnalysisRegistry, ActiveAnalysis
+    registry = AnalysisRegistry()
+    registry.record_download(4.0)
+    registry.record_download(2.0)
+
+    entry = ActiveAnalysis("aid1", "uid1", MagicMock())
+    entry.cpu_seconds = 1.0
+    summary = registry.record_cancelled(entry)
+    assert summary["stage"] == "download"
+    assert summary["cpu_seconds_reclaimed"] == 2.0
+
+    entry.download_finished = True
+    assert registry.record_cancelled(entry)["cpu_seconds_reclaimed"] == 0.0
+    assert registry.stats()["cancelled"] == 2
+
+
+@pytest.mark.asyncio
+async def test_download_worker_killed_on_cancel(tmp_path):
+    import sys
+    from app.modules.v1.downloader import worker
+
+    (tmp_path / "hash1.webm.part").write_text("partial")
+    real_exec = asyncio.create_subprocess_exec
+
+    async def sleeper(*args, **kwargs):
+        return await real_exec(sys.executable, "-c", "import time; time.sleep(30)", **kwargs)
+
+    with patch.object(worker.asyncio, "create_subprocess_exec", side_effect=sleeper):
+        task = asyncio.create_task(worker.download_audio_in_worker("http://yt.com", "hash1", out_dir=tmp_path))
+        await asyncio.sleep(0.3)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(task, timeout=5)
+
+    assert not any(tmp_path.glob("hash1.*"))
+
+
+@pytest.mark.asyncio
+async def test_catch_up_memory_and_database(mock_db):
+    from app.modules.v1.analysis.replay import catch_up
+    from app.core.events import replay_buffer
+    oid = ObjectId()
+    with patch("app.modules.v1.analysis.replay.db", mock_db):
+        mock_db.analyses.find_one.return_value = None
+        assert await catch_up(str(oid), "uid1") is None
+
+        mock_db.analyses.find_one.return_value = {"_id": oid, "status": "completed", "title": "T"}
+        state = await catch_up(str(oid), "uid1")
+        assert state["source"] == "database"
+        assert state["events"][0][0] == "analysis_complete"
+
+        replay_buffer.record(str(oid), "analysis_step", {"step": {"step": "download"}, "seq": 1})
+        replay_buffer.record(str(oid), "analysis_complete", {"seq": 2})
+        state = await catch_up(str(oid), "uid1", last_seq=1)
+        assert state["source"] == "memory"
+        assert state["events"] == [("analysis_complete", {"seq": 2})]
+        replay_buffer.forget(str(oid))
+
+
+def test_attach_stream_last_event_id():
+    with patch("app.modules.v1.analysis.router.decode_token", return_value={"sub": "uid1"}), \
+         patch("app.modules.v1.analysis.router.catch_up", new_callable=AsyncMock) as mock_catch_up:
+        mock_catch_up.return_value = {"running": False, "events": [("analysis_complete", {"seq": 7})]}
+        response = client.get(
+            "/api/v1/analysis/aid1/stream",
+            headers={"Authorization": "Bearer good", "Last-Event-ID": "6"},
+        )
+        mock_catch_up.assert_called_with("aid1", "uid1", 6)
+        assert response.text.startswith("id: 7\nevent: analysis_complete")
+
+
+@pytest.mark.asyncio
+async def test_progress_reporter_throttles_and_coalesces():
+    from app.modules.v1.analysis.progress import ProgressReporter
+    emitted = []
+
+    async def emit(update):
+        emitted.append(update)
+
+    reporter = ProgressReporter(emit, min_interval=0.1)
+    for percent in range(50):
+        reporter.update({"step": "download", "percent": percent})
+    await asyncio.sleep(0.05)
+    # First slot is free: only the latest of the burst is sent
+    assert emitted == [{"step": "download", "percent": 49}]
+
+    reporter.update({"step": "download", "percent": 80})
+    await reporter.flush()
+    assert emitted[-1]["percent"] == 80
+
+    # Updates from another thread are handed over to the loop
+    await asyncio.get_running_loop().run_in_executor(None, reporter.update, {"step": "convert", "percent": 10})
+    await asyncio.sleep(0.15)
+    assert emitted[-1] == {"step": "convert", "percent": 10}
+    assert reporter.received == 52 and reporter.emitted == 3
+
+    reporter.close()
+    reporter.update({"step": "convert", "percent": 20})
+    await asyncio.sleep(0.15)
+    assert reporter.emitted == 3
+
+
+@pytest.mark.asyncio
+async def test_list_analyses_keyset_pagination(mock_db):
+    from datetime import datetime
+    from app.modules.v1.analysis import history
+    docs = [{"_id": ObjectId(), "created_at": datetime(2024, 1, day), "status": "completed"} for day in (3, 2, 1)]
+    with patch("app.modules.v1.analysis.history.db", mock_db):
+        mock_db.analyses.find = MagicMock()
+        chain = mock_db.analyses.find.return_value.sort.return_value.limit
+        chain.return_value.to_list = AsyncMock(return_value=docs)
+
+        page = await history.list_analyses("uid1", limit=2)
+        assert [a["created_at"] for a in page["analyses"]] == ["2024-01-03T00:00:00", "2024-01-02T00:00:00"]
+        assert page["next_cursor"]
+        chain.assert_called_with(3)
+
+        await history.list_analyses("uid1", limit=2, cursor=page["next_cursor"])
+        query = mock_db.analyses.find.call_args[0][0]
+        assert query["user_id"] == "uid1"
+        assert query["$or"][1] == {"created_at": datetime(2024, 1, 2), "_id": {"$lt": docs[1]["_id"]}}
+
+    with pytest.raises(history.InvalidCursor):
+        history.decode_cursor("garbage")
+
+
+def test_sentiment_digest():
+    from app.modules.v1.analysis.history import sentiment_digest
+    payload = {"message": {"overall_summary": "ok", "results": {
+        "bateria": {"sentiments": [{"sentiment": "pozytywny"}, {"sentiment": "pozytywny"}, {"sentiment": "negatywny"}]},
+        "ekran": {"sentiments": []},
+    }}}
+    assert sentiment_digest(payload) == {"aspects": {
+        "bateria": {"positive": 2, "negative": 1, "neutral": 0, "score": 0.333},
+    }}
+    assert sentiment_digest({"message": []}) == {"aspects": {}}
+
+
+def test_history_endpoints_require_token_and_validate_cursor():
+    assert client.get("/api/v1/analysis").status_code == 401
+    with patch("app.modules.v1.analysis.router.decode_token", return_value={"sub": "uid1"}):
+        response = client.get("/api/v1/analysis?cursor=bad", headers={"Authorization": "Bearer good"})
+        assert response.status_code == 400
+
+@pytest.mark.asyncio
+async def test_analysis_detail_loads_referenced_results_lazily(mock_db):
+    from datetime import datetime
+    from app.core.compression import pack_text
+    from app.modules.v1.analysis import history
+    tid = ObjectId()
+    text = "Ekran jest jasny i czytelny. " * 100
+    with patch.object(history, "db", mock_db), \
+         patch.object(history, "get_saved_results", new_callable=AsyncMock, return_value={"results": {}}) as mock_saved:
+        # the history list never touches the transcript
+        mock_db.analyses.find_one.return_value = {
+            "_id": ObjectId(), "status": "completed", "created_at": datetime(2024, 1, 1),
+            "transcription_id": str(tid), "sentiment_model": "llama-3.3-70b-versatile",
+        }
+        mock_db.transcriptions.find_one.return_value = {"_id": tid, **pack_text(text)}
+        detail = await history.get_analysis_detail("uid1", str(ObjectId()))
+
+    assert detail["transcription"] == text
+    assert detail["sentiment"] == {"message": {"results": {}}}
+    assert mock_db.transcriptions.find_one.call_args[0][0] == {"_id": tid}
+    # widok starej analizy pokazuje też wyniki starszej wersji promptu
+    mock_saved.assert_called_once_with(str(tid), "llama-3.3-70b-versatile", current_only=False)
+
+
+def test_search_terms_fold_diacritics_and_inflection():
+    from app.modules.v1.analysis import search
+    assert search.fold("Łódź ŻÓŁW") == "lodz zolw"
+    # różne formy tego samego słowa dają ten sam term, modele telefonów zostają bez zmian
+    assert {search.term(w) for w in ("bateria", "baterii", "Baterią", "baterię", "baterie")} == {"bater"}
+    assert search.query_terms("iPhone 15 Pro i bateria bateria") == ["iphon", "15", "pro", "bater"]
+    terms = search.document_terms(
+        "Recenzja Galaxy S23", "Ekran jest świetny.",
+        {"message": {"results": {"bateria": {"sentiments": [{"sentiment": "pozytywny", "sentence": "Bateria trzyma dwa dni"}]}}}},
+    )
+    assert {search.term("Galaxy"), "s23", "ekran", "bater", "trzym"} <= set(terms)
+    assert "jest" not in terms
+
+
+def test_search_highlight_snippets():
+    from app.modules.v1.analysis import search
+    text = "Wstęp. " * 30 + "Bateria trzyma dwa dni, ładowanie baterii trwa godzinę." + " Koniec." * 30
+    snippets = search.highlight(text, search.query_terms("bateria"))
+    assert len(snippets) == 1
+    snippet = snippets[0]
+    assert [snippet["text"][s:e] for s, e in snippet["matches"]] == ["Bateria", "baterii"]
+    assert len(snippet["text"]) < 200 and not snippet["text"].startswith(" ")
+    assert search.highlight(text, ["aparat"]) == []
+
+
+@pytest.mark.asyncio
+async def test_search_analyses_query_and_highlights(mock_db):
+    from datetime import datetime
+    from app.modules.v1.analysis import history, search
+    tid = ObjectId()
+    docs = [{"_id": ObjectId(), "title": "Recenzja iPhone 15", "status": "completed", "created_at": datetime(2024, 1, d),
+             "transcription_id": str(tid), "sentiment_model": "m"} for d in (2, 1)]
+    with patch.object(search, "db", mock_db), patch.object(history, "db", mock_db), \
+         patch.object(history, "get_saved_results", new_callable=AsyncMock, return_value={"results": {
+             "bateria": {"sentiments": [{"sentiment": "pozytywny", "sentence": "Bateria jest świetna"}]}}}):
+        mock_db.analyses.find = MagicMock()
+        chain = mock_db.analyses.find.return_value.sort.return_value.limit
+        chain.return_value.to_list = AsyncMock(return_value=docs)
+        mock_db.transcriptions.find_one.return_value = {"transcription": "Ten iPhone ma dobrą baterię."}
+
+        page = await search.search_analyses("uid1", "Baterii iPhone", limit=1)
+
+    query, projection = mock_db.analyses.find.call_args[0]
+    assert query == {"user_id": "uid1", "search_terms": {"$all": ["bater", "iphon"]}}
+    assert "search_terms" not in projection
+    assert page["next_cursor"] and len(page["analyses"]) == 1
+    result = page["analyses"][0]
+    assert "transcription_id" not in result
+    assert result["highlights"]["title"][0]["matches"] == [[9, 15]]
+    assert result["highlights"]["quotes"][0]["text"] == "Bateria jest świetna"
+    assert result["highlights"]["transcription"][0]["matches"] == [[4, 10], [20, 27]]
+
+    assert await search.search_analyses("uid1", "i w z") == {"analyses": [], "next_cursor": None, "terms": []}
+
+
+def test_search_endpoint_requires_token_and_validates_cursor():
+    assert client.get("/api/v1/analysis/search?q=bateria").status_code == 401
+    with patch("app.modules.v1.analysis.router.decode_token", return_value={"sub": "uid1"}):
+        response = client.get("/api/v1/analysis/search?q=bateria&cursor=bad", headers={"Authorization": "Bearer good"})
+        assert response.status_code == 400
+
+
+def test_rollup_updates_increment_day_and_month_buckets():
+    from datetime import datetime
+    from app.modules.v1.analysis import rollups
+    digest = {"aspects": {
+        "bateria": {"positive": 2, "negative": 1, "neutral": 0, "score": 0.333},
+        "ekran": {"positive": 0, "negative": 1, "neutral": 0, "score": -1.0},
+    }}
+    updates = rollups.rollup_updates("uid1", datetime(2024, 5, 17, 12), digest)
+    keys = {(u._filter["period"], u._filter["bucket"], u._filter["aspect"]) for u in updates}
+    assert keys == {("day", "2024-05-17", "bateria"), ("month", "2024-05", "bateria"),
+                    ("day", "2024-05-17", "ekran"), ("month", "2024-05", "ekran")}
+    assert all(u._upsert for u in updates)
+    assert updates[0]._doc["$inc"] == {"analyses": 1, "positive": 2, "negative": 1, "neutral": 0, "score_sum": 0.333}
+    assert rollups.rollup_updates("uid1", datetime(2024, 5, 17), {"aspects": {}}) == []
+
+
+@pytest.mark.asyncio
+async def test_get_rollups_reads_buckets(mock_db):
+    from app.modules.v1.analysis import rollups
+    docs = [{"bucket": "2024-05", "aspect": "bateria", "analyses": 4, "positive": 6, "negative": 2, "neutral": 1,
+             "score_sum": 1.0}]
+    with patch.object(rollups, "db", mock_db):
+        mock_db.aspect_rollups.find = MagicMock()
+        chain = mock_db.aspect_rollups.find.return_value.sort.return_value.limit
+        chain.return_value.to_list = AsyncMock(return_value=docs)
+        result = await rollups.get_rollups("uid1", "month", "bateria", start="2024-01", end="2024-06")
+
+        assert mock_db.aspect_rollups.find.call_args[0][0] == {
+            "user_id": "uid1", "period": "month", "aspect": "bateria", "bucket": {"$gte": "2024-01", "$lte": "2024-06"},
+        }
+        assert result["rollups"] == [{"bucket": "2024-05", "aspect": "bateria", "analyses": 4, "positive": 6,
+                                      "negative": 2, "neutral": 1, "score": 0.25}]
+        with pytest.raises(rollups.InvalidRollupQuery):
+            await rollups.get_rollups("uid1", "week")
+        with pytest.raises(rollups.InvalidRollupQuery):
+            await rollups.get_rollups("uid1", "month", start="2024-05-17")
+
+
+@pytest.mark.asyncio
+async def test_rollups_rebuild_merges_both_periods(mock_db):
+    from app.modules.v1.analysis import rollups
+    with patch.object(rollups, "db", mock_db):
+        mock_db.analyses.aggregate = MagicMock()
+        mock_db.analyses.aggregate.return_value.to_list = AsyncMock(return_value=[])
+        mock_db.aspect_rollups.count_documents.return_value = 12
+        assert await rollups.rebuild() == 12
+    mock_db.aspect_rollups.delete_many.assert_awaited_once_with({})
+    pipelines = [c[0][0] for c in mock_db.analyses.aggregate.call_args_list]
+    assert [p[-1]["$merge"]["on"] for p in pipelines] == [["user_id", "period", "bucket", "aspect"]] * 2
+    assert [p[1]["$project"]["bucket"]["$dateToString"]["format"] for p in pipelines] == ["%Y-%m-%d", "%Y-%m"]
+
+
+def test_rollups_endpoint_requires_token_and_validates_period():
+    assert client.get("/api/v1/analysis/rollups").status_code == 401
+    with patch("app.modules.v1.analysis.router.decode_token", return_value={"sub": "uid1"}):
+        response = client.get("/api/v1/analysis/rollups?period=week", headers={"Authorization": "Bearer good"})
+        assert response.status_code == 400
+
+
+def _video(video_id, title=None):
+    return {"video_id": video_id, "url": f"https://www.youtube.com/watch?v={video_id}", "title": title}
+
+
+@pytest.mark.asyncio
+async def test_batch_expand_dedupes_and_marks_cached(mock_db):
+    from app.modules.v1.analysis import batch
+    from app.utils.helpers import hash_url
+    listings = {
+        "https://youtu.be/aaaaaaaaaaa": [_video("aaaaaaaaaaa")],
+        "https://www.youtube.com/playlist?list=PL1": [_video("bbbbbbbbbbb", "B"), _video("aaaaaaaaaaa", "A")],
+    }
+
+    def fake_expand(url, max_entries):
+        if url not in listings:
+            raise batch.DownloadError(f"Failed to list videos of {url}")
+        return listings[url][:max_entries]
+
+    with patch.object(batch, "expand_url", side_effect=fake_expand), patch.object(batch, "db", mock_db):
+        entries, errors = await batch.expand_sources(
+            ["https://youtu.be/aaaaaaaaaaa", "https://www.youtube.com/playlist?list=PL1", "https://zly.link"], 10
+        )
+        assert [e["video_id"] for e in entries] == ["aaaaaaaaaaa", "bbbbbbbbbbb"]
+        assert errors == [{"source": "https://zly.link", "error": "Failed to list videos of https://zly.link"}]
+
+        # wcześniejsza analiza tego samego filmu pod adresem youtu.be
+        mock_db.transcriptions.find = MagicMock()
+        mock_db.transcriptions.find.return_value.to_list = AsyncMock(
+            return_value=[{"link_hash": hash_url("https://youtu.be/aaaaaaaaaaa")}]
+        )
+        await batch.mark_cached(entries, "deepgram-nova-2")
+    assert [(e["cached"], e["url"]) for e in entries] == [
+        (True, "https://youtu.be/aaaaaaaaaaa"), (False, "https://www.youtube.com/watch?v=bbbbbbbbbbb"),
+    ]
+    query = mock_db.transcriptions.find.call_args[0][0]
+    assert query["model"] == "deepgram-nova-2" and len(query["link_hash"]["$in"]) == 3
+
+    with patch.object(batch, "expand_url", side_effect=fake_expand):
+        entries, _ = await batch.expand_sources(["https://www.youtube.com/playlist?list=PL1"], 1)
+    assert len(entries) == 1
+
+
+def test_batch_combine_digests():
+    from app.modules.v1.analysis.batch import combine_digests
+    combined = combine_digests([
+        {"aspects": {"bateria": {"positive": 2, "negative": 0, "neutral": 1, "score": 0.667}}},
+        {"aspects": {"bateria": {"positive": 0, "negative": 1, "neutral": 0, "score": -1.0},
+                     "ekran": {"positive": 1, "negative": 0, "neutral": 0, "score": 1.0}}},
+        None,
+    ])
+    assert combined["aspects"]["bateria"] == {"analyses": 2, "positive": 2, "negative": 1, "neutral": 1, "score": 0.25}
+    assert combined["aspects"]["ekran"]["analyses"] == 1
+
+
+def test_batch_stream_fans_out_and_combines(mock_db):
+    from app.modules.v1.analysis import batch
+    started = []
+
+    async def fake_video_pipeline(sid, url, user_id, model="deepgram-nova-2", analysis_oid=None, batch_id=None):
+        analysis_id = str(analysis_oid)
+        started.append((url, batch_id))
+        event_bus.publish(analysis_id, "analysis_step", {"analysis_id": analysis_id, "step": {"step": "download"}})
+        if "bbbbbbbbbbb" in url:
+            event_bus.publish(analysis_id, "analysis_error", {"analysis_id": analysis_id, "error": "Deepgram"})
+            return
+        event_bus.publish(analysis_id, "analysis_complete", {"analysis_id": analysis_id, "title": "T", "sentiment": {
+            "message": {"results": {"bateria": {"sentiments": [{"sentiment": "pozytywny"}]}}}}})
+
+    mock_db.batches = AsyncMock()
+    mock_db.transcriptions.find = MagicMock()
+    mock_db.transcriptions.find.return_value.to_list = AsyncMock(return_value=[])
+    with patch("app.modules.v1.analysis.router.decode_token", return_value={"sub": "uid1"}), \
+         patch("app.modules.v1.analysis.pipeline.process_video_analysis", side_effect=fake_video_pipeline), \
+         patch.object(batch, "db", mock_db), \
+         patch.object(batch, "expand_url", side_effect=lambda url, limit: [_video("aaaaaaaaaaa"), _video("bbbbbbbbbbb")]):
+        response = client.post(
+            "/api/v1/analysis/batch?format=ndjson",
+            json={"urls": ["https://www.youtube.com/playlist?list=PL1"]},
+            headers={"Authorization": "Bearer good"},
+        )
+    assert response.status_code == 200
+    events = [json.loads(line) for line in response.text.splitlines()]
+    names = [e["event"] for e in events]
+    assert names[:2] == ["batch_started", "batch_expanded"] and names[-1] == "batch_complete"
+    assert names.count("batch_progress") == 4  # krok + status każdego filmu
+
+    final = events[-1]["data"]
+    batch_id = final["batch_id"]
+    assert {url for url, _ in started} == {"https://www.youtube.com/watch?v=aaaaaaaaaaa",
+                                            "https://www.youtube.com/watch?v=bbbbbbbbbbb"}
+    assert {b for _, b in started} == {batch_id}
+    assert [e["status"] for e in final["entries"]] == ["completed", "error"]
+    assert final["summary"]["completed"] == 1 and final["summary"]["failed"] == 1
+    assert final["summary"]["sentiment_digest"]["aspects"]["bateria"]["positive"] == 1
+    assert mock_db.batches.update_one.call_args[0][1]["$set"]["status"] == "completed"
+    assert event_bus.subscriber_count() == 0
+
+
+def test_batch_endpoint_validation():
+    assert client.post("/api/v1/analysis/batch", json={"urls": ["https://youtu.be/aaaaaaaaaaa"]}).status_code == 401
+    with patch("app.modules.v1.analysis.router.decode_token", return_value={"sub": "uid1"}):
+        headers = {"Authorization": "Bearer good"}
+        assert client.post("/api/v1/analysis/batch", json={"urls": []}, headers=headers).status_code == 422
+        with patch("app.modules.v1.analysis.router.settings.BATCH_MAX_SOURCES", 1):
+            response = client.post("/api/v1/analysis/batch", headers=headers,
+                                   json={"urls": ["https://youtu.be/aaaaaaaaaaa", "https://youtu.be/bbbbbbbbbbb"]})
+            assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_bulk_process_url_records_stages_and_cache():
+    from app.core.concurrency import stage_limiter
+    from app.modules.v1.analysis import bulk
+    transcription = MagicMock(id=ObjectId(), title="T", transcription="Bateria trzyma długo. " * 20)
+    sentiment = {"results": {"bateria": {"sentiments": [{"sentiment": "pozytywny"}]}}}
+
+    async def fake_transcribe(url, model_name="deepgram-nova-2"):
+        async with stage_limiter.slot("download"):
+            await asyncio.sleep(0.01)
+        return transcription
+
+    limiter = MagicMock(acquire=AsyncMock())
+    with patch.object(bulk, "transcribe_video", side_effect=fake_transcribe), \
+         patch.object(bulk, "get_saved_results", AsyncMock(return_value=None)), \
+         patch.object(bulk, "analyze", AsyncMock(return_value=sentiment)):
+        record = await bulk.process_url("https://youtu.be/aaaaaaaaaaa", limiter=limiter)
+    assert record["status"] == "completed" and record["key"] == "aaaaaaaaaaa"
+    assert record["sentiment_digest"]["aspects"]["bateria"]["positive"] == 1
+    assert record["cache"] == {"transcription": False, "sentiment": False}
+    assert record["seconds"]["download"] >= 0.01
+    limiter.acquire.assert_awaited_once()
+
+    # zapisana transkrypcja i wynik: bez pobierania i bez limitu dostawcy
+    limiter.acquire.reset_mock()
+    with patch.object(bulk, "transcribe_video", AsyncMock(return_value=transcription)), \
+         patch.object(bulk, "get_saved_results", AsyncMock(return_value=sentiment)), \
+         patch.object(bulk, "analyze", AsyncMock(return_value=sentiment)):
+        record = await bulk.process_url("https://youtu.be/aaaaaaaaaaa", limiter=limiter)
+    assert record["cache"] == {"transcription": True, "sentiment": True}
+    limiter.acquire.assert_not_awaited()
+
+    with patch.object(bulk, "transcribe_video", AsyncMock(side_effect=RuntimeError("Deepgram"))):
+        record = await bulk.process_url("https://youtu.be/aaaaaaaaaaa")
+    assert record["status"] == "error" and record["error"] == "Deepgram" and "cache" not in record
+
+
+@pytest.mark.asyncio
+async def test_bulk_process_url_saves_analysis_for_user(mock_db):
+    """Z --user wynik trafia do historii, wyszukiwania i rollupów użytkownika"""
+    from app.modules.v1.analysis import bulk
+    transcription = MagicMock(id=ObjectId(), title="Recenzja", transcription="Bateria trzyma długo.")
+    sentiment = {"results": {"bateria": {"sentiments": [{"sentiment": "pozytywny"}]}}}
+    mock_db.analyses.insert_one.return_value = MagicMock(inserted_id=ObjectId())
+    with patch.object(bulk, "db", mock_db), \
+         patch.object(bulk, "transcribe_video", AsyncMock(return_value=transcription)), \
+         patch.object(bulk, "get_saved_results", AsyncMock(return_value=sentiment)), \
+         patch.object(bulk, "analyze", AsyncMock(return_value=sentiment)), \
+         patch.object(bulk.rollups, "record_analysis", new_callable=AsyncMock) as mock_rollup:
+        record = await bulk.process_url("https://youtu.be/aaaaaaaaaaa", user_id="uid1")
+
+    doc = mock_db.analyses.insert_one.call_args[0][0]
+    assert record["analysis_id"] == str(mock_db.analyses.insert_one.return_value.inserted_id)
+    assert (doc["user_id"], doc["status"], doc["transcription_id"]) == ("uid1", "completed", str(transcription.id))
+    assert doc["sentiment_digest"]["aspects"]["bateria"]["positive"] == 1
+    assert "bater" in doc["search_terms"] and "recenzj" in doc["search_terms"]
+    mock_rollup.assert_awaited_once_with("uid1", doc["created_at"], doc["sentiment_digest"])
+
+    # bez --user nic nie jest zapisywane jako analiza
+    mock_db.analyses.insert_one.reset_mock()
+    with patch.object(bulk, "db", mock_db), \
+         patch.object(bulk, "transcribe_video", AsyncMock(return_value=transcription)), \
+         patch.object(bulk, "get_saved_results", AsyncMock(return_value=sentiment)), \
+         patch.object(bulk, "analyze", AsyncMock(return_value=sentiment)):
+        assert "analysis_id" not in await bulk.process_url("https://youtu.be/aaaaaaaaaaa")
+    mock_db.analyses.insert_one.assert_not_called()
+
+
+def test_bulk_run_checkpoint_skips_completed(tmp_path):
+    from app.modules.v1.analysis import bulk
+    urls = tmp_path / "urls.txt"
+    urls.write_text("# nocny przebieg\nhttps://youtu.be/aaaaaaaaaaa\n\n"
+                    "https://www.youtube.com/watch?v=aaaaaaaaaaa\nhttps://youtu.be/bbbbbbbbbbb\n")
+    output = tmp_path / "results.jsonl"
+    processed = []
+
+    async def fake_process(url, model, sentiment_model, limiter, user_id=None):
+        processed.append(url)
+        status = "error" if "bbbbbbbbbbb" in url and len(processed) < 3 else "completed"
+        return {"url": url, "key": bulk.url_key(url), "status": status, "seconds": {"total": 0.1, "sentiment": 0.1},
+                "cache": {"transcription": True, "sentiment": False}}
+
+    with patch.object(bulk, "connect_db", AsyncMock()), patch.object(bulk, "close_db", AsyncMock()), \
+         patch.object(bulk, "process_url", side_effect=fake_process):
+        first = bulk.run(urls, output, workers=0, report=lambda line: None)
+        second = bulk.run(urls, output, workers=0, report=lambda line: None)
+    assert processed == ["https://youtu.be/aaaaaaaaaaa", "https://youtu.be/bbbbbbbbbbb", "https://youtu.be/bbbbbbbbbbb"]
+    assert (first["completed"], first["failed"], first["skipped"]) == (1, 1, 0)
+    assert (second["completed"], second["failed"], second["skipped"]) == (1, 0, 1)
+    assert first["cache_hits"] == {"transcription": 1, "sentiment": 0}
+    assert (tmp_path / "results.jsonl.done").read_text().split() == ["aaaaaaaaaaa", "bbbbbbbbbbb"]
+    assert [json.loads(line)["status"] for line in output.read_text().splitlines()] == ["completed", "error", "completed"]
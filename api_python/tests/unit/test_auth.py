@@ -5,6 +5,7 @@ from app.modules.v1.auth import service as auth_service
 from unittest.mock import patch, AsyncMock
 from datetime import datetime, timedelta
 import jwt
+from pymongo.errors import DuplicateKeyError
 
 if not hasattr(jwt, 'JWTError'):
     if hasattr(jwt, 'PyJWTError'):
@@ -51,17 +52,19 @@ def test_token_invalid_signature():
 @pytest.mark.asyncio
 async def test_create_user_success(mock_db):
     with patch("app.modules.v1.auth.service.db", mock_db):
-        mock_db.users.find_one.side_effect = [None, {"_id": "123", "email": "new@test.com"}] 
         mock_db.users.insert_one.return_value.inserted_id = "123"
         
         user = await auth_service.create_user("new@test.com", "pass")
         assert user["email"] == "new@test.com"
+        assert user["_id"] == "123"
         mock_db.users.insert_one.assert_called_once()
+        # Single round trip: no lookups before or after the insert
+        mock_db.users.find_one.assert_not_called()
 
 @pytest.mark.asyncio
 async def test_create_user_exists(mock_db):
     with patch("app.modules.v1.auth.service.db", mock_db):
-        mock_db.users.find_one.return_value = {"email": "exists@test.com"}
+        mock_db.users.insert_one.side_effect = DuplicateKeyError("E11000 duplicate key error")
         user = await auth_service.create_user("exists@test.com", "pass")
         assert user is None
 
@@ -86,6 +89,26 @@ async def test_authenticate_user(mock_db):
         auth_none = await auth_service.authenticate_user("404@test.com", "pass")
         assert auth_none is False
 
+@pytest.mark.asyncio
+async def test_authenticate_user_rehashes_on_cost_change(mock_db):
+    old_hash = auth_service.get_password_hash("pass", rounds=4)
+    mock_user = {"_id": "123", "email": "test@test.com", "password": old_hash}
+
+    with patch("app.modules.v1.auth.service.db", mock_db), \
+         patch.object(auth_service.settings, "BCRYPT_ROUNDS", 5):
+        mock_db.users.find_one.return_value = mock_user
+        user = await auth_service.authenticate_user("test@test.com", "pass")
+
+        new_hash = mock_db.users.update_one.call_args[0][1]["$set"]["password"]
+        assert auth_service.hash_rounds(new_hash) == 5
+        assert user["password"] == new_hash
+        assert auth_service.verify_password("pass", new_hash) is True
+
+        # Up-to-date hash: no write
+        mock_db.users.update_one.reset_mock()
+        await auth_service.authenticate_user("test@test.com", "pass")
+        mock_db.users.update_one.assert_not_called()
+
 # --- API Router Tests ---
 
 @pytest.mark.asyncio
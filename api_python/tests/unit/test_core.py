@@ -1,10 +1,12 @@
+import asyncio
 import pytest
 from app.core.config import settings, Settings
 from app.core.database import init_indexes
 from app.core.exceptions import AppException, DownloadError
 from app.utils.helpers import hash_url
 from app.core.sentiment_keywords import ASPECT_KEYWORDS
-from unittest.mock import patch, AsyncMock
+from unittest.mock import patch, AsyncMock, MagicMock, ANY
+from datetime import datetime
 
 def test_config():
     assert settings.APP_NAME == "Video Sentiment Analyzer"
@@ -20,7 +22,22 @@ async def test_init_indexes(mock_db):
     with patch("app.core.database.db", mock_db):
         await init_indexes()
         assert mock_db.transcriptions.create_index.call_count == 2
-        mock_db.transcriptions.create_index.assert_any_call("link_hash")
+        mock_db.transcriptions.create_index.assert_any_call(
+            [("link_hash", 1), ("model", 1)], unique=True
+        )
+        mock_db.sentiment_analysis.create_index.assert_called_once_with(
+            [("transcription_id", 1), ("model", 1)], unique=True
+        )
+        mock_db.transcriptions.drop_index.assert_called_once_with("link_hash_1")
+
+@pytest.mark.asyncio
+async def test_init_indexes_survives_failures(mock_db):
+    from pymongo.errors import OperationFailure
+    mock_db.users.create_index.side_effect = OperationFailure("duplicate key")
+    mock_db.transcriptions.drop_index.side_effect = OperationFailure("index not found")
+    with patch("app.core.database.db", mock_db):
+        await init_indexes()
+    assert mock_db.analyses.create_index.call_count == 5
 
 def test_app_exception():
     exc = AppException("Error message", status_code=418, detail={"foo": "bar"})
@@ -43,4 +60,506 @@ def test_hash_url():
     url = "https://example.com"
     hashed = hash_url(url)
     assert isinstance(hashed, str)
-    assert len(hashed) == 64  
\ No newline at end of file
+    assert len(hashed) == 64  
+
+
+@pytest.mark.asyncio
+async def test_event_bus_publish_and_drop_oldest():
+    from app.core.events import AnalysisEventBus
+    bus = AnalysisEventBus(max_queue_size=2)
+    queue = bus.subscribe("aid1")
+    bus.publish("aid1", "analysis_step", {"n": 1})
+    bus.publish("aid1", "analysis_step", {"n": 2})
+    bus.publish("aid1", "analysis_complete", {"n": 3})
+    bus.publish("other", "analysis_step", {"n": 4})
+
+    assert queue.get_nowait() == ("analysis_step", {"n": 2})
+    assert queue.get_nowait() == ("analysis_complete", {"n": 3})
+    assert queue.empty()
+
+    bus.unsubscribe("aid1", queue)
+    assert bus.subscriber_count() == 0
+
+def test_replay_buffer_since_and_eviction():
+    from app.core.events import ReplayBuffer
+    buf = ReplayBuffer(max_analyses=2, max_events=3)
+    for n in range(5):
+        assert buf.record("aid1", "analysis_step", {"n": n}) == {"n": n, "seq": n + 1}
+
+    assert [d["seq"] for _, d in buf.since("aid1", 3)] == [4, 5]
+    # history before seq 3 was truncated, caller must fall back to the database
+    assert buf.since("aid1", 1) is None
+
+    buf.record("aid2", "analysis_step", {})
+    buf.record("aid3", "analysis_step", {})
+    assert buf.since("aid1") is None
+    assert buf.since("aid3") is not None
+
+def test_compact_events_keeps_latest_step():
+    from app.core.events import compact_events
+    events = [
+        ("analysis_started", {}),
+        ("analysis_step", {"step": {"step": "transcription", "status": "in_progress"}}),
+        ("analysis_step", {"step": {"step": "transcription", "status": "completed"}}),
+        ("analysis_complete", {}),
+    ]
+    compacted = compact_events(events)
+    assert [e for e, _ in compacted] == ["analysis_started", "analysis_step", "analysis_complete"]
+    assert compacted[1][1]["step"]["status"] == "completed"
+
+@pytest.mark.asyncio
+async def test_local_message_bus_delivers_in_process():
+    from app.core.message_bus import MessageBus
+    bus = MessageBus()
+    received = []
+
+    async def handler(payload, remote):
+        received.append((payload, remote))
+
+    bus.on("analysis_event", handler)
+    await bus.publish("analysis_event", {"n": 1})
+    await bus.publish("unknown", {"n": 2})
+    assert received == [({"n": 1}, False)]
+
+@pytest.mark.asyncio
+async def test_unix_socket_message_bus_fan_out(tmp_path):
+    import asyncio
+    from app.core.message_bus import UnixSocketMessageBus
+    worker_a = UnixSocketMessageBus(str(tmp_path))
+    worker_b = UnixSocketMessageBus(str(tmp_path))
+    received_a, received_b = [], []
+
+    async def on_a(payload, remote):
+        received_a.append((payload, remote))
+
+    async def on_b(payload, remote):
+        received_b.append((payload, remote))
+
+    worker_a.on("analysis_event", on_a)
+    worker_b.on("analysis_event", on_b)
+    await worker_a.start()
+    await worker_b.start()
+    (tmp_path / "999-dead.sock").touch()  # stale socket of a dead worker
+    try:
+        await worker_a.publish("analysis_event", {"analysis_id": "aid1", "text": "ą" * 10000})
+        for _ in range(50):
+            if received_b:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        await worker_a.stop()
+        await worker_b.stop()
+
+    assert received_a == [({"analysis_id": "aid1", "text": "ą" * 10000}, False)]
+    assert received_b == [({"analysis_id": "aid1", "text": "ą" * 10000}, True)]
+    assert not list(tmp_path.glob("*.sock"))
+
+def test_route_classes_and_budget():
+    from app.core.rate_limit import route_class, parse_budget
+    assert route_class("POST", "/api/v1/auth/login") == "auth"
+    assert route_class("POST", "/api/v1/analysis/stream") == "analysis"
+    assert route_class("POST", "/api/v1/analysis/aid1/cancel") == "control"
+    assert route_class("GET", "/api/v1/analysis") == "read"
+    assert parse_budget("10/60") == (10.0, 10 / 60)
+
+def test_rate_limiter_token_bucket():
+    from app.core.rate_limit import RateLimiter
+    limiter = RateLimiter({"auth": (2, 1.0)})
+    assert limiter.check("auth", ["1.2.3.4"], now=0) == 0
+    assert limiter.check("auth", ["1.2.3.4"], now=0) == 0
+    assert limiter.check("auth", ["1.2.3.4"], now=0) == pytest.approx(1.0)
+    # other clients have their own bucket, buckets refill over time
+    assert limiter.check("auth", ["5.6.7.8"], now=0) == 0
+    assert limiter.check("auth", ["1.2.3.4"], now=1.0) == 0
+    # a user is limited across IPs
+    assert limiter.check("auth", ["9.9.9.9", "user:a"], now=1.0) == 0
+    assert limiter.check("auth", ["8.8.8.8", "user:a"], now=1.0) == 0
+    assert limiter.check("auth", ["7.7.7.7", "user:a"], now=1.0) > 0
+    assert limiter.rejected == 2
+    # unknown route classes are not limited
+    assert limiter.check("other", ["1.2.3.4"], now=0) == 0
+
+def test_rate_limiter_evicts_least_recently_used():
+    from app.core.rate_limit import RateLimiter
+    limiter = RateLimiter({"read": (1, 0.1)}, max_keys=2)
+    limiter.check("read", ["a"], now=0)
+    limiter.check("read", ["b"], now=0)
+    limiter.check("read", ["a"], now=0)
+    limiter.check("read", ["c"], now=0)
+    assert ("read", "b") not in limiter._buckets
+    assert ("read", "a") in limiter._buckets
+
+@pytest.mark.asyncio
+async def test_load_shedder_detects_event_loop_lag():
+    import asyncio
+    import time
+    from app.core.rate_limit import LoadShedder
+    shedder = LoadShedder(threshold=0.05, interval=0.01, shed_classes=["read"])
+    await shedder.start()
+    await asyncio.sleep(0.02)
+    time.sleep(0.1)  # block the loop
+    await asyncio.sleep(0.02)
+    assert shedder.overloaded
+    assert shedder.should_shed("read")
+    assert not shedder.should_shed("auth")
+    await shedder.stop()
+
+def test_index_audit_check_plan():
+    from app.core.index_audit import check_plan
+    ixscan = {"queryPlanner": {"winningPlan": {
+        "stage": "LIMIT", "inputStage": {"stage": "PROJECTION_SIMPLE", "inputStage": {
+            "stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "email_1"}}}}}}
+    result = check_plan(ixscan)
+    assert result["indexes"] == ["email_1"]
+    assert not result["collscan"] and not result["blocking_sort"]
+
+    # slot-based engine nests the plan under `queryPlan`
+    collscan = {"queryPlanner": {"winningPlan": {
+        "queryPlan": {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}},
+        "slotBasedPlan": {"stages": "..."}}}}
+    result = check_plan(collscan)
+    assert result["stages"] == ["SORT", "COLLSCAN"]
+    assert result["collscan"] and result["blocking_sort"]
+
+def test_index_audit_fails_on_collscan():
+    from unittest.mock import MagicMock
+    from app.core.index_audit import audit, hot_queries
+    database = MagicMock()
+    plans = {
+        "users": {"stage": "IXSCAN", "indexName": "email_1"},
+        "analyses": {"stage": "IXSCAN", "indexName": "user_id_1_created_at_-1__id_-1"},
+    }
+    def collection(name):
+        coll = MagicMock()
+        cursor = coll.find.return_value
+        cursor.sort.return_value = cursor
+        cursor.limit.return_value = cursor
+        cursor.explain.return_value = {"queryPlanner": {"winningPlan": plans.get(name, {"stage": "COLLSCAN"})}}
+        return coll
+    database.__getitem__.side_effect = collection
+
+    queries = hot_queries()
+    assert audit(database, [q for q in queries if q["collection"] in plans])
+    assert not audit(database, queries)
+
+def test_settings_typed_values_and_env_file(tmp_path):
+    env_file = tmp_path / ".env"
+    env_file.write_text(
+        "# comment\n"
+        "export MONGO_URI='mongodb://db:27017'\n"
+        "MONGO_MAX_POOL_SIZE=20\n"
+        "CANCEL_ON_DISCONNECT=yes\n"
+    )
+    s = Settings(env={"MONGO_MAX_POOL_SIZE": "50", "MONGO_WRITE_CONCERN": "majority"}, env_file=str(env_file))
+    assert s.MONGO_URI == "mongodb://db:27017"
+    # the environment wins over the env file
+    assert s.MONGO_MAX_POOL_SIZE == 50
+    assert s.CANCEL_ON_DISCONNECT is True
+    assert s.PROGRESS_MAX_EMITS_PER_SECOND == 4.0
+
+    options = s.mongo_client_options()
+    assert options["maxPoolSize"] == 50
+    assert options["w"] == "majority"
+    assert "readConcernLevel" not in options
+    assert Settings(env={"MONGO_WRITE_CONCERN": "2"}, env_file=None).mongo_client_options()["w"] == 2
+
+def test_settings_rejects_malformed_values():
+    with pytest.raises(ValueError, match="MONGO_MAX_POOL_SIZE"):
+        Settings(env={"MONGO_MAX_POOL_SIZE": "many"}, env_file=None)
+    with pytest.raises(ValueError, match="RATE_LIMIT_ENABLED"):
+        Settings(env={"RATE_LIMIT_ENABLED": "maybe"}, env_file=None)
+
+def test_settings_secrets():
+    s = Settings(env={"GROQ_SECRET": "from-env"}, env_file=None)
+    assert s.GROQ_SECRET == "from-env"
+    with patch("app.core.config.importlib.import_module", side_effect=ImportError):
+        assert Settings(env={}, env_file=None).DEEPGRAM_SECRET == ""
+
+@pytest.mark.asyncio
+async def test_database_client_lifecycle():
+    from app.core import database
+    with patch("app.core.database.AsyncIOMotorClient") as MockClient:
+        client = await database.connect_db(maxPoolSize=5)
+        assert MockClient.call_args.kwargs["maxPoolSize"] == 5
+        assert MockClient.call_args.kwargs["serverSelectionTimeoutMS"] == settings.MONGO_SERVER_SELECTION_TIMEOUT_MS
+        # `db` resolves collections on the client opened in the lifespan
+        assert database.db.users is client[settings.MONGO_DB].users
+        await database.close_db()
+        client.close.assert_called_once()
+        assert database._client is None
+
+@pytest.mark.asyncio
+async def test_stage_limiter_bounds_concurrency():
+    import asyncio
+    from app.core.concurrency import StageLimiter
+    limiter = StageLimiter({"download": 2, "sentiment": 0})
+    peak = 0
+
+    async def work(stage):
+        nonlocal peak
+        async with limiter.slot(stage):
+            peak = max(peak, limiter.running[stage])
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(*(work("download") for _ in range(6)))
+    assert peak == 2
+    peak = 0
+    await asyncio.gather(*(work("sentiment") for _ in range(6)))
+    assert peak == 6
+    assert limiter.running == {"download": 0, "sentiment": 0}
+    assert limiter.waiting == {"download": 0, "sentiment": 0}
+    assert limiter.completed == {"download": 6, "sentiment": 6}
+    assert limiter.busy_seconds["download"] >= 0.06
+
+def test_lru_cache_caps_ttl_and_invalidation():
+    from app.core.cache import LRUCache
+    cache = LRUCache("t", max_entries=2, max_bytes=100, ttl=60, sizeof=len)
+    cache.set("a", "x" * 10)
+    cache.set("b", "y" * 10)
+    assert cache.get("a") == "x" * 10  # "a" is now most recent
+    cache.set("c", "z" * 10)
+    assert cache.get("b") is None and cache.evictions == 1
+    # byte cap: a long value evicts the least recently used ones
+    cache.set("d", "w" * 95)
+    assert cache.get("a") is None and cache.get("c") is None and cache.bytes == 95
+    # larger than the whole cache: not stored
+    cache.set("e", "v" * 101)
+    assert cache.get("e") is None and cache.get("d") is not None
+    cache.invalidate("d")
+    assert len(cache) == 0 and cache.bytes == 0
+
+    with patch("app.core.cache.time.monotonic", return_value=0):
+        cache.set("f", "old")
+    with patch("app.core.cache.time.monotonic", return_value=61):
+        assert cache.get("f") is None
+    assert cache.expirations == 1
+
+@pytest.mark.asyncio
+async def test_lru_cache_get_or_load_coalesces_misses():
+    import asyncio
+    from app.core.cache import LRUCache
+    cache = LRUCache("t")
+    calls = 0
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"v": 1}
+
+    results = await asyncio.gather(*(cache.get_or_load("k", load) for _ in range(5)))
+    assert calls == 1 and all(r == {"v": 1} for r in results)
+    assert await cache.get_or_load("k", load) == {"v": 1}
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["coalesced"]) == (1, 5, 4)
+
+    # None (not found) and errors are not cached
+    async def missing():
+        return None
+    assert await cache.get_or_load("none", missing) is None
+    assert "none" not in cache._entries
+
+    async def failing():
+        raise RuntimeError("db down")
+    with pytest.raises(RuntimeError):
+        await cache.get_or_load("err", failing)
+    assert cache._loading == {}
+
+def test_transcript_compression_round_trip():
+    from app.core import compression
+    text = "Bateria trzyma dwa dni, aparat robi świetne zdjęcia. " * 100
+    with patch.object(settings, "TRANSCRIPT_COMPRESSION", "zlib"):
+        packed = compression.pack_text(text)
+        assert set(packed) == {"transcription_z", "transcription_codec"}
+        assert len(packed["transcription_z"]) < len(text.encode("utf-8")) / 5
+        assert compression.unpack_text(packed) == text
+        # short transcripts are not worth compressing
+        assert compression.pack_text("krótki tekst") == {"transcription": "krótki tekst"}
+        with patch.object(compression, "zstandard", None), \
+             patch.object(settings, "TRANSCRIPT_COMPRESSION", "zstd"):
+            assert compression.pack_text(text)["transcription_codec"] == "zlib"
+    with patch.object(settings, "TRANSCRIPT_COMPRESSION", "none"):
+        assert compression.pack_text(text) == {"transcription": text}
+    # documents written before compression are read as they are
+    assert compression.unpack_text({"transcription": "stary"}) == "stary"
+    assert compression.unpack_text(None) is None
+
+def _cursor(docs):
+    cursor = MagicMock()
+    cursor.sort.return_value.limit.return_value.to_list = AsyncMock(return_value=docs)
+    return cursor
+
+def test_retention_archive_round_trip(tmp_path):
+    from bson import ObjectId
+    from app.core.retention import write_archive, read_archive
+    path = tmp_path / "analyses" / "run.jsonl.gz"
+    docs = [{"_id": ObjectId(), "title": "Recenzja ż", "created_at": datetime(2024, 1, 1)} for _ in range(3)]
+    write_archive(path, docs[:2])
+    write_archive(path, docs[2:])  # kolejna partia dopisywana do tego samego pliku
+    assert read_archive(path) == docs
+
+def test_retention_failed_expiry():
+    from app.core.retention import failed_expiry
+    now = datetime(2024, 1, 1)
+    with patch.object(settings, "RETENTION_FAILED_ANALYSES_DAYS", 30):
+        assert failed_expiry(now) == {"expire_at": datetime(2024, 1, 31)}
+    with patch.object(settings, "RETENTION_FAILED_ANALYSES_DAYS", 0):
+        assert failed_expiry(now) == {}
+
+@pytest.mark.asyncio
+async def test_retention_run_archives_and_prunes(mock_db, tmp_path):
+    from bson import ObjectId
+    from app.core.retention import RetentionJob, read_archive
+    old_analysis = {"_id": ObjectId(), "status": "completed", "transcription_id": "t1"}
+    kept, orphaned = ObjectId(), ObjectId()
+    transcriptions = [{"_id": kept, "link_hash": "a", "model": "m"}, {"_id": orphaned, "link_hash": "b", "model": "m"}]
+    sentiment = [{"_id": ObjectId(), "transcription_id": str(kept)}, {"_id": ObjectId(), "transcription_id": "gone"}]
+    mock_db.maintenance = AsyncMock()
+    mock_db.maintenance.find_one.return_value = None
+    mock_db.analyses.find = MagicMock(return_value=_cursor([old_analysis]))
+    mock_db.analyses.distinct.return_value = [str(kept)]
+    mock_db.analyses.update_many.return_value.modified_count = 2
+    mock_db.transcriptions.find = MagicMock(side_effect=[
+        _cursor(transcriptions),
+        MagicMock(to_list=AsyncMock(return_value=[{"_id": kept}])),
+    ])
+    mock_db.sentiment_analysis.find = MagicMock(return_value=_cursor(sentiment))
+    with patch("app.core.retention.db", mock_db), \
+         patch("app.core.retention.transcription_cache") as mock_cache, \
+         patch.object(settings, "ARCHIVE_ANALYSES_AFTER_DAYS", 365), \
+         patch.object(settings, "ARCHIVE_TRANSCRIPTIONS_AFTER_DAYS", 365), \
+         patch.object(settings, "ARCHIVE_DIR", str(tmp_path)), \
+         patch.object(settings, "RETENTION_AUDIO_HOURS", 0):
+        stats = await RetentionJob().run_once(datetime(2025, 1, 1))
+
+    assert stats["failed_expiry_backfilled"] == 2
+    assert (stats["analyses"], stats["transcriptions"], stats["orphaned_sentiment"]) == (1, 1, 1)
+    # tylko nieużywana transkrypcja i sentyment bez transkrypcji trafiają do archiwum
+    mock_db.transcriptions.delete_many.assert_awaited_once_with({"_id": {"$in": [orphaned]}})
+    mock_db.sentiment_analysis.delete_many.assert_awaited_once_with({"_id": {"$in": [sentiment[1]["_id"]]}})
+    archived = read_archive(tmp_path / "transcriptions" / f"{stats['run_id']}.jsonl.gz")
+    assert [doc["_id"] for doc in archived] == [orphaned]
+    # wpisy cache zapytań o konkretny model i o `auto`
+    assert [c.args[0] for c in mock_cache.invalidate.call_args_list] == [("b", "m"), ("b", "auto")]
+    # cała kolekcja sprawdzona - następny przebieg zaczyna od początku
+    checkpoint = mock_db.maintenance.update_one.call_args[0]
+    assert checkpoint[0] == {"_id": "retention:orphaned_sentiment"} and checkpoint[1]["$set"]["last_id"] is None
+
+@pytest.mark.asyncio
+async def test_retention_defaults_keep_history(mock_db):
+    """Domyślnie nic nie jest archiwizowane ani usuwane poza nieudanymi analizami i starym audio"""
+    from app.core.config import Settings
+    from app.core.retention import RetentionJob
+    defaults = Settings()
+    mock_db.maintenance = AsyncMock()
+    mock_db.analyses.update_many.return_value.modified_count = 0
+    with patch("app.core.retention.db", mock_db), \
+         patch.object(settings, "ARCHIVE_ANALYSES_AFTER_DAYS", defaults.ARCHIVE_ANALYSES_AFTER_DAYS), \
+         patch.object(settings, "ARCHIVE_TRANSCRIPTIONS_AFTER_DAYS", defaults.ARCHIVE_TRANSCRIPTIONS_AFTER_DAYS), \
+         patch.object(settings, "RETENTION_AUDIO_HOURS", 0):
+        stats = await RetentionJob().run_once(datetime(2025, 1, 1))
+    assert "analyses" not in stats and "transcriptions" not in stats and "orphaned_sentiment" not in stats
+    mock_db.analyses.find.assert_not_called()
+    mock_db.analyses.delete_many.assert_not_called()
+    mock_db.transcriptions.delete_many.assert_not_called()
+    mock_db.sentiment_analysis.delete_many.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_retention_orphan_scan_resumes_from_checkpoint(mock_db, tmp_path):
+    """Sentyment sprawdzany przyrostowo: od ostatniego _id, najwyżej RETENTION_ORPHAN_SCAN_BATCHES partii"""
+    from bson import ObjectId
+    from app.core.retention import RetentionJob
+    last_id = ObjectId()
+    batches = [[{"_id": ObjectId(), "transcription_id": "gone"}] for _ in range(3)]
+    mock_db.maintenance = AsyncMock()
+    mock_db.maintenance.find_one.return_value = {"last_id": last_id}
+    mock_db.sentiment_analysis.find = MagicMock(side_effect=[_cursor(batch) for batch in batches])
+    mock_db.transcriptions.find = MagicMock(return_value=MagicMock(to_list=AsyncMock(return_value=[])))
+    with patch("app.core.retention.db", mock_db), \
+         patch.object(settings, "ARCHIVE_DIR", str(tmp_path)), \
+         patch.object(settings, "RETENTION_BATCH_SIZE", 1), \
+         patch.object(settings, "RETENTION_BATCH_PAUSE_SECONDS", 0), \
+         patch.object(settings, "RETENTION_ORPHAN_SCAN_BATCHES", 2):
+        assert await RetentionJob().prune_orphaned_sentiment("run", datetime(2025, 1, 1)) == 2
+
+    assert mock_db.sentiment_analysis.find.call_args_list[0][0][0] == {"_id": {"$gt": last_id}}
+    assert mock_db.sentiment_analysis.find.call_count == 2
+    update = mock_db.maintenance.update_one.call_args[0][1]
+    assert update["$set"]["last_id"] == batches[1][0]["_id"]
+
+@pytest.mark.asyncio
+async def test_retention_skips_when_lease_is_held(mock_db):
+    from pymongo.errors import DuplicateKeyError
+    from app.core.retention import RetentionJob
+    mock_db.maintenance = AsyncMock()
+    mock_db.maintenance.find_one_and_update.side_effect = DuplicateKeyError("E11000")
+    with patch("app.core.retention.db", mock_db):
+        assert await RetentionJob().run_once() == {"skipped": True}
+    mock_db.analyses.update_many.assert_not_called()
+
+def test_retention_prunes_old_audio(tmp_path):
+    import os
+    import time
+    from app.core.retention import RetentionJob
+    old, fresh = tmp_path / "old.mp3", tmp_path / "fresh.mp3"
+    old.write_bytes(b"x")
+    fresh.write_bytes(b"x")
+    os.utime(old, (time.time() - 48 * 3600,) * 2)
+    with patch.object(settings, "RETENTION_AUDIO_HOURS", 24):
+        assert RetentionJob.prune_audio(tmp_path) == 1
+    assert not old.exists() and fresh.exists()
+
+def _step(step, status, message=""):
+    return {"step": step, "status": status, "message": message, "timestamp": datetime.utcnow()}
+
+@pytest.mark.asyncio
+async def test_write_behind_coalesces_into_one_bulk_write(mock_db):
+    from app.core.write_behind import WriteBehindBuffer
+    buffer = WriteBehindBuffer("analyses", flush_interval=0.05, max_pending=100)
+    with patch("app.core.write_behind.db", mock_db):
+        await buffer.update("a1", step=_step("download", "in_progress", "10%"))
+        await buffer.update("a1", step=_step("download", "in_progress", "90%"))  # zastępuje poprzedni
+        await buffer.update("a1", step=_step("download", "completed"))
+        await buffer.update("a2", fields={"title": "T"}, step=_step("download", "in_progress"))
+        mock_db.analyses.bulk_write.assert_not_called()
+        await asyncio.sleep(0.1)
+
+    mock_db.analyses.bulk_write.assert_awaited_once()
+    requests, = mock_db.analyses.bulk_write.call_args[0]
+    assert mock_db.analyses.bulk_write.call_args[1] == {"ordered": False}
+    first = requests[0]._doc["$push"]["steps"]["$each"]
+    assert [(s["status"], s["message"]) for s in first] == [("in_progress", "90%"), ("completed", "")]
+    assert requests[1]._doc["$set"] == {"title": "T"}
+    assert buffer.stats() == {"pending": 0, "updates": 4, "writes": 1}
+
+@pytest.mark.asyncio
+async def test_write_behind_flushes_on_size_and_finish_is_synchronous(mock_db):
+    from app.core.write_behind import WriteBehindBuffer
+    buffer = WriteBehindBuffer("analyses", flush_interval=60, max_pending=2)
+    with patch("app.core.write_behind.db", mock_db):
+        await buffer.update("a1", step=_step("download", "in_progress"))
+        await buffer.update("a2", step=_step("download", "in_progress"))
+        await asyncio.sleep(0)
+        assert len(mock_db.analyses.bulk_write.call_args[0][0]) == 2
+
+        await buffer.update("a1", step=_step("sentiment", "completed"))
+        await buffer.finish("a1", {"status": "completed"}, step=_step("done", "completed"))
+    mock_db.analyses.update_one.assert_awaited_once_with(
+        {"_id": "a1"},
+        {"$set": {"status": "completed"}, "$push": {"steps": {"$each": [ANY, ANY]}}},
+    )
+    assert buffer.stats()["pending"] == 0
+
+@pytest.mark.asyncio
+async def test_write_behind_keeps_updates_when_mongo_is_down(mock_db):
+    from pymongo.errors import AutoReconnect
+    from app.core.write_behind import WriteBehindBuffer
+    buffer = WriteBehindBuffer("analyses", flush_interval=60, max_pending=100)
+    mock_db.analyses.bulk_write.side_effect = AutoReconnect("down")
+    with patch("app.core.write_behind.db", mock_db):
+        await buffer.update("a1", step=_step("download", "in_progress"))
+        await buffer.flush()
+        await buffer.update("a1", step=_step("download", "completed"))
+        await buffer.finish("a1", {"status": "error"})
+    steps = mock_db.analyses.update_one.call_args[0][1]["$push"]["steps"]["$each"]
+    assert [s["status"] for s in steps] == ["in_progress", "completed"]
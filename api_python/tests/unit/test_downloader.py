@@ -101,3 +101,71 @@ def test_download_audio_raises_download_error(tmp_path, monkeypatch):
 
     with pytest.raises(DownloadError):
         downloader.download_audio(url, filename_hash, out_dir=tmp_path)
+
+
+def test_download_progress_hook_reports_percent_and_eta():
+    updates = []
+    hook = downloader._download_progress_hook(updates.append)
+
+    hook({"status": "downloading", "downloaded_bytes": 250, "total_bytes": 1000, "eta": 75})
+    hook({"status": "downloading", "downloaded_bytes": 10, "total_bytes_estimate": None})
+    hook({"status": "finished"})
+
+    assert updates[0]["percent"] == 25.0
+    assert updates[0]["eta"] == 75
+    assert "25%" in updates[0]["message"] and "1:15" in updates[0]["message"]
+    assert updates[1]["percent"] is None
+    assert updates[2]["status"] == "completed"
+
+
+def test_expand_url_video_without_extraction(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("yt-dlp must not be called for a video URL")
+
+    monkeypatch.setattr(downloader.yt_dlp, "YoutubeDL", fail)
+    assert downloader.expand_url("https://youtu.be/dQw4w9WgXcQ?t=10", 10) == [
+        {"video_id": "dQw4w9WgXcQ", "url": "https://www.youtube.com/watch?v=dQw4w9WgXcQ", "title": None}
+    ]
+
+
+def test_expand_url_channel_tabs_flat(monkeypatch):
+    listings = {
+        "https://www.youtube.com/@kanal": {"_type": "playlist", "entries": [
+            {"_type": "url", "ie_key": "YoutubeTab", "url": "https://www.youtube.com/@kanal/videos"},
+            {"_type": "url", "ie_key": "YoutubeTab", "url": "https://www.youtube.com/@kanal/shorts"},
+        ]},
+        "https://www.youtube.com/@kanal/videos": {"_type": "playlist", "entries": [
+            {"_type": "url", "ie_key": "Youtube", "id": "aaaaaaaaaaa", "url": "https://www.youtube.com/watch?v=aaaaaaaaaaa", "title": "A"},
+            {"_type": "url", "ie_key": "Youtube", "id": "bbbbbbbbbbb", "url": "bbbbbbbbbbb", "title": "B"},
+        ]},
+        "https://www.youtube.com/@kanal/shorts": {"_type": "playlist", "entries": [
+            {"_type": "url", "ie_key": "Youtube", "id": "ccccccccccc", "url": "https://www.youtube.com/shorts/ccccccccccc"},
+        ]},
+    }
+    calls = []
+
+    class FlatYTDLP(FakeYTDLP):
+        def extract_info(self, url, download=False):
+            assert self.opts["extract_flat"] == "in_playlist" and not download
+            calls.append(url)
+            return listings[url]
+
+    monkeypatch.setattr(downloader.yt_dlp, "YoutubeDL", FlatYTDLP)
+    videos = downloader.expand_url("https://www.youtube.com/@kanal", 2)
+    assert [(v["video_id"], v["title"]) for v in videos] == [("aaaaaaaaaaa", "A"), ("bbbbbbbbbbb", "B")]
+    assert videos[1]["url"] == "https://www.youtube.com/watch?v=bbbbbbbbbbb"
+    # limit reached: the second tab is not listed
+    assert calls == ["https://www.youtube.com/@kanal", "https://www.youtube.com/@kanal/videos"]
+
+    assert [v["video_id"] for v in downloader.expand_url("https://www.youtube.com/@kanal", 10)] == \
+        ["aaaaaaaaaaa", "bbbbbbbbbbb", "ccccccccccc"]
+
+
+def test_expand_url_error(monkeypatch):
+    class BrokenYTDLP(FakeYTDLP):
+        def extract_info(self, url, download=False):
+            raise RuntimeError("404")
+
+    monkeypatch.setattr(downloader.yt_dlp, "YoutubeDL", BrokenYTDLP)
+    with pytest.raises(DownloadError):
+        downloader.expand_url("https://www.youtube.com/playlist?list=PLx", 10)
@@ -37,6 +37,48 @@ async def test_process_v1_legacy():
         response = client.post("/api/v1/process", json={"url": "http://yt.com"})
         assert response.status_code == 200
 
+def test_rate_limit_returns_429_with_retry_after():
+    from app.core.rate_limit import rate_limiter
+    with patch.dict(rate_limiter.budgets, {"read": (2, 0.5)}):
+        assert client.get("/api/v1/auth/test").status_code != 429
+        assert client.get("/api/v1/auth/test").status_code != 429
+        response = client.get("/api/v1/auth/test")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "2"
+    assert response.json()["meta"] == {"retry_after": 2}
+    # health check is never limited
+    assert client.get("/").status_code == 200
+
+def test_rate_limit_response_has_cors_headers():
+    """429 dla żądania z innego originu musi mieć nagłówki CORS, inaczej przeglądarka go nie pokaże"""
+    from app.core.rate_limit import rate_limiter
+    origin = {"Origin": "http://localhost:3000"}
+    with patch.dict(rate_limiter.budgets, {"read": (1, 0.5)}):
+        assert client.get("/api/v1/auth/test", headers=origin).status_code != 429
+        # preflight nie zużywa limitu
+        preflight = client.options("/api/v1/auth/test", headers={**origin, "Access-Control-Request-Method": "GET"})
+        assert preflight.status_code == 200
+        response = client.get("/api/v1/auth/test", headers=origin)
+    assert response.status_code == 429
+    assert response.headers["access-control-allow-origin"] == "http://localhost:3000"
+
+def test_rate_limit_malformed_bearer_token_is_anonymous():
+    """Uszkodzony token w middleware nie może kończyć się błędem 500"""
+    response = client.get("/api/v1/cache/stats", headers={"Authorization": "Bearer garbage"})
+    assert response.status_code == 200
+    with patch("app.modules.v1.auth.service.jwt.decode", side_effect=AttributeError("jwt")):
+        assert client.get("/api/v1/cache/stats", headers={"Authorization": "Bearer garbage"}).status_code == 200
+
+def test_load_shedding_returns_503():
+    from app.core.rate_limit import load_shedder
+    with patch.object(load_shedder, "lag", load_shedder.threshold + 1):
+        response = client.get("/api/v1/auth/test")
+        assert response.status_code == 503
+        assert "Retry-After" in response.headers
+        # auth is not a low-priority class
+        with patch("app.modules.v1.auth.router.authenticate_user", new_callable=AsyncMock, return_value=None):
+            assert client.post("/api/v1/auth/login", json={"email": "a@b.pl", "password": "x"}).status_code != 503
+
 # --- Testy Handlerów Wyjątków ---
 
 def test_app_exception_handler():
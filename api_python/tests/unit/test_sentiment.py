@@ -97,6 +97,72 @@ async def test_analyze_success(mock_db):
         result = await analyze(oid)
         assert result["overall_summary"] == "S"
 
+@pytest.mark.asyncio
+async def test_analyze_with_transcription_text_skips_reread(mock_db):
+    oid = str(ObjectId())
+    mock_json = {"overall_summary": "S", "results": {}}
+
+    with patch("app.modules.v1.sentiment.service.db", mock_db), \
+         patch("app.modules.v1.sentiment.service.Groq") as MockGroq:
+        mock_db.sentiment_analysis.find_one.return_value = None
+
+        mock_chat = MockGroq.return_value.chat.completions.create.return_value
+        mock_chat.choices[0].message.content = json.dumps(mock_json)
+
+        result = await analyze(oid, transcription_text="Text")
+        assert result["overall_summary"] == "S"
+        mock_db.transcriptions.find_one.assert_not_called()
+        assert MockGroq.return_value.chat.completions.create.call_args.kwargs["messages"][1]["content"] == "Text"
+
+@pytest.mark.asyncio
+async def test_analyze_aligns_quotes_with_transcription(mock_db):
+    oid = str(ObjectId())
+    text = "Ekran jest jasny. Bateria trzyma spokojnie dwa dni przy normalnym użytkowaniu."
+    mock_json = {"overall_summary": "S", "results": {"bateria": {"sentiments": [
+        {"sentiment": "pozytywny", "sentence": "bateria trzyma spokojnie dwa dni"},
+        {"sentiment": "negatywny", "sentence": "Aparat w nocy robi słabe zdjęcia"},
+    ]}}}
+
+    with patch("app.modules.v1.sentiment.service.db", mock_db), \
+         patch("app.modules.v1.sentiment.service.Groq") as MockGroq:
+        mock_db.sentiment_analysis.find_one.return_value = None
+        MockGroq.return_value.chat.completions.create.return_value.choices[0].message.content = json.dumps(mock_json)
+
+        result = await analyze(oid, transcription_text=text)
+
+    found, invented = result["results"]["bateria"]["sentiments"]
+    assert text[found["alignment"]["start"]:found["alignment"]["end"]] == "Bateria trzyma spokojnie dwa dni"
+    assert invented["alignment"]["matched"] is False
+    assert result["alignment"] == {"quotes": 2, "matched": 1}
+    # zapisany wynik zawiera pozycje cytatów
+    assert mock_db.sentiment_analysis.insert_one.call_args[0][0]["results"]["results"]["bateria"] == \
+        result["results"]["bateria"]
+    # bez czasów słów od wywołującego: tylko pozycje znaków, transkrypcja nie jest czytana ponownie
+    assert "start_time" not in found["alignment"]
+    mock_db.transcriptions.find_one.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_analyze_uses_word_timings_from_caller(mock_db):
+    from app.modules.v1.transcription.word_timings import WordTimings
+    oid = str(ObjectId())
+    text = "Ekran jest jasny. Bateria trzyma dwa dni."
+    words = [{"word": w, "punctuated_word": w, "start": i * 0.5, "end": i * 0.5 + 0.4, "confidence": 0.9}
+             for i, w in enumerate(text.split())]
+    mock_json = {"overall_summary": "S", "results": {"bateria": {"sentiments": [
+        {"sentiment": "pozytywny", "sentence": "Bateria trzyma dwa dni"},
+    ]}}}
+
+    with patch("app.modules.v1.sentiment.service.db", mock_db), \
+         patch("app.modules.v1.sentiment.service.Groq") as MockGroq:
+        mock_db.sentiment_analysis.find_one.return_value = None
+        MockGroq.return_value.chat.completions.create.return_value.choices[0].message.content = json.dumps(mock_json)
+
+        result = await analyze(oid, transcription_text=text, word_timings=WordTimings.from_words(words, text))
+
+    alignment = result["results"]["bateria"]["sentiments"][0]["alignment"]
+    assert (alignment["start_time"], alignment["end_time"]) == (1.5, 3.4)
+    mock_db.transcriptions.find_one.assert_not_called()
+
 @pytest.mark.asyncio
 async def test_analyze_save_db_error(mock_db):
     """Pokrycie błędu zapisu do bazy (save_results_to_db)"""
@@ -121,4 +187,178 @@ def test_sentiment_endpoint():
     with patch("app.modules.v1.sentiment.router.analyze", new_callable=AsyncMock) as mock_an:
         mock_an.return_value = {"ok": 1}
         response = client.post("/api/v1/sentiment/analyze/123")
-        assert response.status_code == 200
\ No newline at end of file
+        assert response.status_code == 200
+
+def test_quote_aligner_fuzzy_matches_and_flags_invented_quotes():
+    from app.modules.v1.sentiment.alignment import QuoteAligner
+    text = ("Na początek wygląd. Obudowa jest aluminiowa i bardzo dobrze leży w dłoni. "
+            "Ładowanie do pełna trwa około godziny, a bateria spokojnie wytrzymuje cały dzień intensywnego używania. "
+            "Aparat w nocy radzi sobie przeciętnie.")
+    aligner = QuoteAligner(text)
+
+    exact = aligner.align("Obudowa jest aluminiowa i bardzo dobrze leży w dłoni.")
+    assert exact["matched"] and exact["score"] == 1.0
+    assert text[exact["start"]:exact["end"]] == "Obudowa jest aluminiowa i bardzo dobrze leży w dłoni"
+
+    # bez polskich znaków, z pominiętym słowem - nadal znaleziony
+    fuzzy = aligner.align("bateria wytrzymuje caly dzien intensywnego uzywania")
+    assert fuzzy["matched"] and fuzzy["score"] < 1.0
+    assert text[fuzzy["start"]:fuzzy["end"]] == "bateria spokojnie wytrzymuje cały dzień intensywnego używania"
+
+    assert aligner.align("Ekran ma świetne kolory i wysoką jasność")["matched"] is False
+    assert aligner.align("")["matched"] is False
+
+
+def test_quote_aligner_word_times():
+    from app.modules.v1.sentiment.alignment import QuoteAligner, align_results
+    from app.modules.v1.transcription.word_timings import WordTimings
+    text = "Bateria trzyma dwa dni, ekran jest jasny."
+    words = [{"punctuated_word": w, "start": i * 0.5, "end": i * 0.5 + 0.4, "confidence": 0.9}
+             for i, w in enumerate(text.split())]
+    found = QuoteAligner(text, WordTimings.from_words(words, text)).align("ekran jest jasny")
+    assert (found["start_time"], found["end_time"]) == (2.0, 3.4)
+    # bez czasów słów - tylko pozycja w tekście
+    assert "start_time" not in QuoteAligner(text).align("ekran jest jasny")
+
+    results = {"ekran": {"sentiments": [{"sentiment": "pozytywny", "sentence": "ekran jest jasny"},
+                                        {"sentiment": "neutralny"}]}}
+    assert align_results(results, text) == {"quotes": 1, "matched": 1, "unmatched": []}
+    assert results["ekran"]["sentiments"][0]["alignment"]["matched"]
+
+def _backfill_db(mock_db, docs, current=()):
+    mock_db.maintenance = AsyncMock()
+    mock_db.maintenance.find_one.return_value = None
+    mock_db.transcriptions.count_documents.return_value = len(docs)
+    mock_db.transcriptions.find = MagicMock()
+    chain = mock_db.transcriptions.find.return_value.sort.return_value.limit.return_value
+    chain.to_list = AsyncMock(side_effect=[docs, []])
+    mock_db.sentiment_analysis.find = MagicMock()
+    mock_db.sentiment_analysis.find.return_value.to_list = AsyncMock(
+        return_value=[{"transcription_id": str(doc["_id"])} for doc in current]
+    )
+    mock_db.analyses.find = MagicMock()
+    mock_db.analyses.find.return_value.to_list = AsyncMock(return_value=[])
+
+@pytest.mark.asyncio
+async def test_backfill_skips_current_results_and_checkpoints(mock_db):
+    from app.modules.v1.sentiment import backfill
+    done, empty, pending = ({"_id": ObjectId(), "transcription": t} for t in ("stary", "", "Bateria trzyma"))
+    _backfill_db(mock_db, [done, empty, pending], current=[done])
+    with patch("app.modules.v1.sentiment.backfill.db", mock_db), \
+         patch("app.modules.v1.sentiment.backfill.analyze", new_callable=AsyncMock) as mock_analyze:
+        mock_analyze.return_value = {"results": {}}
+        stats = await backfill.run_backfill("model-x", report=lambda line: None)
+
+    # tylko transkrypcja bez aktualnych wyników, z nadpisaniem starych
+    mock_analyze.assert_awaited_once_with(str(pending["_id"]), "model-x", transcription_text="Bateria trzyma", refresh=True,
+                                          word_timings=None)
+    assert stats == {"scanned": 3, "analyzed": 1, "skipped": 2, "failed": 0,
+                     "tokens": sum(backfill.estimate_tokens("Bateria trzyma")), "analyses_updated": 0}
+    sentiment_filter = mock_db.sentiment_analysis.find.call_args[0][0]
+    assert sentiment_filter["model"] == "model-x" and sentiment_filter["prompt_version"] == {"$in": [1, None]}
+    checkpoint = mock_db.maintenance.update_one.call_args_list[0]
+    assert checkpoint[0][0] == {"_id": "backfill:model-x:v1"}
+    assert checkpoint[0][1]["$set"]["last_id"] == pending["_id"]
+    assert "finished_at" in mock_db.maintenance.update_one.call_args_list[-1][0][1]["$set"]
+
+@pytest.mark.asyncio
+async def test_backfill_resumes_and_records_failures(mock_db):
+    from app.modules.v1.sentiment import backfill
+    last_id, doc = ObjectId(), {"_id": ObjectId(), "transcription": "Ekran jest jasny"}
+    _backfill_db(mock_db, [doc])
+    mock_db.maintenance.find_one.return_value = {"last_id": last_id, "scanned": 10, "analyzed": 7, "failed": 1}
+    with patch("app.modules.v1.sentiment.backfill.db", mock_db), \
+         patch("app.modules.v1.sentiment.backfill.analyze", new_callable=AsyncMock) as mock_analyze:
+        mock_analyze.return_value = None  # błąd API
+        stats = await backfill.run_backfill("model-x", retries=0, report=lambda line: None)
+
+    assert mock_db.transcriptions.find.call_args_list[0][0][0] == {"_id": {"$gt": last_id}}
+    assert (stats["scanned"], stats["analyzed"], stats["failed"]) == (11, 7, 2)
+    update = mock_db.maintenance.update_one.call_args_list[0][0][1]
+    assert update["$push"]["failed_ids"]["$each"] == [str(doc["_id"])]
+
+@pytest.mark.asyncio
+async def test_backfill_updates_analyses_and_rebuilds_rollups(mock_db):
+    """Analizy pokazujące przeanalizowaną transkrypcję dostają nowy digest i search_terms"""
+    from app.modules.v1.analysis import search
+    from app.modules.v1.sentiment import backfill
+    doc = {"_id": ObjectId(), "transcription": "Bateria trzyma dwa dni"}
+    tid = str(doc["_id"])
+    _backfill_db(mock_db, [doc])
+    analysis = {"_id": ObjectId(), "title": "Recenzja", "transcription_id": tid}
+    mock_db.analyses.find.return_value.to_list = AsyncMock(return_value=[analysis])
+    results = {"results": {"bateria": {"sentiments": [{"sentiment": "pozytywny", "sentence": "Bateria trzyma"}]}}}
+    with patch("app.modules.v1.sentiment.backfill.db", mock_db), \
+         patch("app.modules.v1.sentiment.backfill.analyze", new_callable=AsyncMock, return_value=results), \
+         patch("app.modules.v1.sentiment.backfill.get_saved_results", new_callable=AsyncMock, return_value=results), \
+         patch("app.modules.v1.sentiment.backfill.sentiment_cache") as mock_cache, \
+         patch("app.modules.v1.sentiment.backfill.rollups.rebuild", new_callable=AsyncMock) as mock_rebuild:
+        stats = await backfill.run_backfill("model-x", report=lambda line: None)
+
+    mock_cache.invalidate.assert_called_once_with((tid, "model-x"))
+    query = mock_db.analyses.find.call_args[0][0]
+    assert query["transcription_id"] == {"$in": [tid]} and query["sentiment_model"] == "model-x"
+    (update,), _ = mock_db.analyses.bulk_write.call_args
+    fields = update[0]._doc["$set"]
+    assert fields["sentiment_digest"]["aspects"]["bateria"]["positive"] == 1
+    assert fields["search_terms"] == search.document_terms("Recenzja", doc["transcription"], {"message": results})
+    assert stats["analyses_updated"] == 1
+    mock_rebuild.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_backfill_dry_run_estimate(mock_db):
+    from app.modules.v1.sentiment import backfill
+    docs = [{"_id": ObjectId(), "transcription": "słowo " * 1000} for _ in range(2)]
+    _backfill_db(mock_db, docs, current=docs[:1])
+    with patch("app.modules.v1.sentiment.backfill.db", mock_db):
+        found = await backfill.estimate("llama-3.3-70b-versatile")
+    input_tokens, output_tokens = backfill.estimate_tokens("słowo " * 1000)
+    assert (found["transcriptions"], found["pending"]) == (2, 1)
+    assert (found["input_tokens"], found["output_tokens"]) == (input_tokens, output_tokens)
+    assert found["cost_usd"] == backfill.cost("llama-3.3-70b-versatile", input_tokens, output_tokens)
+    assert backfill.cost("unknown-model", 1000, 1000) is None
+    assert backfill.cost("unknown-model", 1_000_000, 1_000_000, (1.0, 2.0)) == 3.0
+
+@pytest.mark.asyncio
+async def test_save_results_replace_overwrites(mock_db):
+    from app.modules.v1.sentiment.service import save_results_to_db
+    with patch("app.modules.v1.sentiment.service.db", mock_db):
+        await save_results_to_db("t1", "m", {"results": {}}, replace=True)
+    (query, doc), kwargs = mock_db.sentiment_analysis.replace_one.call_args
+    assert query == {"transcription_id": "t1", "model": "m"} and kwargs == {"upsert": True}
+    assert doc["prompt_version"] == 1
+    mock_db.sentiment_analysis.insert_one.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_get_saved_results_current_prompt_only(mock_db):
+    """Wyniki starszej wersji promptu nie są serwowane na żywo, tylko w widokach starych analiz"""
+    from app.modules.v1.sentiment.service import get_saved_results
+    mock_db.sentiment_analysis.find_one.side_effect = [None, None, {"results": {"stare": True}}]
+    with patch("app.modules.v1.sentiment.service.db", mock_db):
+        assert await get_saved_results("t-old", "m") is None
+        assert await get_saved_results("t-old", "m", current_only=False) == {"stare": True}
+    query = mock_db.sentiment_analysis.find_one.call_args_list[0][0][0]
+    assert query["prompt_version"] == {"$in": [1, None]}
+    assert "prompt_version" not in mock_db.sentiment_analysis.find_one.call_args_list[2][0][0]
+
+@pytest.mark.asyncio
+async def test_save_results_replaces_older_prompt_version(mock_db):
+    """Unikalny indeks blokuje insert przy starych wynikach - są nadpisywane"""
+    from pymongo.errors import DuplicateKeyError
+    from app.modules.v1.sentiment.service import save_results_to_db
+    mock_db.sentiment_analysis.insert_one.side_effect = DuplicateKeyError("dup")
+    mock_db.sentiment_analysis.replace_one.return_value = MagicMock(modified_count=1)
+    with patch("app.modules.v1.sentiment.service.db", mock_db), \
+         patch("app.modules.v1.sentiment.service.sentiment_cache") as mock_cache:
+        await save_results_to_db("t1", "m", {"results": {}})
+    (query, doc), _ = mock_db.sentiment_analysis.replace_one.call_args
+    assert query == {"transcription_id": "t1", "model": "m", "$nor": [{"prompt_version": {"$in": [1, None]}}]}
+    assert doc["prompt_version"] == 1
+    mock_cache.set.assert_called_once_with(("t1", "m"), {"results": {}})
+
+def test_token_bucket_cost():
+    from app.core.rate_limit import TokenBucket
+    bucket = TokenBucket(100, 10, now=0.0)
+    assert bucket.take(0.0, 60) == 0.0
+    assert bucket.take(0.0, 60) == pytest.approx(2.0)
+    assert bucket.take(2.0, 60) == 0.0
@@ -1,12 +1,14 @@
 import pytest
+import asyncio
+from bson import ObjectId
 from unittest.mock import patch, AsyncMock, MagicMock, ANY
+from app.modules.v1.analysis.pipeline import emit_step, process_video_analysis
 from app.socketio_handler import (
-    emit_step, 
-    process_video_analysis, 
     start_analysis, 
     get_analyses,
     connect,
-    disconnect
+    disconnect,
+    cancel_analysis
 )
 from datetime import datetime
 
@@ -17,8 +19,8 @@ async def test_emit_step():
         await emit_step("sid1", "aid1", "step1", "status", "msg")
         mock_sio.emit.assert_called_with(
             'analysis_step', 
-            {'analysis_id': 'aid1', 'step': {'step': 'step1', 'status': 'status', 'message': 'msg', 'timestamp': ANY}}, 
-            room='sid1'
+            {'analysis_id': 'aid1', 'step': {'step': 'step1', 'status': 'status', 'message': 'msg', 'timestamp': ANY}, 'seq': ANY}, 
+            room='analysis:aid1'
         )
 
 @pytest.mark.asyncio
@@ -30,12 +32,15 @@ async def test_process_video_analysis_success(mock_db):
     mock_transcription.transcription = "text"
     mock_transcription.title = "title"
     
-    mock_sentiment = {"overall_summary": "good", "results": {}}
+    mock_sentiment = {"overall_summary": "good", "results": {
+        "bateria": {"sentiments": [{"sentiment": "pozytywny", "sentence": "Bateria trzyma dwa dni"}]}}}
     
     with patch("app.socketio_handler.sio", mock_sio), \
-         patch("app.socketio_handler.db", mock_db), \
-         patch("app.socketio_handler.transcribe_video", new_callable=AsyncMock) as mock_tr, \
-         patch("app.socketio_handler.analyze", new_callable=AsyncMock) as mock_an:
+         patch("app.modules.v1.analysis.pipeline.db", mock_db), \
+         patch("app.core.write_behind.db", mock_db), \
+         patch("app.modules.v1.analysis.rollups.db", mock_db), \
+         patch("app.modules.v1.analysis.pipeline.transcribe_video", new_callable=AsyncMock) as mock_tr, \
+         patch("app.modules.v1.analysis.pipeline.analyze", new_callable=AsyncMock) as mock_an:
         
         mock_db.analyses.insert_one.return_value.inserted_id = "aid1"
         mock_tr.return_value = mock_transcription
@@ -46,11 +51,28 @@ async def test_process_video_analysis_success(mock_db):
         assert mock_tr.called
         assert mock_an.called
         assert mock_db.analyses.update_one.call_count > 0
-        mock_sio.emit.assert_any_call('analysis_complete', ANY, room='sid1')
+        mock_sio.enter_room.assert_called_with('sid1', 'analysis:aid1')
+        mock_sio.emit.assert_any_call('analysis_complete', ANY, room='analysis:aid1')
+        # the analysis stores references, not copies of the transcript and sentiment
+        stored = mock_db.analyses.update_one.call_args[0][1]["$set"]
+        assert stored["transcription_id"] == "tid1"
+        assert stored["sentiment_model"] == "llama-3.3-70b-versatile"
+        assert "transcription" not in stored and "sentiment" not in stored
+        # step history is written once, together with the terminal state
+        assert mock_db.analyses.update_one.call_count == 1
+        steps = mock_db.analyses.update_one.call_args[0][1]["$push"]["steps"]["$each"]
+        assert [(s["step"], s["status"]) for s in steps] == [
+            ("download", "in_progress"), ("transcription", "completed"),
+            ("sentiment", "in_progress"), ("sentiment", "completed"),
+        ]
+        # aspect rollups of the user are incremented (day + month bucket)
+        rollup_updates = mock_db.aspect_rollups.bulk_write.call_args[0][0]
+        assert {u._filter["period"] for u in rollup_updates} == {"day", "month"}
+        assert {u._filter["user_id"] for u in rollup_updates} == {"uid1"}
 
 @pytest.mark.asyncio
-async def test_process_video_analysis_whisper_mapping(mock_db):
-    """Testuje czy model 'whisper' jest mapowany na 'deepgram-nova-2'"""
+async def test_process_video_analysis_model_names(mock_db):
+    """Modele silników przechodzą bez zmian, stare nazwy GUI 'whisperpy-*' oznaczają 'auto'"""
     mock_sio = AsyncMock()
     mock_transcription = MagicMock()
     mock_transcription.id = "tid1"
@@ -58,40 +80,51 @@ async def test_process_video_analysis_whisper_mapping(mock_db):
     mock_transcription.title = "title"
 
     with patch("app.socketio_handler.sio", mock_sio), \
-         patch("app.socketio_handler.db", mock_db), \
-         patch("app.socketio_handler.transcribe_video", new_callable=AsyncMock) as mock_tr, \
-         patch("app.socketio_handler.analyze", new_callable=AsyncMock) as mock_an:
+         patch("app.modules.v1.analysis.pipeline.db", mock_db), \
+         patch("app.core.write_behind.db", mock_db), \
+         patch("app.modules.v1.analysis.pipeline.transcribe_video", new_callable=AsyncMock) as mock_tr, \
+         patch("app.modules.v1.analysis.pipeline.analyze", new_callable=AsyncMock) as mock_an:
         
         mock_db.analyses.insert_one.return_value.inserted_id = "aid1"
         mock_tr.return_value = mock_transcription
         mock_an.return_value = {"msg": "ok"}
         
         await process_video_analysis("sid1", "http://url", "uid1", model="whisper-large")
-        
+        mock_tr.assert_called_with("http://url", model_name="whisper-large")
+
+        await process_video_analysis("sid1", "http://url", "uid1", model="whisperpy-base")
+        mock_tr.assert_called_with("http://url", model_name="auto")
+
+        await process_video_analysis("sid1", "http://url", "uid1", model=None)
         mock_tr.assert_called_with("http://url", model_name="deepgram-nova-2")
 
 @pytest.mark.asyncio
 async def test_process_video_analysis_error(mock_db):
     mock_sio = AsyncMock()
     with patch("app.socketio_handler.sio", mock_sio), \
-         patch("app.socketio_handler.db", mock_db), \
-         patch("app.socketio_handler.transcribe_video", side_effect=Exception("Fail")):
+         patch("app.modules.v1.analysis.pipeline.db", mock_db), \
+         patch("app.core.write_behind.db", mock_db), \
+         patch("app.modules.v1.analysis.pipeline.transcribe_video", side_effect=Exception("Fail")):
         
         mock_db.analyses.insert_one.return_value.inserted_id = "aid1"
         
         await process_video_analysis("sid1", "http://url", "uid1")
         
-        mock_sio.emit.assert_any_call('analysis_error', ANY, room='sid1')
+        mock_sio.emit.assert_any_call('analysis_error', ANY, room='analysis:aid1')
         mock_db.analyses.update_one.assert_called_with(
             {"_id": "aid1"}, 
-            {"$set": {"status": "error"}}
+            {"$set": {"status": "error", "expire_at": ANY},
+             "$push": {"steps": {"$each": [ANY, {"step": "error", "status": "error", "message": "Błąd: Fail", "timestamp": ANY}]}}}
         )
 
 @pytest.mark.asyncio
 async def test_socket_handlers():
     mock_sio = AsyncMock()
+    mock_sio.rooms = MagicMock(return_value=[])
     with patch("app.socketio_handler.sio", mock_sio):
-        await connect("sid1", {}, auth={"token": "t"})
+        with patch("app.socketio_handler.decode_token", return_value={"sub": "uid1", "exp": 4102444800}):
+            await connect("sid1", {}, auth={"token": "t"})
+        mock_sio.save_session.assert_called_with("sid1", {"user_id": "uid1", "ip": None})
         mock_sio.emit.assert_called_with('connected', ANY, room='sid1')
         
         await disconnect("sid1") 
@@ -99,47 +132,246 @@ async def test_socket_handlers():
         await start_analysis("sid1", {})
         mock_sio.emit.assert_called_with('analysis_error', {'error': 'URL is required'}, room='sid1')
         
+        mock_sio.get_session.return_value = {}
         await start_analysis("sid1", {"url": "u"})
-        mock_sio.emit.assert_called_with('analysis_error', {'error': 'Authentication token is required'}, room='sid1')
-        
-        with patch("app.socketio_handler.decode_token", return_value=None):
-            await start_analysis("sid1", {"url": "u", "token": "bad"})
-            mock_sio.emit.assert_called_with('analysis_error', {'error': 'Invalid or expired token'}, room='sid1')
-        
-        with patch("app.socketio_handler.decode_token", return_value={"sub": None}):
-             await start_analysis("sid1", {"url": "u", "token": "badpayload"})
-             mock_sio.emit.assert_called_with('analysis_error', {'error': 'Invalid token payload'}, room='sid1')
+        mock_sio.emit.assert_called_with('analysis_error', {'error': 'Not authenticated'}, room='sid1')
 
-        with patch("app.socketio_handler.decode_token", return_value={"sub": "uid1"}), \
+        mock_sio.get_session.return_value = {"user_id": "uid1"}
+        with patch("app.socketio_handler.decode_token") as mock_decode, \
              patch("app.socketio_handler.asyncio.create_task") as mock_task:
-            await start_analysis("sid1", {"url": "u", "token": "good", "model": "whisper"})
+            await start_analysis("sid1", {"url": "u", "model": "whisper"})
             mock_task.assert_called()
+            # Identity comes from the session, no JWT work per event
+            mock_decode.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_connect_rejects_unauthenticated_sockets():
+    import socketio
+    mock_sio = AsyncMock()
+    with patch("app.socketio_handler.sio", mock_sio):
+        for auth in (None, {}, {"token": "bad"}):
+            with patch("app.socketio_handler.decode_token", return_value=None), \
+                 pytest.raises(socketio.exceptions.ConnectionRefusedError):
+                await connect("sid1", {}, auth=auth)
+        mock_sio.save_session.assert_not_called()
+        mock_sio.emit.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_connect_refuses_malformed_token():
+    """Prawdziwe decode_token: śmieciowy token to odmowa połączenia, nie wyjątek handlera"""
+    import socketio
+    mock_sio = AsyncMock()
+    with patch("app.socketio_handler.sio", mock_sio):
+        for token in ("garbage", "a.b.c", 12345):
+            with pytest.raises(socketio.exceptions.ConnectionRefusedError):
+                await connect("sid1", {}, auth={"token": token})
+        with patch("app.modules.v1.auth.service.jwt.decode", side_effect=AttributeError("jwt")), \
+             pytest.raises(socketio.exceptions.ConnectionRefusedError):
+            await connect("sid1", {}, auth={"token": "garbage"})
+        mock_sio.save_session.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_session_expiry_disconnects_socket():
+    import time
+    from app.socketio_handler import _session_expiry
+    mock_sio = AsyncMock()
+    with patch("app.socketio_handler.sio", mock_sio), \
+         patch("app.socketio_handler.decode_token", return_value={"sub": "uid1", "exp": time.time() + 0.05}):
+        await connect("sid-exp", {}, auth={"token": "t"})
+        assert "sid-exp" in _session_expiry
+        await asyncio.sleep(0.15)
+        mock_sio.emit.assert_any_call('auth_expired', ANY, room='sid-exp')
+        mock_sio.disconnect.assert_called_with("sid-exp")
+        assert "sid-exp" not in _session_expiry
+
 
 @pytest.mark.asyncio
 async def test_get_analyses(mock_db):
     mock_sio = AsyncMock()
     with patch("app.socketio_handler.sio", mock_sio), \
-         patch("app.socketio_handler.db", mock_db):
+         patch("app.modules.v1.analysis.history.db", mock_db):
 
         mock_db.analyses.find = MagicMock() 
         
         mock_cursor = AsyncMock()
         mock_cursor.to_list.return_value = [{"_id": "aid1", "created_at": datetime.now()}]
         
-        mock_db.analyses.find.return_value.sort.return_value = mock_cursor
+        mock_db.analyses.find.return_value.sort.return_value.limit.return_value = mock_cursor
 
+        mock_sio.get_session.side_effect = KeyError("sid1")
         await get_analyses("sid1", {})
-        mock_sio.emit.assert_called_with('error', {'message': 'Authentication token is required'}, room='sid1')
+        mock_sio.emit.assert_called_with('error', {'message': 'Not authenticated'}, room='sid1')
+        mock_sio.get_session.side_effect = None
+
+        mock_sio.get_session.return_value = {"user_id": "uid1"}
+        await get_analyses("sid1", {})
+
+        mock_sio.emit.assert_called_with('analyses_list', {
+            'analyses': [{'id': 'aid1', 'created_at': ANY}], 'next_cursor': None, 'cursor': None
+        }, room='sid1')
+        query, projection = mock_db.analyses.find.call_args[0]
+        assert query == {"user_id": "uid1"}
+        assert "transcription" not in projection and "sentiment" not in projection
         
-        with patch("app.socketio_handler.decode_token", return_value=None):
-             await get_analyses("sid1", {"token": "bad"})
-             mock_sio.emit.assert_called_with('error', {'message': 'Invalid or expired token'}, room='sid1')
-
-        with patch("app.socketio_handler.decode_token", return_value={"sub": "uid1"}):
-            await get_analyses("sid1", {"token": "good"})
-
-            mock_sio.emit.assert_called_with('analyses_list', ANY, room='sid1')
-            
-        with patch("app.socketio_handler.decode_token", side_effect=Exception("Boom")):
-            await get_analyses("sid1", {"token": "crash"})
-            mock_sio.emit.assert_called_with('error', {'message': 'Boom'}, room='sid1')
\ No newline at end of file
+        with patch("app.modules.v1.analysis.history.list_analyses", side_effect=Exception("Boom")):
+            await get_analyses("sid1", {})
+            mock_sio.emit.assert_called_with('error', {'message': 'Boom'}, room='sid1')
+
+@pytest.mark.asyncio
+async def test_process_video_analysis_cancelled(mock_db):
+    from app.modules.v1.analysis.registry import analysis_registry
+    mock_sio = AsyncMock()
+    oid = ObjectId()
+    started = asyncio.Event()
+
+    async def slow_transcription(*args, **kwargs):
+        started.set()
+        await asyncio.sleep(10)
+
+    with patch("app.socketio_handler.sio", mock_sio), \
+         patch("app.modules.v1.analysis.pipeline.db", mock_db), \
+         patch("app.core.write_behind.db", mock_db), \
+         patch("app.modules.v1.analysis.pipeline.transcribe_video", side_effect=slow_transcription):
+        mock_db.analyses.insert_one.return_value.inserted_id = oid
+
+        task = asyncio.create_task(process_video_analysis("sid1", "http://url", "uid1", analysis_oid=oid))
+        analysis_registry.register(str(oid), "uid1", task)
+        await started.wait()
+        assert analysis_registry.cancel(str(oid), "cancelled_by_user")
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        update = mock_db.analyses.update_one.call_args[0][1]["$set"]
+        assert update["status"] == "cancelled"
+        assert update["cancellation"]["reason"] == "cancelled_by_user"
+        mock_sio.emit.assert_any_call('analysis_cancelled', ANY, room=f'analysis:{oid}')
+        assert analysis_registry.get(str(oid)) is None
+
+
+@pytest.mark.asyncio
+async def test_cancel_analysis_handler():
+    mock_sio = AsyncMock()
+    with patch("app.socketio_handler.sio", mock_sio), \
+         patch("app.socketio_handler.analysis_registry") as mock_registry:
+        mock_sio.get_session.return_value = {}
+        await cancel_analysis("sid1", {"analysis_id": "aid1"})
+        mock_sio.emit.assert_called_with('analysis_error', {'analysis_id': 'aid1', 'error': 'Not authenticated'}, room='sid1')
+
+        mock_sio.get_session.return_value = {"user_id": "uid1"}
+        mock_registry.get.return_value = MagicMock(user_id="other")
+        await cancel_analysis("sid1", {"analysis_id": "aid1"})
+        mock_registry.cancel.assert_not_called()
+
+        mock_registry.get.return_value = MagicMock(user_id="uid1")
+        await cancel_analysis("sid1", {"analysis_id": "aid1"})
+        mock_registry.cancel.assert_called_with("aid1", "cancelled_by_user")
+
+
+@pytest.mark.asyncio
+async def test_disconnect_cancel_policy():
+    mock_sio = MagicMock()
+    mock_sio.rooms.return_value = ["sid1", "analysis:aid1", "analysis:aid2"]
+    with patch("app.socketio_handler.sio", mock_sio), \
+         patch("app.socketio_handler.settings") as mock_settings, \
+         patch("app.socketio_handler.analysis_has_listeners", side_effect=lambda aid, exclude_sid: aid == "aid2"), \
+         patch("app.socketio_handler.analysis_registry") as mock_registry:
+        mock_settings.CANCEL_ON_DISCONNECT = True
+        await disconnect("sid1")
+        mock_registry.cancel_after_grace.assert_called_once_with("aid1", "client_disconnected")
+
+
+@pytest.mark.asyncio
+async def test_subscribe_analysis():
+    from app.socketio_handler import subscribe_analysis
+    mock_sio = AsyncMock()
+    mock_sio.rooms = MagicMock()
+    mock_sio.get_session.return_value = {"user_id": "uid1"}
+    with patch("app.socketio_handler.sio", mock_sio), \
+         patch("app.socketio_handler.catch_up", new_callable=AsyncMock) as mock_catch_up:
+        mock_catch_up.return_value = None
+        await subscribe_analysis("sid2", {"analysis_id": "aid1"})
+        mock_sio.leave_room.assert_called_with("sid2", "analysis:aid1")
+        mock_sio.emit.assert_called_with('analysis_error', {'analysis_id': 'aid1', 'error': 'Analysis not found'}, room='sid2')
+
+        mock_catch_up.return_value = {"running": True, "events": [("analysis_step", {"seq": 4})]}
+        mock_sio.leave_room.reset_mock()
+        await subscribe_analysis("sid2", {"analysis_id": "aid1", "last_seq": 3})
+        mock_catch_up.assert_called_with("aid1", "uid1", 3)
+        mock_sio.enter_room.assert_called_with("sid2", "analysis:aid1")
+        mock_sio.leave_room.assert_not_called()
+        mock_sio.emit.assert_called_with('analysis_replay', {
+            'analysis_id': 'aid1',
+            'running': True,
+            'events': [{'event': 'analysis_step', 'data': {'seq': 4}}],
+        }, room='sid2')
+
+
+@pytest.mark.asyncio
+async def test_deliver_event_from_other_worker():
+    from app.socketio_handler import deliver_event
+    from app.core.events import replay_buffer, event_bus
+    mock_sio = AsyncMock()
+    queue = event_bus.subscribe("aid-remote")
+    with patch("app.socketio_handler.sio", mock_sio):
+        await deliver_event({"analysis_id": "aid-remote", "event": "analysis_step", "data": {"seq": 5}}, True)
+
+    mock_sio.emit.assert_called_with('analysis_step', {'seq': 5}, room='analysis:aid-remote')
+    assert queue.get_nowait() == ('analysis_step', {'seq': 5})
+    assert replay_buffer.since("aid-remote") == [('analysis_step', {'seq': 5})]
+    event_bus.unsubscribe("aid-remote", queue)
+    replay_buffer.forget("aid-remote")
+
+
+@pytest.mark.asyncio
+async def test_cancel_analysis_relayed_to_other_workers():
+    mock_sio = AsyncMock()
+    mock_sio.get_session.return_value = {"user_id": "uid1"}
+    with patch("app.socketio_handler.sio", mock_sio), \
+         patch("app.socketio_handler.message_bus") as mock_bus:
+        mock_bus.distributed = True
+        mock_bus.publish = AsyncMock()
+        await cancel_analysis("sid1", {"analysis_id": "aid-elsewhere"})
+        mock_bus.publish.assert_called_with('cancel_analysis', {
+            'analysis_id': 'aid-elsewhere', 'user_id': 'uid1', 'reason': 'cancelled_by_user'
+        })
+        mock_sio.emit.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_get_analysis_detail(mock_db):
+    from app.socketio_handler import get_analysis_detail
+    mock_sio = AsyncMock()
+    oid = ObjectId()
+    mock_sio.get_session.return_value = {"user_id": "uid1"}
+    with patch("app.socketio_handler.sio", mock_sio), \
+         patch("app.modules.v1.analysis.history.db", mock_db):
+        mock_db.analyses.find_one.return_value = {"_id": oid, "transcription": "text", "created_at": datetime(2024, 1, 1)}
+        await get_analysis_detail("sid1", {"analysis_id": str(oid)})
+        mock_sio.emit.assert_called_with('analysis_detail', {'analysis': {
+            'id': str(oid), 'transcription': 'text', 'created_at': '2024-01-01T00:00:00'
+        }}, room='sid1')
+        assert mock_db.analyses.find_one.call_args[0][0] == {"_id": oid, "user_id": "uid1"}
+
+        mock_db.analyses.find_one.return_value = None
+        await get_analysis_detail("sid1", {"analysis_id": str(oid)})
+        mock_sio.emit.assert_called_with('error', {'message': 'Analysis not found'}, room='sid1')
+
+
+@pytest.mark.asyncio
+async def test_start_analysis_rate_limited():
+    from app.core.rate_limit import rate_limiter
+    mock_sio = AsyncMock()
+    mock_sio.get_session.return_value = {"user_id": "uid1", "ip": "10.0.0.1"}
+    with patch("app.socketio_handler.sio", mock_sio), \
+         patch.dict(rate_limiter.budgets, {"analysis": (1, 1 / 60)}), \
+         patch("app.socketio_handler.start_analysis_task") as mock_start:
+        await start_analysis("sid1", {"url": "u"})
+        await start_analysis("sid1", {"url": "u"})
+
+    mock_start.assert_called_once()
+    mock_sio.emit.assert_called_with(
+        'analysis_error', {'error': 'Too many requests', 'retry_after': 60}, room='sid1'
+    )
@@ -23,27 +23,43 @@ async def test_transcribe_video_cached(mock_db):
         result = await transcribe_video("http://yt.com")
         assert result.transcription == "Cached text"
 
+@pytest.mark.asyncio
+async def test_transcribe_video_repeat_url_served_from_cache(mock_db):
+    with patch("app.modules.v1.transcription.service.db", mock_db):
+        mock_db.transcriptions.find_one.return_value = {
+            "_id": "existing_id",
+            "transcription": "Cached text",
+            "link_hash": "hash",
+            "model": "deepgram-nova-2",
+            "url": "http://yt.com",
+            "title": "Title",
+            "created_at": datetime.now()
+        }
+
+        first = await transcribe_video("http://yt.com")
+        second = await transcribe_video("http://yt.com")
+        assert first == second
+        mock_db.transcriptions.find_one.assert_called_once()
+
 @pytest.mark.asyncio
 async def test_transcribe_video_new_and_unlink_error(mock_db):
     """Pokrywa sukces transkrypcji + błąd przy usuwaniu pliku (unlink)"""
     with patch("app.modules.v1.transcription.service.db", mock_db), \
          patch("app.modules.v1.transcription.service.download_audio") as mock_dl, \
-         patch("app.modules.v1.transcription.service.DeepgramClient") as mock_dg, \
+         patch("app.modules.v1.transcription.backends.DeepgramClient") as mock_dg, \
          patch("builtins.open", new_callable=MagicMock), \
          patch("app.modules.v1.transcription.service.Path") as MockPath: 
         
-        mock_db.transcriptions.find_one.side_effect = [
-            None, 
-            {
-                "_id": "new_id", 
-                "transcription": "New text", 
-                "link_hash": "hash", 
-                "title": "T", 
-                "url": "http://yt.com", 
-                "model": "deepgram-nova-2", 
-                "created_at": datetime.now()
-            } 
-        ]
+        mock_db.transcriptions.find_one.return_value = None
+        mock_db.transcriptions.find_one_and_update.return_value = {
+            "_id": "new_id", 
+            "transcription": "New text", 
+            "link_hash": "hash", 
+            "title": "T", 
+            "url": "http://yt.com", 
+            "model": "deepgram-nova-2", 
+            "created_at": datetime.now()
+        }
         
         mock_dl.return_value = ("hash", "dummy_path", "Video Title")
         
@@ -55,12 +71,19 @@ async def test_transcribe_video_new_and_unlink_error(mock_db):
         
         result = await transcribe_video("http://yt.com")
         assert result.transcription == "New text"
+        # cache check + atomic upsert that returns the stored document
+        mock_db.transcriptions.find_one.assert_called_once()
+        mock_db.transcriptions.find_one_and_update.assert_called_once()
+        mock_db.transcriptions.update_one.assert_not_called()
+        # the stored document is cached for the next request of this URL
+        assert (await transcribe_video("http://yt.com")).transcription == "New text"
+        mock_db.transcriptions.find_one.assert_called_once()
 
 @pytest.mark.asyncio
 async def test_transcribe_deepgram_error(mock_db):
     """Pokrywa błąd API Deepgram"""
     with patch("app.modules.v1.transcription.service.download_audio"), \
-         patch("app.modules.v1.transcription.service.DeepgramClient") as mock_dg, \
+         patch("app.modules.v1.transcription.backends.DeepgramClient") as mock_dg, \
          patch("app.modules.v1.transcription.service.db", mock_db):
         
         mock_db.transcriptions.find_one.return_value = None
@@ -73,4 +96,187 @@ def test_transcription_endpoint():
     with patch("app.modules.v1.transcription.router.transcribe_video", new_callable=AsyncMock) as mock_svc:
         mock_svc.return_value = {"id": "123", "transcription": "abc"}
         response = client.post("/api/v1/transcribe/process", json={"url": "http://yt.com", "model": "deepgram-nova-2"})
-        assert response.status_code == 200
\ No newline at end of file
+        assert response.status_code == 200
+
+def test_chunked_upload_reports_chunks(tmp_path):
+    from app.modules.v1.transcription.backends import ChunkedUpload
+    audio = tmp_path / "a.wav"
+    audio.write_bytes(b"x" * 25)
+    updates = []
+
+    upload = ChunkedUpload(audio, updates.append, chunk_size=10)
+    assert b"".join(upload) == b"x" * 25
+    assert [u["chunks_done"] for u in updates] == [1, 2, 3]
+    assert updates[-1]["percent"] == 100.0
+    # Re-iterable, so a retried request sends the whole file again
+    assert b"".join(upload) == b"x" * 25
+
+def _timings():
+    from app.modules.v1.transcription.word_timings import WordTimings
+    text = "Bateria trzyma dwa dni, ekran jest jasny."
+    words = [{"word": w.strip(",.").lower(), "punctuated_word": w, "start": i * 0.5, "end": i * 0.5 + 0.4,
+              "confidence": 0.987} for i, w in enumerate(text.split())]
+    return text, WordTimings.from_words(words, text)
+
+def test_word_timings_columns_and_lookups():
+    text, timings = _timings()
+    assert len(timings) == 7
+    assert list(timings.offset) == [0, 8, 15, 19, 24, 30, 35]
+    assert timings.word(3) == {"word": "dni,", "start": 1.5, "end": 1.9, "confidence": 0.99, "offset": 19}
+    # słowa nachodzące na zakres [1.2, 2.1) s
+    assert [w["word"] for w in timings.slice(1.2, 2.1)] == ["dwa", "dni,", "ekran"]
+    assert timings.slice(10, 20) == []
+    assert timings.time_at(text.index("jasny") + 2) == (3.0, 3.4)
+    assert timings.span_times(text.index("ekran"), len(text)) == (2.0, 3.4)
+
+def test_word_timings_pack_round_trip():
+    from app.modules.v1.transcription.word_timings import WordTimings
+    text, timings = _timings()
+    doc = timings.pack()
+    assert doc["words_codec"] == "zlib"
+    restored = WordTimings.unpack(doc, text)
+    assert [restored.word(i) for i in range(7)] == [timings.word(i) for i in range(7)]
+    # transkrypcje bez czasów słów
+    assert WordTimings.from_words([], text).pack() == {}
+    assert WordTimings.unpack({"transcription": text}, text) is None
+    with pytest.raises(ValueError):
+        WordTimings.from_bytes(b"\x02" + timings.to_bytes()[1:], text)
+
+def test_words_endpoint(mock_db):
+    from app.core.compression import pack_text
+    text, timings = _timings()
+    with patch("app.modules.v1.transcription.word_timings.db", mock_db):
+        mock_db.transcriptions.find_one.return_value = {**pack_text(text), **timings.pack()}
+        response = client.get("/api/v1/transcribe/65a1b2c3d4e5f6a7b8c9d0e1/words", params={"start": 2.7})
+        assert response.status_code == 200
+        assert [w["word"] for w in response.json()["words"]] == ["jest", "jasny."]
+        assert response.json()["total_words"] == 7
+
+        mock_db.transcriptions.find_one.return_value = {**pack_text(text)}
+        assert client.get("/api/v1/transcribe/65a1b2c3d4e5f6a7b8c9d0e1/words").status_code == 404
+
+def _backend(name, local=False, slots=0, rtf=0.1, max_duration=None, available=True, text="Tekst z silnika"):
+    from app.modules.v1.transcription.backends import Capabilities, TranscriptionBackend, TranscriptResult
+
+    class FakeBackend(TranscriptionBackend):
+        capabilities = Capabilities(local=local, max_concurrency=slots, realtime_factor=rtf, max_duration=max_duration)
+        calls = []
+
+        def available(self):
+            return available
+
+        async def transcribe(self, path, language="pl", progress=None):
+            self.calls.append((path, language))
+            return TranscriptResult(text, [{"word": "tekst", "punctuated_word": "Tekst", "start": 0.0, "end": 0.4,
+                                            "confidence": 0.9}], duration=100.0)
+
+    backend = FakeBackend()
+    backend.name = name
+    return backend
+
+def test_backend_registry_routing():
+    from app.core.exceptions import TranscriptionError
+    from app.modules.v1.transcription.backends import AUTO, BackendRegistry
+    cloud, local = _backend("cloud", rtf=0.05), _backend("local", local=True, slots=1, rtf=0.2, max_duration=1800)
+    registry = BackendRegistry([cloud, local, _backend("off", available=False)])
+
+    assert registry.choose("local") is local
+    with pytest.raises(TranscriptionError) as unknown:
+        registry.choose("whisper-large")
+    assert unknown.value.status_code == 400
+    with pytest.raises(TranscriptionError) as unavailable:
+        registry.choose("off")
+    assert unavailable.value.status_code == 503
+
+    # domyślnie lokalny silnik tylko gdy szybszy albo jako zapas
+    assert registry.choose(AUTO, 300) is cloud
+    with patch("app.modules.v1.transcription.backends.settings.TRANSCRIPTION_LOCAL_MAX_SECONDS", 600):
+        assert registry.choose(AUTO, 300) is local
+        assert registry.choose(AUTO, 3600) is cloud  # za długie dla lokalnego progu
+        with registry.track(local):
+            assert registry.choose(AUTO, 300) is cloud  # jedyny worker zajęty
+    assert registry.running["local"] == 0
+
+    cloud_only = BackendRegistry([_backend("cloud", available=False), local])
+    assert cloud_only.choose(AUTO, 600) is local
+    with pytest.raises(TranscriptionError):
+        cloud_only.choose(AUTO, 3600)
+
+    # zmierzony współczynnik czasu rzeczywistego zmienia wybór
+    for _ in range(30):
+        registry.record(cloud, 100.0, 50.0)
+    assert registry.realtime_factor["cloud"] > 0.4
+    assert registry.choose(AUTO, 300) is local
+    assert registry.model_filter(AUTO) == {"$in": ["cloud", "local", "off"]}
+    assert registry.model_filter("cloud") == "cloud"
+
+@pytest.mark.asyncio
+async def test_transcribe_video_auto_stores_chosen_engine(mock_db):
+    from app.modules.v1.transcription.backends import BackendRegistry
+    from app.modules.v1.transcription import service
+    local = _backend("whisper-base", local=True, slots=1)
+    registry = BackendRegistry([_backend("deepgram-nova-2", available=False), local])
+    stored = {"_id": "new_id", "transcription": "Tekst z silnika", "link_hash": "hash", "title": "T",
+              "url": "http://yt.com", "model": "whisper-base", "created_at": datetime.now()}
+    with patch.object(service, "db", mock_db), patch.object(service, "transcription_backends", registry), \
+         patch.object(service, "download_audio", return_value=("hash", "a.mp3", "T")) as mock_dl, \
+         patch.object(service, "audio_duration", return_value=120.0):
+        mock_db.transcriptions.find_one.return_value = None
+        mock_db.transcriptions.find_one_and_update.return_value = stored
+        result = await transcribe_video("http://yt.com", model_name="whisperpy-base")
+        assert result.model == "whisper-base" and local.calls == [("a.mp3", "pl")]
+        # zapisana transkrypcja dowolnego silnika spełnia "auto"
+        assert mock_db.transcriptions.find_one.call_args[0][0]["model"] == {"$in": ["deepgram-nova-2", "whisper-base"]}
+        query, update = mock_db.transcriptions.find_one_and_update.call_args[0]
+        assert query["model"] == "whisper-base" and update["$setOnInsert"]["model"] == "whisper-base"
+        assert "words_z" in update["$setOnInsert"]
+        assert registry.realtime_factor["whisper-base"] < 0.1
+
+        # jawnie wybrany niedostępny silnik: błąd przed pobieraniem
+        mock_dl.reset_mock()
+        with pytest.raises(service.TranscriptionError):
+            await transcribe_video("http://yt.com/2", model_name="deepgram-nova-2")
+        mock_dl.assert_not_called()
+
+def test_local_whisper_worker_converts_words():
+    import sys
+    from types import SimpleNamespace
+    from app.modules.v1.transcription import local_whisper
+    fake_whisper = SimpleNamespace(load_audio=lambda path: [0.0] * 32000, audio=SimpleNamespace(SAMPLE_RATE=16000))
+    model = MagicMock()
+    model.transcribe.return_value = {"text": " Dobry ekran.", "segments": [{"words": [
+        {"word": " Dobry", "start": 0.0, "end": 0.3, "probability": 0.91},
+        {"word": " ekran.", "start": 0.3, "end": 0.8, "probability": 0.75},
+    ]}]}
+    with patch.dict(sys.modules, {"whisper": fake_whisper}), patch.object(local_whisper, "_model", model):
+        result = local_whisper._transcribe_file("a.mp3", "pl")
+    assert result["text"] == "Dobry ekran." and result["duration"] == 2.0
+    assert [w["punctuated_word"] for w in result["words"]] == ["Dobry", "ekran."]
+    assert model.transcribe.call_args.kwargs["word_timestamps"] is True
+
+    backend = local_whisper.LocalWhisperBackend("small", workers=0)
+    assert backend.name == "whisper-small" and not backend.available()
+    assert backend.capabilities.local and backend.capabilities.realtime_factor == 0.3
+
+def test_backends_endpoint():
+    response = client.get("/api/v1/transcribe/backends")
+    assert response.status_code == 200
+    names = [b["name"] for b in response.json()]
+    assert names[0] == "deepgram-nova-2" and names[1].startswith("whisper-")
+    assert response.json()[0]["capabilities"]["progress"] is True
+
+@pytest.mark.asyncio
+async def test_transcribe_video_result_carries_word_timings(mock_db):
+    from app.core.compression import pack_text
+    from app.modules.v1.transcription.service import word_timings_of
+    text, timings = _timings()
+    with patch("app.modules.v1.transcription.service.db", mock_db):
+        mock_db.transcriptions.find_one.return_value = {
+            "_id": "existing_id", **pack_text(text), **timings.pack(), "link_hash": "hash",
+            "model": "deepgram-nova-2", "url": "http://yt.com", "title": "T", "created_at": datetime.now(),
+        }
+        result = await transcribe_video("http://yt.com")
+        # czasy słów przychodzą z tym samym odczytem co tekst i nie trafiają do odpowiedzi
+        assert mock_db.transcriptions.find_one.call_args[0][1]["words_z"] == 1
+        assert word_timings_of(result).word(3) == timings.word(3)
+        assert "words_z" not in result.model_dump() and "_words" not in result.model_dump()
@@ -6,7 +6,7 @@ import './AnalysisApp.css';
 const SOCKET_URL = 'http://localhost:8000';
 
 function AnalysisApp() {
-  const { user, isAuthenticated } = useAuth();
+  const { user, isAuthenticated, logout } = useAuth();
   const [socket, setSocket] = useState(null);
   const [analyses, setAnalyses] = useState([]);
   const [selectedAnalysis, setSelectedAnalysis] = useState(null);
@@ -14,7 +14,12 @@ function AnalysisApp() {
   const [isProcessing, setIsProcessing] = useState(false);
   const [steps, setSteps] = useState([]);
   const [currentAnalysisId, setCurrentAnalysisId] = useState(null);
+  // Kursor kolejnej strony historii (null = brak kolejnych)
+  const [nextCursor, setNextCursor] = useState(null);
   const stepsEndRef = useRef(null);
+  // Analiza w toku i ostatni odebrany `seq` - potrzebne do wznowienia po reconnect
+  const activeAnalysisRef = useRef(null);
+  const lastSeqRef = useRef(0);
 
   useEffect(() => {
     // Only connect if user is authenticated
@@ -51,6 +56,14 @@ function AnalysisApp() {
       console.log('✅ Connected to server');
       // Request list of analyses with token
       newSocket.emit('get_analyses', { token });
+      // Po reconnect (nowy sid) dołącz ponownie do pokoju analizy w toku
+      if (activeAnalysisRef.current) {
+        newSocket.emit('subscribe_analysis', {
+          analysis_id: activeAnalysisRef.current,
+          last_seq: lastSeqRef.current,
+          token
+        });
+      }
     });
 
     newSocket.on('connected', (data) => {
@@ -59,17 +72,49 @@ function AnalysisApp() {
 
     newSocket.on('analyses_list', (data) => {
       console.log('Received analyses:', data.analyses);
-      setAnalyses(data.analyses || []);
+      // Odpowiedź na "załaduj więcej" dokleja stronę, pierwsza strona zastępuje listę
+      setAnalyses(prev => (data.cursor ? [...prev, ...(data.analyses || [])] : (data.analyses || [])));
+      setNextCursor(data.next_cursor || null);
+    });
+
+    // Pełne dane analizy (transkrypcja, sentyment) pobierane dopiero po wybraniu
+    newSocket.on('analysis_detail', (data) => {
+      setSelectedAnalysis(prev => (prev && prev.id === data.analysis.id ? data.analysis : prev));
     });
 
-    newSocket.on('analysis_step', (data) => {
+    // Zwraca false dla zdarzeń już odebranych (duplikaty po replay)
+    const trackSeq = (data) => {
+      if (data.seq === undefined) return true;
+      if (data.seq <= lastSeqRef.current) return false;
+      lastSeqRef.current = data.seq;
+      return true;
+    };
+
+    const handleStarted = (data) => {
+      activeAnalysisRef.current = data.analysis_id;
+      lastSeqRef.current = 0;
+      trackSeq(data);
+      setCurrentAnalysisId(data.analysis_id);
+    };
+
+    const handleStep = (data) => {
+      if (!trackSeq(data)) return;
       console.log('Analysis step:', data);
-      setSteps(prev => [...prev, data.step]);
+      setSteps(prev => {
+        const last = prev[prev.length - 1];
+        // Progress updates of a running step replace it instead of piling up
+        if (last && last.step === data.step.step && last.status === 'in_progress') {
+          return [...prev.slice(0, -1), data.step];
+        }
+        return [...prev, data.step];
+      });
       setCurrentAnalysisId(data.analysis_id);
       scrollToBottom();
-    });
+    };
 
-    newSocket.on('analysis_complete', (data) => {
+    const handleComplete = (data) => {
+      if (!trackSeq(data)) return;
+      activeAnalysisRef.current = null;
       console.log('Analysis complete:', data);
       setIsProcessing(false);
       const completedAnalysis = {
@@ -83,10 +128,14 @@ function AnalysisApp() {
       setSteps([]); // Wyczyść kroki i przejdź do wyników
       // Refresh analyses list with token
       newSocket.emit('get_analyses', { token });
-    });
+    };
 
-    newSocket.on('analysis_error', (data) => {
+    const handleError = (data) => {
+      if (!trackSeq(data)) return;
       console.error('Analysis error:', data);
+      if (data.analysis_id && data.analysis_id === activeAnalysisRef.current) {
+        activeAnalysisRef.current = null;
+      }
       setIsProcessing(false);
       setSteps(prev => [...prev, {
         step: 'error',
@@ -94,10 +143,48 @@ function AnalysisApp() {
         message: `Błąd: ${data.error}`,
         timestamp: new Date().toISOString()
       }]);
+    };
+
+    const handleCancelled = (data) => {
+      if (!trackSeq(data)) return;
+      activeAnalysisRef.current = null;
+      setIsProcessing(false);
+      setSteps(prev => [...prev, {
+        step: 'cancelled',
+        status: 'error',
+        message: 'Analiza anulowana',
+        timestamp: new Date().toISOString()
+      }]);
+    };
+
+    const handlers = {
+      analysis_started: handleStarted,
+      analysis_step: handleStep,
+      analysis_complete: handleComplete,
+      analysis_error: handleError,
+      analysis_cancelled: handleCancelled
+    };
+    Object.entries(handlers).forEach(([event, handler]) => newSocket.on(event, handler));
+
+    // Skrócona historia zdarzeń po ponownym dołączeniu do analizy
+    newSocket.on('analysis_replay', (data) => {
+      console.log('Analysis replay:', data);
+      (data.events || []).forEach(({ event, data: eventData }) => {
+        if (handlers[event]) handlers[event](eventData);
+      });
     });
 
     newSocket.on('connect_error', (error) => {
       console.error('Connection error:', error);
+      // Serwer odrzuca połączenia bez ważnego tokenu już przy connect
+      if (error.message === 'Authentication failed') {
+        logout();
+      }
+    });
+
+    newSocket.on('auth_expired', () => {
+      console.warn('Session expired');
+      logout();
     });
 
     newSocket.on('reconnect', (attemptNumber) => {
@@ -171,6 +258,17 @@ function AnalysisApp() {
     setSelectedAnalysis(analysis);
     setSteps([]);
     setCurrentAnalysisId(analysis.id);
+    const token = localStorage.getItem('access_token');
+    if (socket && token) {
+      socket.emit('get_analysis_detail', { analysis_id: analysis.id, token });
+    }
+  };
+
+  const handleLoadMore = () => {
+    const token = localStorage.getItem('access_token');
+    if (socket && token && nextCursor) {
+      socket.emit('get_analyses', { token, cursor: nextCursor });
+    }
   };
 
   const getStatusIcon = (status) => {
@@ -311,6 +409,11 @@ function AnalysisApp() {
               </div>
             ))
           )}
+          {nextCursor && (
+            <button className="load-more-btn" onClick={handleLoadMore}>
+              Załaduj więcej
+            </button>
+          )}
         </div>
       </div>
 
@@ -338,6 +441,9 @@ function AnalysisApp() {
                   </div>
                   <div className="step-content">
                     <div className="step-message">{step.message}</div>
+                    {step.status === 'in_progress' && step.percent != null && (
+                      <progress className="step-progress" max="100" value={step.percent} />
+                    )}
                     <div className="step-time">
                       {new Date(step.timestamp).toLocaleTimeString('pl-PL')}
                     </div>